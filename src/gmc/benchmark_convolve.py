@@ -0,0 +1,33 @@
+import torch
+
+import gmc.config as config
+import gmc.mixture as gm
+from gmc.profiling import benchmark
+
+# gm.convolve: repeat + repeat_interleave (previous implementation) vs. broadcasting vs. broadcasting with an output budget. forward and backward.
+n_batch = 16
+n_layers = 8
+n_components = 64
+n_kernel_components = 32
+n_components_out = 256
+config.validation_level = config.VALIDATION_OFF
+
+
+def repeat_convolve(m1: torch.Tensor, m2: torch.Tensor) -> torch.Tensor:
+    m1, m2 = gm._polynomial_mul_repeat(m1, m2)
+    m_new = m1 + m2
+    m_new_w = (gm.weights(m1) * gm.weights(m2)).unsqueeze(-1)
+    return torch.cat((m_new_w, m_new[:, :, :, 1:]), dim=-1)
+
+
+devices = ['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu']
+for n_dims in (2, 3):
+    for device in devices:
+        data = gm.generate_random_mixtures(n_batch, n_layers, n_components, n_dims, pos_radius=1, cov_radius=0.5, device=device).requires_grad_()
+        kernels = gm.generate_random_mixtures(n_batch, n_layers, n_kernel_components, n_dims, pos_radius=1, cov_radius=0.5, device=device).requires_grad_()
+        timings = dict()
+        for name, fun in (("repeat", lambda: repeat_convolve(data, kernels)),
+                          ("broadcast", lambda: gm.convolve(data, kernels)),
+                          (f"budget {n_components_out}", lambda: gm.convolve(data, kernels, n_components_out))):
+            timings[name] = benchmark(device, lambda: fun().sum().backward())
+        print(f"{n_dims}d {device}: " + ", ".join(f"{name} {t * 1000:.2f}ms ({timings['repeat'] / t:.1f}x)" for name, t in timings.items()))
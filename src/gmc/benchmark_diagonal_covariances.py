@@ -0,0 +1,54 @@
+import torch
+
+import gmc.config as config
+import gmc.mixture as gm
+import gmc.mixture_diagonal as gmd
+import gmc.mixture_isotropic as gmi
+import gmc.modules
+from gmc.profiling import benchmark
+from modelnet_classification.config import Config as ModelNetConfig
+
+# the first Convolution and ReLUFitting (fixed_point_only) layers of the ModelNet configuration (3d, 64 input Gaussians) with full, diagonal and isotropic
+# covariances (ConvolutionConfig.covariance_type, fitting.Config.covariance_type). forward and forward + backward of one batch.
+# no convolution fitting (n_convolution_fittiong_components = -1), the diagonal and isotropic types don't implement it.
+# the full covariance path uses the cpp extensions, the diagonal and isotropic paths are element wise pure torch.
+modelnet_config = ModelNetConfig()
+model_config = modelnet_config.model
+layer = model_config.layers[0]
+n_batch = modelnet_config.batch_size
+n_components_in = 64
+config.validation_level = config.VALIDATION_OFF
+
+
+def make_layers(covariance_type: str, device: str):
+    convolution = gmc.modules.Convolution(gmc.modules.ConvolutionConfig(covariance_type=covariance_type), n_layers_in=1, n_layers_out=layer.n_feature_layers,
+                                          n_kernel_components=model_config.n_kernel_components, n_dims=model_config.n_dims,
+                                          position_range=layer.kernel_radius, covariance_range=(layer.kernel_radius / 3) ** 2, weight_sd=1.0, weight_mean=0.1)
+    relu_config = gmc.modules.ReLUFittingConfig()
+    relu_config.fitting_config.covariance_type = covariance_type
+    relu = gmc.modules.ReLUFitting(relu_config, n_layers=layer.n_feature_layers, n_output_gaussians=layer.n_fitting_components)
+    return convolution.to(device), relu
+
+
+def forward(convolution, relu, x: torch.Tensor, x_constant: torch.Tensor) -> torch.Tensor:
+    y, y_constant = relu(*convolution(x, x_constant))
+    return y
+
+
+def forward_backward(convolution, relu, x: torch.Tensor, x_constant: torch.Tensor) -> None:
+    gm.weights(forward(convolution, relu, x, x_constant)).sum().backward()
+
+
+devices = ['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu']
+for device in devices:
+    x = gm.generate_random_mixtures(n_batch, 1, n_components_in, model_config.n_dims, pos_radius=1, cov_radius=0.1, device=device)
+    x_constant = torch.zeros(n_batch, 1, device=device)
+    inputs = {gm.COVARIANCE_FULL: x, gm.COVARIANCE_DIAGONAL: gmd.from_full(x), gm.COVARIANCE_ISOTROPIC: gmi.from_full(x)}
+
+    for name, function in (("forward", forward), ("forward + backward", forward_backward)):
+        timings = {}
+        for covariance_type, x_typed in inputs.items():
+            convolution, relu = make_layers(covariance_type, device)
+            timings[covariance_type] = benchmark(device, lambda: function(convolution, relu, x_typed, x_constant))
+        print(f"{device} convolution + relu fitting {name}: "
+              + ", ".join(f"{covariance_type} {t * 1000:.2f}ms ({timings[gm.COVARIANCE_FULL] / t:.1f}x)" for covariance_type, t in timings.items()))
@@ -0,0 +1,30 @@
+import torch
+
+import gmc.mixture as gm
+import gmc.model
+from gmc.model import Layer
+from gmc.profiling import benchmark
+
+# convolution + relu fitting, separate vs. fused (Config.fused_convolution_relu). mnist config without convolution fitting.
+# the layers don't reduce the number of components, so the input and the number of layers are kept small.
+n_batch = 21
+n_input_components = 16
+
+devices = ['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu']
+for device in devices:
+    timings = dict()
+    peak_memory = dict()
+    for fused in (False, True):
+        config = gmc.model.Config(n_dims=2)
+        config.layers = [Layer(8, 1, -1, -1), Layer(16, 1, -1, -1)]
+        config.fused_convolution_relu = fused
+        torch.manual_seed(0)
+        net = gmc.model.Net(learn_positions=True, learn_covariances=True, config=config).to(device)
+        torch.manual_seed(0)
+        x = gm.generate_random_mixtures(n_batch, 1, n_input_components, n_dims=2, pos_radius=1, cov_radius=0.1, weight_min=0, weight_max=1).to(device)
+
+        # the warm up call loads the extensions
+        timings[fused], peak_memory[fused] = benchmark(device, lambda: net(x).sum().backward(), n_warm_up=1, n_repetitions=1, peak_memory=True)
+
+    memory = f", peak memory {peak_memory[False] / 1024 ** 2:.0f}MiB -> {peak_memory[True] / 1024 ** 2:.0f}MiB" if device == 'cuda' else ""
+    print(f"{device}: separate {timings[False] * 1000:.1f}ms, fused {timings[True] * 1000:.1f}ms, speedup {timings[False] / timings[True]:.1f}x{memory}")
@@ -0,0 +1,56 @@
+"""
+Measures the import time of the gmc modules in fresh interpreters, relative to importing torch alone.
+
+Importing gmc must not build or load C++ extensions, nor pull in matplotlib or tensorboard. Both would show up here as a large
+overhead. The script exits with an error if the overhead of a module exceeds the budget (seconds), so it can be used in CI:
+
+    python -m gmc.benchmark_import_time [budget]
+"""
+import json
+import os
+import subprocess
+import sys
+import typing
+
+n_repetitions = 5
+modules = ["gmc.mixture", "gmc.mat_tools", "gmc.fitting", "gmc.modules", "gmc.model"]
+heavy_modules = ["matplotlib", "torch.utils.tensorboard"]
+
+_probe = """
+import json, sys, time
+start = time.perf_counter()
+import torch
+torch_time = time.perf_counter()
+for module in sys.argv[1:]:
+    __import__(module)
+end = time.perf_counter()
+from gmc.cpp.extensions import loader
+loaded = [name for name, extension in loader.lazy_extensions.items() if extension.is_loaded()]
+heavy = [name for name in {heavy_modules} if name in sys.modules]
+print(json.dumps([end - torch_time, loaded, heavy]))
+""".format(heavy_modules=heavy_modules)
+
+
+def measure(module: str) -> typing.Tuple[float, typing.List[str], typing.List[str]]:
+    """returns the best import time over n_repetitions (without torch), the loaded extensions and the heavy modules that were imported"""
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([src_dir, os.environ.get("PYTHONPATH", "")]))
+    best = float("inf")
+    loaded, heavy = [], []
+    for i in range(n_repetitions):
+        output = subprocess.run([sys.executable, "-c", _probe, module], env=environment, check=True, capture_output=True, text=True).stdout
+        gmc_time, loaded, heavy = json.loads(output.strip().splitlines()[-1])
+        best = min(best, gmc_time)
+    return best, loaded, heavy
+
+
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    failed = False
+    for module in modules:
+        time, loaded, heavy = measure(module)
+        ok = time < budget and len(loaded) == 0 and len(heavy) == 0
+        failed = failed or not ok
+        print(f"{module:<16} {time * 1000:8.1f}ms  loaded extensions: {loaded}  heavy imports: {heavy}  {'ok' if ok else 'FAILED'}")
+    if failed:
+        exit(1)
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import time
+
+import gmc.inout as gmio
+import gmc.mixture as gm
+
+# writing and reading a 3d mixture as ascii ply, binary ply and binary ply memory mapped with packed covariances (no copy before use).
+with tempfile.TemporaryDirectory() as directory:
+    for n_components in (512, 16 * 1024, 1024 * 1024):
+        mixture = gm.generate_random_mixtures(1, 1, n_components, n_dims=3, pos_radius=10, cov_radius=0.5)
+        ascii_file = os.path.join(directory, "mixture_ascii.ply")
+        binary_file = os.path.join(directory, "mixture_binary.ply")
+
+        timings = dict()
+        start = time.perf_counter()
+        gmio.write_gm_to_ply(gm.weights(mixture), gm.positions(mixture), gm.covariances(mixture), 0, ascii_file)
+        timings["ascii write"] = time.perf_counter() - start
+        start = time.perf_counter()
+        gmio.write_gm_to_binary_ply(mixture, binary_file)
+        timings["binary write"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        gmio.read_gm_from_ply(ascii_file, device='cpu')
+        timings["ascii read"] = time.perf_counter() - start
+        start = time.perf_counter()
+        gmio.read_gm_from_binary_ply(binary_file)
+        timings["binary read"] = time.perf_counter() - start
+        start = time.perf_counter()
+        gmio.read_gm_from_binary_ply(binary_file, packed_covariances=True)
+        timings["binary mmap"] = time.perf_counter() - start
+
+        sizes = f"{os.path.getsize(ascii_file) / 1024:.0f}KiB ascii, {os.path.getsize(binary_file) / 1024:.0f}KiB binary"
+        print(f"{n_components} components ({sizes}): " + ", ".join(f"{k} {v * 1000:.1f}ms" for k, v in timings.items()))
@@ -0,0 +1,45 @@
+import torch
+
+import gmc.mixture as gm
+import gmc.mixture_script as gms
+from gmc.profiling import benchmark
+
+# small mixtures on the cpu: gmc.mixture (eager) vs. gmc.mixture_script eager, scripted and compiled.
+# convolve, convert_priors_to_amplitudes and evaluate_componentwise_inversed in one step, forward only.
+n_batch = 8
+n_layers = 8
+n_components = 16
+n_kernel_components = 4
+n_xes = 256
+n_iterations = 100
+
+
+def step(mixture: torch.Tensor, kernel: torch.Tensor, xes: torch.Tensor) -> torch.Tensor:
+    convolved = gm.convert_priors_to_amplitudes(gm.convolve(mixture, kernel))
+    return gm.evaluate_componentwise_inversed(gm.pack_mixture(gm.weights(convolved), gm.positions(convolved), gm.CovarianceCache(convolved).inverse), xes)
+
+
+def step_script(mixture: torch.Tensor, kernel: torch.Tensor, xes: torch.Tensor) -> torch.Tensor:
+    convolved = gms.convert_priors_to_amplitudes(gms.convolve(mixture, kernel))
+    # only the inverse is missing in mixture_script, it is the same in all variants
+    inversed = gms.pack_mixture(gms.weights(convolved), gms.positions(convolved), torch.inverse(gms.covariances(convolved)))
+    return gms.evaluate_componentwise_inversed(inversed, xes)
+
+
+variants = [("gmc.mixture", step), ("mixture_script", step_script), ("scripted", torch.jit.script(step_script))]
+if hasattr(torch, "compile"):
+    variants.append(("compiled", torch.compile(step_script)))
+
+for n_dims in (2, 3):
+    mixture = gm.generate_random_mixtures(n_batch, n_layers, n_components, n_dims, pos_radius=1, cov_radius=0.5)
+    kernel = gm.generate_random_mixtures(1, n_layers, n_kernel_components, n_dims, pos_radius=1, cov_radius=0.5)
+    xes = torch.rand(1, n_layers, n_xes, n_dims) * 4 - 2
+    timings = dict()
+    reference = step(mixture, kernel, xes)
+    with torch.no_grad():
+        for name, fun in variants:
+            # the warm up calls compile
+            timings[name] = benchmark('cpu', lambda: fun(mixture, kernel, xes), n_warm_up=3, n_repetitions=n_iterations)
+            result = fun(mixture, kernel, xes)
+            error = (result - reference).abs().max().item()
+            print(f"{n_dims}d {name}: {timings[name] * 1000:.3f}ms, speedup {timings['gmc.mixture'] / timings[name]:.2f}x, max error {error:.3e}")
@@ -0,0 +1,39 @@
+import torch
+
+import gmc.mixture as gm
+import gmc.cpp.extensions.convolution.binding as cpp_convolution
+from gmc.profiling import benchmark
+
+# evaluation and convolution forward with full and packed covariances. the kernels read the packed records directly.
+n_batch = 1
+n_layers = 4
+n_components = 1024
+n_xes = 100000
+n_kernel_layers_out = 8
+n_kernel_components = 5
+position_radius = 10
+covariance_radius = 5
+
+for n_dims in (2, 3):
+    mixture = gm.generate_random_mixtures(n_batch, n_layers, n_components, n_dims, pos_radius=position_radius, cov_radius=covariance_radius)
+    mixture = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.CovarianceCache(mixture).inverse)
+    kernels = gm.generate_random_mixtures(n_kernel_layers_out, n_layers, n_kernel_components, n_dims, pos_radius=1, cov_radius=0.25)
+    xes = torch.rand([1, n_layers, n_xes, n_dims]) * position_radius * 2 - position_radius
+
+    devices = ['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu']
+    for device in devices:
+        x = xes.to(device)
+        k = kernels.to(device)
+        full = mixture.to(device)
+        packed = gm.convert_to_packed_covariances(full)
+
+        # the warm up call loads the extension
+        eval_full = benchmark(device, lambda: gm.evaluate_inversed(full, x), n_warm_up=1, n_repetitions=3)
+        eval_packed = benchmark(device, lambda: gm.evaluate_inversed(packed, x), n_warm_up=1, n_repetitions=3)
+        eval_error = (gm.evaluate_inversed(packed, x) - gm.evaluate_inversed(full, x)).abs().max().item()
+        conv_full = benchmark(device, lambda: cpp_convolution.apply(full, k), n_warm_up=1, n_repetitions=10)
+        conv_packed = benchmark(device, lambda: cpp_convolution.apply(packed, k), n_warm_up=1, n_repetitions=10)
+
+        print(f"{n_dims}d {device}: {full.shape[-1]} -> {packed.shape[-1]} values per component. "
+              f"evaluate {eval_full * 1000:.1f}ms -> {eval_packed * 1000:.1f}ms (max error {eval_error:.1e}), "
+              f"convolution {conv_full * 1000:.2f}ms -> {conv_packed * 1000:.2f}ms")
@@ -0,0 +1,38 @@
+import torch
+
+import gmc.mixture as gm
+from gmc.profiling import benchmark
+
+# evaluation with float32, bfloat16 and half mixture storage. the accumulation is always in float32.
+n_batch = 1
+n_layers = 4
+n_components = 1024
+n_xes = 100000
+position_radius = 10
+covariance_radius = 5
+
+get_cpu_capability = getattr(torch.backends.cpu, "get_cpu_capability", None)
+if get_cpu_capability is not None:
+    print(f"cpu capability: {get_cpu_capability()}")
+
+for n_dims in (2, 3):
+    mixture = gm.generate_random_mixtures(n_batch, n_layers, n_components, n_dims, pos_radius=position_radius, cov_radius=covariance_radius)
+    mixture = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.CovarianceCache(mixture).inverse)
+    xes = torch.rand([1, n_layers, n_xes, n_dims]) * position_radius * 2 - position_radius
+
+    devices = ['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu']
+    for device in devices:
+        x = xes.to(device)
+        timings = dict()
+        results = dict()
+        for dtype in (torch.float32, torch.bfloat16, torch.float16):
+            m = mixture.to(device=device, dtype=dtype)
+            # the warm up call loads the extension
+            timings[dtype] = benchmark(device, lambda: gm.evaluate_inversed(m, x), n_warm_up=1, n_repetitions=1)
+            results[dtype] = gm.evaluate_inversed(m, x)
+
+        reference = results[torch.float32]
+        for dtype in (torch.bfloat16, torch.float16):
+            error = ((results[dtype] - reference).abs().max() / reference.abs().max()).item()
+            print(f"{n_dims}d {device} {dtype}: {timings[dtype] * 1000:.1f}ms (float32 {timings[torch.float32] * 1000:.1f}ms), "
+                  f"speedup {timings[torch.float32] / timings[dtype]:.2f}x, max relative error {error:.3e}")
@@ -0,0 +1,27 @@
+import torch
+
+import gmc.mixture as gm
+import gmc.render as render
+from gmc.profiling import benchmark
+
+# tiled rendering vs. evaluating every component at every pixel, e.g. for ReLUFitting.debug_render. 5 x 5 images, 200 x 200 pixels.
+n_batch = 5
+n_layers = 5
+image_size = 200
+position_radius = 20
+covariance_radius = 1
+
+devices = ['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu']
+for n_components in (16, 128, 1024):
+    mixture = gm.generate_random_mixtures(n_batch, n_layers, n_components, 2, pos_radius=position_radius, cov_radius=covariance_radius)
+    constant = torch.zeros(n_batch, n_layers)
+    for device in devices:
+        m = mixture.to(device)
+        c = constant.to(device)
+        args = dict(x_low=-position_radius, y_low=-position_radius, x_high=position_radius, y_high=position_radius, width=image_size, height=image_size)
+        timings = {
+            "full": benchmark(device, lambda: render.render(m, c, sigma_cutoff=float('inf'), **args), n_warm_up=1, n_repetitions=1),
+            "tiled": benchmark(device, lambda: render.render(m, c, **args), n_warm_up=1, n_repetitions=1),
+            "tiled + colour": benchmark(device, lambda: render.colour_mapped(render.montage(render.render(m, c, **args)), -1, 1), n_warm_up=1, n_repetitions=1),
+        }
+        print(f"{n_components} components {device}: " + ", ".join(f"{name} {t * 1000:.1f}ms" for name, t in timings.items()))
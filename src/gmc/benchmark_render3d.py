@@ -0,0 +1,21 @@
+import torch
+
+import gmc.mixture as gm
+import gmc.render3d as render3d
+from gmc.profiling import benchmark
+
+# cpu renderer for 3D mixtures: 512 components, 512 x 512 pixels, density and ellipsoids.
+n_components = 512
+image_size = 512
+
+for n_batch, n_layers in ((1, 1), (2, 4)):
+    mixture = gm.generate_random_mixtures(n_batch, n_layers, n_components, 3, pos_radius=10, cov_radius=0.5)
+    vis = render3d.CpuVisualizer(False, image_size, image_size)
+    vis.set_camera_auto(True)
+    vis.set_gaussian_mixtures(mixture, isgmm=True)
+    for name, ellipsoids, density in (("density", False, True), ("ellipsoids", True, False), ("both", True, True)):
+        vis.set_ellipsoids_pc_rendering(ellipsoids, False)
+        vis.set_density_rendering(density)
+        duration = benchmark('cpu', vis.render, n_warm_up=1, n_repetitions=1)
+        print(f"{n_batch}x{n_layers} mixtures, {name}: {duration * 1000:.1f}ms ({torch.get_num_threads()} threads)")
+    vis.finish()
@@ -0,0 +1,31 @@
+import torch
+
+import gmc.mat_tools as mat_tools
+import gmc.mixture as gm
+from gmc.profiling import benchmark
+
+# representative selection: 32 out of 10k components, sort + gather vs. topk + gather (forward and backward).
+n_batch = 16
+n_layers = 8
+n_components = 10000
+k = 32
+
+
+def sort_and_gather(mixture: torch.Tensor) -> torch.Tensor:
+    _, sorted_indices = torch.sort(gm.weights(mixture.detach()).abs(), descending=True)
+    return mat_tools.my_index_select(mixture, sorted_indices)[:, :, :k, :]
+
+
+def select_top(mixture: torch.Tensor) -> torch.Tensor:
+    return mat_tools.select_top_components(mixture, k, gm.weights(mixture.detach()).abs())
+
+
+devices = ['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu']
+for n_dims in (2, 3):
+    for device in devices:
+        mixture = gm.generate_random_mixtures(n_batch, n_layers, n_components, n_dims, pos_radius=1, cov_radius=0.5, device=device).requires_grad_()
+        timings = dict()
+        for name, fun in (("sort + gather", sort_and_gather), ("select_top_components", select_top)):
+            timings[name] = benchmark(device, lambda: fun(mixture).sum().backward())
+        print(f"{n_dims}d {device}: " + ", ".join(f"{name} {t * 1000:.2f}ms" for name, t in timings.items()) +
+              f", speedup {timings['sort + gather'] / timings['select_top_components']:.1f}x")
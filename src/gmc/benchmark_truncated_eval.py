@@ -0,0 +1,33 @@
+import torch
+
+import gmc.mixture as gm
+from gmc.profiling import benchmark
+
+# truncated support evaluation (bvh) vs. full evaluation. 1024 components, 10^5 points.
+n_batch = 1
+n_layers = 4
+n_components = 1024
+n_xes = 100000
+position_radius = 10
+covariance_radius = 0.5
+
+for n_dims in (2, 3):
+    mixture = gm.generate_random_mixtures(n_batch, n_layers, n_components, n_dims, pos_radius=position_radius, cov_radius=covariance_radius)
+    mixture = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.covariances(mixture).inverse().transpose(-2, -1))
+    xes = torch.rand([1, n_layers, n_xes, n_dims]) * position_radius * 2 - position_radius
+
+    devices = ['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu']
+    for device in devices:
+        m = mixture.to(device)
+        x = xes.to(device)
+        timings = dict()
+        results = dict()
+        for name, fun in (("full", lambda: gm.evaluate_inversed(m, x)), ("truncated", lambda: gm.evaluate_inversed_truncated(m, x))):
+            # the warm up call loads the extension
+            timings[name] = benchmark(device, fun, n_warm_up=1, n_repetitions=1)
+            results[name] = fun()
+
+        error = (results["full"] - results["truncated"]).abs().max().item()
+        bound = gm.truncation_error_bound(m).max().item()
+        print(f"{n_dims}d {device}: full {timings['full'] * 1000:.1f}ms, truncated {timings['truncated'] * 1000:.1f}ms, "
+              f"speedup {timings['full'] / timings['truncated']:.1f}x, max error {error:.3e} (bound {bound:.3e})")
@@ -0,0 +1,52 @@
+import torch
+import torch.profiler
+
+import gmc.config
+import gmc.mixture as gm
+import gmc.model
+from gmc.profiling import benchmark
+
+# one training step (forward + backward) of gmc.model.Net with the mnist config at every validation level (gmc.config.validation_level).
+# the torch profiler counts the det, nan / inf scans and host syncs (aten::item / aten::_local_scalar_dense) issued by the validation.
+# Net.profiler (gmc.profiling.Profiler) times every module in separate steps, as it syncs the device around each of them. the table compares the
+# levels per module, i.e., it shows in which layers the per step saving is made.
+n_batch = 21
+n_input_components = 64
+n_steps = 5
+counted_ops = ("aten::linalg_det", "aten::det", "aten::isnan", "aten::isinf", "aten::isfinite", "aten::item", "aten::_local_scalar_dense")
+
+devices = ['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu']
+for device in devices:
+    torch.manual_seed(0)
+    net = gmc.model.Net(learn_positions=True, learn_covariances=True, config=gmc.model.Config(n_dims=2)).to(device)
+    x = gm.generate_random_mixtures(n_batch, 1, n_input_components, n_dims=2, pos_radius=1, cov_radius=0.1, weight_min=0, weight_max=1).to(device)
+
+    def step():
+        net(x).sum().backward()
+
+    step()  # warm up, loads the extensions
+    module_times = dict()
+    for name, level in (("full", gmc.config.VALIDATION_FULL), ("cheap", gmc.config.VALIDATION_CHEAP), ("off", gmc.config.VALIDATION_OFF)):
+        gmc.config.validation_level = level
+        duration = benchmark(device, step, n_warm_up=1, n_repetitions=n_steps)
+
+        net.profiler.reset()
+        net.profiler.enabled = True
+        for i in range(n_steps):
+            step()
+        net.profiler.enabled = False
+        module_times[name] = {r.name: (r.forward_time, r.backward_time) for r in net.profiler.records.values()}
+
+        activities = [torch.profiler.ProfilerActivity.CPU] + ([torch.profiler.ProfilerActivity.CUDA] if device == 'cuda' else [])
+        with torch.profiler.profile(activities=activities) as profiler:
+            step()
+        counts = {e.key: e.count for e in profiler.key_averages() if e.key in counted_ops}
+        counts = ", ".join(f"{op[len('aten::'):]} {counts.get(op, 0)}" for op in counted_ops)
+        print(f"{device} {name}: {duration * 1000:.1f}ms per step ({counts})")
+
+    # forward / backward ms per step and module at every level
+    print(f"{'module':<24}" + "".join(f"{name + ' fwd / bwd':>22}" for name in module_times))
+    for module in module_times["full"]:
+        times = [module_times[name].get(module, (0.0, 0.0)) for name in module_times]
+        print(f"{module:<24}" + "".join(f"{forward * 1000 / n_steps:>13.3f} / {backward * 1000 / n_steps:<6.3f}" for forward, backward in times))
+    gmc.config.validation_level = gmc.config.VALIDATION_FULL
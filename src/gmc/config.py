@@ -6,3 +6,12 @@ data_base_path = pathlib.Path(f"{source_dir}/../../data")
 
 eval_slize_size = 1024 * 1024 * 100
 eval_img_n_sample_points = 50 * 50
+# truncated evaluation (gm.evaluate_inversed_truncated) skips components that are further away than this many standard deviations
+eval_sigma_cutoff = 3.0
+
+# validation of mixtures and intermediate values (gm.is_valid_mixture, gm.is_valid_mixture_and_constant, gm.value_check):
+# off turns them into no-ops, cheap checks only shapes and devices, full also scans for nan / inf and non positive definite covariances (syncs with the device).
+VALIDATION_OFF = 0
+VALIDATION_CHEAP = 1
+VALIDATION_FULL = 2
+validation_level = int(os.environ.get("GMC_VALIDATION_LEVEL", VALIDATION_FULL))
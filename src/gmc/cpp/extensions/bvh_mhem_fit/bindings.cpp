@@ -2,14 +2,14 @@
 #include <algorithm>
 
 #include <torch/extension.h>
-#include <c10/cuda/CUDAGuard.h>
+#include "util/device_guard.h"
 
 #include "bindings.h"
 #include "implementation.h"
 #include "bvh_mhem_fit/Config.h"
 
 std::vector<torch::Tensor> bvh_mhem_fit_forward(const torch::Tensor& mixture, int n_components_fitting, int reduction_n) {
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (mixture.is_cuda()) {
         assert (device_of(mixture).has_value());
         device_guard.set_device(device_of(mixture).value());
@@ -26,7 +26,7 @@ torch::Tensor bvh_mhem_fit_backward(const torch::Tensor& grad,
                                     const torch::Tensor& target_mixture,
                                     const torch::Tensor& bvh_nodes, const torch::Tensor& bvh_attribs,
                                     int n_components_fitting, int reduction_n) {
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (grad.is_cuda()) {
         assert (device_of(grad).has_value());
         device_guard.set_device(device_of(grad).value());
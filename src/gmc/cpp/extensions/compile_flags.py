@@ -15,3 +15,22 @@ else:
     cpp_extra_cflags = ["-fopenmp", "-ffast-math", " -fno-finite-math-only", "-O4", "-march=native", "--std=c++17", "-DGPE_LIMIT_N_REDUCTION", "-DNDEBUG"]  # , "-DNDEBUG", "-DGPE_NO_CUDA_ERROR_CHECKING"
     cuda_extra_cuda_cflags.append("-Xcompiler -fopenmp -ccbin /usr/bin/g++ -DNDEBUG")  #  -DNDEBUG"
 
+
+# CPU-only builds compile the OpenMP code paths with the host compiler and don't need nvcc (see loader.py).
+# Set GPE_CPU_ONLY=1 to force them. Otherwise the loader prefers an installed CUDA build and JIT compiles the CUDA code paths
+# only if they can be compiled (a CUDA toolkit is installed) and run (pytorch sees a GPU), see loader.jit_cpu_only.
+from torch.utils.cpp_extension import CUDA_HOME
+cpu_only_forced = os.environ.get("GPE_CPU_ONLY", "0") not in ("", "0")
+cuda_toolkit_available = CUDA_HOME is not None
+cpu_only_include_path = source_dir + "/cpu_only/"
+if platform.system() == "Windows":
+    cpu_only_extra_cflags = cpp_extra_cflags + ["/DGPE_CPU_ONLY"]
+    cpu_only_extra_ldflags = []
+else:
+    cpu_only_extra_cflags = cpp_extra_cflags + ["-DGPE_CPU_ONLY"]
+    cpu_only_extra_ldflags = ["-lpthread", "-fopenmp"]
+
+
+def portable(flags):
+    # binaries that are shipped to other machines (setup.py) must not use the instruction set of the build machine
+    return [flag for flag in flags if flag != "-march=native"]
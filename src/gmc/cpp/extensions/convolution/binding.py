@@ -1,24 +1,17 @@
-from torch.utils.cpp_extension import load
 import torch.autograd
 
-from gmc.cpp.extensions.compile_flags import *
+from gmc.cpp.extensions import loader
 
-source_dir = os.path.dirname(__file__)
-
-
-source_files = [source_dir + '/bindings.cpp', source_dir + '/implementation_dispatch.cpp', source_dir + '/../CpuSynchronisationPoint.cpp']
-for dtype in ['float', 'double']:
-    for reduction_n in [1, ]:
-        for ndims in [2, 3]:
-            for direction in ['forward', 'backward']:
-                source_files.append(source_dir + f"/implementation_{direction}_instances/template_instance_implementation_{direction}_{reduction_n}_{dtype}_{ndims}.cu")
-
-cpp_binding = load('convolution', source_files,
-                   extra_include_paths=extra_include_paths,
-                   verbose=True, extra_cflags=cuda_extra_cflags, extra_cuda_cflags=cuda_extra_cuda_cflags, extra_ldflags=["-lpthread"])
+cpp_binding = loader.lazy('convolution')
 
 
 class ConvolutionFitting(torch.autograd.Function):
+    """
+    Half and bfloat16 inputs are widened to float32 on load inside the forward kernel, the result is stored in the dtype of data.
+    The inputs are saved for backward in their own dtype. The backward pass still computes on float32 copies (loader.widened),
+    its gradients are returned in the dtype of the inputs.
+    Data and kernels with packed covariances are read directly as well (the result is in the full layout), backward runs on full layout copies.
+    """
     @staticmethod
     def forward(ctx, data: torch.Tensor, kernels: torch.Tensor):
         if not data.is_contiguous():
@@ -36,9 +29,9 @@ class ConvolutionFitting(torch.autograd.Function):
             grad_output = grad_output.contiguous()
 
         data, kernels = ctx.saved_tensors
-        data_grad, kernels_grad = cpp_binding.backward(grad_output, data, kernels)
+        data_grad, kernels_grad = cpp_binding.backward(loader.widened(grad_output), loader.widened(data), loader.widened(kernels))
 
-        return data_grad, kernels_grad
+        return data_grad.to(data.dtype), kernels_grad.to(kernels.dtype)
 
 
 apply = ConvolutionFitting.apply
@@ -2,13 +2,13 @@
 #include <algorithm>
 
 #include <torch/extension.h>
-#include <c10/cuda/CUDAGuard.h>
+#include "util/device_guard.h"
 
 #include "convolution/bindings.h"
 #include "convolution/implementation.h"
 
 torch::Tensor convolution_forward(torch::Tensor data, torch::Tensor kernels) {
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (data.is_cuda()) {
         assert (device_of(data).has_value());
         device_guard.set_device(device_of(data).value());
@@ -17,7 +17,7 @@ torch::Tensor convolution_forward(torch::Tensor data, torch::Tensor kernels) {
 }
 
 std::pair<torch::Tensor, torch::Tensor> convolution_backward(torch::Tensor grad, torch::Tensor data, torch::Tensor kernels) {
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (grad.is_cuda()) {
         assert (device_of(grad).has_value());
         device_guard.set_device(device_of(grad).value());
@@ -7,6 +7,10 @@ namespace convolution {
 
 torch::Tensor forward_impl(const at::Tensor& data, const at::Tensor& kernels);
 
+// half and bfloat16 data and kernels, widened to float on load. the result has the dtype of data.
+// also reads data and kernels with packed covariances (gpe::is_packed), the result is in the full layout.
+torch::Tensor forward_reduced_precision_impl(const at::Tensor& data, const at::Tensor& kernels);
+
 std::pair<at::Tensor, at::Tensor> backward_impl(const torch::Tensor& grad, const torch::Tensor& data, const torch::Tensor& kernels);
 
 }
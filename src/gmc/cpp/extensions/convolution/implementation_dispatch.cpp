@@ -66,12 +66,21 @@ std::pair<torch::Tensor, torch::Tensor> dispatch_backward_dim_and_scalar_type(to
 }
 
 torch::Tensor forward_impl(const torch::Tensor& data, const torch::Tensor& kernels) {
-    auto n_dims = gpe::n_dimensions(data);
     auto scalar_type = data.scalar_type();
+    if (scalar_type == torch::ScalarType::Half || scalar_type == torch::ScalarType::BFloat16 || gpe::is_packed(data) || gpe::is_packed(kernels))
+        return forward_reduced_precision_impl(data, kernels);
+    auto n_dims = gpe::n_dimensions(data);
     return dispatch_forward_dim_and_scalar_type(data, kernels, n_dims, scalar_type);
 }
 
 std::pair<torch::Tensor, torch::Tensor> backward_impl(const torch::Tensor& grad, const torch::Tensor& data, const torch::Tensor& kernels) {
+    if (gpe::is_packed(data) || gpe::is_packed(kernels)) {
+        // the backward kernels read Gaussian structs. they run on full layout copies, the gradients are packed again.
+        const auto data_packed = gpe::is_packed(data);
+        const auto kernels_packed = gpe::is_packed(kernels);
+        auto [data_grad, kernels_grad] = backward_impl(grad, data_packed ? gpe::unpacked(data) : data, kernels_packed ? gpe::unpacked(kernels) : kernels);
+        return {data_packed ? gpe::packed_gradient(data_grad) : data_grad, kernels_packed ? gpe::packed_gradient(kernels_grad) : kernels_grad};
+    }
     auto n_dims = gpe::n_dimensions(grad);
     auto scalar_type = grad.scalar_type();
     return dispatch_backward_dim_and_scalar_type(grad, data, kernels, n_dims, scalar_type);
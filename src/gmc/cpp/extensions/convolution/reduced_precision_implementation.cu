@@ -0,0 +1,103 @@
+#include "convolution/implementation.h"
+
+#include <cuda.h>
+#include <cuda_runtime.h>
+#include <torch/types.h>
+
+#include "common.h"
+#include "cuda_qt_creator_definitinos.h"
+#include "hacked_accessor.h"
+#include "parallel_start.h"
+#include "util/gaussian.h"
+#include "util/helper.h"
+#include "util/mixture.h"
+
+namespace convolution {
+namespace {
+
+template <int N_DIMS, typename scalar_t, bool PACKED, typename Record>
+__host__ __device__ gpe::Gaussian<N_DIMS, scalar_t> load(const Record& record) {
+    if constexpr (PACKED)
+        return gpe::load_packed_gaussian<N_DIMS, scalar_t>(record);
+    else
+        return gpe::load_gaussian<N_DIMS, scalar_t>(record);
+}
+
+} // anonymous namespace
+
+// not in the anonymous namespace, nvcc doesn't allow extended lambdas there
+template <typename storage_t, typename scalar_t, int N_DIMS, bool DATA_PACKED, bool KERNELS_PACKED>
+void forward_records(const torch::Tensor& data, const torch::Tensor& kernels, torch::Tensor& out_mixture,
+                     const gpe::MixtureNs& n, const gpe::MixtureNs& kernel_n, const dim3& dimGrid, const dim3& dimBlock) {
+    // the records are widened to scalar_t on load and narrowed to storage_t on store, no float32 or full layout copy of the inputs is made
+    const auto data_a = gpe::accessor<storage_t, 4, storage_t>(data);
+    const auto kernel_a = gpe::accessor<storage_t, 4, storage_t>(kernels);
+    auto out_mixture_a = gpe::accessor<storage_t, 4, storage_t>(out_mixture);
+    const auto n_channels_in = n.layers;
+    const auto n_target_components = unsigned(n.components * n_channels_in * kernel_n.components);
+
+    auto fun = [data_a, kernel_a, out_mixture_a, n_channels_in, kernel_n, n, n_target_components] __host__ __device__
+        (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
+            GPE_UNUSED(gpe_gridDim)
+            const unsigned component_out_id = gpe_blockIdx.x * gpe_blockDim.x + gpe_threadIdx.x;
+            if (component_out_id >= n_target_components)
+                return;
+
+            const unsigned batch_id = gpe_blockIdx.y * gpe_blockDim.y + gpe_threadIdx.y;
+            const unsigned channel_out_id = gpe_blockIdx.z * gpe_blockDim.z + gpe_threadIdx.z;
+
+            const auto gaussian_indices = gpe::split_n_dim_index<uint32_t, 3, unsigned>({unsigned(n.components), unsigned(n_channels_in), unsigned(kernel_n.components)}, component_out_id);
+            const unsigned& component_in_id = gaussian_indices[0];
+            const unsigned& channel_in_id = gaussian_indices[1];
+            const unsigned& component_kernel_id = gaussian_indices[2];
+
+            const auto data_gaussian = load<N_DIMS, scalar_t, DATA_PACKED>(data_a[batch_id][channel_in_id][component_in_id]);
+            const auto kernel_gaussian = load<N_DIMS, scalar_t, KERNELS_PACKED>(kernel_a[channel_out_id][channel_in_id][component_kernel_id]);
+
+            gpe::store_gaussian(out_mixture_a[int(batch_id)][int(channel_out_id)][int(component_out_id)],
+                                gpe::Gaussian<N_DIMS, scalar_t>(data_gaussian.weight * kernel_gaussian.weight,
+                                                                data_gaussian.position + kernel_gaussian.position,
+                                                                data_gaussian.covariance + kernel_gaussian.covariance));
+        };
+    gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(data), dimGrid, dimBlock, fun);
+}
+
+torch::Tensor forward_reduced_precision_impl(const torch::Tensor& data, const torch::Tensor& kernels) {
+    using namespace torch::indexing;
+
+    const auto n = gpe::get_ns(data, true);
+    const auto kernel_n = gpe::get_ns(kernels, true);
+    const auto n_channels_in = n.layers;
+    const auto n_channels_out = kernel_n.batch;
+    const auto n_target_components = unsigned(n.components * n_channels_in * kernel_n.components);
+    TORCH_CHECK(n.batch * n_channels_out < 65535, "n_batch x n_layers must be smaller than 65535 for CUDA")
+    TORCH_CHECK(n.components >= 1, "number of components must be greater 1 for this implementation")
+    TORCH_CHECK(kernel_n.components >= 1, "number of components must be greater 1 for this implementation")
+    TORCH_CHECK(n_channels_in == kernel_n.layers, "number of input feature maps must agree with the second kernel dimension")
+    TORCH_CHECK(n.dims == kernel_n.dims, "number of dimensions of data and kernel must agree")
+    TORCH_CHECK(data.dtype() == kernels.dtype(), "kernel and data dtypes must agree")
+    TORCH_CHECK(data.device() == kernels.device(), "data and kernel devices must agree")
+
+    dim3 dimBlock = dim3(256, 1, 1);
+    dim3 dimGrid = dim3((unsigned(n_target_components) + dimBlock.x - 1) / dimBlock.x,
+                        (unsigned(n.batch) + dimBlock.y - 1) / dimBlock.y,
+                        (unsigned(n_channels_out) + dimBlock.z - 1) / dimBlock.z);
+
+    const auto data_packed = gpe::is_packed(data);
+    const auto kernels_packed = gpe::is_packed(kernels);
+    // the sums of the covariances are stored in the full layout
+    auto out_mixture = torch::empty({n.batch, n_channels_out, n_target_components, 1 + n.dims + n.dims * n.dims}, torch::TensorOptions(data.device()).dtype(data.dtype()));
+    GPE_DISPATCH_STORAGE_TYPES_AND_DIM(data.scalar_type(), n.dims, ([&] {
+        if (data_packed && kernels_packed)
+            forward_records<storage_t, scalar_t, N_DIMS, true, true>(data, kernels, out_mixture, n, kernel_n, dimGrid, dimBlock);
+        else if (data_packed)
+            forward_records<storage_t, scalar_t, N_DIMS, true, false>(data, kernels, out_mixture, n, kernel_n, dimGrid, dimBlock);
+        else if (kernels_packed)
+            forward_records<storage_t, scalar_t, N_DIMS, false, true>(data, kernels, out_mixture, n, kernel_n, dimGrid, dimBlock);
+        else
+            forward_records<storage_t, scalar_t, N_DIMS, false, false>(data, kernels, out_mixture, n, kernel_n, dimGrid, dimBlock);
+    }));
+    return out_mixture;
+}
+
+} // namespace convolution
@@ -1,25 +1,16 @@
-from torch.utils.cpp_extension import load
-import os
 import torch.autograd
 
-from gmc.cpp.extensions.compile_flags import *
+from gmc.cpp.extensions import loader
 
-source_dir = os.path.dirname(__file__)
-
-
-source_files = [source_dir + '/bindings.cpp', source_dir + '/implementation_dispatch.cpp', source_dir + '/Tree.cu', source_dir + '/../CpuSynchronisationPoint.cpp']
-for dtype in ['float', 'double']:
-    for reduction_n in [1, ]:
-        for ndims in [2, 3]:
-            for direction in ['forward', 'backward']:
-                source_files.append(source_dir + f"/implementation_{direction}_instances/template_instance_implementation_{direction}_{reduction_n}_{dtype}_{ndims}.cu")
-
-cpp_binding = load('convolution_fitting', source_files,
-                   extra_include_paths=extra_include_paths,
-                   verbose=True, extra_cflags=cuda_extra_cflags, extra_cuda_cflags=cuda_extra_cuda_cflags, extra_ldflags=["-lpthread"])
+cpp_binding = loader.lazy('convolution_fitting')
 
 
 class ConvolutionFitting(torch.autograd.Function):
+    """
+    Half and bfloat16 inputs are convolved and fitted in float32, the fitting is returned in the dtype of data. Unlike the convolution
+    and convolution_relu forward kernels, the tree building and fitting kernels don't widen on load yet: the inputs are copied to
+    float32 here (loader.widened), which costs one float32 copy of data and kernels per call.
+    """
     @staticmethod
     def forward(ctx, data: torch.Tensor, kernels: torch.Tensor, n_components_fitting: int):
         if not data.is_contiguous():
@@ -27,9 +18,9 @@ class ConvolutionFitting(torch.autograd.Function):
         if not kernels.is_contiguous():
             kernels = kernels.contiguous()
 
-        fitting, cached_pos_cov, nodesobjs, fitting_subtrees = cpp_binding.forward(data, kernels, n_components_fitting)
+        fitting, cached_pos_cov, nodesobjs, fitting_subtrees = cpp_binding.forward(loader.widened(data), loader.widened(kernels), n_components_fitting)
         ctx.save_for_backward(data, kernels, torch.tensor(n_components_fitting), fitting, cached_pos_cov, nodesobjs, fitting_subtrees )
-        return fitting
+        return fitting.to(data.dtype)
 
     @staticmethod
     def backward(ctx, grad_output):
@@ -37,9 +28,10 @@ class ConvolutionFitting(torch.autograd.Function):
             grad_output = grad_output.contiguous()
 
         data, kernels, n_components_fitting, fitting, cached_pos_cov, nodesobjs, fitting_subtrees = ctx.saved_tensors
-        grad_data, grad_kernel = cpp_binding.backward(grad_output, data, kernels, n_components_fitting.item(), fitting, cached_pos_cov, nodesobjs, fitting_subtrees)
+        grad_data, grad_kernel = cpp_binding.backward(loader.widened(grad_output), loader.widened(data), loader.widened(kernels), n_components_fitting.item(),
+                                                      fitting, cached_pos_cov, nodesobjs, fitting_subtrees)
 
-        return grad_data, grad_kernel, None
+        return grad_data.to(data.dtype), grad_kernel.to(kernels.dtype), None
 
 
 apply = ConvolutionFitting.apply
@@ -2,14 +2,14 @@
 #include <algorithm>
 
 #include <torch/extension.h>
-#include <c10/cuda/CUDAGuard.h>
+#include "util/device_guard.h"
 
 #include "convolution_fitting/bindings.h"
 #include "convolution_fitting/implementation.h"
 #include "convolution_fitting/Config.h"
 
 std::vector<torch::Tensor> convolution_fitting_forward(torch::Tensor data, torch::Tensor kernels, int n_components_fitting) {
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (data.is_cuda()) {
         assert (device_of(data).has_value());
         device_guard.set_device(device_of(data).value());
@@ -23,7 +23,7 @@ std::vector<torch::Tensor> convolution_fitting_forward(torch::Tensor data, torch
 std::pair<torch::Tensor, torch::Tensor> convolution_fitting_backward(const torch::Tensor& grad,
                                                                      const torch::Tensor& data, const torch::Tensor& kernels, int n_components_fitting,
                                                                      const torch::Tensor& fitting, const torch::Tensor& cached_pos_covs, const torch::Tensor& nodeobjs, const torch::Tensor& fitting_subtrees) {
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (grad.is_cuda()) {
         assert (device_of(grad).has_value());
         device_guard.set_device(device_of(grad).value());
@@ -0,0 +1,41 @@
+import torch.autograd
+
+from gmc.cpp.extensions import loader
+
+cpp_binding = loader.lazy('convolution_relu')
+
+
+class ConvolutionReLU(torch.autograd.Function):
+    """
+    Convolution, scaling of the weights by weight_scale and ReLU fitting (gmc.fitting.fixed_point_only) in one kernel.
+    The convolved mixture is never stored, neither in the forward pass nor for the backward pass. Returns the fitted mixture,
+    the constant of the ReLU fitting is relu(constant). Half and bfloat16 inputs are widened to float32 on load inside the forward kernel,
+    the result is stored in the dtype of data. The backward pass still computes on float32 copies of the inputs (loader.widened).
+    """
+    @staticmethod
+    def forward(ctx, data: torch.Tensor, kernels: torch.Tensor, constant: torch.Tensor, weight_scale: float):
+        if not data.is_contiguous():
+            data = data.contiguous()
+        if not kernels.is_contiguous():
+            kernels = kernels.contiguous()
+        if not constant.is_contiguous():
+            constant = constant.contiguous()
+
+        result = cpp_binding.forward(data, kernels, constant, weight_scale)
+        ctx.save_for_backward(data, kernels, constant)
+        ctx.weight_scale = weight_scale
+        return result
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        if not grad_output.is_contiguous():
+            grad_output = grad_output.contiguous()
+
+        data, kernels, constant = ctx.saved_tensors
+        data_grad, kernels_grad, constant_grad = cpp_binding.backward(loader.widened(grad_output), loader.widened(data), loader.widened(kernels), loader.widened(constant),
+                                                                      ctx.weight_scale)
+
+        return data_grad.to(data.dtype), kernels_grad.to(kernels.dtype), constant_grad.to(constant.dtype), None
+
+
+apply = ConvolutionReLU.apply
@@ -0,0 +1,29 @@
+#include <torch/extension.h>
+#include "util/device_guard.h"
+
+#include "convolution_relu/implementation.h"
+
+torch::Tensor convolution_relu_forward(torch::Tensor data, torch::Tensor kernels, torch::Tensor constant, double weight_scale) {
+    gpe::OptionalCUDAGuard device_guard;
+    if (data.is_cuda()) {
+        assert (device_of(data).has_value());
+        device_guard.set_device(device_of(data).value());
+    }
+    return convolution_relu::forward_impl(data, kernels, constant, weight_scale);
+}
+
+std::tuple<torch::Tensor, torch::Tensor, torch::Tensor> convolution_relu_backward(torch::Tensor grad, torch::Tensor data, torch::Tensor kernels, torch::Tensor constant, double weight_scale) {
+    gpe::OptionalCUDAGuard device_guard;
+    if (grad.is_cuda()) {
+        assert (device_of(grad).has_value());
+        device_guard.set_device(device_of(grad).value());
+    }
+    return convolution_relu::backward_impl(grad, data, kernels, constant, weight_scale);
+}
+
+#ifndef GMC_CMAKE_TEST_BUILD
+PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
+  m.def("forward", &convolution_relu_forward, "convolution_relu_forward");
+  m.def("backward", &convolution_relu_backward, "convolution_relu_backward");
+}
+#endif
@@ -0,0 +1,315 @@
+#include "convolution_relu/implementation.h"
+
+#include <type_traits>
+
+#include <cuda.h>
+#include <cuda_runtime.h>
+#include <torch/types.h>
+
+#include "common.h"
+#include "cuda_qt_creator_definitinos.h"
+#include "cuda_operations.h"
+#include "hacked_accessor.h"
+#include "parallel_start.h"
+#include "util/cuda.h"
+#include "util/gaussian.h"
+#include "util/glm.h"
+#include "util/grad/gaussian.h"
+#include "util/helper.h"
+#include "util/mixture.h"
+#include "util/scalar.h"
+
+// convolution (as in convolution/implementation_forward.h), scaling of the weights and gmc.fitting.fixed_point_only with one iteration,
+// computed without materialising the convolved mixture. every thread handles one output component, the target (convolved mixture)
+// is evaluated at its position by recomputing the convolved gaussians on the fly. the backward pass recomputes in the same way, so the only
+// tensors stored between forward and backward are the inputs.
+
+namespace convolution_relu {
+namespace {
+
+template <typename scalar_t, int N_DIMS, typename DataAccessor, typename KernelAccessor>
+EXECUTION_DEVICES gpe::Gaussian<N_DIMS, scalar_t> convolved_gaussian(const DataAccessor& data_a, const KernelAccessor& kernel_a,
+                                                                       const gpe::MixtureNs& n, const gpe::MixtureNs& kernel_n,
+                                                                       unsigned batch_id, unsigned channel_out_id, unsigned component_id, scalar_t weight_scale) {
+    // same component order as the convolution extension: component_in_id runs fastest, then channel_in_id, then component_kernel_id
+    const auto gaussian_indices = gpe::split_n_dim_index<uint32_t, 3, unsigned>({unsigned(n.components), unsigned(n.layers), unsigned(kernel_n.components)}, component_id);
+    const auto& data_gaussian = gpe::load_gaussian<N_DIMS, scalar_t>(data_a[batch_id][gaussian_indices[1]][gaussian_indices[0]]);
+    const auto& kernel_gaussian = gpe::load_gaussian<N_DIMS, scalar_t>(kernel_a[channel_out_id][gaussian_indices[1]][gaussian_indices[2]]);
+    return gpe::Gaussian<N_DIMS, scalar_t>(weight_scale * data_gaussian.weight * kernel_gaussian.weight,
+                                           data_gaussian.position + kernel_gaussian.position,
+                                           data_gaussian.covariance + kernel_gaussian.covariance);
+}
+
+template <typename scalar_t, int N_DIMS, typename DataAccessor, typename KernelAccessor>
+EXECUTION_DEVICES void scatter_gaussian_grad(const DataAccessor& data_a, const KernelAccessor& kernel_a, DataAccessor& data_grad_a, KernelAccessor& kernel_grad_a,
+                                             const gpe::MixtureNs& n, const gpe::MixtureNs& kernel_n,
+                                             unsigned batch_id, unsigned channel_out_id, unsigned component_id, scalar_t weight_scale,
+                                             const gpe::Gaussian<N_DIMS, scalar_t>& grad) {
+    const auto gaussian_indices = gpe::split_n_dim_index<uint32_t, 3, unsigned>({unsigned(n.components), unsigned(n.layers), unsigned(kernel_n.components)}, component_id);
+    const unsigned& component_in_id = gaussian_indices[0];
+    const unsigned& channel_in_id = gaussian_indices[1];
+    const unsigned& component_kernel_id = gaussian_indices[2];
+
+    auto& data_grad = data_grad_a[batch_id][channel_in_id][component_in_id];
+    auto& kernel_grad = kernel_grad_a[channel_out_id][channel_in_id][component_kernel_id];
+    gpe::atomicAdd(&data_grad.weight, grad.weight * weight_scale * kernel_a[channel_out_id][channel_in_id][component_kernel_id].weight);
+    gpe::atomicAdd(&kernel_grad.weight, grad.weight * weight_scale * data_a[batch_id][channel_in_id][component_in_id].weight);
+    for (unsigned i = 0; i < N_DIMS; ++i) {
+        if (grad.position[i] != 0) {
+            gpe::atomicAdd(&data_grad.position[i], grad.position[i]);
+            gpe::atomicAdd(&kernel_grad.position[i], grad.position[i]);
+        }
+        for (unsigned j = 0; j < N_DIMS; ++j) {
+            if (grad.covariance[i][j] != 0) {
+                gpe::atomicAdd(&data_grad.covariance[i][j], grad.covariance[i][j]);
+                gpe::atomicAdd(&kernel_grad.covariance[i][j], grad.covariance[i][j]);
+            }
+        }
+    }
+}
+
+// fitting.initial_approx_to_relu, followed by the abs() + 0.1 at the start of fitting.fixed_point_iteration_to_relu
+template <typename scalar_t>
+EXECUTION_DEVICES scalar_t initial_weight(scalar_t weight, scalar_t constant) {
+    const auto relu_constant = gpe::max(constant, scalar_t(0));
+    return gpe::abs(weight + constant > 0 ? weight : -relu_constant) + scalar_t(0.1);
+}
+
+template <typename scalar_t>
+EXECUTION_DEVICES scalar_t initial_weight_grad_weight(scalar_t weight, scalar_t constant) {
+    if (weight + constant > 0)
+        return scalar_t(weight > 0) - scalar_t(weight < 0);
+    return 0;
+}
+
+template <typename scalar_t>
+EXECUTION_DEVICES scalar_t initial_weight_grad_constant(scalar_t weight, scalar_t constant) {
+    // |-relu(constant)| == constant for positive constants
+    return scalar_t(weight + constant <= 0 && constant > 0);
+}
+
+template <typename scalar_t>
+struct Evaluations {
+    scalar_t target;
+    scalar_t initial;
+};
+
+// evaluates the target (convolved mixture) and the initial fitting at position
+template <typename scalar_t, int N_DIMS, typename DataAccessor, typename KernelAccessor>
+EXECUTION_DEVICES Evaluations<scalar_t> evaluate_target_and_initial(const DataAccessor& data_a, const KernelAccessor& kernel_a,
+                                                                    const gpe::MixtureNs& n, const gpe::MixtureNs& kernel_n, unsigned n_target_components,
+                                                                    unsigned batch_id, unsigned channel_out_id, scalar_t weight_scale, scalar_t constant,
+                                                                    const glm::vec<N_DIMS, scalar_t>& position) {
+    scalar_t target = 0;
+    scalar_t initial = 0;
+    for (unsigned component_id = 0; component_id < n_target_components; ++component_id) {
+        const auto gaussian = convolved_gaussian<scalar_t, N_DIMS>(data_a, kernel_a, n, kernel_n, batch_id, channel_out_id, component_id, weight_scale);
+        const auto density = gpe::evaluate(gpe::Gaussian<N_DIMS, scalar_t>(1, gaussian.position, gaussian.covariance), position);
+        target += gaussian.weight * density;
+        initial += initial_weight(gaussian.weight, constant) * density;
+    }
+    return {target, initial};
+}
+
+// float and double mixtures are accessed as Gaussian records. half and bfloat16 ones value by value, widened to scalar_t on load (gpe::load_gaussian)
+template <typename storage_t, typename scalar_t, int N_DIMS>
+auto mixture_accessor(const torch::Tensor& mixture) {
+    if constexpr (std::is_same_v<storage_t, scalar_t>)
+        return gpe::struct_accessor<gpe::Gaussian<N_DIMS, scalar_t>, 3, scalar_t>(mixture);
+    else
+        return gpe::accessor<storage_t, 4, storage_t>(mixture);
+}
+
+template<typename storage_t, typename scalar_t, int N_DIMS>
+torch::Tensor forward_impl_t(const torch::Tensor& data, const torch::Tensor& kernels, const torch::Tensor& constant, scalar_t weight_scale) {
+    using Gaussian = gpe::Gaussian<N_DIMS, scalar_t>;
+    const auto n = gpe::get_ns(data);
+    const auto kernel_n = gpe::get_ns(kernels);
+    const auto n_channels_out = kernel_n.batch;
+    const auto n_target_components = unsigned(n.components * n.layers * kernel_n.components);
+
+    auto out_mixture = torch::empty({n.batch, n_channels_out, n_target_components, data.size(-1)}, torch::TensorOptions(data.device()).dtype(data.dtype()));
+
+    const auto data_a = mixture_accessor<storage_t, scalar_t, N_DIMS>(data);
+    const auto kernel_a = mixture_accessor<storage_t, scalar_t, N_DIMS>(kernels);
+    const auto constant_a = gpe::accessor<storage_t, 2, storage_t>(constant);
+    auto out_mixture_a = mixture_accessor<storage_t, scalar_t, N_DIMS>(out_mixture);
+
+    dim3 dimBlock = dim3(128, 1, 1);
+    dim3 dimGrid = dim3((n_target_components + dimBlock.x - 1) / dimBlock.x, unsigned(n_channels_out), unsigned(n.batch));
+    gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(data), dimGrid, dimBlock, [=] __host__ __device__
+                                                  (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
+        GPE_UNUSED(gpe_gridDim)
+        const unsigned component_out_id = gpe_blockIdx.x * gpe_blockDim.x + gpe_threadIdx.x;
+        if (component_out_id >= n_target_components)
+            return;
+        const unsigned channel_out_id = gpe_blockIdx.y;
+        const unsigned batch_id = gpe_blockIdx.z;
+
+        const auto c = scalar_t(constant_a[batch_id][channel_out_id]);
+        const auto gaussian = convolved_gaussian<scalar_t, N_DIMS>(data_a, kernel_a, n, kernel_n, batch_id, channel_out_id, component_out_id, weight_scale);
+        const auto evaluations = evaluate_target_and_initial<scalar_t, N_DIMS>(data_a, kernel_a, n, kernel_n, n_target_components, batch_id, channel_out_id, weight_scale, c, gaussian.position);
+
+        // fixed point iteration: x = x * (relu(target + c) - relu(c) + 0.05) / (initial + 0.05)
+        const auto relu_target = gpe::max(evaluations.target + c, scalar_t(0)) - gpe::max(c, scalar_t(0));
+        const auto weight = initial_weight(gaussian.weight, c) * (relu_target + scalar_t(0.05)) / (evaluations.initial + scalar_t(0.05));
+        gpe::store_gaussian(out_mixture_a[batch_id][channel_out_id][component_out_id], Gaussian(weight, gaussian.position, gaussian.covariance));
+    });
+
+    return out_mixture;
+}
+
+template<typename scalar_t, int N_DIMS>
+std::tuple<torch::Tensor, torch::Tensor, torch::Tensor> backward_impl_t(const torch::Tensor& grad, const torch::Tensor& data, const torch::Tensor& kernels, const torch::Tensor& constant, scalar_t weight_scale) {
+    using Gaussian = gpe::Gaussian<N_DIMS, scalar_t>;
+    using Vec = typename Gaussian::pos_t;
+    const auto n = gpe::get_ns(data);
+    const auto kernel_n = gpe::get_ns(kernels);
+    const auto n_channels_out = kernel_n.batch;
+    const auto n_target_components = unsigned(n.components * n.layers * kernel_n.components);
+    TORCH_CHECK(grad.size(0) == n.batch && grad.size(1) == n_channels_out && grad.size(2) == n_target_components && grad.size(3) == data.size(-1), "grad has the wrong shape")
+
+    auto data_grad = torch::zeros_like(data);
+    auto kernels_grad = torch::zeros_like(kernels);
+    // per output component: d loss / d target, d loss / d initial and d loss / d initial_weight (direct path)
+    auto coefficients = torch::empty({n.batch, n_channels_out, n_target_components, 3}, torch::TensorOptions(data.device()).dtype(data.dtype()));
+    // per output component contributions to the constant grad, summed up at the end
+    auto constant_grad = torch::empty({n.batch, n_channels_out, n_target_components}, torch::TensorOptions(data.device()).dtype(data.dtype()));
+
+    const auto data_a = gpe::struct_accessor<Gaussian, 3, scalar_t>(data);
+    const auto kernel_a = gpe::struct_accessor<Gaussian, 3, scalar_t>(kernels);
+    const auto constant_a = gpe::accessor<scalar_t, 2>(constant);
+    const auto grad_a = gpe::struct_accessor<Gaussian, 3, scalar_t>(grad);
+    auto data_grad_a = gpe::struct_accessor<Gaussian, 3, scalar_t>(data_grad);
+    auto kernels_grad_a = gpe::struct_accessor<Gaussian, 3, scalar_t>(kernels_grad);
+    auto coefficients_a = gpe::accessor<scalar_t, 4>(coefficients);
+    auto constant_grad_a = gpe::accessor<scalar_t, 3>(constant_grad);
+
+    dim3 dimBlock = dim3(128, 1, 1);
+    dim3 dimGrid = dim3((n_target_components + dimBlock.x - 1) / dimBlock.x, unsigned(n_channels_out), unsigned(n.batch));
+
+    // pass 1, per output component: recompute the evaluations and the grads of the fixed point formula
+    gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(data), dimGrid, dimBlock, [=] __host__ __device__
+                                                  (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
+        GPE_UNUSED(gpe_gridDim)
+        const unsigned component_out_id = gpe_blockIdx.x * gpe_blockDim.x + gpe_threadIdx.x;
+        if (component_out_id >= n_target_components)
+            return;
+        const unsigned channel_out_id = gpe_blockIdx.y;
+        const unsigned batch_id = gpe_blockIdx.z;
+
+        const auto c = constant_a[batch_id][channel_out_id];
+        const auto gaussian = convolved_gaussian<scalar_t, N_DIMS>(data_a, kernel_a, n, kernel_n, batch_id, channel_out_id, component_out_id, weight_scale);
+        const auto evaluations = evaluate_target_and_initial<scalar_t, N_DIMS>(data_a, kernel_a, n, kernel_n, n_target_components, batch_id, channel_out_id, weight_scale, c, gaussian.position);
+
+        const auto target_active = evaluations.target + c > 0;
+        const auto relu_target = gpe::max(evaluations.target + c, scalar_t(0)) - gpe::max(c, scalar_t(0));
+        const auto x0 = initial_weight(gaussian.weight, c);
+        const auto denominator = evaluations.initial + scalar_t(0.05);
+        const auto incoming_grad = grad_a[batch_id][channel_out_id][component_out_id].weight;
+
+        const auto grad_relu_target = incoming_grad * x0 / denominator;
+        auto coefficient_row = coefficients_a[batch_id][channel_out_id][component_out_id];
+        coefficient_row[0] = target_active ? grad_relu_target : scalar_t(0);
+        coefficient_row[1] = -incoming_grad * x0 * (relu_target + scalar_t(0.05)) / (denominator * denominator);
+        coefficient_row[2] = incoming_grad * (relu_target + scalar_t(0.05)) / denominator;
+        constant_grad_a[batch_id][channel_out_id][component_out_id] = grad_relu_target * (scalar_t(target_active) - scalar_t(c > 0));
+    });
+
+    // pass 2, per output component: grad of its position, which is also the evaluation position of the target and initial fitting
+    gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(data), dimGrid, dimBlock, [=] __host__ __device__
+                                                  (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
+        GPE_UNUSED(gpe_gridDim)
+        const unsigned component_out_id = gpe_blockIdx.x * gpe_blockDim.x + gpe_threadIdx.x;
+        if (component_out_id >= n_target_components)
+            return;
+        const unsigned channel_out_id = gpe_blockIdx.y;
+        const unsigned batch_id = gpe_blockIdx.z;
+
+        const auto c = constant_a[batch_id][channel_out_id];
+        const auto gaussian = convolved_gaussian<scalar_t, N_DIMS>(data_a, kernel_a, n, kernel_n, batch_id, channel_out_id, component_out_id, weight_scale);
+        const auto coefficient_row = coefficients_a[batch_id][channel_out_id][component_out_id];
+
+        Vec grad_position = grad_a[batch_id][channel_out_id][component_out_id].position;
+        for (unsigned component_id = 0; component_id < n_target_components; ++component_id) {
+            const auto other = convolved_gaussian<scalar_t, N_DIMS>(data_a, kernel_a, n, kernel_n, batch_id, channel_out_id, component_id, weight_scale);
+            const auto factor = coefficient_row[0] * other.weight + coefficient_row[1] * initial_weight(other.weight, c);
+            Gaussian grad_other = {};
+            Vec grad_evalpos = {};
+            gpe::grad::evaluate(Gaussian(1, other.position, other.covariance), gaussian.position, &grad_other, &grad_evalpos, factor);
+            grad_position += grad_evalpos;
+        }
+        scatter_gaussian_grad<scalar_t, N_DIMS>(data_a, kernel_a, data_grad_a, kernels_grad_a, n, kernel_n, batch_id, channel_out_id, component_out_id, weight_scale,
+                                                Gaussian(0, grad_position, typename Gaussian::cov_t(0)));
+    });
+
+    // pass 3, per convolved component: grads of its weight, position and covariance, which enter every evaluation
+    gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(data), dimGrid, dimBlock, [=] __host__ __device__
+                                                  (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
+        GPE_UNUSED(gpe_gridDim)
+        const unsigned component_id = gpe_blockIdx.x * gpe_blockDim.x + gpe_threadIdx.x;
+        if (component_id >= n_target_components)
+            return;
+        const unsigned channel_out_id = gpe_blockIdx.y;
+        const unsigned batch_id = gpe_blockIdx.z;
+
+        const auto c = constant_a[batch_id][channel_out_id];
+        const auto gaussian = convolved_gaussian<scalar_t, N_DIMS>(data_a, kernel_a, n, kernel_n, batch_id, channel_out_id, component_id, weight_scale);
+        const auto x0 = initial_weight(gaussian.weight, c);
+
+        scalar_t grad_weight = 0;
+        scalar_t grad_x0 = coefficients_a[batch_id][channel_out_id][component_id][2];
+        Gaussian grad_gaussian = Gaussian(0, Vec(0), grad_a[batch_id][channel_out_id][component_id].covariance);
+        for (unsigned component_out_id = 0; component_out_id < n_target_components; ++component_out_id) {
+            const auto position = convolved_gaussian<scalar_t, N_DIMS>(data_a, kernel_a, n, kernel_n, batch_id, channel_out_id, component_out_id, weight_scale).position;
+            const auto coefficient_row = coefficients_a[batch_id][channel_out_id][component_out_id];
+            Gaussian grad_density = {};
+            Vec grad_evalpos = {};
+            gpe::grad::evaluate(Gaussian(1, gaussian.position, gaussian.covariance), position, &grad_density, &grad_evalpos, scalar_t(1));
+            const auto factor = coefficient_row[0] * gaussian.weight + coefficient_row[1] * x0;
+            grad_weight += coefficient_row[0] * grad_density.weight;
+            grad_x0 += coefficient_row[1] * grad_density.weight;
+            grad_gaussian.position += factor * grad_density.position;
+            grad_gaussian.covariance += factor * grad_density.covariance;
+        }
+        grad_gaussian.weight = grad_weight + grad_x0 * initial_weight_grad_weight(gaussian.weight, c);
+        constant_grad_a[batch_id][channel_out_id][component_id] += grad_x0 * initial_weight_grad_constant(gaussian.weight, c);
+        scatter_gaussian_grad<scalar_t, N_DIMS>(data_a, kernel_a, data_grad_a, kernels_grad_a, n, kernel_n, batch_id, channel_out_id, component_id, weight_scale, grad_gaussian);
+    });
+
+    return {data_grad, kernels_grad, constant_grad.sum(-1)};
+}
+
+void check_input(const torch::Tensor& data, const torch::Tensor& kernels, const torch::Tensor& constant) {
+    const auto n = gpe::get_ns(data);
+    const auto kernel_n = gpe::get_ns(kernels);
+    TORCH_CHECK(n.batch * kernel_n.batch < 65535, "n_batch x n_layers must be smaller than 65535 for CUDA")
+    TORCH_CHECK(n.components >= 1, "number of components must be greater 1 for this implementation")
+    TORCH_CHECK(kernel_n.components >= 1, "number of components must be greater 1 for this implementation")
+    TORCH_CHECK(n.layers == kernel_n.layers, "number of input feature maps must agree with the second kernel dimension")
+    TORCH_CHECK(n.dims == kernel_n.dims, "number of dimensions of data and kernel must agree")
+    TORCH_CHECK(n.dims == 2 || n.dims == 3, "only 2D and 3D mixtures are supported")
+    TORCH_CHECK(data.dtype() == kernels.dtype() && data.dtype() == constant.dtype(), "kernel, data and constant dtypes must agree")
+    TORCH_CHECK(data.device() == kernels.device() && data.device() == constant.device(), "kernel, data and constant devices must agree")
+    TORCH_CHECK(constant.dim() == 2 && constant.size(0) == n.batch && constant.size(1) == kernel_n.batch, "constant must have the shape [n_batch, n_channels_out]")
+}
+
+} // anonymous namespace
+
+torch::Tensor forward_impl(const torch::Tensor& data, const torch::Tensor& kernels, const torch::Tensor& constant, double weight_scale) {
+    check_input(data, kernels, constant);
+    // half and bfloat16 inputs are widened to float on load, the result is stored in their dtype
+    return GPE_DISPATCH_STORAGE_TYPES_AND_DIM(data.scalar_type(), gpe::n_dimensions(data), ([&] {
+        return forward_impl_t<storage_t, scalar_t, N_DIMS>(data, kernels, constant, scalar_t(weight_scale));
+    }));
+}
+
+std::tuple<torch::Tensor, torch::Tensor, torch::Tensor> backward_impl(const torch::Tensor& grad, const torch::Tensor& data, const torch::Tensor& kernels, const torch::Tensor& constant, double weight_scale) {
+    check_input(data, kernels, constant);
+    TORCH_CHECK(grad.dtype() == data.dtype() && grad.device() == data.device(), "grad dtype and device must agree with data")
+    return GPE_DISPATCH_FLOATING_TYPES_AND_DIM(data.scalar_type(), gpe::n_dimensions(data), ([&] {
+        return backward_impl_t<scalar_t, N_DIMS>(grad, data, kernels, constant, scalar_t(weight_scale));
+    }));
+}
+
+} // namespace convolution_relu
@@ -0,0 +1,13 @@
+#ifndef CONVOLUTION_RELU_IMPLEMENTATION
+#define CONVOLUTION_RELU_IMPLEMENTATION
+#include <tuple>
+#include <torch/script.h>
+
+namespace convolution_relu {
+
+torch::Tensor forward_impl(const torch::Tensor& data, const torch::Tensor& kernels, const torch::Tensor& constant, double weight_scale);
+
+std::tuple<torch::Tensor, torch::Tensor, torch::Tensor> backward_impl(const torch::Tensor& grad, const torch::Tensor& data, const torch::Tensor& kernels, const torch::Tensor& constant, double weight_scale);
+
+}
+#endif
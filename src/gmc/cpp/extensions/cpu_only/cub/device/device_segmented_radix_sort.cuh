@@ -0,0 +1,25 @@
+#ifndef GPE_CPU_ONLY_CUB_DEVICE_SEGMENTED_RADIX_SORT_CUH
+#define GPE_CPU_ONLY_CUB_DEVICE_SEGMENTED_RADIX_SORT_CUH
+
+// cub is only called on the CUDA branches (tensor.is_cuda()), the CPU branches sort with the standard library.
+// CPU-only builds (GPE_CPU_ONLY) can't reach those branches with valid input, so we fail loudly if they do.
+#include <c10/util/Exception.h>
+
+#include "../../cuda_runtime.h"
+
+namespace cub {
+struct DeviceSegmentedRadixSort {
+    template <typename... Args>
+    static cudaError_t SortKeys(Args&&...) {
+        TORCH_CHECK(false, "cub::DeviceSegmentedRadixSort::SortKeys: gmc extension was built without CUDA support (GPE_CPU_ONLY)");
+        return cudaErrorNoDevice;
+    }
+    template <typename... Args>
+    static cudaError_t SortPairs(Args&&...) {
+        TORCH_CHECK(false, "cub::DeviceSegmentedRadixSort::SortPairs: gmc extension was built without CUDA support (GPE_CPU_ONLY)");
+        return cudaErrorNoDevice;
+    }
+};
+}
+
+#endif // GPE_CPU_ONLY_CUB_DEVICE_SEGMENTED_RADIX_SORT_CUH
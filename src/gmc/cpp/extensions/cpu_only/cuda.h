@@ -0,0 +1,7 @@
+#ifndef GPE_CPU_ONLY_CUDA_H
+#define GPE_CPU_ONLY_CUDA_H
+
+// Stand-in for the CUDA driver header in CPU-only builds (GPE_CPU_ONLY), see cuda_runtime.h.
+#include "cuda_runtime.h"
+
+#endif // GPE_CPU_ONLY_CUDA_H
@@ -0,0 +1,39 @@
+#ifndef GPE_CPU_ONLY_CUDA_RUNTIME_H
+#define GPE_CPU_ONLY_CUDA_RUNTIME_H
+
+// Stand-in for the CUDA runtime header, used only by CPU-only builds (GPE_CPU_ONLY, see loader.py).
+// It provides the few CUDA types, qualifiers and runtime calls that the shared CPU/CUDA code paths
+// need in order to compile with the host compiler. Nothing in here does actual CUDA work.
+
+#ifndef GPE_CPU_ONLY
+#error "cpu_only/cuda_runtime.h must only be on the include path of GPE_CPU_ONLY builds"
+#endif
+
+#include <cstddef>
+
+#include "vector_types.h"
+
+#define __host__
+#define __device__
+#define __global__
+#define __shared__ static
+#define __constant__ static
+#ifdef _MSC_VER
+#define __forceinline__ __forceinline
+#else
+#define __forceinline__ inline __attribute__((always_inline))
+#endif
+
+enum cudaError_t {
+    cudaSuccess = 0,
+    cudaErrorNoDevice = 100
+};
+
+inline cudaError_t cudaPeekAtLastError() { return cudaSuccess; }
+inline cudaError_t cudaGetLastError() { return cudaSuccess; }
+inline cudaError_t cudaDeviceSynchronize() { return cudaSuccess; }
+inline const char* cudaGetErrorString(cudaError_t) { return "gmc extension was built without CUDA support (GPE_CPU_ONLY)"; }
+inline cudaError_t cudaMalloc(void** ptr, std::size_t) { *ptr = nullptr; return cudaErrorNoDevice; }
+inline cudaError_t cudaFree(void*) { return cudaSuccess; }
+
+#endif // GPE_CPU_ONLY_CUDA_RUNTIME_H
@@ -0,0 +1,15 @@
+#ifndef GPE_CPU_ONLY_MATH_CONSTANTS_H
+#define GPE_CPU_ONLY_MATH_CONSTANTS_H
+
+// Stand-in for the CUDA math constants header, used only by CPU-only builds (GPE_CPU_ONLY, see loader.py).
+
+#ifndef GPE_CPU_ONLY
+#error "cpu_only/math_constants.h must only be on the include path of GPE_CPU_ONLY builds"
+#endif
+
+#include <limits>
+
+#define CUDART_INF_F std::numeric_limits<float>::infinity()
+#define CUDART_INF std::numeric_limits<double>::infinity()
+
+#endif // GPE_CPU_ONLY_MATH_CONSTANTS_H
@@ -0,0 +1,11 @@
+#ifndef GPE_CPU_ONLY_THRUST_SWAP_H
+#define GPE_CPU_ONLY_THRUST_SWAP_H
+
+// CPU-only builds (GPE_CPU_ONLY) map thrust::swap to the standard library.
+#include <utility>
+
+namespace thrust {
+using std::swap;
+}
+
+#endif // GPE_CPU_ONLY_THRUST_SWAP_H
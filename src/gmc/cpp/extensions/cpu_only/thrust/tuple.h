@@ -0,0 +1,14 @@
+#ifndef GPE_CPU_ONLY_THRUST_TUPLE_H
+#define GPE_CPU_ONLY_THRUST_TUPLE_H
+
+// thrust::tuple is only used as a host/device std::tuple; CPU-only builds (GPE_CPU_ONLY) map it to the standard library.
+#include <tuple>
+
+namespace thrust {
+using std::tuple;
+using std::tie;
+using std::make_tuple;
+using std::get;
+}
+
+#endif // GPE_CPU_ONLY_THRUST_TUPLE_H
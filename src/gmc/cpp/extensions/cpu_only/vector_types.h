@@ -0,0 +1,35 @@
+#ifndef GPE_CPU_ONLY_VECTOR_TYPES_H
+#define GPE_CPU_ONLY_VECTOR_TYPES_H
+
+// Host versions of the CUDA vector types for CPU-only builds (GPE_CPU_ONLY), see cuda_runtime.h.
+
+struct dim3 {
+    unsigned x, y, z;
+    constexpr dim3(unsigned x = 1, unsigned y = 1, unsigned z = 1) : x(x), y(y), z(z) {}
+};
+
+#define GPE_CPU_ONLY_VECTOR_TYPE_2(type, name)                                                                   \
+    struct name##2 { type x, y; };                                                                             \
+    inline name##2 make_##name##2(type x, type y) { return {x, y}; }
+#define GPE_CPU_ONLY_VECTOR_TYPE_3(type, name)                                                                   \
+    struct name##3 { type x, y, z; };                                                                          \
+    inline name##3 make_##name##3(type x, type y, type z) { return {x, y, z}; }
+#define GPE_CPU_ONLY_VECTOR_TYPE_4(type, name)                                                                   \
+    struct name##4 { type x, y, z, w; };                                                                       \
+    inline name##4 make_##name##4(type x, type y, type z, type w) { return {x, y, z, w}; }
+#define GPE_CPU_ONLY_VECTOR_TYPES(type, name)                                                                    \
+    GPE_CPU_ONLY_VECTOR_TYPE_2(type, name)                                                                       \
+    GPE_CPU_ONLY_VECTOR_TYPE_3(type, name)                                                                       \
+    GPE_CPU_ONLY_VECTOR_TYPE_4(type, name)
+
+GPE_CPU_ONLY_VECTOR_TYPES(float, float)
+GPE_CPU_ONLY_VECTOR_TYPES(double, double)
+GPE_CPU_ONLY_VECTOR_TYPES(int, int)
+GPE_CPU_ONLY_VECTOR_TYPES(unsigned int, uint)
+
+#undef GPE_CPU_ONLY_VECTOR_TYPES
+#undef GPE_CPU_ONLY_VECTOR_TYPE_4
+#undef GPE_CPU_ONLY_VECTOR_TYPE_3
+#undef GPE_CPU_ONLY_VECTOR_TYPE_2
+
+#endif // GPE_CPU_ONLY_VECTOR_TYPES_H
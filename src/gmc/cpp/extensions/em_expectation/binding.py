@@ -0,0 +1,34 @@
+import typing
+
+import torch
+
+from gmc.cpp.extensions import loader
+
+cpp_binding = loader.lazy('em_expectation')
+
+
+def available() -> bool:
+    """
+    False if the extension can't be built or loaded, the caller should use the dense torch implementation then.
+    """
+    return cpp_binding.is_available()
+
+
+def expectation(points: torch.Tensor, positions: torch.Tensor, inversed_covariances: torch.Tensor, log_amplitudes: torch.Tensor,
+                noise_loglikelihood: typing.Optional[torch.Tensor] = None) -> typing.Tuple[torch.Tensor, torch.Tensor]:
+    """
+    E-step of the EM fitting in pcfitting (EMTools.expectation) in one streaming pass over the Gaussians per point. The log likelihoods are reduced
+    with an online max and normalised in place, the only memory is the output. No autograd, EM doesn't need gradients.
+
+    @param points: tensor with dimensions n_batch, n_points, n_dims
+    @param positions: tensor with dimensions n_batch, n_gaussians, n_dims
+    @param inversed_covariances: tensor with dimensions n_batch, n_gaussians, n_dims, n_dims
+    @param log_amplitudes: tensor with dimensions n_batch, n_gaussians
+    @param noise_loglikelihood: tensor with dimensions n_batch, the log likelihood of the uniform noise cluster, or None if there is none
+    @return: responsibilities with dimensions n_batch, n_points, n_gaussians (+ 1 for the noise cluster, last),
+             log likelihood of every point given the mixture with dimensions n_batch, n_points
+    """
+    if noise_loglikelihood is None:
+        noise_loglikelihood = torch.zeros(0, dtype=points.dtype, device=points.device)
+    return cpp_binding.forward(points.contiguous(), positions.contiguous(), inversed_covariances.contiguous(),
+                               log_amplitudes.contiguous(), noise_loglikelihood.contiguous())
@@ -0,0 +1,20 @@
+#include <torch/extension.h>
+#include "util/device_guard.h"
+
+#include "em_expectation/implementation.h"
+
+std::tuple<torch::Tensor, torch::Tensor> em_expectation_forward(torch::Tensor points, torch::Tensor positions, torch::Tensor inversed_covariances,
+                                                                torch::Tensor log_amplitudes, torch::Tensor noise_loglikelihood) {
+    gpe::OptionalCUDAGuard device_guard;
+    if (points.is_cuda()) {
+        assert (device_of(points).has_value());
+        device_guard.set_device(device_of(points).value());
+    }
+    return em_expectation::forward_impl(points, positions, inversed_covariances, log_amplitudes, noise_loglikelihood);
+}
+
+#ifndef GMC_CMAKE_TEST_BUILD
+PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
+  m.def("forward", &em_expectation_forward, "em_expectation_forward");
+}
+#endif
@@ -0,0 +1,136 @@
+#include "em_expectation/implementation.h"
+
+#include <limits>
+
+#include <cuda.h>
+#include <cuda_runtime.h>
+#include <torch/types.h>
+
+#include "common.h"
+#include "cuda_qt_creator_definitinos.h"
+#include "hacked_accessor.h"
+#include "parallel_start.h"
+#include "util/cuda.h"
+#include "util/glm.h"
+#include "util/scalar.h"
+
+// expectation step of the em fitting in pcfitting (EMTools.expectation). every thread handles one point and streams over the gaussians:
+// the log likelihoods log(amplitude) - 0.5 * mahalanobis distance are written into the responsibilities row, while their log-sum-exp is
+// accumulated with an online max (the running sum is rescaled whenever the max grows). a second sweep over the same row, which is still in cache,
+// normalises it. there are no n_points x n_gaussians temporaries, the only memory traffic is reading the mixture and writing the output.
+
+namespace em_expectation {
+namespace {
+
+template<typename scalar_t>
+struct LogSumExp {
+    scalar_t max = -std::numeric_limits<scalar_t>::infinity();
+    scalar_t sum = 0;
+
+    EXECUTION_DEVICES void add(scalar_t value) {
+        // nan fails both comparisons below. a degenerate gaussian must poison the point as in torch.logsumexp instead of being skipped
+        if (gpe::isnan(value)) {
+            sum = value;
+        }
+        else if (value > max) {
+            sum = sum * gpe::exp(max - value) + 1;
+            max = value;
+        }
+        else if (value > -std::numeric_limits<scalar_t>::infinity()) {
+            sum += gpe::exp(value - max);
+        }
+    }
+
+    EXECUTION_DEVICES scalar_t result() const {
+        return max + gpe::log(sum);
+    }
+};
+
+template<typename scalar_t, int N_DIMS>
+std::tuple<torch::Tensor, torch::Tensor> forward_impl_t(const torch::Tensor& points, const torch::Tensor& positions, const torch::Tensor& inversed_covariances,
+                                                        const torch::Tensor& log_amplitudes, const torch::Tensor& noise_loglikelihood) {
+    using Vec = glm::vec<N_DIMS, scalar_t>;
+    using Mat = glm::mat<N_DIMS, N_DIMS, scalar_t>;
+    const auto n_batch = unsigned(points.size(0));
+    const auto n_points = unsigned(points.size(1));
+    const auto n_gaussians = unsigned(positions.size(1));
+    const bool has_noise = noise_loglikelihood.numel() > 0;
+
+    auto responsibilities = torch::empty({points.size(0), points.size(1), positions.size(1) + has_noise}, torch::TensorOptions(points.device()).dtype(points.dtype()));
+    auto point_loglikelihoods = torch::empty({points.size(0), points.size(1)}, torch::TensorOptions(points.device()).dtype(points.dtype()));
+
+    const auto points_a = gpe::struct_accessor<Vec, 2, scalar_t>(points);
+    const auto positions_a = gpe::struct_accessor<Vec, 2, scalar_t>(positions);
+    // the inversed covariances are symmetric, the column major glm matrices don't need a transpose
+    const auto inversed_covariances_a = gpe::struct_accessor<Mat, 2, scalar_t>(inversed_covariances.view({positions.size(0), positions.size(1), N_DIMS * N_DIMS}));
+    const auto log_amplitudes_a = gpe::accessor<scalar_t, 2>(log_amplitudes);
+    const auto noise_loglikelihood_a = gpe::accessor<scalar_t, 1>(noise_loglikelihood);
+    auto responsibilities_a = gpe::accessor<scalar_t, 3>(responsibilities);
+    auto point_loglikelihoods_a = gpe::accessor<scalar_t, 2>(point_loglikelihoods);
+
+    dim3 dimBlock = dim3(128, 1, 1);
+    dim3 dimGrid = dim3((n_points + dimBlock.x - 1) / dimBlock.x, 1, n_batch);
+    gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(points), dimGrid, dimBlock, [=] __host__ __device__
+                                                  (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
+        GPE_UNUSED(gpe_gridDim)
+        const unsigned point_id = gpe_blockIdx.x * gpe_blockDim.x + gpe_threadIdx.x;
+        if (point_id >= n_points)
+            return;
+        const unsigned batch_id = gpe_blockIdx.z;
+
+        const Vec point = points_a[batch_id][point_id];
+        auto row = responsibilities_a[batch_id][point_id];
+        LogSumExp<scalar_t> log_sum_exp;
+        for (unsigned gaussian_id = 0; gaussian_id < n_gaussians; ++gaussian_id) {
+            const Vec t = point - positions_a[batch_id][gaussian_id];
+            const auto log_likelihood = log_amplitudes_a[batch_id][gaussian_id] - scalar_t(0.5) * glm::dot(t, inversed_covariances_a[batch_id][gaussian_id] * t);
+            row[gaussian_id] = log_likelihood;
+            log_sum_exp.add(log_likelihood);
+        }
+        if (has_noise) {
+            row[n_gaussians] = noise_loglikelihood_a[batch_id];
+            log_sum_exp.add(noise_loglikelihood_a[batch_id]);
+        }
+
+        const auto point_loglikelihood = log_sum_exp.result();
+        point_loglikelihoods_a[batch_id][point_id] = point_loglikelihood;
+        for (unsigned gaussian_id = 0; gaussian_id < n_gaussians + unsigned(has_noise); ++gaussian_id) {
+            row[gaussian_id] = gpe::exp(row[gaussian_id] - point_loglikelihood);
+        }
+    });
+
+    return {responsibilities, point_loglikelihoods};
+}
+
+void check_input(const torch::Tensor& points, const torch::Tensor& positions, const torch::Tensor& inversed_covariances,
+                 const torch::Tensor& log_amplitudes, const torch::Tensor& noise_loglikelihood) {
+    TORCH_CHECK(points.dim() == 3 && (points.size(2) == 2 || points.size(2) == 3), "points must have the shape [n_batch, n_points, n_dims], with 2 or 3 dimensions")
+    const auto n_batch = points.size(0);
+    const auto n_dims = points.size(2);
+    TORCH_CHECK(n_batch < 65535, "n_batch must be smaller than 65535 for CUDA")
+    TORCH_CHECK(positions.dim() == 3 && positions.size(0) == n_batch && positions.size(2) == n_dims, "positions must have the shape [n_batch, n_gaussians, n_dims]")
+    const auto n_gaussians = positions.size(1);
+    TORCH_CHECK(n_gaussians >= 1, "number of gaussians must be at least 1")
+    TORCH_CHECK(inversed_covariances.dim() == 4 && inversed_covariances.size(0) == n_batch && inversed_covariances.size(1) == n_gaussians
+                && inversed_covariances.size(2) == n_dims && inversed_covariances.size(3) == n_dims, "inversed_covariances must have the shape [n_batch, n_gaussians, n_dims, n_dims]")
+    TORCH_CHECK(log_amplitudes.dim() == 2 && log_amplitudes.size(0) == n_batch && log_amplitudes.size(1) == n_gaussians, "log_amplitudes must have the shape [n_batch, n_gaussians]")
+    TORCH_CHECK(noise_loglikelihood.dim() == 1 && (noise_loglikelihood.size(0) == 0 || noise_loglikelihood.size(0) == n_batch), "noise_loglikelihood must be empty or have the shape [n_batch]")
+    TORCH_CHECK(points.is_contiguous() && positions.is_contiguous() && inversed_covariances.is_contiguous() && log_amplitudes.is_contiguous() && noise_loglikelihood.is_contiguous(),
+                "all inputs must be contiguous")
+    for (const auto& tensor : {positions, inversed_covariances, log_amplitudes, noise_loglikelihood}) {
+        TORCH_CHECK(tensor.dtype() == points.dtype(), "all inputs must have the same dtype")
+        TORCH_CHECK(tensor.device() == points.device(), "all inputs must be on the same device")
+    }
+}
+
+} // anonymous namespace
+
+std::tuple<torch::Tensor, torch::Tensor> forward_impl(const torch::Tensor& points, const torch::Tensor& positions, const torch::Tensor& inversed_covariances,
+                                                      const torch::Tensor& log_amplitudes, const torch::Tensor& noise_loglikelihood) {
+    check_input(points, positions, inversed_covariances, log_amplitudes, noise_loglikelihood);
+    return GPE_DISPATCH_FLOATING_TYPES_AND_DIM(points.scalar_type(), points.size(2), ([&] {
+        return forward_impl_t<scalar_t, N_DIMS>(points, positions, inversed_covariances, log_amplitudes, noise_loglikelihood);
+    }));
+}
+
+} // namespace em_expectation
@@ -0,0 +1,14 @@
+#ifndef EM_EXPECTATION_IMPLEMENTATION
+#define EM_EXPECTATION_IMPLEMENTATION
+#include <tuple>
+#include <torch/script.h>
+
+namespace em_expectation {
+
+// noise_loglikelihood is empty if there is no noise cluster, otherwise it has one entry per batch and becomes the last column of the responsibilities.
+// returns the responsibilities [n_batch, n_points, n_gaussians (+ 1)] and the log likelihood of every point [n_batch, n_points].
+std::tuple<torch::Tensor, torch::Tensor> forward_impl(const torch::Tensor& points, const torch::Tensor& positions, const torch::Tensor& inversed_covariances,
+                                                      const torch::Tensor& log_amplitudes, const torch::Tensor& noise_loglikelihood);
+
+}
+#endif
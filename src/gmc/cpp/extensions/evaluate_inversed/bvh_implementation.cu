@@ -0,0 +1,227 @@
+#include "evaluate_inversed/implementations.h"
+
+#include <torch/script.h>
+
+#include <cuda.h>
+#include <cuda_runtime.h>
+
+#include "common.h"
+#include "cuda_qt_creator_definitinos.h"
+#include "hacked_accessor.h"
+#include "lbvh/bvh.h"
+#include "parallel_start.h"
+#include "util/gaussian_mixture.h"
+#include "util/grad/gaussian.h"
+#include "util/mixture.h"
+#include "util/scalar.h"
+
+// truncated support evaluation: every mixture gets a bvh over the aabbs of its components' ellipsoids at sigma_cutoff standard deviations,
+// and every query point only evaluates the components whose aabb contains it.
+
+namespace {
+using node_index_torch_t = lbvh::detail::Node::index_type_torch;
+using node_index_t = lbvh::detail::Node::index_type;
+
+// lbvh/query.h has a shared memory stack that limits the block size and the tree depth to 17.
+// karras trees over unique 64 bit morton codes are at most 64 levels deep, so we use a larger stack in local memory.
+constexpr int N_THREADS = 128;
+constexpr int STACK_SIZE = 64;
+
+template<typename scalar_t, typename Function>
+__host__ __device__ __forceinline__
+void for_each_overlapping(const lbvh::detail::Node* nodes, const lbvh::Aabb<scalar_t>* aabbs,
+                          const lbvh::vector_of_t<scalar_t>& point, const Function& fun) {
+    node_index_t stack[STACK_SIZE];
+    node_index_t* stack_ptr = stack;
+    *stack_ptr++ = 0; // root node is always 0
+
+    do {
+        const node_index_t node = *--stack_ptr;
+        const node_index_t children[2] = {nodes[node].left_idx, nodes[node].right_idx};
+        for (int i = 0; i < 2; ++i) {
+            const node_index_t child = children[i];
+            if (!lbvh::inside(point, aabbs[child]))
+                continue;
+            if (nodes[child].left_idx == node_index_t(-1)) {
+                fun(unsigned(nodes[child].object_idx));
+            }
+            else {
+                assert(stack_ptr < stack + STACK_SIZE);
+                *stack_ptr++ = child;
+            }
+        }
+    } while (stack < stack_ptr);
+}
+
+template<typename scalar_t, unsigned N_DIMS>
+std::tuple<torch::Tensor, torch::Tensor, torch::Tensor> bvh_forward_impl_t(const torch::Tensor& mixture, const torch::Tensor& xes, double sigma_cutoff) {
+    using Gaussian = gpe::Gaussian<N_DIMS, scalar_t>;
+    using Vec = typename Gaussian::pos_t;
+    using Aabb = lbvh::Aabb<scalar_t>;
+
+    auto n = gpe::check_input_and_get_ns(mixture, xes);
+    TORCH_CHECK(n.components >= 2, "the bvh needs at least 2 components")
+    TORCH_CHECK(n.components < 32768, "the bvh supports less than 32768 components (16 bit node indices)")
+    TORCH_CHECK(n.batch * n.layers < 65535, "n_batch x n_layers must be smaller than 65535 for CUDA")
+
+    lbvh::Config config;
+    config.make_aabbs = true;
+    config.aabb_sigma_cutoff = float(sigma_cutoff);
+    const lbvh::Bvh<N_DIMS, scalar_t> bvh(mixture, config);
+
+    torch::Tensor sum = torch::zeros({n.batch, n.layers, n.xes}, torch::dtype(mixture.dtype()).device(mixture.device()));
+
+    dim3 dimBlock = dim3(N_THREADS, 1, 1);
+    const dim3 dimGrid = dim3((uint(n.xes) + dimBlock.x - 1) / dimBlock.x,
+                              uint(n.layers),
+                              uint(n.batch));
+
+    auto mixture_a = gpe::struct_accessor<Gaussian, 3>(mixture);
+    auto xes_a = gpe::struct_accessor<Vec, 3>(xes);
+    auto nodes_a = gpe::struct_accessor<lbvh::detail::Node, 3, node_index_torch_t>(bvh.m_nodes);
+    auto aabbs_a = gpe::struct_accessor<Aabb, 3, scalar_t>(bvh.m_aabbs);
+    auto sum_a = gpe::accessor<scalar_t, 3>(sum);
+    gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(mixture), dimGrid, dimBlock, [=] __host__ __device__
+                                                  (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
+        GPE_UNUSED(gpe_gridDim)
+        const auto batch_index = (gpe_blockIdx.z);
+        const auto layer_index = (gpe_blockIdx.y);
+        const auto batch_xes_index = gpe::min(batch_index, unsigned(n.batch_xes - 1));
+        const auto layer_xes_index = gpe::min(layer_index, unsigned(n.layers_xes - 1));
+        const auto xes_index = (gpe_blockIdx.x * gpe_blockDim.x + gpe_threadIdx.x);
+
+        if (xes_index >= unsigned(n.xes))
+            return;
+
+        const auto& x_pos = xes_a[batch_xes_index][layer_xes_index][xes_index];
+        const auto* nodes = &nodes_a[batch_index][layer_index][0];
+        const auto* aabbs = &aabbs_a[batch_index][layer_index][0];
+
+        scalar_t value = 0;
+        for_each_overlapping(nodes, aabbs, lbvh::make_vector_of(x_pos), [&](unsigned component_index) {
+            value += gpe::evaluate_inversed(mixture_a[batch_index][layer_index][component_index], x_pos);
+        });
+        sum_a[batch_index][layer_index][xes_index] = value;
+    });
+
+    return std::make_tuple(sum, bvh.m_nodes, bvh.m_aabbs);
+}
+
+template<typename scalar_t, unsigned N_DIMS>
+std::tuple<torch::Tensor, torch::Tensor> bvh_backward_impl_t(const torch::Tensor& grad_output, const torch::Tensor& mixture, const torch::Tensor& xes,
+                                                             const torch::Tensor& bvh_nodes, const torch::Tensor& bvh_aabbs,
+                                                             bool requires_grad_mixture, bool requires_grad_xes) {
+    using Gaussian = gpe::Gaussian<N_DIMS, scalar_t>;
+    using Vec = typename Gaussian::pos_t;
+    using Aabb = lbvh::Aabb<scalar_t>;
+
+    auto n = gpe::check_input_and_get_ns(mixture, xes);
+
+    TORCH_CHECK(grad_output.dim() == 3, "grad_output has wrong number of dimensions")
+    TORCH_CHECK(grad_output.size(0) == n.batch, "grad_output has wrong batch dimension")
+    TORCH_CHECK(grad_output.size(1) == n.layers, "grad_output has wrong layer dimension")
+    TORCH_CHECK(grad_output.size(2) == n.xes, "grad_output has wrong xes dimension")
+    TORCH_CHECK(grad_output.dtype() == mixture.dtype(), "grad_output dtype does not match with mixture dtype")
+    TORCH_CHECK(bvh_nodes.size(2) == 2 * n.components - 1, "bvh_nodes do not match the mixture")
+
+    torch::Tensor grad_mixture = torch::zeros({n.batch, n.layers, n.components, mixture.size(3)}, torch::dtype(mixture.dtype()).device(mixture.device()));
+    torch::Tensor grad_xes = torch::zeros({n.batch_xes, n.layers_xes, n.xes, n.dims}, torch::dtype(mixture.dtype()).device(mixture.device()));
+
+    dim3 dimBlock = dim3(N_THREADS, 1, 1);
+    const dim3 dimGrid = dim3((uint(n.xes) + dimBlock.x - 1) / dimBlock.x,
+                              uint(n.layers),
+                              uint(n.batch));
+
+    auto mixture_a = gpe::struct_accessor<Gaussian, 3>(mixture);
+    auto xes_a = gpe::struct_accessor<Vec, 3>(xes);
+    auto nodes_a = gpe::struct_accessor<lbvh::detail::Node, 3, node_index_torch_t>(bvh_nodes);
+    auto aabbs_a = gpe::struct_accessor<Aabb, 3, scalar_t>(bvh_aabbs);
+    auto grad_mixture_a = gpe::struct_accessor<Gaussian, 3>(grad_mixture);
+    auto grad_xes_a = gpe::struct_accessor<Vec, 3>(grad_xes);
+    auto grad_output_a = gpe::accessor<scalar_t, 3>(grad_output);
+    gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(mixture), dimGrid, dimBlock, [=] __host__ __device__
+                                                  (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
+        GPE_UNUSED(gpe_gridDim)
+        const auto batch_index = (gpe_blockIdx.z);
+        const auto layer_index = (gpe_blockIdx.y);
+        const auto batch_xes_index = gpe::min(batch_index, unsigned(n.batch_xes - 1));
+        const auto layer_xes_index = gpe::min(layer_index, unsigned(n.layers_xes - 1));
+        const auto xes_index = (gpe_blockIdx.x * gpe_blockDim.x + gpe_threadIdx.x);
+
+        if (xes_index >= unsigned(n.xes))
+            return;
+
+        const auto& x_pos = xes_a[batch_xes_index][layer_xes_index][xes_index];
+        const auto incoming_grad = grad_output_a[batch_index][layer_index][xes_index];
+        const auto* nodes = &nodes_a[batch_index][layer_index][0];
+        const auto* aabbs = &aabbs_a[batch_index][layer_index][0];
+
+        Vec grad_x_pos_sum = {};
+        for_each_overlapping(nodes, aabbs, lbvh::make_vector_of(x_pos), [&](unsigned component_index) {
+            const auto& component = mixture_a[batch_index][layer_index][component_index];
+            Gaussian grad_component = {};
+            Vec grad_x_pos = {};
+            gpe::grad::evaluate_inversed(component, x_pos, &grad_component, &grad_x_pos, incoming_grad);
+            grad_x_pos_sum += grad_x_pos;
+
+            if (requires_grad_mixture) {
+                Gaussian& grad_mixture = grad_mixture_a[batch_index][layer_index][component_index];
+                gpe::atomicAdd(&grad_mixture.weight, grad_component.weight);
+                for (int i = 0; i < int(N_DIMS); ++i) {
+                    gpe::atomicAdd(&grad_mixture.position[i], grad_component.position[i]);
+                    for (int j = 0; j < int(N_DIMS); ++j)
+                        gpe::atomicAdd(&grad_mixture.covariance[i][j], grad_component.covariance[i][j]);
+                }
+            }
+        });
+
+        if (requires_grad_xes) {
+            // several mixtures (batch / layer) may share the same xes
+            for (int i = 0; i < int(N_DIMS); ++i) {
+                gpe::atomicAdd(&grad_xes_a[batch_xes_index][layer_xes_index][xes_index][i], grad_x_pos_sum[i]);
+            }
+        }
+    });
+
+    return std::make_tuple(grad_mixture, grad_xes);
+}
+
+} // anonymous namespace
+
+std::tuple<torch::Tensor, torch::Tensor, torch::Tensor> bvh_forward_impl(const torch::Tensor& mixture, const torch::Tensor& xes, double sigma_cutoff) {
+    if (gpe::n_dimensions(mixture) == 2 && mixture.scalar_type() == torch::ScalarType::Float)
+        return bvh_forward_impl_t<float, 2>(mixture, xes, sigma_cutoff);
+
+    if (gpe::n_dimensions(mixture) == 2 && mixture.scalar_type() == torch::ScalarType::Double)
+        return bvh_forward_impl_t<double, 2>(mixture, xes, sigma_cutoff);
+
+    if (gpe::n_dimensions(mixture) == 3 && mixture.scalar_type() == torch::ScalarType::Float)
+        return bvh_forward_impl_t<float, 3>(mixture, xes, sigma_cutoff);
+
+    if (gpe::n_dimensions(mixture) == 3 && mixture.scalar_type() == torch::ScalarType::Double)
+        return bvh_forward_impl_t<double, 3>(mixture, xes, sigma_cutoff);
+
+    TORCH_CHECK(false, "unsupported datatype or number of dimensions")
+
+    return {};
+}
+
+std::tuple<torch::Tensor, torch::Tensor> bvh_backward_impl(const torch::Tensor& grad_output, const torch::Tensor& mixture, const torch::Tensor& xes,
+                                                           const torch::Tensor& bvh_nodes, const torch::Tensor& bvh_aabbs,
+                                                           bool requires_grad_mixture, bool requires_grad_xes) {
+    if (gpe::n_dimensions(mixture) == 2 && mixture.scalar_type() == torch::ScalarType::Float)
+        return bvh_backward_impl_t<float, 2>(grad_output, mixture, xes, bvh_nodes, bvh_aabbs, requires_grad_mixture, requires_grad_xes);
+
+    if (gpe::n_dimensions(mixture) == 2 && mixture.scalar_type() == torch::ScalarType::Double)
+        return bvh_backward_impl_t<double, 2>(grad_output, mixture, xes, bvh_nodes, bvh_aabbs, requires_grad_mixture, requires_grad_xes);
+
+    if (gpe::n_dimensions(mixture) == 3 && mixture.scalar_type() == torch::ScalarType::Float)
+        return bvh_backward_impl_t<float, 3>(grad_output, mixture, xes, bvh_nodes, bvh_aabbs, requires_grad_mixture, requires_grad_xes);
+
+    if (gpe::n_dimensions(mixture) == 3 && mixture.scalar_type() == torch::ScalarType::Double)
+        return bvh_backward_impl_t<double, 3>(grad_output, mixture, xes, bvh_nodes, bvh_aabbs, requires_grad_mixture, requires_grad_xes);
+
+    TORCH_CHECK(false, "unsupported datatype or number of dimensions")
+
+    return {};
+}
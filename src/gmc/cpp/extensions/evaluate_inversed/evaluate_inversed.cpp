@@ -3,18 +3,26 @@
 #include <cassert>
 
 #include <torch/extension.h>
-#include <c10/cuda/CUDAGuard.h>
+#include "util/device_guard.h"
+#include "util/mixture.h"
 
 #include "implementations.h"
 
 namespace evaluate_inversed {
 std::tuple<at::Tensor> parallel_forward(const torch::Tensor& mixture, const torch::Tensor& xes) {
 //    auto guard = gpe::make_device_guard(mixture);
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (mixture.is_cuda()) {
         assert (device_of(mixture).has_value());
         device_guard.set_device(device_of(mixture).value());
+    }
+    // records that can't be reinterpreted as Gaussian structs are read value by value
+    if (mixture.scalar_type() == torch::ScalarType::Half || mixture.scalar_type() == torch::ScalarType::BFloat16 || gpe::is_packed(mixture))
+        return {parallel_forward_reduced_precision_impl(mixture, xes)};
+    if (mixture.is_cuda()) {
+#ifndef GPE_CPU_ONLY
         return parallel_forward_optimised_impl(mixture, xes);
+#endif
     }
     return {parallel_forward_impl(mixture, xes)};
 }
@@ -24,13 +32,43 @@ std::tuple<torch::Tensor, torch::Tensor> parallel_backward(const torch::Tensor&
                                                            const torch::Tensor& xes,
                                                            const std::tuple<torch::Tensor>&,
                                                            bool requires_grad_mixture, bool requires_grad_xes) {
-    at::cuda::OptionalCUDAGuard device_guard;
+    if (gpe::is_packed(mixture)) {
+        // the backward kernels read Gaussian structs. they run on a full layout copy, the gradient is packed again.
+        auto [grad_mixture, grad_xes] = parallel_backward(grad_output, gpe::unpacked(mixture), xes, {}, requires_grad_mixture, requires_grad_xes);
+        return {gpe::packed_gradient(grad_mixture), grad_xes};
+    }
+    gpe::OptionalCUDAGuard device_guard;
     if (mixture.is_cuda()) {
         assert (device_of(mixture).has_value());
         device_guard.set_device(device_of(mixture).value());
+#ifndef GPE_CPU_ONLY
         return parallel_backward_optimised_impl(grad_output, mixture, xes, requires_grad_mixture, requires_grad_xes);
+#endif
     }
     return parallel_backward_impl(grad_output, mixture, xes, requires_grad_mixture, requires_grad_xes);
 }
 
+std::tuple<torch::Tensor, torch::Tensor, torch::Tensor> bvh_forward(const torch::Tensor& mixture, const torch::Tensor& xes, double sigma_cutoff) {
+    gpe::OptionalCUDAGuard device_guard;
+    if (mixture.is_cuda()) {
+        assert (device_of(mixture).has_value());
+        device_guard.set_device(device_of(mixture).value());
+    }
+    return bvh_forward_impl(mixture, xes, sigma_cutoff);
+}
+
+std::tuple<torch::Tensor, torch::Tensor> bvh_backward(const torch::Tensor& grad_output,
+                                                      const torch::Tensor& mixture,
+                                                      const torch::Tensor& xes,
+                                                      const torch::Tensor& bvh_nodes,
+                                                      const torch::Tensor& bvh_aabbs,
+                                                      bool requires_grad_mixture, bool requires_grad_xes) {
+    gpe::OptionalCUDAGuard device_guard;
+    if (mixture.is_cuda()) {
+        assert (device_of(mixture).has_value());
+        device_guard.set_device(device_of(mixture).value());
+    }
+    return bvh_backward_impl(grad_output, mixture, xes, bvh_nodes, bvh_aabbs, requires_grad_mixture, requires_grad_xes);
+}
+
 }
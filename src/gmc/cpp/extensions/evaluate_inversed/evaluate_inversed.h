@@ -11,6 +11,11 @@ std::tuple<torch::Tensor, torch::Tensor> parallel_backward(const torch::Tensor&
                                                            const std::tuple<torch::Tensor>& forward_out,
                                                            bool requires_grad_mixture, bool requires_grad_xes);
 
+std::tuple<torch::Tensor, torch::Tensor, torch::Tensor> bvh_forward(const torch::Tensor& mixture, const torch::Tensor& xes, double sigma_cutoff);
+std::tuple<torch::Tensor, torch::Tensor> bvh_backward(const torch::Tensor& grad_output, const torch::Tensor& mixture, const torch::Tensor& xes,
+                                                      const torch::Tensor& bvh_nodes, const torch::Tensor& bvh_aabbs,
+                                                      bool requires_grad_mixture, bool requires_grad_xes);
+
 }
 
 #endif // GPE_EVALUATE_INVERSED_H
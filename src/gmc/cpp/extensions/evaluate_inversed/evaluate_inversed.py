@@ -1,31 +1,28 @@
-from torch.utils.cpp_extension import load
-import os
 import torch.autograd
-from gmc.cpp.extensions.compile_flags import *
-
-source_dir = os.path.dirname(__file__)
-# print(source_dir)
-
-bindings = load('evaluate_inversed',
-                [source_dir + '/evaluate_inversed_bindings.cpp',
-                 source_dir + '/parallel_implementation.cu',
-                 source_dir + '/parallel_implementation_optimised_backward.cu',
-                 source_dir + '/parallel_implementation_optimised_forward.cu',
-                 source_dir + '/../CpuSynchronisationPoint.cpp'],
-                extra_include_paths=extra_include_paths, verbose=True, extra_cflags=cuda_extra_cflags, extra_cuda_cflags=cuda_extra_cuda_cflags, extra_ldflags=["-lpthread"])
+from gmc.cpp.extensions import loader
 
+bindings = loader.lazy('evaluate_inversed')
 
 class EvaluateInversed(torch.autograd.Function):
+    """
+    Half and bfloat16 mixtures are read as they are and widened per value in the kernel, the sum is accumulated and returned in float32.
+    Their backward runs in float32, the gradients are returned in the dtypes of the inputs.
+    Mixtures with packed covariances are read directly, their backward runs on a full layout copy and returns the gradient in the packed layout.
+    """
     @staticmethod
     def forward(ctx, mixture: torch.Tensor, xes: torch.Tensor):
         if not mixture.is_contiguous():
             mixture = mixture.contiguous()
 
+        xes_dtype = xes.dtype
+        if mixture.dtype in loader.reduced_precision_dtypes:
+            xes = xes.float()
         if not xes.is_contiguous():
             xes = xes.contiguous()
 
         output = bindings.parallel_forward(mixture, xes)
         ctx.save_for_backward(mixture, xes, *output)
+        ctx.xes_dtype = xes_dtype
 
         return output[0]
 
@@ -35,9 +32,50 @@ class EvaluateInversed(torch.autograd.Function):
             grad_output = grad_output.contiguous()
 
         mixture, xes, *output = ctx.saved_tensors
+        mixture_dtype = mixture.dtype
+        if mixture_dtype in loader.reduced_precision_dtypes:
+            mixture = mixture.float()
+            grad_output = grad_output.float()
         grad_mixture, grad_xes = bindings.parallel_backward(grad_output, mixture, xes, output, ctx.needs_input_grad[0], ctx.needs_input_grad[1])
 
-        return grad_mixture, grad_xes
+        return grad_mixture.to(mixture_dtype), grad_xes.to(ctx.xes_dtype)
 
 
 apply = EvaluateInversed.apply
+
+
+class EvaluateInversedTruncated(torch.autograd.Function):
+    """
+    Only evaluates components whose ellipsoid at sigma_cutoff standard deviations (its bounding box, to be precise) contains the point.
+    Uses one bvh per mixture. The bvh is built in forward and reused in backward.
+    """
+    @staticmethod
+    def forward(ctx, mixture: torch.Tensor, xes: torch.Tensor, sigma_cutoff: float):
+        # the bvh is built in float32 for half and bfloat16 mixtures
+        ctx.dtypes = (mixture.dtype, xes.dtype)
+        if mixture.dtype in loader.reduced_precision_dtypes:
+            mixture = mixture.float()
+            xes = xes.float()
+        if not mixture.is_contiguous():
+            mixture = mixture.contiguous()
+
+        if not xes.is_contiguous():
+            xes = xes.contiguous()
+
+        output, bvh_nodes, bvh_aabbs = bindings.bvh_forward(mixture, xes, sigma_cutoff)
+        ctx.save_for_backward(mixture, xes, bvh_nodes, bvh_aabbs)
+
+        return output
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        if not grad_output.is_contiguous():
+            grad_output = grad_output.contiguous()
+
+        mixture, xes, bvh_nodes, bvh_aabbs = ctx.saved_tensors
+        grad_mixture, grad_xes = bindings.bvh_backward(grad_output.to(mixture.dtype), mixture, xes, bvh_nodes, bvh_aabbs, ctx.needs_input_grad[0], ctx.needs_input_grad[1])
+
+        return grad_mixture.to(ctx.dtypes[0]), grad_xes.to(ctx.dtypes[1]), None
+
+
+apply_truncated = EvaluateInversedTruncated.apply
@@ -3,4 +3,6 @@
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
     m.def("parallel_forward", &evaluate_inversed::parallel_forward, "evaluate_inversed parallel forward (CPU and CUDA optimised))");
     m.def("parallel_backward", &evaluate_inversed::parallel_backward, "evaluate_inversed parallel backward (CPU and CUDA optimised)");
+    m.def("bvh_forward", &evaluate_inversed::bvh_forward, "evaluate_inversed truncated at sigma_cutoff using a bvh (CPU and CUDA)");
+    m.def("bvh_backward", &evaluate_inversed::bvh_backward, "evaluate_inversed truncated at sigma_cutoff using a bvh, backward (CPU and CUDA)");
 }
@@ -19,5 +19,17 @@ std::tuple<torch::Tensor, torch::Tensor> parallel_backward_optimised_impl(const
                                                                           const torch::Tensor& xes,
                                                                           bool requires_grad_mixture, bool requires_grad_xes);
 
+// mixture in half or bfloat16 (storage), xes and the result in float (computation and accumulation). CPU and CUDA.
+// also reads float and double mixtures with packed covariances (gpe::is_packed), xes and the result have their dtype then.
+at::Tensor parallel_forward_reduced_precision_impl(const torch::Tensor& mixture, const torch::Tensor& xes);
+
+std::tuple<torch::Tensor, torch::Tensor, torch::Tensor> bvh_forward_impl(const torch::Tensor& mixture, const torch::Tensor& xes, double sigma_cutoff);
+
+std::tuple<torch::Tensor, torch::Tensor> bvh_backward_impl(const torch::Tensor& grad_output,
+                                                           const torch::Tensor& mixture,
+                                                           const torch::Tensor& xes,
+                                                           const torch::Tensor& bvh_nodes,
+                                                           const torch::Tensor& bvh_aabbs,
+                                                           bool requires_grad_mixture, bool requires_grad_xes);
 
 #endif // EVALUATE_INVERSED_PARALLEL_IMPLEMENTATION_H
@@ -0,0 +1,90 @@
+#include "evaluate_inversed/implementations.h"
+
+#include <torch/script.h>
+
+#include <cuda.h>
+#include <cuda_runtime.h>
+
+#include "common.h"
+#include "cuda_qt_creator_definitinos.h"
+#include "hacked_accessor.h"
+#include "parallel_start.h"
+#include "util/scalar.h"
+#include "util/gaussian.h"
+#include "util/mixture.h"
+
+namespace {
+
+template <typename storage_t, typename scalar_t, int DIMS, bool PACKED>
+__host__ __device__
+void forward(const dim3& gpe_gridDim, const dim3& gpe_blockDim,
+             const dim3& gpe_blockIdx, const dim3& gpe_threadIdx,
+             const gpe::PackedTensorAccessor32<storage_t, 4> mixture_a,
+             const gpe::PackedTensorAccessor32<scalar_t, 4> xes_a,
+             gpe::PackedTensorAccessor32<scalar_t, 3> sum_a,
+             const gpe::MixtureAndXesNs n) {
+    GPE_UNUSED(gpe_gridDim)
+    const auto batch_index = int(gpe_blockIdx.z);
+    const auto layer_index = int(gpe_blockIdx.y);
+    const auto batch_xes_index = gpe::min(batch_index, n.batch_xes - 1);
+    const auto layer_xes_index = gpe::min(layer_index, n.layers_xes - 1);
+    const auto xes_index = int(gpe_blockIdx.x * gpe_blockDim.x + gpe_threadIdx.x);
+
+    if (xes_index >= n.xes)
+        return;
+
+    const auto& x_pos = gpe::vec<DIMS>(xes_a[batch_xes_index][layer_xes_index][xes_index][0]);
+
+    scalar_t sum = 0;
+    for (int component_index = 0; component_index < n.components; ++component_index) {
+        // the records can't be reinterpreted as glm types, every value is widened to scalar_t on load
+        const auto record = mixture_a[batch_index][layer_index][component_index];
+        if constexpr (PACKED) {
+            sum += gpe::evaluate_inversed(gpe::load_packed_gaussian<DIMS, scalar_t>(record), x_pos);
+        }
+        else {
+            sum += gpe::evaluate_inversed(gpe::load_gaussian<DIMS, scalar_t>(record), x_pos);
+        }
+    }
+    sum_a[batch_index][layer_index][xes_index] = sum;
+}
+
+} // anonymous namespace
+
+at::Tensor parallel_forward_reduced_precision_impl(const torch::Tensor& mixture, const torch::Tensor& xes) {
+    using namespace torch::indexing;
+    auto n = gpe::check_input_and_get_ns(mixture, xes, false, true);
+    const auto packed = gpe::is_packed(mixture);
+
+    TORCH_CHECK(mixture.device() == xes.device(), "mixture and xes must be on the same device")
+    TORCH_CHECK(n.batch * n.layers < 65535, "n_batch x n_layers must be smaller than 65535 for CUDA")
+
+    dim3 dimBlock = dim3(128, 1, 1);
+    const dim3 dimGrid = dim3((uint(n.xes) + dimBlock.x - 1) / dimBlock.x,
+                              uint(n.layers),
+                              uint(n.batch));
+
+    return GPE_DISPATCH_STORAGE_TYPES_AND_DIM(mixture.scalar_type(), n.dims, ([&] {
+        TORCH_CHECK(xes.scalar_type() == c10::CppTypeToScalarType<scalar_t>::value, "xes must have the dtype of the mixture, or float for half and bfloat16 mixtures")
+        torch::Tensor sum = torch::zeros({n.batch, n.layers, n.xes}, torch::dtype(xes.dtype()).device(mixture.device()));
+        auto sum_a = gpe::accessor<scalar_t, 3, scalar_t>(sum);
+        const auto mixture_a = gpe::accessor<storage_t, 4, storage_t>(mixture);
+        const auto xes_a = gpe::accessor<scalar_t, 4, scalar_t>(xes);
+
+        if (packed) {
+            auto fun = [mixture_a, xes_a, sum_a, n] __host__ __device__
+                (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) {
+                    forward<storage_t, scalar_t, N_DIMS, true>(gpe_gridDim, gpe_blockDim, gpe_blockIdx, gpe_threadIdx, mixture_a, xes_a, sum_a, n);
+                };
+            gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(mixture), dimGrid, dimBlock, fun);
+        }
+        else {
+            auto fun = [mixture_a, xes_a, sum_a, n] __host__ __device__
+                (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) {
+                    forward<storage_t, scalar_t, N_DIMS, false>(gpe_gridDim, gpe_blockDim, gpe_blockIdx, gpe_threadIdx, mixture_a, xes_a, sum_a, n);
+                };
+            gpe::start_parallel<gpe::ComputeDevice::Both>(gpe::device(mixture), dimGrid, dimBlock, fun);
+        }
+        return sum;
+    }));
+}
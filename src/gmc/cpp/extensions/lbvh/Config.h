@@ -7,6 +7,8 @@ struct Config {
     enum class MortonCodeAlgorithm{Old, Cov1_12p36pc16i, Cov2_54pc10i, Cov3_27p27c10i, Cov4_27c27p10i} morton_code_algorithm = MortonCodeAlgorithm::Old;
     bool make_aabbs = true;
     float aabb_threshold = float(0.001);
+    // if > 0, the aabbs bound the ellipsoid at this mahalanobis distance (in standard deviations) instead of using the weight dependent aabb_threshold
+    float aabb_sigma_cutoff = float(0);
 };
 
 }
@@ -164,6 +164,7 @@ const glm::vec<3, scalar_t> colwise_length(const glm::mat<3, 3, scalar_t>& mat)
 template<int N_DIMS, typename scalar_t>
 at::Tensor Bvh<N_DIMS, scalar_t>::compute_aabbs() {
     const scalar_t threshold = scalar_t(m_config.aabb_threshold);
+    const scalar_t sigma_cutoff = scalar_t(m_config.aabb_sigma_cutoff);
 
     auto aabbs = torch::zeros({m_n.batch, m_n.layers, m_n.components, 8}, torch::TensorOptions(m_mixture.device()).dtype(detail::TorchTypeMapper<scalar_t>::id()));
     auto aabbs_view = aabbs.view({-1, 8});
@@ -175,7 +176,7 @@ at::Tensor Bvh<N_DIMS, scalar_t>::compute_aabbs() {
 
     dim3 dimBlock = dim3(1024, 1, 1);
     dim3 dimGrid = dim3(unsigned(n_gaussians + dimBlock.x - 1) / dimBlock.x, 1, 1);
-    auto fun = [aabbs_a, gaussians_a, n_gaussians, threshold] __host__ __device__
+    auto fun = [aabbs_a, gaussians_a, n_gaussians, threshold, sigma_cutoff] __host__ __device__
             (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
         GPE_UNUSED(gpe_gridDim)
                 using Vec = glm::vec<N_DIMS, scalar_t>;
@@ -198,26 +199,37 @@ at::Tensor Bvh<N_DIMS, scalar_t>::compute_aabbs() {
                 // TODO: when it works, we can probably remove one of the sqrt and sqrt after they are mul together
                 factor = gpe::sqrt(factor);
 
-                Vec eigenvalues;
-                Mat eigenvectors;
-                // torch inverse is slow, do it with glm
-                thrust::tie(eigenvalues, eigenvectors) = gpe::detail::compute_symeig(glm::inverse(gaussian.covariance));
+                Vec delta;
+                if (sigma_cutoff > 0) {
+                    // truncated evaluation (gm.evaluate_inversed_truncated) needs the exact box of the ellipsoid x^T C^-1 x <= sigma_cutoff^2,
+                    // its half extents are sigma_cutoff * sqrt(diag(C)), see https://members.loria.fr/SHornus/ellipsoid-bbox.html
+                    const Mat covariance = glm::inverse(gaussian.covariance);
+                    for (int i = 0; i < N_DIMS; ++i)
+                        delta[i] = sigma_cutoff * gpe::sqrt(covariance[i][i]);
+                }
+                else {
+                    // the boxes of the fitting (bvh_mhem_fit) are unchanged
+                    Vec eigenvalues;
+                    Mat eigenvectors;
+                    // torch inverse is slow, do it with glm
+                    thrust::tie(eigenvalues, eigenvectors) = gpe::detail::compute_symeig(glm::inverse(gaussian.covariance));
 
-                //    printf("g%d: eigenvalues=%f/%f\n", gaussian_id, eigenvalues[0], eigenvalues[1]);
-                //    printf("g%d: eigenvectors=\n%f/%f\n%f/%f\n", gaussian_id, eigenvectors[0][0], eigenvectors[0][1], eigenvectors[1][0], eigenvectors[1][1]);
+                    //    printf("g%d: eigenvalues=%f/%f\n", gaussian_id, eigenvalues[0], eigenvalues[1]);
+                    //    printf("g%d: eigenvectors=\n%f/%f\n%f/%f\n", gaussian_id, eigenvectors[0][0], eigenvectors[0][1], eigenvectors[1][0], eigenvectors[1][1]);
 
-                eigenvalues = glm::sqrt(eigenvalues);
-                eigenvectors = mul_eigenvecs_with_eigenvals(eigenvectors, eigenvalues);
+                    eigenvalues = glm::sqrt(eigenvalues);
+                    eigenvectors = mul_eigenvecs_with_eigenvals(eigenvectors, eigenvalues);
 
-                auto ellipsoidM = factor * eigenvectors;
-                //    printf("g%d: ellipsoidM=\n%f/%f\n%f/%f\n", gaussian_id, ellipsoidM[0][0], ellipsoidM[0][1], ellipsoidM[1][0], ellipsoidM[1][1]);
+                    auto ellipsoidM = factor * eigenvectors;
+                    //    printf("g%d: ellipsoidM=\n%f/%f\n%f/%f\n", gaussian_id, ellipsoidM[0][0], ellipsoidM[0][1], ellipsoidM[1][0], ellipsoidM[1][1]);
 
-                // https://stackoverflow.com/a/24112864/4032670
-                // https://members.loria.fr/SHornus/ellipsoid-bbox.html
-                // we take the norm over the eigenvectors, that is analogous to simon fraiss' code in gmvis/core/Gaussian.cpp
+                    // https://stackoverflow.com/a/24112864/4032670
+                    // https://members.loria.fr/SHornus/ellipsoid-bbox.html
+                    // we take the norm over the eigenvectors, that is analogous to simon fraiss' code in gmvis/core/Gaussian.cpp
 
-                ellipsoidM = glm::transpose(ellipsoidM);
-                auto delta = colwise_length(ellipsoidM);
+                    ellipsoidM = glm::transpose(ellipsoidM);
+                    delta = colwise_length(ellipsoidM);
+                }
 
                 auto upper = gaussian.position + delta;
                 auto lower = gaussian.position - delta;
@@ -0,0 +1,273 @@
+import functools
+import hashlib
+import importlib.machinery
+import importlib.util
+import os
+import tempfile
+import typing
+import warnings
+
+import torch
+from torch.utils.cpp_extension import load as torch_load
+
+from gmc.cpp.extensions.compile_flags import *
+
+# compiled extensions are stored in a versioned cache, keyed on a hash of the sources and the build flags.
+# a warm cache is imported directly, without running the compiler or ninja. set GMC_EXTENSIONS_CACHE to share the cache between nodes.
+# setup.py in the src directory builds the same extensions ahead of time into gmc/cpp/extensions/prebuilt.
+cache_version = 1
+cache_root = os.environ.get("GMC_EXTENSIONS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "gmc_extensions"))
+prebuilt_dir = source_dir + "/prebuilt"
+
+# half and bfloat16 are storage formats for the extensions. evaluate_inversed reads them directly, the others widen them to float32 at the binding.
+reduced_precision_dtypes = (torch.float16, torch.bfloat16)
+
+
+def widened(tensor: torch.Tensor) -> torch.Tensor:
+    # float32 copy for kernels that have no half / bfloat16 path. prefer widening on load inside the kernel (gpe::load_gaussian).
+    return tensor.float() if tensor.dtype in reduced_precision_dtypes else tensor
+
+
+def _template_instances(extension_dir: str, reduction_ns: typing.Sequence[int]) -> typing.List[str]:
+    files = []
+    for dtype in ['float', 'double']:
+        for reduction_n in reduction_ns:
+            for ndims in [2, 3]:
+                for direction in ['forward', 'backward']:
+                    files.append(f"{source_dir}/{extension_dir}/implementation_{direction}_instances/template_instance_implementation_{direction}_{reduction_n}_{dtype}_{ndims}.cu")
+    return files
+
+
+# name -> (source files, cuda only source files)
+extensions = {
+    'evaluate_inversed': ([source_dir + '/evaluate_inversed/evaluate_inversed_bindings.cpp',
+                           source_dir + '/evaluate_inversed/parallel_implementation.cu',
+                           source_dir + '/evaluate_inversed/reduced_precision_implementation.cu',
+                           source_dir + '/evaluate_inversed/bvh_implementation.cu',
+                           source_dir + '/lbvh/bvh.cu',
+                           source_dir + '/CpuSynchronisationPoint.cpp'],
+                          [source_dir + '/evaluate_inversed/parallel_implementation_optimised_backward.cu',
+                           source_dir + '/evaluate_inversed/parallel_implementation_optimised_forward.cu']),
+    'convolution': ([source_dir + '/convolution/bindings.cpp', source_dir + '/convolution/implementation_dispatch.cpp',
+                     source_dir + '/convolution/reduced_precision_implementation.cu', source_dir + '/CpuSynchronisationPoint.cpp']
+                    + _template_instances('convolution', [1]),
+                    []),
+    'convolution_relu': ([source_dir + '/convolution_relu/bindings.cpp', source_dir + '/convolution_relu/implementation.cu', source_dir + '/CpuSynchronisationPoint.cpp'],
+                         []),
+    'convolution_fitting': ([source_dir + '/convolution_fitting/bindings.cpp', source_dir + '/convolution_fitting/implementation_dispatch.cpp',
+                             source_dir + '/convolution_fitting/Tree.cu', source_dir + '/CpuSynchronisationPoint.cpp']
+                            + _template_instances('convolution_fitting', [1]),
+                            []),
+    'bvh_mhem_fit': ([source_dir + '/bvh_mhem_fit/bindings.cpp', source_dir + '/bvh_mhem_fit/implementation_dispatch.cpp', source_dir + '/lbvh/bvh.cu',
+                      source_dir + '/CpuSynchronisationPoint.cpp', source_dir + '/pieces/pieces.cpp', source_dir + '/pieces/matrix_inverse.cu', source_dir + '/pieces/symeig.cu']
+                     + _template_instances('bvh_mhem_fit', [2, 4, 8, 16]),
+                     []),
+    'em_expectation': ([source_dir + '/em_expectation/bindings.cpp', source_dir + '/em_expectation/implementation.cu', source_dir + '/CpuSynchronisationPoint.cpp'],
+                       []),
+    'pieces_bindings': ([source_dir + '/pieces/pieces_bindings.cpp', source_dir + '/pieces/matrix_inverse.cu', source_dir + '/pieces/pieces.cpp',
+                         source_dir + '/pieces/symeig.cu', source_dir + '/CpuSynchronisationPoint.cpp'],
+                        []),
+}
+
+
+def _cpu_only_sources(name: str, source_files: typing.List[str]) -> typing.List[str]:
+    # torch decides by file ending whether nvcc is used. we compile the .cu files through generated .cpp wrappers instead.
+    wrapper_dir = os.path.join(tempfile.gettempdir(), "gmc_cpu_only_sources", name)
+    os.makedirs(wrapper_dir, exist_ok=True)
+
+    result = []
+    for source_file in source_files:
+        if not source_file.endswith(".cu"):
+            result.append(source_file)
+            continue
+        wrapper_file = os.path.join(wrapper_dir, os.path.basename(source_file)[:-len(".cu")] + ".cpp")
+        wrapper_content = f'#include "{os.path.abspath(source_file)}"\n'
+        # only write on change, otherwise ninja would rebuild everything due to the new time stamp
+        if not os.path.exists(wrapper_file) or open(wrapper_file).read() != wrapper_content:
+            with open(wrapper_file, "w") as file:
+                file.write(wrapper_content)
+        result.append(wrapper_file)
+    return result
+
+
+def jit_cpu_only() -> bool:
+    """
+    Mode of JIT builds: the CUDA code paths are only compiled if a CUDA toolkit is installed and pytorch sees a GPU (or GPE_CPU_ONLY=1 is set).
+    """
+    return cpu_only_forced or not cuda_toolkit_available or not torch.cuda.is_available()
+
+
+def _module_name(name: str, cpu_only: bool) -> str:
+    return name + "_cpu_only" if cpu_only else name
+
+
+def build_configuration(name: str, cpu_only: typing.Optional[bool] = None, portable_flags: bool = False) -> typing.Dict[str, typing.Any]:
+    """
+    Returns the module name, sources and flags used for building the extension in CUDA or CPU only mode (default: the JIT mode, see jit_cpu_only).
+    portable_flags drops the flags that tie the binary to the CPU of the build machine, for the prebuilt binaries of setup.py.
+    """
+    if cpu_only is None:
+        cpu_only = jit_cpu_only()
+    flags = portable if portable_flags else list
+    source_files, cuda_only_source_files = extensions[name]
+    if cpu_only:
+        return dict(name=_module_name(name, cpu_only), sources=_cpu_only_sources(name, source_files),
+                    extra_include_paths=[cpu_only_include_path] + extra_include_paths,
+                    extra_cflags=flags(cpu_only_extra_cflags), extra_cuda_cflags=[], extra_ldflags=cpu_only_extra_ldflags)
+
+    return dict(name=_module_name(name, cpu_only), sources=source_files + cuda_only_source_files,
+                extra_include_paths=extra_include_paths,
+                extra_cflags=flags(cuda_extra_cflags), extra_cuda_cflags=cuda_extra_cuda_cflags, extra_ldflags=["-lpthread"])
+
+
+def sources_available(name: str) -> bool:
+    """
+    False if only the binaries are installed (e.g. from a wheel), the extension can't be rebuilt then.
+    """
+    source_files, cuda_only_source_files = extensions[name]
+    return all(os.path.exists(f) for f in source_files)
+
+
+def _environment_key(name: str, cpu_only: typing.Optional[bool], portable_flags: bool) -> str:
+    # everything that goes into the binary except the sources: module name, flags and the torch version
+    configuration = build_configuration(name, cpu_only, portable_flags)
+    sha = hashlib.sha256()
+    for part in [str(cache_version), configuration["name"], torch.__version__, str(torch.version.cuda),
+                 *configuration["extra_cflags"], *configuration["extra_cuda_cflags"], *configuration["extra_ldflags"]]:
+        sha.update(part.encode())
+        sha.update(b"\0")
+    return sha.hexdigest()[:24]
+
+
+@functools.lru_cache(maxsize=None)
+def _sources_key() -> str:
+    # headers are included transitively, so we hash the whole extension source tree.
+    # external header only libraries (glm etc.) are not part of the key, delete the cache when updating them.
+    # hashed once per process, sources that are edited while it runs are only picked up after a restart.
+    sha = hashlib.sha256()
+    for directory, sub_directories, files in sorted(os.walk(source_dir)):
+        sub_directories.sort()
+        if os.path.abspath(directory).startswith(os.path.abspath(prebuilt_dir)):
+            continue
+        for file in sorted(files):
+            if os.path.splitext(file)[1] in (".h", ".cuh", ".cpp", ".cu"):
+                path = os.path.join(directory, file)
+                sha.update(os.path.relpath(path, source_dir).encode())
+                with open(path, "rb") as f:
+                    sha.update(f.read())
+    return sha.hexdigest()[:24]
+
+
+def build_key(name: str, cpu_only: typing.Optional[bool] = None, portable_flags: bool = False) -> str:
+    """
+    Hash of everything that goes into the binary: sources, headers, flags and the torch version, as "{environment hash}-{sources hash}".
+    Without installed sources, the sources hash is empty and only the environment hash of a stored key is compared (see key_matches).
+    cpu_only and portable_flags select the configuration, as in build_configuration.
+    """
+    if not sources_available(name):
+        return _environment_key(name, cpu_only, portable_flags) + "-"
+    return _environment_key(name, cpu_only, portable_flags) + "-" + _sources_key()
+
+
+def key_matches(stored_key: str, key: str) -> bool:
+    """
+    Compares the key stored next to a binary with the current build_key. The sources part is skipped if the current key has none,
+    i.e. a wheel without sources trusts the key written at build time, as long as the torch version and the flags are the same.
+    """
+    environment, _, sources = key.partition("-")
+    stored_environment, _, stored_sources = stored_key.strip().partition("-")
+    return stored_environment == environment and (sources == "" or stored_sources == sources)
+
+
+def _import_binary(module_name: str, directory: str, key: str):
+    key_file = os.path.join(directory, module_name + ".key")
+    if not os.path.exists(key_file) or not key_matches(open(key_file).read(), key):
+        return None
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        path = os.path.join(directory, module_name + suffix)
+        if os.path.exists(path):
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module
+    return None
+
+
+def load(name: str):
+    """
+    Loads an extension from the prebuilt directory or the cache if the build key matches, otherwise JIT compiles it into the cache.
+    A prebuilt CUDA binary is preferred over a prebuilt CPU only one, it runs without a CUDA toolkit and also handles CPU tensors.
+    """
+    prebuilt_modes = [True] if cpu_only_forced else [False, True]
+    for cpu_only in prebuilt_modes:
+        module = _import_binary(_module_name(name, cpu_only), prebuilt_dir, build_key(name, cpu_only, portable_flags=True))
+        if module is not None:
+            return module
+
+    if not sources_available(name):
+        raise RuntimeError(f"the prebuilt extension {name} is missing or was built for a different torch version or flags, "
+                           f"and its sources are not installed. rebuild the package (see src/setup.py) for torch {torch.__version__}.")
+
+    configuration = build_configuration(name)
+    module_name = configuration["name"]
+    key = build_key(name)
+    build_directory = os.path.join(cache_root, module_name, key)
+    module = _import_binary(module_name, build_directory, key)
+    if module is not None:
+        return module
+
+    os.makedirs(build_directory, exist_ok=True)
+    module = torch_load(**configuration, build_directory=build_directory, verbose=True)
+    # torch names the module {name}_v{n} if the same extension was already built with different sources in this process. don't cache those.
+    if module.__name__ == module_name:
+        with open(os.path.join(build_directory, module_name + ".key"), "w") as file:
+            file.write(key)
+    return module
+
+
+class LazyExtension:
+    """
+    Stands in for an extension module and loads it on first attribute access, e.g. the first kernel call.
+    Importing the python bindings is therefore cheap, compilation or loading of the binary only happens when a kernel is used.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.module = None
+        self.error: typing.Optional[Exception] = None
+
+    def is_loaded(self) -> bool:
+        return self.module is not None
+
+    def is_available(self) -> bool:
+        """
+        Loads the extension if that wasn't tried yet. False if it can't be loaded (no compiler or CUDA toolkit, build error, no matching prebuilt binary),
+        for callers that have a fallback. The failure is remembered, loading is not retried.
+        """
+        if self.module is None and self.error is None:
+            try:
+                self.module = load(self.name)
+            except (RuntimeError, ImportError, OSError) as e:
+                self.error = e
+                warnings.warn(f"the extension {self.name} can't be loaded: {e}")
+        return self.module is not None
+
+    def __getattr__(self, attribute: str):
+        # only called for attributes not found on the instance, i.e. the functions of the extension
+        if attribute.startswith("__"):
+            raise AttributeError(attribute)
+        if self.module is None:
+            self.module = load(self.name)
+        return getattr(self.module, attribute)
+
+
+lazy_extensions: typing.Dict[str, LazyExtension] = {}
+
+
+def lazy(name: str) -> LazyExtension:
+    """
+    Returns the (shared) lazy handle of an extension. Nothing is built or loaded until a function of it is accessed.
+    """
+    assert name in extensions
+    if name not in lazy_extensions:
+        lazy_extensions[name] = LazyExtension(name)
+    return lazy_extensions[name]
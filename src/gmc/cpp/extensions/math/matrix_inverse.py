@@ -6,9 +6,18 @@ from gmc.cpp.extensions.compile_flags import *
 source_dir = os.path.dirname(__file__)
 # print(source_dir)
 
-cuda = load('matrix_inverse_cuda', [source_dir + '/matrix_inverse_cuda.cpp', source_dir + '/matrix_inverse_cuda.cu'],
-            extra_include_paths=extra_include_paths,
-            verbose=True, extra_cflags=cuda_extra_cflags, extra_cuda_cflags=cuda_extra_cuda_cflags)
+# the cpu path uses pytorch's inverse, so there is nothing to build in cpu only mode.
+# the cuda kernel is built on first use.
+cuda = None
+
+
+def cuda_binding():
+    global cuda
+    if cuda is None and cuda_toolkit_available and not cpu_only_forced:
+        cuda = load('matrix_inverse_cuda', [source_dir + '/matrix_inverse_cuda.cpp', source_dir + '/matrix_inverse_cuda.cu'],
+                    extra_include_paths=extra_include_paths,
+                    verbose=True, extra_cflags=cuda_extra_cflags, extra_cuda_cflags=cuda_extra_cuda_cflags)
+    return cuda
 
 
 class MatrixInverse(torch.autograd.Function):
@@ -20,8 +29,8 @@ class MatrixInverse(torch.autograd.Function):
         if not matrices.is_contiguous():
             matrices = matrices.contiguous()
 
-        if matrices.is_cuda:
-            output = cuda.forward(matrices).transpose(-1, -2)
+        if matrices.is_cuda and cuda_binding() is not None:
+            output = cuda_binding().forward(matrices).transpose(-1, -2)
         else:
             output = matrices.inverse()
         ctx.save_for_backward(matrices, output)
@@ -46,6 +46,41 @@
     }                                                                                   \
   }()
 
+// dispatches the reduced precision storage types (half and bfloat16) in addition to float and double.
+// storage_t is the type in memory, scalar_t the type for computation and accumulation (float for the reduced precision types).
+#define GPE_PRIVATE_CASE_STORAGE_TYPE_AND_DIM(enum_type, storage_type, type, n_dims, ...) \
+  case enum_type: {                                                 \
+    using storage_t = storage_type;                                 \
+    using scalar_t = type;                                          \
+    if (n_dims == 2) {                                              \
+        constexpr int N_DIMS = 2;                                   \
+        return __VA_ARGS__();                                       \
+    }                                                               \
+    else if (n_dims == 3) {                                         \
+        constexpr int N_DIMS = 3;                                   \
+        return __VA_ARGS__();                                       \
+    }                                                               \
+    else {                                                          \
+        std::string dimstr = std::to_string(n_dims);                \
+        AT_ERROR(__FILE__, ":", __LINE__, " not implemented for 'n_dims == ", dimstr.c_str(), "'"); \
+    }                                                               \
+  }
+
+#define GPE_DISPATCH_STORAGE_TYPES_AND_DIM(TYPE, N_DIMS, ...)                           \
+  [&] {                                                                                 \
+    const auto& the_type = TYPE;                                                        \
+    const auto& the_n_dims = N_DIMS;                                                    \
+    at::ScalarType _st = ::detail::scalar_type(the_type);                               \
+    switch (_st) {                                                                      \
+      GPE_PRIVATE_CASE_STORAGE_TYPE_AND_DIM(at::ScalarType::Double, double, double, the_n_dims, __VA_ARGS__)          \
+      GPE_PRIVATE_CASE_STORAGE_TYPE_AND_DIM(at::ScalarType::Float, float, float, the_n_dims, __VA_ARGS__)             \
+      GPE_PRIVATE_CASE_STORAGE_TYPE_AND_DIM(at::ScalarType::Half, at::Half, float, the_n_dims, __VA_ARGS__)           \
+      GPE_PRIVATE_CASE_STORAGE_TYPE_AND_DIM(at::ScalarType::BFloat16, at::BFloat16, float, the_n_dims, __VA_ARGS__)   \
+      default:                                                                          \
+        AT_ERROR(__FILE__, ":", __LINE__, " not implemented for '", at::toString(_st), "'"); \
+    }                                                                                   \
+  }()
+
 namespace gpe {
 
 enum class ComputeDevice {
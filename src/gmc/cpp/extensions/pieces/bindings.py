@@ -1,18 +1,9 @@
-from torch.utils.cpp_extension import load
-import os
 import torch.autograd
 import torch.linalg
 
-from gmc.cpp.extensions.compile_flags import *
+from gmc.cpp.extensions import loader
 
-source_dir = os.path.dirname(__file__)
-
-
-source_files = [source_dir + '/pieces_bindings.cpp', source_dir + '/matrix_inverse.cu', source_dir + '/pieces.cpp', source_dir + '/symeig.cu', source_dir + '/../CpuSynchronisationPoint.cpp']
-
-pieces_binding = load('pieces_bindings', source_files,
-                   extra_include_paths=extra_include_paths,
-                   verbose=True, extra_cflags=cuda_extra_cflags, extra_cuda_cflags=cuda_extra_cuda_cflags, extra_ldflags=["-lpthread"])
+pieces_binding = loader.lazy('pieces_bindings')
 
 
 class SymEig(torch.autograd.Function):
@@ -3,7 +3,7 @@
 #include <cassert>
 
 #include <torch/extension.h>
-#include <c10/cuda/CUDAGuard.h>
+#include "util/device_guard.h"
 
 #include "pieces/matrix_inverse.h"
 #include "pieces/symeig.h"
@@ -15,7 +15,7 @@ namespace pieces {
 
 at::Tensor matrix_inverse(const at::Tensor& matrices)
 {
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (matrices.is_cuda()) {
         assert (device_of(matrices).has_value());
         device_guard.set_device(device_of(matrices).value());
@@ -25,7 +25,7 @@ at::Tensor matrix_inverse(const at::Tensor& matrices)
 
 
 std::tuple<torch::Tensor, torch::Tensor> symeig(const torch::Tensor& matrices) {
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (matrices.is_cuda()) {
         assert (device_of(matrices).has_value());
         device_guard.set_device(device_of(matrices).value());
@@ -34,7 +34,7 @@ std::tuple<torch::Tensor, torch::Tensor> symeig(const torch::Tensor& matrices) {
 }
 
 torch::Tensor symeig_backward(const torch::Tensor& matrices, const torch::Tensor& cached_values, const torch::Tensor& cached_vectors, const torch::Tensor& grad_values, const torch::Tensor& grad_vectors) {
-    at::cuda::OptionalCUDAGuard device_guard;
+    gpe::OptionalCUDAGuard device_guard;
     if (matrices.is_cuda()) {
         assert (device_of(matrices).has_value());
         device_guard.set_device(device_of(matrices).value());
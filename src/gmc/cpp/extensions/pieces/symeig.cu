@@ -132,9 +132,10 @@ std::tuple<torch::Tensor, torch::Tensor> forward(const torch::Tensor& matrices)
                                             auto eigenvectors_a = gpe::struct_accessor<glm::mat<N_DIMS, N_DIMS, scalar_t>, 1>(eigenvectors);
                                             auto eigenvalues_a = gpe::struct_accessor<glm::vec<N_DIMS, scalar_t>, 1>(eigenvalues);
 
+                                            // declared outside of the kernel lambda, gcc does not see N_DIMS inside of it when compiling for the cpu only.
+                                            using Vec = glm::vec<N_DIMS, scalar_t>;
+                                            using Mat = glm::mat<N_DIMS, N_DIMS, scalar_t>;
                                             auto fun = [matrices_a, eigenvectors_a, eigenvalues_a, n_batch] __host__ __device__ (const dim3& gpe_gridDim, const dim3& gpe_blockDim, const dim3& gpe_blockIdx, const dim3& gpe_threadIdx) mutable {
-                                                using Vec = glm::vec<N_DIMS, scalar_t>;
-                                                using Mat = glm::mat<N_DIMS, N_DIMS, scalar_t>;
                                                 GPE_UNUSED(gpe_gridDim);
                                                 const auto index = gpe_blockDim.x * gpe_blockIdx.x + gpe_threadIdx.x;
                                                 if (index >= n_batch)
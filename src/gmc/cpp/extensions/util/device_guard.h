@@ -0,0 +1,28 @@
+#ifndef GPE_UTIL_DEVICE_GUARD_H
+#define GPE_UTIL_DEVICE_GUARD_H
+
+#include <c10/core/Device.h>
+#include <c10/util/Exception.h>
+
+#ifdef GPE_CPU_ONLY
+
+namespace gpe {
+// CPU-only builds (GPE_CPU_ONLY) have no CUDA kernels. set_device is only called for CUDA tensors, so we fail there with a clear message.
+struct OptionalCUDAGuard {
+    void set_device(const c10::Device&) {
+        TORCH_CHECK(false, "gmc extension was built without CUDA support (GPE_CPU_ONLY), but got a CUDA tensor");
+    }
+};
+} // namespace gpe
+
+#else // GPE_CPU_ONLY
+
+#include <c10/cuda/CUDAGuard.h>
+
+namespace gpe {
+using OptionalCUDAGuard = at::cuda::OptionalCUDAGuard;
+} // namespace gpe
+
+#endif // GPE_CPU_ONLY
+
+#endif // GPE_UTIL_DEVICE_GUARD_H
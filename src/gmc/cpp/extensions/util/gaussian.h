@@ -1,6 +1,7 @@
 #ifndef GPE_UTIL_GAUSSIAN_H
 #define GPE_UTIL_GAUSSIAN_H
 
+#include <type_traits>
 #include <gcem.hpp>
 
 #include "util/autodiff.h"
@@ -128,6 +129,61 @@ EXECUTION_DEVICES scalar_t kl_divergence(const gpe::Gaussian<N_DIMS, scalar_t>&
     return scalar_t(0.5) * (mahalanobis_factor + trace - N_DIMS - logarithm);
 }
 
+// half and bfloat16 mixtures can't be reinterpreted as Gaussian records (see evaluate_inversed/reduced_precision_implementation.cu).
+// load_gaussian reads a record, i.e., a row of a gpe::accessor<storage_t, 4, storage_t>, widening every value to scalar_t.
+// store_gaussian writes it back, narrowing to the storage type. for Gaussian records of struct accessors both are plain copies.
+template <int N_DIMS, typename scalar_t>
+EXECUTION_DEVICES const Gaussian<N_DIMS, scalar_t>& load_gaussian(const Gaussian<N_DIMS, scalar_t>& record) {
+    return record;
+}
+
+template <int N_DIMS, typename scalar_t, typename Record>
+EXECUTION_DEVICES Gaussian<N_DIMS, scalar_t> load_gaussian(const Record& record) {
+    Gaussian<N_DIMS, scalar_t> gaussian;
+    gaussian.weight = scalar_t(record[0]);
+    for (int i = 0; i < N_DIMS; ++i) {
+        gaussian.position[i] = scalar_t(record[1 + i]);
+        for (int j = 0; j < N_DIMS; ++j) {
+            gaussian.covariance[i][j] = scalar_t(record[1 + N_DIMS + i * N_DIMS + j]);
+        }
+    }
+    return gaussian;
+}
+
+// records with packed covariances (see gpe::is_packed) store the upper triangle in row major order, the lower one is mirrored on load.
+template <int N_DIMS, typename scalar_t, typename Record>
+EXECUTION_DEVICES Gaussian<N_DIMS, scalar_t> load_packed_gaussian(const Record& record) {
+    Gaussian<N_DIMS, scalar_t> gaussian;
+    gaussian.weight = scalar_t(record[0]);
+    int packed_index = 1 + N_DIMS;
+    for (int i = 0; i < N_DIMS; ++i) {
+        gaussian.position[i] = scalar_t(record[1 + i]);
+        for (int j = i; j < N_DIMS; ++j) {
+            const auto value = scalar_t(record[packed_index++]);
+            gaussian.covariance[i][j] = value;
+            gaussian.covariance[j][i] = value;
+        }
+    }
+    return gaussian;
+}
+
+template <int N_DIMS, typename scalar_t>
+EXECUTION_DEVICES void store_gaussian(Gaussian<N_DIMS, scalar_t>& record, const Gaussian<N_DIMS, scalar_t>& gaussian) {
+    record = gaussian;
+}
+
+template <int N_DIMS, typename scalar_t, typename Record>
+EXECUTION_DEVICES void store_gaussian(Record record, const Gaussian<N_DIMS, scalar_t>& gaussian) {
+    using storage_t = std::remove_cv_t<std::remove_reference_t<decltype(record[0])>>;
+    record[0] = storage_t(gaussian.weight);
+    for (int i = 0; i < N_DIMS; ++i) {
+        record[1 + i] = storage_t(gaussian.position[i]);
+        for (int j = 0; j < N_DIMS; ++j) {
+            record[1 + N_DIMS + i * N_DIMS + j] = storage_t(gaussian.covariance[i][j]);
+        }
+    }
+}
+
 } // namespace gpe
 
 #endif // GPE_UTIL_GAUSSIAN_H
@@ -1,5 +1,6 @@
 #ifndef GPE_UTIL_MIXTURE_H
 #define GPE_UTIL_MIXTURE_H
+#include <vector>
 #include <torch/types.h>
 
 #include "util/cuda.h"
@@ -34,14 +35,46 @@ inline int n_components(torch::Tensor mixture) {
     return int(mixture.size(2));
 }
 
-inline int n_dimensions(torch::Tensor mixture) {
+// packed covariances (gm.convert_to_packed_covariances): weight, position and the upper triangle of the covariance in row major order,
+// 6 instead of 7 elements in 2d and 10 instead of 13 in 3d. only kernels that read records with gpe::load_packed_gaussian accept them.
+inline bool is_packed(torch::Tensor mixture) {
+    auto vector_length = mixture.size(-1);
+    return vector_length == 6 || vector_length == 10;
+}
+
+inline int n_dimensions(torch::Tensor mixture, bool allow_packed = false) {
     auto vector_length = mixture.size(-1);
     if (vector_length == 7)
         return 2;
     if (vector_length == 13)
         return 3;
+    if (allow_packed && vector_length == 6)
+        return 2;
+    if (allow_packed && vector_length == 10)
+        return 3;
+
+    TORCH_CHECK(false, "mixture must have 7 or 13 elements in the last dimension (6 or 10 with packed covariances, if supported by the kernel)")
+}
+
+// index of every element of the full layout in the packed layout
+inline torch::Tensor packed_index(int n_dims, torch::Device device) {
+    if (n_dims == 2)
+        return torch::tensor({0, 1, 2, 3, 4, 4, 5}, torch::TensorOptions(device).dtype(torch::kLong));
+    return torch::tensor({0, 1, 2, 3, 4, 5, 6, 5, 7, 8, 6, 8, 9}, torch::TensorOptions(device).dtype(torch::kLong));
+}
+
+// full layout copy of a mixture with packed covariances, for the kernels that read Gaussian structs (e.g. the backward passes).
+inline torch::Tensor unpacked(const torch::Tensor& mixture) {
+    return mixture.index_select(-1, packed_index(n_dimensions(mixture, true), mixture.device()));
+}
 
-    TORCH_CHECK(false, "mixture must have 7 or 13 elements in the last dimension")
+// gradient with respect to the packed layout from one with respect to the full layout. the off diagonal covariance elements are stored once,
+// their two gradients are summed.
+inline torch::Tensor packed_gradient(const torch::Tensor& grad) {
+    const auto n_dims = n_dimensions(grad);
+    std::vector<int64_t> packed_shape = grad.sizes().vec();
+    packed_shape.back() = 1 + n_dims + n_dims * (n_dims + 1) / 2;
+    return torch::zeros(packed_shape, grad.options()).index_add_(grad.dim() - 1, packed_index(n_dims, grad.device()), grad);
 }
 
 inline torch::Tensor weights(torch::Tensor mixture) {
@@ -93,28 +126,28 @@ inline void check_mixture(torch::Tensor mixture) {
 }
 
 
-inline MixtureNs get_ns(torch::Tensor mixture) {
+inline MixtureNs get_ns(torch::Tensor mixture, bool allow_packed = false) {
     //check_mixture(mixture);
 
     auto n_batch = gpe::n_batch(mixture);
     auto n_layers = gpe::n_layers(mixture);
     auto n_components = gpe::n_components(mixture);
-    auto n_dims = gpe::n_dimensions(mixture);
+    auto n_dims = gpe::n_dimensions(mixture, allow_packed);
 
     return {n_batch, n_layers, n_components, n_dims};
 }
 
-inline MixtureAndXesNs check_input_and_get_ns(torch::Tensor mixture, torch::Tensor xes) {
+inline MixtureAndXesNs check_input_and_get_ns(torch::Tensor mixture, torch::Tensor xes, bool same_dtype = true, bool allow_packed = false) {
     //check_mixture(mixture);
 
     auto n_batch = gpe::n_batch(mixture);
     auto n_layers = gpe::n_layers(mixture);
     auto n_components = gpe::n_components(mixture);
-    auto n_dims = gpe::n_dimensions(mixture);
+    auto n_dims = gpe::n_dimensions(mixture, allow_packed);
 
     TORCH_CHECK(xes.is_contiguous(), "xes must be contiguous")
     TORCH_CHECK(xes.dim() == 4, "xes must have 4 dimensions");
-    TORCH_CHECK(xes.dtype() == mixture.dtype(), "mixture and xes must have the same dtype");
+    TORCH_CHECK(!same_dtype || xes.dtype() == mixture.dtype(), "mixture and xes must have the same dtype");
     TORCH_CHECK(xes.device() == mixture.device(), "mixture and xes must have the same device");
     auto n_batch_xes = int(xes.size(0));
     auto n_layers_xes = int(xes.size(1));
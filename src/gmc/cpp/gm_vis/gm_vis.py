@@ -42,6 +42,8 @@ class GmVisColoringRenderMode(IntEnum):
     COLOR_AMPLITUDE = 3
 
     def convert_to_cpp(self):
+        if pygmvis is None:
+            return self
         if self == GmVisColoringRenderMode.COLOR_UNIFORM:
             return pygmvis.GMColoringRenderMode.COLOR_UNIFORM
         elif self == GmVisColoringRenderMode.COLOR_WEIGHT:
@@ -57,6 +59,8 @@ class GmVisColorRangeMode(IntEnum):
     RANGE_MEDMED = 3
 
     def convert_to_cpp(self):
+        if pygmvis is None:
+            return self
         if self == GmVisColorRangeMode.RANGE_MANUAL:
             return pygmvis.GMColorRangeMode.RANGE_MANUAL
         elif self == GmVisColorRangeMode.RANGE_MINMAX:
@@ -73,6 +77,8 @@ class GmVisDensityRenderMode(IntEnum):
     ADDITIVE_SAMPLING_OCTREE = 4
 
     def convert_to_cpp(self):
+        if pygmvis is None:
+            return self
         if self == GmVisDensityRenderMode.ADDITIVE_EXACT:
             return pygmvis.GMDensityRenderMode.ADDITIVE_EXACT
         elif self == GmVisDensityRenderMode.ADDITIVE_ACC_OCTREE:
@@ -93,9 +99,19 @@ class GMVisualizer:
         #       If true, the renderings will rone in a new thread. If false, we'll wait until it's done
         #   width/height: int
         #       Size of desired renderings in pixels
-        self._vis = pygmvis.create_visualizer(asyncmode, width, height)
+        # Without the pygmvis build (e.g. headless machines), gmc.render3d.CpuVisualizer renders instead.
+        if pygmvis is None:
+            import gmc.render3d
+            self._vis = gmc.render3d.CpuVisualizer(asyncmode, width, height)
+        else:
+            self._vis = pygmvis.create_visualizer(asyncmode, width, height)
         self.set_density_rendermode(GmVisDensityRenderMode.ADDITIVE_ACC_PROJECTED)
 
+    @property
+    def is_cpu(self) -> bool:
+        # the cpu renderer also takes mixtures with several layers (rendered like additional batch entries)
+        return pygmvis is None
+
     def set_image_size(self, width: int, height: int):
         # Sets the size of the renderings
         self._vis.set_image_size(width, height)
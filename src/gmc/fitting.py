@@ -3,20 +3,26 @@ import time
 
 import torch
 from torch import Tensor
-from torch.utils.tensorboard import SummaryWriter as TensorboardWriter
 
 import gmc.mixture as gm
 import gmc.mat_tools as mat_tools
+import gmc.profiling
 from gmc.cpp.extensions.bvh_mhem_fit import binding as cppBvhMhemFit
 
+if typing.TYPE_CHECKING:
+    # tensorboard is slow to import and only needed by callers that log
+    from torch.utils.tensorboard import SummaryWriter as TensorboardWriter
+
 
 class Config:
     def __init__(self, n_reduction: int=4):
         self.n_reduction = n_reduction
         self.KL_divergence_threshold = 2.0
+        # gm.COVARIANCE_DIAGONAL and gm.COVARIANCE_ISOTROPIC are supported by fixed_point_only
+        self.covariance_type = gm.COVARIANCE_FULL
 
 
-def solver(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: TensorboardWriter = None, convolution_layer: str = None, solver_n_samples=0) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
+def solver(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: "TensorboardWriter" = None, convolution_layer: str = None, solver_n_samples=0) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
     if tensorboard_epoch is not None:
         # torch.cuda.synchronize()
         # t0 = time.perf_counter()
@@ -35,10 +41,11 @@ def solver(mixture: Tensor, constant: Tensor, n_components: int, config: Config
         eval_points = generate_random_sampling(mixture, gm.n_components(mixture) * (-solver_n_samples))
 
     covariances = gm.covariances(mixture)
+    covariance_cache = gm.CovarianceCache(mixture)
 
     ret_const = constant.where(constant > 0, torch.zeros(1, device=device))
-    target = torch.maximum(gm.evaluate(mixture, eval_points) + constant, torch.zeros(1, 1, 1, device=device)) - ret_const
-    A = gm.evaluate_componentwise(gm.pack_mixture(torch.ones_like(weights), positions, covariances), eval_points)
+    target = torch.maximum(gm.evaluate(mixture, eval_points, covariance_cache) + constant, torch.zeros(1, 1, 1, device=device)) - ret_const
+    A = gm.evaluate_componentwise(gm.pack_mixture(torch.ones_like(weights), positions, covariances), eval_points, covariance_cache)
 
     new_weights = (torch.linalg.pinv(A) @ target.unsqueeze(-1)).squeeze()
     # new_weights = torch.linalg.lstsq(A, target).solution
@@ -54,7 +61,18 @@ def solver(mixture: Tensor, constant: Tensor, n_components: int, config: Config
     return fitting, ret_const, []
 
 
-def fixed_point_only(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: TensorboardWriter = None, convolution_layer: str = None) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
+def fixed_point_only(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: "TensorboardWriter" = None, convolution_layer: str = None) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
+    if config.covariance_type != gm.COVARIANCE_FULL:
+        # diagonal and isotropic covariances are evaluated element wise, the mse is logged on full layout copies
+        initial_fitting = initial_approx_to_relu(mixture, constant, config.covariance_type)
+        fp_fitting, ret_const = fixed_point_iteration_to_relu(mixture, constant, initial_fitting, covariance_type=config.covariance_type)
+        if tensorboard_epoch is not None:
+            to_full = gm.covariance_type_module(config.covariance_type).to_full
+            full_mixture = to_full(mixture)
+            tensorboard_epoch[0].add_scalar(f"51.1 fitting {convolution_layer} fixed point iteration mse =",
+                                            mse(full_mixture, constant, to_full(fp_fitting), ret_const, generate_random_sampling(full_mixture, 1000)), tensorboard_epoch[1])
+        return fp_fitting, ret_const, [initial_fitting]
+
     if tensorboard_epoch is not None:
         # torch.cuda.synchronize()
         # t0 = time.perf_counter()
@@ -69,7 +87,9 @@ def fixed_point_only(mixture: Tensor, constant: Tensor, n_components: int, confi
     #     t1 = time.perf_counter()
     #     tensorboard.add_scalar(f"50.1 fitting {convolution_layer} initial_approx_to_relu time =", t1 - t0, epoch)
 
-    fp_fitting, ret_const = fixed_point_iteration_to_relu(mixture, constant, initial_fitting)
+    # the initial fitting has the covariances of the target
+    covariance_cache = gm.CovarianceCache(mixture)
+    fp_fitting, ret_const = fixed_point_iteration_to_relu(mixture, constant, initial_fitting, target_covariance_cache=covariance_cache, fitting_covariance_cache=covariance_cache)
 
     if tensorboard_epoch is not None:
         # torch.cuda.synchronize()
@@ -80,7 +100,7 @@ def fixed_point_only(mixture: Tensor, constant: Tensor, n_components: int, confi
     return fp_fitting, ret_const, [initial_fitting]
 
 
-def splitter_and_fixed_point(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: TensorboardWriter = None, convolution_layer: str = None) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
+def splitter_and_fixed_point(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: "TensorboardWriter" = None, convolution_layer: str = None) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
     if tensorboard_epoch is not None:
         # torch.cuda.synchronize()
         # t0 = time.perf_counter()
@@ -129,7 +149,9 @@ def fixed_point_and_max(mixture: Tensor, constant: Tensor, n_components: int, co
     #     t1 = time.perf_counter()
     #     tensorboard.add_scalar(f"50.1 fitting {convolution_layer} initial_approx_to_relu time =", t1 - t0, epoch)
 
-    fp_fitting, ret_const = fixed_point_iteration_to_relu(mixture, constant, initial_fitting)
+    # the initial fitting has the covariances of the target
+    covariance_cache = gm.CovarianceCache(mixture)
+    fp_fitting, ret_const = fixed_point_iteration_to_relu(mixture, constant, initial_fitting, target_covariance_cache=covariance_cache, fitting_covariance_cache=covariance_cache)
 
     if tensorboard_epoch is not None:
         # torch.cuda.synchronize()
@@ -154,7 +176,7 @@ def fixed_point_and_max(mixture: Tensor, constant: Tensor, n_components: int, co
 
 
 
-def fixed_point_and_tree_hem2(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: TensorboardWriter = None, convolution_layer: str = None) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
+def fixed_point_and_tree_hem2(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: "TensorboardWriter" = None, convolution_layer: str = None) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
     config.n_reduction = 2
     return fixed_point_and_tree_hem(mixture, constant, n_components, config, tensorboard_epoch, convolution_layer)
 
@@ -174,7 +196,9 @@ def fixed_point_and_tree_hem(mixture: Tensor, constant: Tensor, n_components: in
     #     t1 = time.perf_counter()
     #     tensorboard.add_scalar(f"50.1 fitting {convolution_layer} initial_approx_to_relu time =", t1 - t0, epoch)
 
-    fp_fitting, ret_const = fixed_point_iteration_to_relu(mixture, constant, initial_fitting)
+    # the initial fitting has the covariances of the target
+    covariance_cache = gm.CovarianceCache(mixture)
+    fp_fitting, ret_const = fixed_point_iteration_to_relu(mixture, constant, initial_fitting, target_covariance_cache=covariance_cache, fitting_covariance_cache=covariance_cache)
 
     if tensorboard_epoch is not None:
         # torch.cuda.synchronize()
@@ -201,7 +225,7 @@ def fixed_point_and_tree_hem(mixture: Tensor, constant: Tensor, n_components: in
     return fitting, ret_const, [initial_fitting, fp_fitting]
 
 
-def fixed_point_and_mhem(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: typing.Optional[typing.Tuple[TensorboardWriter, int]] = None, convolution_layer: str = None) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
+def fixed_point_and_mhem(mixture: Tensor, constant: Tensor, n_components: int, config: Config = Config(), tensorboard_epoch: typing.Optional[typing.Tuple["TensorboardWriter", int]] = None, convolution_layer: str = None) -> typing.Tuple[Tensor, Tensor, typing.List[Tensor]]:
     if tensorboard_epoch is not None:
         # torch.cuda.synchronize()
         # t0 = time.perf_counter()
@@ -216,7 +240,9 @@ def fixed_point_and_mhem(mixture: Tensor, constant: Tensor, n_components: int, c
     #     t1 = time.perf_counter()
     #     tensorboard.add_scalar(f"50.1 fitting {convolution_layer} initial_approx_to_relu time =", t1 - t0, epoch)
 
-    fp_fitting, ret_const = fixed_point_iteration_to_relu(mixture, constant, initial_fitting)
+    # the initial fitting has the covariances of the target
+    covariance_cache = gm.CovarianceCache(mixture)
+    fp_fitting, ret_const = fixed_point_iteration_to_relu(mixture, constant, initial_fitting, target_covariance_cache=covariance_cache, fitting_covariance_cache=covariance_cache)
 
     if tensorboard_epoch is not None:
         # torch.cuda.synchronize()
@@ -259,7 +285,7 @@ def splitter(mixture: Tensor, iteration_targets: typing.List[int], displacement:
             rating = rating.where(eigenvalues[..., 1] / eigenvalues[..., 0] > 1.04, torch.zeros_like(rating))
 
         selected_ratings, selection = torch.topk(rating, k_subdivisions, dim=2)
-        assert (selected_ratings > 0.00000000001).all().item()
+        assert gm.value_check(lambda: (selected_ratings > 0.00000000001).all())
 
         n = mixture.gather(2, selection.unsqueeze(-1).expand(-1, -1, -1, mixture.shape[-1]))
         eig_vals = eigenvalues.gather(2, selection.unsqueeze(-1).expand(-1, -1, -1, n_dims))
@@ -276,40 +302,59 @@ def splitter(mixture: Tensor, iteration_targets: typing.List[int], displacement:
     return mixture
 
 
-def initial_approx_to_relu(mixture: Tensor, constant: Tensor) -> Tensor:
+def initial_approx_to_relu(mixture: Tensor, constant: Tensor, covariance_type: str = gm.COVARIANCE_FULL) -> Tensor:
     device = mixture.device
     relu_const = constant.where(constant > 0, torch.zeros(1, device=device))
     weights = gm.weights(mixture)
     new_weights = weights.where(weights + constant.unsqueeze(-1) > 0, -relu_const.unsqueeze(-1))
+    if covariance_type != gm.COVARIANCE_FULL:
+        # the weight comes first in every layout
+        return torch.cat((new_weights.unsqueeze(-1), mixture[:, :, :, 1:]), dim=-1)
     return gm.pack_mixture(new_weights, gm.positions(mixture), gm.covariances(mixture))
 
 
-def fixed_point_iteration_to_relu(target_mixture: Tensor, target_constant: Tensor, fitting_mixture: Tensor, n_iter: int = 1) -> typing.Tuple[Tensor, Tensor]:
-    assert gm.is_valid_mixture_and_constant(target_mixture, target_constant)
-    assert gm.is_valid_mixture(fitting_mixture)
+def fixed_point_iteration_to_relu(target_mixture: Tensor, target_constant: Tensor, fitting_mixture: Tensor, n_iter: int = 1,
+                                  target_covariance_cache: typing.Optional[gm.CovarianceCache] = None, fitting_covariance_cache: typing.Optional[gm.CovarianceCache] = None,
+                                  covariance_type: str = gm.COVARIANCE_FULL) -> typing.Tuple[Tensor, Tensor]:
+    """
+    @param covariance_type: of both mixtures. the covariance caches are for full covariances only, the other types have nothing to cache
+    """
     assert gm.n_batch(target_mixture) == gm.n_batch(fitting_mixture)
     assert gm.n_layers(target_mixture) == gm.n_layers(fitting_mixture)
-    assert gm.n_dimensions(target_mixture) == gm.n_dimensions(fitting_mixture)
     assert target_mixture.device == fitting_mixture.device
+    if covariance_type == gm.COVARIANCE_FULL:
+        assert gm.is_valid_mixture_and_constant(target_mixture, target_constant)
+        assert gm.is_valid_mixture(fitting_mixture)
+        assert gm.n_dimensions(target_mixture) == gm.n_dimensions(fitting_mixture)
+        positions = gm.positions(fitting_mixture)
+        covariances = gm.covariances(fitting_mixture)
+        pack_mixture = gm.pack_mixture
+        if fitting_covariance_cache is None:
+            fitting_covariance_cache = gm.CovarianceCache(fitting_mixture)
+    else:
+        module = gm.covariance_type_module(covariance_type)
+        assert module.n_dimensions(target_mixture) == module.n_dimensions(fitting_mixture)
+        positions = module.positions(fitting_mixture)
+        covariances = module.variances(fitting_mixture)
+        pack_mixture = module.pack_mixture
 
     weights = gm.weights(fitting_mixture)
-    positions = gm.positions(fitting_mixture)
-    covariances = gm.covariances(fitting_mixture)
     device = fitting_mixture.device
 
     # todo: make transfer fitting function configurable. e.g. these two can be replaced by leaky relu or softplus (?, might break if we have many overlaying Gs)
     ret_const = target_constant.where(target_constant > 0, torch.zeros(1, device=device))
-    b = gm.evaluate(target_mixture, positions) + target_constant.unsqueeze(-1)
+    b = gm.evaluate(target_mixture, positions, target_covariance_cache, covariance_type) + target_constant.unsqueeze(-1)
     b = b.where(b > 0, torch.zeros(1, device=device)) - ret_const.unsqueeze(-1)
 
     x = weights.abs() + 0.1
 
+    # only the weights change between the iterations
     for i in range(n_iter):
         x = x.abs()
-        new_mixture = gm.pack_mixture(x, positions, covariances)
-        x = x * (b + 0.05) / (gm.evaluate(new_mixture, positions) + 0.05)
+        new_mixture = pack_mixture(x, positions, covariances)
+        x = x * (b + 0.05) / (gm.evaluate(new_mixture, positions, fitting_covariance_cache, covariance_type) + 0.05)
 
-    return gm.pack_mixture(x, positions, covariances), ret_const
+    return pack_mixture(x, positions, covariances), ret_const
 
 
 def generate_random_sampling(m: Tensor, n: int) -> Tensor:
@@ -343,14 +388,11 @@ def tree_hem(m: Tensor, n_components: int, n_reduction: int) -> Tensor:
     # scale the mixture to some sort of standard in order to improve numerical stability
 
     cov_scaling_factor = mat_tools.trace(gm.covariances(m)).mean(-1, keepdim=True) / gm.n_dimensions(m)  # mean over components and trace elements
-    assert (cov_scaling_factor > 0).all().item()
+    assert gm.value_check(lambda: (cov_scaling_factor > 0).all())
     backward_cov_scaling_factor = torch.sqrt(cov_scaling_factor)
     cov_scaling_factor = (1 / backward_cov_scaling_factor)
 
-    assert not torch.any(torch.isnan(backward_cov_scaling_factor))
-    assert not torch.any(torch.isinf(backward_cov_scaling_factor))
-    assert not torch.any(torch.isnan(cov_scaling_factor))
-    assert not torch.any(torch.isinf(cov_scaling_factor))
+    assert gm.value_check(lambda: torch.isfinite(backward_cov_scaling_factor).all() & torch.isfinite(cov_scaling_factor).all())
 
     m = gm.spatial_scale(m, cov_scaling_factor)
     m = cppBvhMhemFit.apply(m, n_components, n_reduction)
@@ -391,8 +433,9 @@ def calc_likelihoods(target: Tensor, fitting: Tensor) -> Tensor:
     target_n_virtual_points = n_virtual_points * target_weights
 
     # preiner equation 9
-    gaussian_values = gm.evaluate_componentwise(gm.pack_mixture(torch.ones_like(fitting_weights), fitting_positions, fitting_covariances), target_positions)
-    c = mat_tools.inverse(fitting_covariances).view(n_batch, n_layers, 1, n_fitting_components, n_dims, n_dims) \
+    fitting_covariance_cache = gm.CovarianceCache(fitting)
+    gaussian_values = gm.evaluate_componentwise(gm.pack_mixture(torch.ones_like(fitting_weights), fitting_positions, fitting_covariances), target_positions, fitting_covariance_cache)
+    c = fitting_covariance_cache.inverse.unsqueeze(2) \
         @ target_covariances.view(n_batch, n_layers, n_target_components, 1, n_dims, n_dims)
     exp_values = torch.exp(-0.5 * mat_tools.trace(c))
 
@@ -401,22 +444,23 @@ def calc_likelihoods(target: Tensor, fitting: Tensor) -> Tensor:
     return torch.pow(almost_likelihoods, target_n_virtual_points.unsqueeze(-1))
 
 
-def calc_KL_divergence(target: Tensor, fitting: Tensor) -> Tensor:
+def calc_KL_divergence(target: Tensor, fitting: Tensor, fitting_covariance_cache: typing.Optional[gm.CovarianceCache] = None) -> Tensor:
     # index i -> target
     # index s -> fitting
+    if fitting_covariance_cache is None:
+        fitting_covariance_cache = gm.CovarianceCache(fitting)
 
     target_positions = gm.positions(target).unsqueeze(3)
     target_covariances = gm.covariances(target).unsqueeze(3)
 
     fitting_positions = gm.positions(fitting).unsqueeze(2)
-    fitting_covariances = gm.covariances(fitting).unsqueeze(2)
-    fitting_covariances_inversed = mat_tools.inverse(fitting_covariances)
+    fitting_covariances_inversed = fitting_covariance_cache.inverse.unsqueeze(2)
 
     p_diff = target_positions - fitting_positions
     # mahalanobis_factor = mahalanobis distance squared
     mahalanobis_factor = (p_diff.unsqueeze(-2) @ fitting_covariances_inversed @ p_diff.unsqueeze(-1)).squeeze(dim=-1).squeeze(dim=-1)
     trace = mat_tools.trace(fitting_covariances_inversed @ target_covariances)
-    logarithm = torch.log(target_covariances.det() / fitting_covariances.det())
+    logarithm = torch.log(target_covariances.det() / fitting_covariance_cache.det.unsqueeze(2))
     KL_divergence = 0.5 * (mahalanobis_factor + trace - gm.n_dimensions(target) - logarithm)
 
     return KL_divergence
@@ -425,18 +469,10 @@ def calc_KL_divergence(target: Tensor, fitting: Tensor) -> Tensor:
 def representative_select_for_relu(mixture: Tensor, n_components: int, config: Config = Config()) -> Tensor:
     assert n_components > 0
     component_integrals = gm.weights(mixture.detach()).abs()
-
-    n_original_components = gm.n_components(mixture)
-    device = mixture.device
-
-    # original
-    _, sorted_indices = torch.sort(component_integrals, descending=True)
-    selection_mixture = mat_tools.my_index_select(mixture, sorted_indices)[:, :, :n_components, :]
-
-    return selection_mixture
+    return mat_tools.select_top_components(mixture, n_components, component_integrals)
 
 
-def mhem_fit_a_to_b(fitting_mixture: Tensor, target_mixture: Tensor, config: Config = Config(), tensorboard: TensorboardWriter = None) -> Tensor:
+def mhem_fit_a_to_b(fitting_mixture: Tensor, target_mixture: Tensor, config: Config = Config(), tensorboard: "TensorboardWriter" = None) -> Tensor:
     assert gm.is_valid_mixture(fitting_mixture)
     assert gm.is_valid_mixture(target_mixture)
     assert gm.n_batch(target_mixture) == gm.n_batch(fitting_mixture)
@@ -467,18 +503,18 @@ def mhem_fit_a_to_b(fitting_mixture: Tensor, target_mixture: Tensor, config: Con
     fitting_weights = gm.weights(fitting_double_gmm).unsqueeze(2)
     # sign_match = target_weights.sign() == fitting_weights.sign()
     if tensorboard is not None:
-        torch.cuda.synchronize()
+        gmc.profiling.synchronize(device)
         t0 = time.perf_counter()
 
     likelihoods = calc_likelihoods(target_double_gmm.detach(), fitting_double_gmm.detach())
     if tensorboard is not None:
-        torch.cuda.synchronize()
+        gmc.profiling.synchronize(device)
         t1 = time.perf_counter()
         tensorboard.add_scalar(f"50.4.1 mhem_fit_a_to_b {target_mixture.shape} -> {gm.n_components(fitting_mixture)} calc_likelihoods time =", t1 - t0, 0)
 
     # KL_divergence = calc_KL_divergence(target_double_gmm.detach(), fitting_double_gmm.detach())
     if tensorboard is not None:
-        torch.cuda.synchronize()
+        gmc.profiling.synchronize(device)
         t2 = time.perf_counter()
         tensorboard.add_scalar(f"50.4.2 mhem_fit_a_to_b {target_mixture.shape} -> {gm.n_components(fitting_mixture)} KL_divergence time =", t2 - t1, 0)
 
@@ -489,36 +525,36 @@ def mhem_fit_a_to_b(fitting_mixture: Tensor, target_mixture: Tensor, config: Con
     responsibilities = likelihoods / torch.max(likelihoods_sum, torch.tensor([0.00001], device=likelihoods_sum.device).view(1, 1, 1, 1))
 
     if tensorboard is not None:
-        torch.cuda.synchronize()
+        gmc.profiling.synchronize(device)
         t3 = time.perf_counter()
         tensorboard.add_scalar(f"50.4.3 mhem_fit_a_to_b {target_mixture.shape} -> {gm.n_components(fitting_mixture)} other 1 time =", t3 - t2, 0)
-    assert not torch.any(torch.isnan(responsibilities))
+    assert gm.value_check(lambda: ~torch.isnan(responsibilities).any())
 
     # index i -> target
     # index s -> fitting
     responsibilities = responsibilities * gm.weights(target_double_gmm).abs().unsqueeze(-1)
     newWeights = torch.sum(responsibilities, 2)
-    assert not torch.any(torch.isnan(responsibilities))
+    assert gm.value_check(lambda: ~torch.isnan(responsibilities).any())
 
-    assert not torch.any(torch.isnan(newWeights))
+    assert gm.value_check(lambda: ~torch.isnan(newWeights).any())
     responsibilities = responsibilities / torch.max(newWeights, torch.tensor([0.00001], device=likelihoods_sum.device).view(1, 1, 1)).view(n_batch, n_layers, 1, n_components_fitting)
-    assert torch.all(responsibilities >= 0)
-    assert not torch.any(torch.isnan(responsibilities))
+    assert gm.value_check(lambda: (responsibilities >= 0).all())
+    assert gm.value_check(lambda: ~torch.isnan(responsibilities).any())
     newPositions = torch.sum(responsibilities.unsqueeze(-1) * gm.positions(target_double_gmm).view(n_batch, n_layers, n_components_target, 1, n_dims), 2)
-    assert not torch.any(torch.isnan(newPositions))
+    assert gm.value_check(lambda: ~torch.isnan(newPositions).any())
     posDiffs = gm.positions(target_double_gmm).view(n_batch, n_layers, n_components_target, 1, n_dims, 1) - newPositions.view(n_batch, n_layers, 1, n_components_fitting, n_dims, 1)
-    assert not torch.any(torch.isnan(posDiffs))
+    assert gm.value_check(lambda: ~torch.isnan(posDiffs).any())
 
     newCovariances = (torch.sum(responsibilities.unsqueeze(-1).unsqueeze(-1) * (gm.covariances(target_double_gmm).view(n_batch, n_layers, n_components_target, 1, n_dims, n_dims) +
                                                                                 posDiffs.matmul(posDiffs.transpose(-1, -2))), 2))
     newCovariances = newCovariances + (newWeights < 0.0001).unsqueeze(-1).unsqueeze(-1) * torch.eye(n_dims, device=device).view(1, 1, 1, n_dims, n_dims) * 0.0001
 
-    assert not torch.any(torch.isnan(newCovariances))
+    assert gm.value_check(lambda: ~torch.isnan(newCovariances).any())
 
     fitting_double_gmm = gm.pack_mixture(newWeights.contiguous() * gm.weights(fitting_double_gmm).sign(), newPositions.contiguous(), newCovariances.contiguous())
 
     if tensorboard is not None:
-        torch.cuda.synchronize()
+        gmc.profiling.synchronize(device)
         t4 = time.perf_counter()
         tensorboard.add_scalar(f"50.4.4 mhem_fit_a_to_b {target_mixture.shape} -> {gm.n_components(fitting_mixture)} other 2 time =", t4 - t3, 0)
 
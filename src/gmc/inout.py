@@ -1,26 +1,42 @@
+import io
+import math
 import typing
 import os.path
 
 import numpy as np
 import torch
+import torch.utils.data
 from torch import Tensor
 
 import gmc.mixture as gm
 import gmc.config as config
 
 
-def save(mixture: Tensor, file_name: str, meta_info=None) -> None:
+def save(mixture: Tensor, file_name: str, meta_info=None, packed: bool = False) -> None:
+    """
+    writes the full layout (version 6), which older versions of load can read as well. with packed, only the upper triangle of the covariances
+    is stored (gm.convert_to_packed_covariances, version 7), which is 23% smaller in 3d but needs the current load.
+    """
     assert gm.is_valid_mixture(mixture)
+    if packed:
+        version = 7
+        data = gm.convert_to_packed_covariances(mixture.detach()).cpu()
+    else:
+        version = 6
+        data = gm.convert_to_full_covariances(mixture.detach()).cpu()
     dictionary = {
         "type": "gm.Mixture",
-        "version": 6,
-        "data": mixture.detach().cpu(),
+        "version": version,
+        "data": data,
         "meta_info": meta_info
     }
     torch.save(dictionary, config.data_base_path / file_name)
 
 
-def load(file_name: str) -> typing.Tuple[Tensor, typing.Any]:
+def load(file_name: str, packed_covariances: bool = False) -> typing.Tuple[Tensor, typing.Any]:
+    """
+    returns the mixture in the full layout, or with packed covariances (gm.convert_to_packed_covariances) if packed_covariances is set.
+    """
     dictionary = torch.load(config.data_base_path / file_name)
     assert dictionary["type"] == "gm.Mixture"
     if dictionary["version"] == 3:
@@ -41,17 +57,22 @@ def load(file_name: str) -> typing.Tuple[Tensor, typing.Any]:
     elif dictionary["version"] == 5:
         mixture = dictionary["data"]
         mixture = gm.convert_amplitudes_to_priors(mixture)
+    elif dictionary["version"] == 6:
+        mixture = dictionary["data"]
     else:
-        assert dictionary["version"] == 6
+        assert dictionary["version"] == 7
         mixture = dictionary["data"]
 
     assert gm.is_valid_mixture(mixture)
-    return mixture, dictionary["meta_info"]
+    if packed_covariances:
+        return gm.convert_to_packed_covariances(mixture), dictionary["meta_info"]
+    return gm.convert_to_full_covariances(mixture), dictionary["meta_info"]
 
 
-def write_gm_to_ply(m_weights: Tensor, m_positions: Tensor, m_covariances: Tensor, index: int, filename: str):
+def write_gm_to_ply(m_weights: Tensor, m_positions: Tensor, m_covariances: Tensor, index: int, filename: str, binary: bool = False):
     # Writes a single Gaussian Mixture to a ply-file
     # The parameter "index" defines which element in the batch to use
+    # The parameter "binary" selects the binary format (write_gm_to_binary_ply) instead of ascii
     weight_shape = m_weights.shape  # should be (m,1,n)
     pos_shape = m_positions.shape  # should be (m,1,n,3)
     cov_shape = m_covariances.shape  # should be (m,1,n,3,3)
@@ -69,6 +90,10 @@ def write_gm_to_ply(m_weights: Tensor, m_positions: Tensor, m_covariances: Tenso
     _positions = m_positions[index, 0, :, :].view(n, 3)
     _covs = m_covariances[index, 0, :, :, :].view(n, 3, 3)
 
+    if binary:
+        write_gm_to_binary_ply(gm.pack_mixture(_weights.view(1, 1, n), _positions.view(1, 1, n, 3), _covs.view(1, 1, n, 3, 3)), filename)
+        return
+
     if not os.path.exists(os.path.dirname(filename)):
         os.makedirs(os.path.dirname(filename))
     file = open(filename, "w+")
@@ -105,37 +130,211 @@ def write_gm_to_ply2(m: Tensor, path_without_ending: str):
             write_gm_to_ply(gm.weights(t), gm.positions(t), gm.covariances(t), 0, f"{path_without_ending}_b{b}_l{l}.ply");
 
 
+# binary ply: little endian float32, one row per component in the order of the packed mixture layout (gm.convert_to_packed_covariances),
+# i.e., weight, position, upper triangle of the covariance. a comment line stores the batch and layer dimensions, rows are in batch, layer, component order.
+# the data block can therefore be memory mapped and used as a packed mixture without copying (read_gm_from_binary_ply).
+_binary_ply_properties = {2: ["weight", "x", "y", "covxx", "covxy", "covyy"],
+                          3: ["weight", "x", "y", "z", "covxx", "covxy", "covxz", "covyy", "covyz", "covzz"]}
+
+
+def write_gm_to_binary_ply(mixture: Tensor, filename: str) -> None:
+    """
+    Writes the mixture (all batches and layers, weights as they are) to a binary ply file.
+    """
+    assert gm.is_valid_mixture(mixture)
+    n_dims = gm.n_dimensions(mixture)
+    data = gm.convert_to_packed_covariances(mixture.detach()).to(device='cpu', dtype=torch.float32).contiguous()
+
+    if os.path.dirname(filename) != "" and not os.path.exists(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    with open(filename, "wb") as file:
+        header = "ply\nformat binary_little_endian 1.0\n"
+        header += f"comment gmc batch_layer_shape {gm.n_batch(mixture)} {gm.n_layers(mixture)}\n"
+        header += f"element component {gm.n_batch(mixture) * gm.n_layers(mixture) * gm.n_components(mixture)}\n"
+        header += "".join(f"property float {p}\n" for p in _binary_ply_properties[n_dims])
+        header += "end_header\n"
+        file.write(header.encode("ascii"))
+        file.write(data.numpy().astype("<f4", copy=False).tobytes())
+
+
+def _read_ply_header(file: typing.BinaryIO) -> typing.Dict[str, typing.Any]:
+    header = {"format": None, "n_elements": 0, "properties": [], "batch_layer_shape": None}
+    line = file.readline().decode("ascii").strip()
+    assert line == "ply", "not a ply file"
+    while True:
+        line = file.readline()
+        assert len(line) > 0, "ply header without end_header"
+        line = line.decode("ascii").strip()
+        if line.startswith("format "):
+            header["format"] = line.split()[1]
+        elif line.startswith("comment gmc batch_layer_shape "):
+            header["batch_layer_shape"] = tuple(int(v) for v in line.split()[3:5])
+        elif line.startswith("element component "):
+            header["n_elements"] = int(line.split()[2])
+        elif line.startswith("property "):
+            data_type, name = line.split()[1:3]
+            assert data_type in ("float", "float32"), f"unsupported ply property type {data_type}"
+            header["properties"].append(name)
+        elif line == "end_header":
+            header["data_offset"] = file.tell()
+            return header
+
+
+def read_gm_from_binary_ply(filename: str, device='cpu', packed_covariances: bool = False) -> Tensor:
+    """
+    Reads a mixture written by write_gm_to_binary_ply, with the batch and layer dimensions. The weights are returned as they are stored.
+    On the cpu and with packed_covariances, the returned tensor is a copy on write memory map of the file, i.e., nothing is read before use.
+    """
+    with open(filename, "rb") as file:
+        header = _read_ply_header(file)
+    assert header["format"] == "binary_little_endian", f"{filename} is not a little endian binary ply file"
+    properties = header["properties"]
+    n_dims = 3 if "z" in properties else 2
+    n_batch, n_layers = header["batch_layer_shape"] if header["batch_layer_shape"] is not None else (1, 1)
+    n_components = header["n_elements"] // (n_batch * n_layers)
+    assert n_batch * n_layers * n_components == header["n_elements"]
+
+    if header["n_elements"] == 0:
+        # numpy can't map an empty data block
+        mixture = torch.zeros(n_batch, n_layers, 0, len(properties))
+    else:
+        data = np.memmap(filename, dtype="<f4", mode="c", offset=header["data_offset"], shape=(header["n_elements"], len(properties)))
+        mixture = torch.from_numpy(data).view(n_batch, n_layers, n_components, len(properties))
+    if properties != _binary_ply_properties[n_dims]:
+        # written by another tool, reorder (copies)
+        mixture = mixture[..., [properties.index(p) for p in _binary_ply_properties[n_dims]]]
+    mixture = mixture.to(device)
+    if packed_covariances:
+        return mixture
+    return gm.convert_to_full_covariances(mixture)
+
+
 def read_gm_from_ply(filename: str, ismodel: bool = False, device='cuda') -> Tensor:
-    # Reads a Gaussian Mixture from a ply-file
+    # Reads a Gaussian Mixture from a ply-file, ascii (3d) or binary (write_gm_to_binary_ply, 2d or 3d)
     # The parameter "ismodel" defines whether the weights in the file represent amplitudes (False) or priors (True)
     # The weights of the returned GM are amplitudes.
-    fin = open(filename)
-    header = True
-    index = 0
-    for line in fin:
-        if header:
-            if line.startswith("element component "):
-                number = int(line[18:])
-                gmpos = torch.zeros((1, 1, number, 3), device=device)
-                gmcov = torch.zeros((1, 1, number, 3, 3), device=device)
-                gmwei = torch.zeros((1, 1, number), device=device)
-            elif line.startswith("end_header"):
-                header = False
-        else:
-            elements = line.split("  ")
-            gmpos[0, 0, index, :] = torch.tensor([float(e) for e in elements[0:3]])
-            gmcov[0, 0, index, 0, 0] = float(elements[3])
-            gmcov[0, 0, index, 0, 1] = gmcov[0, 0, index, 1, 0] = float(elements[4])
-            gmcov[0, 0, index, 0, 2] = gmcov[0, 0, index, 2, 0] = float(elements[5])
-            gmcov[0, 0, index, 1, 1] = float(elements[6])
-            gmcov[0, 0, index, 1, 2] = gmcov[0, 0, index, 2, 1] = float(elements[7])
-            gmcov[0, 0, index, 2, 2] = float(elements[8])
-            gmwei[0, 0, index] = float(elements[9])
-            index = index + 1
-    fin.close()
+    with open(filename, "rb") as fin:
+        header = _read_ply_header(fin)
+        if header["format"] == "ascii":
+            if header["n_elements"] == 0:
+                data = torch.zeros(0, 10, device=device)
+            else:
+                data = torch.from_numpy(np.loadtxt(io.TextIOWrapper(fin, encoding="ascii"), dtype=np.float32, ndmin=2)).to(device)
+    if header["format"] == "ascii":
+        # x, y, z, covxx, covxy, covxz, covyy, covyz, covzz, weight
+        gmpos = data[:, 0:3].view(1, 1, -1, 3)
+        gmcov = data[:, [3, 4, 5, 4, 6, 7, 5, 7, 8]].view(1, 1, -1, 3, 3)
+        gmwei = data[:, 9].view(1, 1, -1)
+    else:
+        mixture = read_gm_from_binary_ply(filename, device)
+        gmpos = gm.positions(mixture)
+        gmcov = gm.covariances(mixture)
+        gmwei = gm.weights(mixture)
     if ismodel:
-        gmwei /= gmwei.sum()
-        amplitudes = gmwei / (gmcov.det().sqrt() * 15.74960995)
+        # normalisation of the gaussian: sqrt((2 pi)^n_dims * det(covariance))
+        n_dims = gmpos.shape[-1]
+        gmwei = gmwei / gmwei.sum(dim=-1, keepdim=True)
+        amplitudes = gmwei / (gmcov.det().sqrt() * ((2 * math.pi) ** (n_dims / 2)))
         return gm.pack_mixture(amplitudes, gmpos, gmcov)
     else:
         return gm.pack_mixture(gmwei, gmpos, gmcov)
+
+
+# sharded store for data sets of mixtures (write_shards, ShardedMixtureDataSet): a few large binary shards plus one index file, instead of one
+# torch.save file per sample. every sample occupies a fixed size block of [n_layers, n_components, packed gaussian] little endian float32 values,
+# samples with less components are padded with zero weight gaussians. the index stores the labels and the shard and offset of every sample.
+def write_shards(samples: typing.Iterable[typing.Tuple[Tensor, typing.Any]], directory: str, n_components: typing.Optional[int] = None, samples_per_shard: int = 8192) -> None:
+    """
+    @param samples: (mixture, label) pairs, mixtures without batch dimension ([n_layers, n_components, gaussian]), labels convertible to a tensor
+    @param n_components: block size, defaults to the number of components of the first sample
+    """
+    os.makedirs(directory, exist_ok=True)
+    shard_files = []
+    shard_ids = []
+    offsets = []
+    labels = []
+    sample_shape = None
+    file = None
+    for mixture, label in samples:
+        mixture = gm.convert_to_packed_covariances(mixture.detach().view(1, *mixture.shape)).to(device='cpu', dtype=torch.float32)
+        assert gm.is_valid_mixture(mixture)
+        if sample_shape is None:
+            sample_shape = [gm.n_layers(mixture), n_components if n_components is not None else gm.n_components(mixture), mixture.shape[-1]]
+        assert [gm.n_layers(mixture), mixture.shape[-1]] == [sample_shape[0], sample_shape[2]]
+        assert gm.n_components(mixture) <= sample_shape[1]
+        if gm.n_components(mixture) < sample_shape[1]:
+            n_dims = gm.n_dimensions(mixture)
+            padding = gm.pack_mixture(torch.zeros(1, sample_shape[0], sample_shape[1] - gm.n_components(mixture)),
+                                      torch.zeros(1, sample_shape[0], sample_shape[1] - gm.n_components(mixture), n_dims),
+                                      torch.eye(n_dims).expand(1, sample_shape[0], sample_shape[1] - gm.n_components(mixture), n_dims, n_dims), packed_covariances=True)
+            mixture = torch.cat((mixture, padding), dim=2)
+
+        if file is None or offsets[-1] + 1 == samples_per_shard:
+            if file is not None:
+                file.close()
+            shard_files.append(f"shard_{len(shard_files)}.bin")
+            file = open(os.path.join(directory, shard_files[-1]), "wb")
+            offsets.append(0)
+        else:
+            offsets.append(offsets[-1] + 1)
+        shard_ids.append(len(shard_files) - 1)
+        labels.append(torch.as_tensor(label).view(-1)[0])
+        file.write(mixture.contiguous().numpy().astype("<f4", copy=False).tobytes())
+    if file is not None:
+        file.close()
+
+    assert len(labels) > 0
+    torch.save({
+        "type": "gm.MixtureShards",
+        "version": 1,
+        "sample_shape": sample_shape,
+        "shard_files": shard_files,
+        "shard": torch.tensor(shard_ids, dtype=torch.long),
+        "offset": torch.tensor(offsets, dtype=torch.long),
+        "labels": torch.stack(labels)
+    }, os.path.join(directory, "index.pt"))
+
+
+class ShardedMixtureDataSet(torch.utils.data.Dataset):
+    """
+    Serves the samples of write_shards as views into memory mapped shards, i.e., without opening a file or unpickling per sample.
+    The shards are mapped lazily in every data loader worker. Mixtures are returned with packed covariances (gmc.model.Net expands them
+    on the device), unless packed_covariances is False.
+    """
+    def __init__(self, directory: str, begin: int = 0, end: typing.Optional[int] = None, packed_covariances: bool = True):
+        index = torch.load(os.path.join(directory, "index.pt"))
+        assert index["type"] == "gm.MixtureShards"
+        assert index["version"] == 1
+        self.directory = directory
+        self.sample_shape = index["sample_shape"]
+        self.shard_files = index["shard_files"]
+        if end is None:
+            end = len(index["labels"])
+        self.shard = index["shard"][begin:end]
+        self.offset = index["offset"][begin:end]
+        self.labels = index["labels"][begin:end]
+        self.packed_covariances = packed_covariances
+        self._shards = None
+
+    def __getstate__(self):
+        # the maps are not sent to the workers, they map the files themselves
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        if self._shards is None:
+            self._shards = []
+            for shard_file in self.shard_files:
+                path = os.path.join(self.directory, shard_file)
+                n_samples = os.path.getsize(path) // (4 * int(np.prod(self.sample_shape)))
+                self._shards.append(np.memmap(path, dtype="<f4", mode="c", shape=(n_samples, *self.sample_shape)))
+
+        # plain ints, so that the memmap is sliced by basic indexing, i.e., the sample is a view and not a copy
+        mixture = torch.from_numpy(self._shards[int(self.shard[index])][int(self.offset[index])])
+        if not self.packed_covariances:
+            mixture = gm.convert_to_full_covariances(mixture.unsqueeze(0))[0]
+        return mixture, self.labels[index]
@@ -10,14 +10,14 @@ from .cpp.extensions.pieces import bindings as cppPiecesBindings
 # from https://discuss.pytorch.org/t/batched-index-select/9115/10
 # I added an unit test, but it's easy to make an error in such code, so.. :)
 def batched_index_select(tensor: Tensor, dim: int, index: Tensor) -> Tensor:
-    for ii in range(1, len(tensor.shape)):
-        if ii != dim:
-            index = index.unsqueeze(ii)
+    # index has the dimensions 0 and dim of tensor, the others are broadcast by a view (no copy)
+    index_shape = [1] * len(tensor.shape)
+    index_shape[0] = index.shape[0]
+    index_shape[dim] = index.shape[1]
     expanse = list(tensor.shape)
     expanse[0] = -1
     expanse[dim] = -1
-    index = index.expand(expanse)
-    return torch.gather(tensor, dim, index)
+    return torch.gather(tensor, dim, index.view(index_shape).expand(expanse))
 
 
 def my_index_select(tensor: Tensor, index: Tensor) -> Tensor:
@@ -25,10 +25,23 @@ def my_index_select(tensor: Tensor, index: Tensor) -> Tensor:
     expanse = list(tensor.shape)
     for i in range(len(index.shape)):
         expanse[i] = -1 if index.shape[i] > 1 else tensor.shape[i]
-    for ii in range(len(index.shape), len(tensor.shape)):
-        index = index.unsqueeze(ii)
-    index = index.expand(expanse)
-    return torch.gather(tensor, dim, index)
+    index = index.view(*index.shape, *([1] * (len(tensor.shape) - len(index.shape))))
+    return torch.gather(tensor, dim, index.expand(expanse))
+
+
+def select_top_components(mixture: Tensor, k: int, key: Tensor) -> Tensor:
+    """
+    The k components with the largest key (in descending order), e.g. the largest integrals for representative selection.
+    Uses topk instead of sorting all components, and gathers the Gaussian records with one broadcast index (CPU and GPU). Differentiable w.r.t. the mixture.
+
+    @param mixture: tensor with dimensions n_batch, n_layers, n_components, vec (any layout)
+    @param key: tensor with dimensions n_batch, n_layers, n_components (not differentiated)
+    @return: tensor with dimensions n_batch, n_layers, min(k, n_components), vec
+    """
+    assert key.shape == mixture.shape[:-1]
+    k = min(k, mixture.shape[-2])
+    _, indices = torch.topk(key.detach(), k, dim=-1, largest=True, sorted=True)
+    return torch.gather(mixture, -2, indices.unsqueeze(-1).expand(-1, -1, -1, mixture.shape[-1]))
 
 
 def inverse(tensor: Tensor) -> Tensor:
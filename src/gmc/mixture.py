@@ -1,4 +1,5 @@
 import math
+import typing
 
 import torch
 from torch import Tensor
@@ -14,6 +15,10 @@ def n_dimensions(mixture: Tensor) -> int:
         return 2
     if vector_length == 13:  # weight: 1, position: 3, covariance: 9
         return 3
+    if vector_length == 6:  # packed: weight: 1, position: 2, covariance upper triangle: 3
+        return 2
+    if vector_length == 10:  # packed: weight: 1, position: 3, covariance upper triangle: 6
+        return 3
     print(f"Invalid matrix in gm.n_dims with shape {mixture.shape}!")
     assert False
     exit(1)
@@ -43,14 +48,65 @@ def positions(mixture: Tensor) -> Tensor:
 
 
 def covariances(mixture: Tensor) -> Tensor:
+    """
+    a view for the full layout, a new (symmetric) tensor for the packed layout.
+    """
     _n_dims = n_dimensions(mixture)
     new_shape = list(mixture.shape)
     new_shape[-1] = _n_dims
     new_shape.append(_n_dims)
+    if is_packed(mixture):
+        return mixture[:, :, :, (_n_dims + 1):][..., _packed_to_full_index[_n_dims]].view(new_shape)
     return mixture[:, :, :, (_n_dims + 1):].view(new_shape)
 
 
-def pack_mixture(weights: Tensor, positions: Tensor, covariances: Tensor) -> Tensor:
+# packed layout: weight, position, upper triangle of the covariance matrix in row major order (xx, xy, yy or xx, xy, xz, yy, yz, zz).
+# 6 instead of 7 floats in 2d and 10 instead of 13 in 3d. evaluate_inversed and the convolution kernels read it directly (their backward passes
+# work on a full layout copy), the other kernels need the full layout, convert_to_full_covariances expands on the device.
+_packed_to_full_index = {2: [0, 1, 1, 2],
+                         3: [0, 1, 2, 1, 3, 4, 2, 4, 5]}
+_full_to_packed_index = {2: [0, 1, 3],
+                         3: [0, 1, 2, 4, 5, 8]}
+
+
+# covariance types. gmc.mixture_diagonal and gmc.mixture_isotropic store variances instead of matrices, their vector lengths collide with the
+# full and packed layouts (7 floats is 2d full and 3d diagonal), so evaluate, convolve, modules.Convolution and fitting.fixed_point_only take the type explicitly.
+COVARIANCE_FULL = "full"                # full or packed layout
+COVARIANCE_DIAGONAL = "diagonal"
+COVARIANCE_ISOTROPIC = "isotropic"
+
+
+def covariance_type_module(covariance_type: str):
+    """
+    gmc.mixture_diagonal or gmc.mixture_isotropic (imported here, they build on this module)
+    """
+    if covariance_type == COVARIANCE_DIAGONAL:
+        from . import mixture_diagonal
+        return mixture_diagonal
+    assert covariance_type == COVARIANCE_ISOTROPIC
+    from . import mixture_isotropic
+    return mixture_isotropic
+
+
+def is_packed(mixture: Tensor) -> bool:
+    return mixture.shape[-1] == 6 or mixture.shape[-1] == 10
+
+
+def convert_to_packed_covariances(mixture: Tensor) -> Tensor:
+    if is_packed(mixture):
+        return mixture
+    _n_dims = n_dimensions(mixture)
+    return torch.cat((mixture[..., :(_n_dims + 1)], mixture[..., (_n_dims + 1):][..., _full_to_packed_index[_n_dims]]), dim=-1)
+
+
+def convert_to_full_covariances(mixture: Tensor) -> Tensor:
+    if not is_packed(mixture):
+        return mixture
+    _n_dims = n_dimensions(mixture)
+    return torch.cat((mixture[..., :(_n_dims + 1)], mixture[..., (_n_dims + 1):][..., _packed_to_full_index[_n_dims]]), dim=-1)
+
+
+def pack_mixture(weights: Tensor, positions: Tensor, covariances: Tensor, packed_covariances: bool = False) -> Tensor:
     assert weights.shape[0] == positions.shape[0] == covariances.shape[0]
     if not weights.shape[1] == positions.shape[1] == covariances.shape[1]:
         assert weights.shape[1] == positions.shape[1] == covariances.shape[1]
@@ -64,7 +120,52 @@ def pack_mixture(weights: Tensor, positions: Tensor, covariances: Tensor) -> Ten
     assert dims == 2 or dims == 3
 
     cov_shape[-1] = dims * dims
-    return torch.cat((weights.view(weight_shape), positions, covariances.view(cov_shape)), dim=len(positions.shape) - 1)
+    covariances = covariances.reshape(cov_shape)
+    if packed_covariances:
+        covariances = covariances[..., _full_to_packed_index[dims]]
+    return torch.cat((weights.view(weight_shape), positions, covariances), dim=len(positions.shape) - 1)
+
+
+class CovarianceCache:
+    """
+    Side-car for values derived from the covariances of a mixture: the inverse, the determinant and the Cholesky factor.
+    They are computed on first use and shared by evaluate, evaluate_componentwise, convert_amplitudes_to_priors and the fitting.
+    The cached tensors are part of the autograd graph like freshly computed ones.
+
+    Only the covariances are cached, so mixtures with the same covariances (e.g. reweighted fittings) can share one cache.
+    The cache belongs to one forward pass: it must not be used after modifying the mixture in place or after backward.
+    """
+    def __init__(self, mixture: Tensor):
+        self.covariances = covariances(mixture)
+        self._version = self.covariances._version
+        self._inverse: typing.Optional[Tensor] = None
+        self._det: typing.Optional[Tensor] = None
+        self._cholesky: typing.Optional[Tensor] = None
+
+    @property
+    def inverse(self) -> Tensor:
+        assert self.covariances._version == self._version    # modified in place
+        if self._inverse is None:
+            # torch inverse returns a transposed matrix (v 1.3.1). our matrix is symmetric however, and we want to take a view, so the transpose avoids a copy.
+            self._inverse = mat_tools.inverse(self.covariances).transpose(-1, -2)
+        return self._inverse
+
+    @property
+    def det(self) -> Tensor:
+        assert self.covariances._version == self._version
+        if self._det is None:
+            if self._cholesky is not None:
+                self._det = self._cholesky.diagonal(dim1=-2, dim2=-1).prod(dim=-1) ** 2
+            else:
+                self._det = self.covariances.det()
+        return self._det
+
+    @property
+    def cholesky(self) -> Tensor:
+        assert self.covariances._version == self._version
+        if self._cholesky is None:
+            self._cholesky = torch.linalg.cholesky(self.covariances)
+        return self._cholesky
 
 
 def is_valid_mixture(mixture: Tensor) -> bool:
@@ -75,15 +176,26 @@ def is_valid_mixture(mixture: Tensor) -> bool:
     # ok = ok and torch.all(covariances(mixture).det() > 0)
     # return ok
 
+    if config.validation_level == config.VALIDATION_OFF:
+        return True
     # mixture: 1st dimension: batch, 2nd: layer, 3rd: component, 4th: vector of gaussian data
-    assert not torch.any(torch.isnan(mixture))
-    assert not torch.any(torch.isinf(mixture))
     assert len(mixture.shape) == 4
     assert n_dimensions(mixture) == 2 or n_dimensions(mixture) == 3   # also checks the length of the Gaussian vector
-    assert torch.all(covariances(mixture).det() > 0)
+    # nan, inf and det > 0 in one device sync
+    assert value_check(lambda: torch.isfinite(mixture).all() & (covariances(mixture).det() > 0).all())
     return True
 
 
+def value_check(predicate: typing.Callable[[], Tensor]) -> bool:
+    """
+    Evaluates predicate (a scan over tensor values, e.g. for nans) only with config.validation_level == VALIDATION_FULL, as it syncs with the device.
+    Use as assert gm.value_check(lambda: ...).
+    """
+    if config.validation_level < config.VALIDATION_FULL:
+        return True
+    return bool(predicate())
+
+
 def integrate(mixture: Tensor) -> Tensor:
     ## test the cpp version, but disable for now because there is no backward.
     ## we want to use gaussian integrals internally in the cpp fitting code, and had to verify. python integration is not too slow for the time being.
@@ -96,6 +208,7 @@ def evaluate_inversed_with_amplitude_mixture(mixture: Tensor, xes: Tensor) -> Te
 
 
 def evaluate_inversed(mixture: Tensor, xes: Tensor) -> Tensor:
+    # packed covariances are read directly by the kernel
     return cppExtensionsEvaluateInversed.apply(mixture, xes)
 
 
@@ -141,12 +254,116 @@ def old_evaluate_inversed(mixture: Tensor, xes: Tensor) -> Tensor:
     return values_sum
 
 
-def evaluate(mixture: Tensor, xes: Tensor) -> Tensor:
+def evaluate(mixture: Tensor, xes: Tensor, covariance_cache: typing.Optional[CovarianceCache] = None, covariance_type: str = COVARIANCE_FULL) -> Tensor:
+    """
+    @param covariance_cache: of a mixture with the same covariances, computed if not given. full covariances only
+    @param covariance_type: COVARIANCE_DIAGONAL and COVARIANCE_ISOTROPIC are evaluated element wise by covariance_type_module
+    @return: tensor with dimensions n_batch, n_layers, n_xes
+    """
+    if covariance_type != COVARIANCE_FULL:
+        assert covariance_cache is None
+        return covariance_type_module(covariance_type).evaluate(mixture, xes)
+    if covariance_cache is None:
+        covariance_cache = CovarianceCache(mixture)
+    return evaluate_inversed(pack_mixture(weights(mixture), positions(mixture), covariance_cache.inverse), xes)
+
+
+def evaluate_inversed_truncated(mixture: Tensor, xes: Tensor, sigma_cutoff: typing.Optional[float] = None) -> Tensor:
+    """
+    Truncated support evaluation: every query point only evaluates components, which are closer than sigma_cutoff standard deviations
+    (mahalanobis distance), or more precisely, whose bounding box at that distance contains the point. A BVH per mixture finds those
+    components (CPU and CUDA), hence the cost is roughly O(n_xes * log(n_components)) for well spread mixtures.
+    The error is bounded by truncation_error_bound(mixture, sigma_cutoff).
+
+    @param sigma_cutoff: defaults to config.eval_sigma_cutoff
+    @return: tensor with dimensions n_batch, n_layers, n_xes
+    """
+    if sigma_cutoff is None:
+        sigma_cutoff = config.eval_sigma_cutoff
+    if n_components(mixture) < 2:
+        # the bvh needs at least one inner node. there is nothing to gain with a single component anyways.
+        return evaluate_inversed(mixture, xes)
+    # the bvh is built from Gaussian structs, i.e., the full layout
+    return cppExtensionsEvaluateInversed.apply_truncated(convert_to_full_covariances(mixture), xes, float(sigma_cutoff))
+
+
+def truncation_error_bound(mixture: Tensor, sigma_cutoff: typing.Optional[float] = None) -> Tensor:
+    """
+    Upper bound of |evaluate_inversed(mixture, x) - evaluate_inversed_truncated(mixture, x, sigma_cutoff)| for any x.
+    A skipped component is at least sigma_cutoff standard deviations away, so it contributes less than |amplitude| * exp(-sigma_cutoff^2 / 2).
+
+    @param mixture: mixture with inversed covariances (as for evaluate_inversed)
+    @return: tensor with dimensions n_batch, n_layers
+    """
+    if sigma_cutoff is None:
+        sigma_cutoff = config.eval_sigma_cutoff
+    _n_dims = n_dimensions(mixture)
+    amplitudes = weights(mixture) * torch.sqrt(torch.det(covariances(mixture)) / ((2.0 * math.pi) ** _n_dims))
+    return amplitudes.abs().sum(dim=-1) * math.exp(-0.5 * sigma_cutoff ** 2)
+
+
+def evaluate_inversed_chunked(mixture: Tensor, xes: Tensor, memory_budget: typing.Optional[int] = None) -> Tensor:
+    """
+    Streaming variant of evaluate_inversed for huge point sets (4K renderings, 10^6 sample positions etc.).
+    The query points are walked in chunks, and the components only if the budget can't hold the whole mixture. Every chunk is written
+    into a preallocated output. Autograd works as usual. Every component block and every chunk of query points is made contiguous once,
+    so backward keeps a single copy of the mixture and the query points, plus the chunk outputs.
+    The result is bit identical to evaluate_inversed as long as the components are not split, because every point is summed up by
+    the same kernel in the same order. Splitting the components changes the summation order (differences in the order of the machine epsilon).
+    Half and bfloat16 mixtures give a float32 result, as evaluate_inversed.
+
+    @param memory_budget: upper bound in bytes for the kernel in- and outputs of one chunk in forward and backward; defaults to config.eval_slize_size
+    @return: tensor with dimensions n_batch, n_layers, n_xes
+    """
+    if memory_budget is None:
+        memory_budget = config.eval_slize_size
+    _n_batch = n_batch(mixture)
+    _n_layers = n_layers(mixture)
+    _n_dims = n_dimensions(mixture)
+    _n_comps = n_components(mixture)
+
+    assert len(xes.shape) == 4
+    assert xes.shape[0] == 1 or xes.shape[0] == _n_batch
+    assert xes.shape[1] == 1 or xes.shape[1] == _n_layers
+    n_xes = xes.shape[2]
+    assert xes.shape[3] == _n_dims
+
+    # non-contiguous slices are copied by the kernel binding, and backward allocates gradients of the same size. hence the factor 2.
+    element_size = mixture.element_size()
+    bytes_per_component = 2 * element_size * _n_batch * _n_layers * mixture.shape[-1]
+    bytes_per_xes = 2 * element_size * (_n_batch * _n_layers + xes.shape[0] * xes.shape[1] * _n_dims)
+
+    comp_chunk_size = _n_comps
+    if bytes_per_component * _n_comps + bytes_per_xes > memory_budget:
+        comp_chunk_size = max(memory_budget // (2 * bytes_per_component), 1)
+    xes_chunk_size = max((memory_budget - bytes_per_component * comp_chunk_size) // bytes_per_xes, 1)
+
+    # the kernel accumulates and returns reduced precision mixtures in float32
+    result_dtype = torch.float32 if mixture.dtype in (torch.float16, torch.bfloat16) else mixture.dtype
+    result = torch.empty(_n_batch, _n_layers, n_xes, dtype=result_dtype, device=mixture.device)
+    # the chunks of xes are made contiguous once as well, otherwise the kernel binding would copy (and keep) them for every component block
+    xes_chunks = [(xes_begin, min(xes_begin + xes_chunk_size, n_xes), xes[:, :, xes_begin:(xes_begin + xes_chunk_size), :].contiguous())
+                  for xes_begin in range(0, n_xes, xes_chunk_size)]
+    for comps_begin in range(0, _n_comps, comp_chunk_size):
+        comps_end = min(comps_begin + comp_chunk_size, _n_comps)
+        mixture_chunk = mixture[:, :, comps_begin:comps_end, :].contiguous()
+        for xes_begin, xes_end, xes_chunk in xes_chunks:
+            values = cppExtensionsEvaluateInversed.apply(mixture_chunk, xes_chunk)
+            if comps_begin == 0:
+                result[:, :, xes_begin:xes_end] = values
+            else:
+                result[:, :, xes_begin:xes_end] += values
+    return result
+
+
+def evaluate_chunked(mixture: Tensor, xes: Tensor, memory_budget: typing.Optional[int] = None, covariance_cache: typing.Optional[CovarianceCache] = None) -> Tensor:
     """
+    memory bounded variant of evaluate, see evaluate_inversed_chunked.
     @return: tensor with dimensions n_batch, n_layers, n_xes
     """
-    # torch inverse returns a transposed matrix (v 1.3.1). our matrix is symmetric however, and we want to take a view, so the transpose avoids a copy.
-    return evaluate_inversed(pack_mixture(weights(mixture), positions(mixture), mat_tools.inverse(covariances(mixture)).transpose(-1, -2)), xes)
+    if covariance_cache is None:
+        covariance_cache = CovarianceCache(mixture)
+    return evaluate_inversed_chunked(pack_mixture(weights(mixture), positions(mixture), covariance_cache.inverse), xes, memory_budget)
 
 
 def evaluate_componentwise_inversed(gaussians: Tensor, xes: Tensor):
@@ -180,9 +397,10 @@ def evaluate_componentwise_inversed(gaussians: Tensor, xes: Tensor):
     return values
 
 
-def evaluate_componentwise(mixture: Tensor, xes: Tensor) -> Tensor:
-    # torch inverse returns a transposed matrix (v 1.3.1). our matrix is symmetric however, and we want to take a view, so the transpose avoids a copy.
-    return evaluate_componentwise_inversed(pack_mixture(weights(mixture), positions(mixture), mat_tools.inverse(covariances(mixture)).transpose(-1, -2)), xes)
+def evaluate_componentwise(mixture: Tensor, xes: Tensor, covariance_cache: typing.Optional[CovarianceCache] = None) -> Tensor:
+    if covariance_cache is None:
+        covariance_cache = CovarianceCache(mixture)
+    return evaluate_componentwise_inversed(pack_mixture(weights(mixture), positions(mixture), covariance_cache.inverse), xes)
 
 
 def is_valid_mixture_and_constant(mixture: Tensor, constant: Tensor) -> bool:
@@ -195,6 +413,8 @@ def is_valid_mixture_and_constant(mixture: Tensor, constant: Tensor) -> bool:
     # ok = ok and mixture.device == constant.device
     # return ok
 
+    if config.validation_level == config.VALIDATION_OFF:
+        return True
     assert is_valid_mixture(mixture)
     # todo: actually, i think the batch dimension is not needed for the constant
     assert len(constant.shape) == 2
@@ -240,40 +460,69 @@ def _polynomial_mul_repeat(A: Tensor, B: Tensor) -> (Tensor, Tensor):
     return A.repeat(A_repeats), B.repeat_interleave(A_n, dim=2)
 
 
-def convolve(m1: Tensor, m2: Tensor) -> Tensor:
+def convolve(m1: Tensor, m2: Tensor, n_components_out: typing.Optional[int] = None, covariance_type: str = COVARIANCE_FULL) -> Tensor:
+    """
+    Convolution of every component of m1 with every component of m2: the weights (priors) multiply, positions and covariances add.
+    The pairs are broadcast, only the output is materialised (not the repeated inputs as with _polynomial_mul_repeat).
+    Component j * n_components(m1) + i of the output is the convolution of m1[i] and m2[j].
+
+    @param n_components_out: optional budget. if given, only the products with the largest absolute amplitude are computed, in descending order.
+                             the selection costs a few scalars per pair, not the full Gaussian record (e.g. for large kernel banks).
+    @param covariance_type: COVARIANCE_DIAGONAL and COVARIANCE_ISOTROPIC add the variances element wise (covariance_type_module), without budget
+    @return: tensor with dimensions max(n_batch(m1), n_batch(m2)), n_layers, n_components(m1) * n_components(m2) (or n_components_out), vec
+    """
+    if covariance_type != COVARIANCE_FULL:
+        assert n_components_out is None
+        return covariance_type_module(covariance_type).convolve(m1, m2)
+
     assert n_batch(m1) == 1 or n_batch(m2) == 1 or n_batch(m1) == n_batch(m2)
     assert n_layers(m1) == n_layers(m2)
     assert n_dimensions(m1) == n_dimensions(m2)
+    assert is_packed(m1) == is_packed(m2)
     assert is_valid_mixture(m1)
     assert is_valid_mixture(m2)
-    m1, m2 = _polynomial_mul_repeat(m1, m2)
-
-    m1_c = covariances(m1)
-    m2_c = covariances(m2)
-    m_new = m1 + m2
-    m_new_c = covariances(m_new)
-    assert (torch.det(m_new_c) > 0).all()
-    detc1tc2 = torch.det(m1_c) * torch.det(m2_c)
-    detc1pc2 = torch.det(m_new_c)
-    m1_w = weights(m1)
-    m2_w = weights(m2)
-    assert not torch.isnan(m1_w).any()
-    assert not torch.isnan(m2_w).any()
-    assert not torch.isnan(detc1tc2).any()
-    assert not torch.isnan(detc1pc2).any()
-    assert not torch.isnan(torch.sqrt(detc1tc2)).any()
-    assert not torch.isnan(torch.sqrt(detc1pc2)).any()
-    m_new_w = m1_w * m2_w
-    assert not torch.isnan(m_new_w).any()
-    m_new_w = m_new_w.view(n_batch(m_new), n_layers(m_new), n_components(m_new), 1)
-    assert not torch.isnan(m_new_w).any()
-    m_new = m_new[:, :, :, 1:]
-    m_new = torch.cat((m_new_w, m_new), dim=-1)
 
+    if n_components_out is not None and n_components_out < n_components(m1) * n_components(m2):
+        m_new = _convolve_largest(m1, m2, n_components_out)
+    else:
+        # 1. dim: batches, 2. layers, 3. component of m2, 4. component of m1, 5. vector
+        m_new_w = (weights(m2).unsqueeze(3) * weights(m1).unsqueeze(2)).flatten(2, 3)
+        m_new = (m2[:, :, :, 1:].unsqueeze(3) + m1[:, :, :, 1:].unsqueeze(2)).flatten(2, 3)
+        m_new = torch.cat((m_new_w.unsqueeze(-1), m_new), dim=-1)
+
+    # covers nans and non positive definite sums
     assert is_valid_mixture(m_new)
     return m_new
 
 
+def _pairwise_det_of_sums(c1: Tensor, c2: Tensor) -> Tensor:
+    """
+    det(c2[j] + c1[i]) for all pairs, with dimensions n_batch, n_layers, n_components(c2), n_components(c1).
+    closed form, entry by entry, so the summed matrices are never materialised.
+    """
+    def c(row: int, col: int) -> Tensor:
+        return c2[:, :, :, row, col].unsqueeze(3) + c1[:, :, :, row, col].unsqueeze(2)
+
+    if c1.shape[-1] == 2:
+        return c(0, 0) * c(1, 1) - c(0, 1) * c(1, 0)
+    return (c(0, 0) * (c(1, 1) * c(2, 2) - c(1, 2) * c(2, 1))
+            - c(0, 1) * (c(1, 0) * c(2, 2) - c(1, 2) * c(2, 0))
+            + c(0, 2) * (c(1, 0) * c(2, 1) - c(1, 1) * c(2, 0)))
+
+
+def _convolve_largest(m1: Tensor, m2: Tensor, n_components_out: int) -> Tensor:
+    _n_batch = max(n_batch(m1), n_batch(m2))
+    _n_comps_1 = n_components(m1)
+    with torch.no_grad():
+        # amplitude of the convolved Gaussian without the constant (2 pi)^(d/2)
+        key = (weights(m2).unsqueeze(3) * weights(m1).unsqueeze(2)).abs() / _pairwise_det_of_sums(covariances(m1), covariances(m2)).sqrt()
+        _, indices = torch.topk(key.flatten(2, 3), n_components_out, dim=-1, largest=True, sorted=True)
+    vec_size = m1.shape[-1]
+    selected_1 = torch.gather(m1.expand(_n_batch, -1, -1, -1), 2, (indices % _n_comps_1).unsqueeze(-1).expand(-1, -1, -1, vec_size))
+    selected_2 = torch.gather(m2.expand(_n_batch, -1, -1, -1), 2, torch.div(indices, _n_comps_1, rounding_mode='floor').unsqueeze(-1).expand(-1, -1, -1, vec_size))
+    return torch.cat(((weights(selected_1) * weights(selected_2)).unsqueeze(-1), selected_1[:, :, :, 1:] + selected_2[:, :, :, 1:]), dim=-1)
+
+
 def spatial_scale(m: Tensor, scaling_factors: Tensor) -> Tensor:
     """Does not scale weights, i.e., the amplitudes will change, but not the integral."""
     assert len(scaling_factors.shape) == 3
@@ -291,27 +540,33 @@ def spatial_scale(m: Tensor, scaling_factors: Tensor) -> Tensor:
     return pack_mixture(w, p, c)
 
 
-def convert_priors_to_amplitudes2(weights: torch.Tensor, covariances: torch.Tensor) -> torch.Tensor:
+def convert_priors_to_amplitudes2(weights: torch.Tensor, covariances: torch.Tensor, covariances_det: typing.Optional[torch.Tensor] = None) -> torch.Tensor:
     # Given mixture has priors as weights
     # This returns a new mixture with corresponding amplitudes as weights
     ndims = covariances.shape[-1]
     fct = math.sqrt((2 * math.pi) ** ndims)
-    return weights / (covariances.det().sqrt() * fct)
+    if covariances_det is None:
+        covariances_det = covariances.det()
+    return weights / (covariances_det.sqrt() * fct)
 
 
-def convert_priors_to_amplitudes(gm: torch.Tensor) -> torch.Tensor:
+def convert_priors_to_amplitudes(gm: torch.Tensor, covariance_cache: typing.Optional[CovarianceCache] = None) -> torch.Tensor:
     # Given mixture has priors as weights
     # This returns a new mixture with corresponding amplitudes as weights
+    if covariance_cache is None:
+        covariance_cache = CovarianceCache(gm)
     _covariances = covariances(gm)
-    return pack_mixture(convert_priors_to_amplitudes2(weights(gm), _covariances), positions(gm), _covariances)
+    return pack_mixture(convert_priors_to_amplitudes2(weights(gm), _covariances, covariance_cache.det), positions(gm), _covariances)
 
 
-def convert_amplitudes_to_priors(gm: torch.Tensor) -> torch.Tensor:
+def convert_amplitudes_to_priors(gm: torch.Tensor, covariance_cache: typing.Optional[CovarianceCache] = None) -> torch.Tensor:
     # Given mixture has amplitudes as weights
     # This returns a new mixture with corresponding priors as weights
+    if covariance_cache is None:
+        covariance_cache = CovarianceCache(gm)
     ndims = n_dimensions(gm)
     fct = math.sqrt((2 * math.pi) ** ndims)
     gmamp = weights(gm)
     gmcov = covariances(gm)
-    priors = gmamp * (gmcov.det().sqrt() * fct)
+    priors = gmamp * (covariance_cache.det.sqrt() * fct)
     return pack_mixture(priors, positions(gm), gmcov)
@@ -0,0 +1,159 @@
+"""
+Mixtures with axis aligned (diagonal) covariances: weight, position, variances along the axes.
+5 floats per Gaussian in 2d and 7 in 3d, dimensions n_batch, n_layers, n_components, vec as in gmc.mixture.
+The vector lengths overlap with the full and packed layouts, hence the separate module: the functions of gmc.mixture must not be used on these tensors,
+except gmc.mixture.evaluate and gmc.mixture.convolve with covariance_type=gmc.mixture.COVARIANCE_DIAGONAL, which dispatch here.
+modules.Convolution (ConvolutionConfig.covariance_type) and fitting.fixed_point_only (fitting.Config.covariance_type) take these mixtures as well.
+Evaluation, convolution and the prior / amplitude conversion work element wise on the variances, there are no matrix inverses or determinants.
+Weights are priors (integrals) as in gmc.mixture.
+
+gmc.mixture_isotropic builds on the private functions of this module, they take the variances with either n_dims or 1 entries.
+"""
+import math
+import typing
+
+import torch
+from torch import Tensor
+
+from . import config
+from . import mixture as gm
+
+
+def n_dimensions(mixture: Tensor) -> int:
+    vector_length = mixture.shape[-1]
+    assert vector_length == 5 or vector_length == 7     # weight: 1, position: 2 or 3, variances: 2 or 3
+    return (vector_length - 1) // 2
+
+
+def weights(mixture: Tensor) -> Tensor:
+    return mixture[:, :, :, 0]
+
+
+def positions(mixture: Tensor) -> Tensor:
+    return mixture[:, :, :, 1:(n_dimensions(mixture) + 1)]
+
+
+def variances(mixture: Tensor) -> Tensor:
+    return mixture[:, :, :, (n_dimensions(mixture) + 1):]
+
+
+def pack_mixture(weights: Tensor, positions: Tensor, variances: Tensor) -> Tensor:
+    return torch.cat((weights.unsqueeze(-1), positions, variances), dim=-1)
+
+
+def from_full(mixture: Tensor) -> Tensor:
+    """
+    converts a mixture of gmc.mixture (full or packed layout) by dropping the off diagonal covariance entries. exact only for axis aligned mixtures.
+    """
+    return pack_mixture(gm.weights(mixture), gm.positions(mixture), torch.diagonal(gm.covariances(mixture), dim1=-2, dim2=-1))
+
+
+def to_full(mixture: Tensor) -> Tensor:
+    return gm.pack_mixture(weights(mixture), positions(mixture), torch.diag_embed(variances(mixture)))
+
+
+def integrate(mixture: Tensor) -> Tensor:
+    return weights(mixture).sum(dim=-1)
+
+
+def evaluate_componentwise(mixture: Tensor, xes: Tensor) -> Tensor:
+    """
+    @return: tensor with dimensions n_batch, n_layers, n_xes, n_components
+    """
+    return _evaluate_componentwise(weights(mixture), positions(mixture), variances(mixture), xes)
+
+
+def evaluate(mixture: Tensor, xes: Tensor) -> Tensor:
+    """
+    @param xes: tensor with dimensions n_batch (may be 1), n_layers (may be 1), n_xes, n_dims
+    @return: tensor with dimensions n_batch, n_layers, n_xes
+    """
+    return _evaluate(weights(mixture), positions(mixture), variances(mixture), xes)
+
+
+def convolve(m1: Tensor, m2: Tensor) -> Tensor:
+    """
+    Component j * n_components(m1) + i of the output is the convolution of m1[i] and m2[j], as in gmc.mixture.convolve.
+    """
+    assert m1.shape[-1] == m2.shape[-1]
+    return _convolve(m1, m2)
+
+
+def convolve_layers(data: Tensor, kernels: Tensor) -> Tensor:
+    """
+    The convolution layer of gmc.cpp.extensions.convolution (modules.Convolution): every input layer of data with the same input layer of every kernel,
+    the results of all input layers are concatenated. Same components as the extension, in a different order.
+
+    @param data: tensor with dimensions n_batch, n_layers_in, n_components, vec
+    @param kernels: tensor with dimensions n_layers_out, n_layers_in, n_kernel_components, vec
+    @return: tensor with dimensions n_batch, n_layers_out, n_layers_in * n_components * n_kernel_components, vec
+    """
+    assert data.shape[-1] == kernels.shape[-1]
+    return _convolve_layers(data, kernels)
+
+
+def convert_priors_to_amplitudes(mixture: Tensor) -> Tensor:
+    _variances = variances(mixture)
+    return pack_mixture(weights(mixture) / _norm_factor(_variances, n_dimensions(mixture)), positions(mixture), _variances)
+
+
+def convert_amplitudes_to_priors(mixture: Tensor) -> Tensor:
+    _variances = variances(mixture)
+    return pack_mixture(weights(mixture) * _norm_factor(_variances, n_dimensions(mixture)), positions(mixture), _variances)
+
+
+def _norm_factor(variances: Tensor, n_dims: int) -> Tensor:
+    # sqrt((2 pi)^d det(covariance)) with the determinant of a diagonal (or scaled identity) matrix
+    if variances.shape[-1] == 1:
+        det = variances[..., 0] ** n_dims
+    else:
+        det = variances.prod(dim=-1)
+    return torch.sqrt(det * ((2 * math.pi) ** n_dims))
+
+
+def _evaluate_componentwise(weights: Tensor, positions: Tensor, variances: Tensor, xes: Tensor) -> Tensor:
+    n_dims = positions.shape[-1]
+    assert len(xes.shape) == 4
+    assert xes.shape[0] == 1 or xes.shape[0] == weights.shape[0]
+    assert xes.shape[1] == 1 or xes.shape[1] == weights.shape[1]
+    assert xes.shape[3] == n_dims
+
+    # 1. dim: batches, 2. layers, 3. xes, 4. component, 5. vector
+    values = xes.unsqueeze(-2) - positions.unsqueeze(-3)
+    if variances.shape[-1] == 1:
+        quadratic_form = (values * values).sum(dim=-1) / variances.squeeze(-1).unsqueeze(-2)
+    else:
+        quadratic_form = (values * values / variances.unsqueeze(-3)).sum(dim=-1)
+    amplitudes = weights / _norm_factor(variances, n_dims)
+    return amplitudes.unsqueeze(-2) * torch.exp(-0.5 * quadratic_form)
+
+
+def _evaluate(weights: Tensor, positions: Tensor, variances: Tensor, xes: Tensor) -> Tensor:
+    # the component wise values of one chunk of xes fit into config.eval_slize_size
+    n_batch, n_layers, n_components, n_dims = positions.shape
+    n_xes = xes.shape[2]
+    bytes_per_xes = n_batch * n_layers * n_components * n_dims * positions.element_size()
+    xes_chunk_size = max(config.eval_slize_size // bytes_per_xes, 1)
+    if xes_chunk_size >= n_xes:
+        return _evaluate_componentwise(weights, positions, variances, xes).sum(dim=-1)
+    return torch.cat([_evaluate_componentwise(weights, positions, variances, xes[:, :, begin:(begin + xes_chunk_size), :]).sum(dim=-1)
+                      for begin in range(0, n_xes, xes_chunk_size)], dim=2)
+
+
+def _convolve(m1: Tensor, m2: Tensor) -> Tensor:
+    assert m1.shape[0] == 1 or m2.shape[0] == 1 or m1.shape[0] == m2.shape[0]
+    assert m1.shape[1] == m2.shape[1]
+    # the weights multiply, positions and variances add
+    m_new_w = (m2[:, :, :, 0].unsqueeze(3) * m1[:, :, :, 0].unsqueeze(2)).flatten(2, 3)
+    m_new = (m2[:, :, :, 1:].unsqueeze(3) + m1[:, :, :, 1:].unsqueeze(2)).flatten(2, 3)
+    return torch.cat((m_new_w.unsqueeze(-1), m_new), dim=-1)
+
+
+def _convolve_layers(data: Tensor, kernels: Tensor) -> Tensor:
+    assert data.shape[1] == kernels.shape[1]
+    # 1. dim: batches, 2. output layers, 3. input layers, 4. data component, 5. kernel component, 6. vector
+    data = data.unsqueeze(1).unsqueeze(4)
+    kernels = kernels.unsqueeze(0).unsqueeze(3)
+    m_new_w = (data[..., 0] * kernels[..., 0]).flatten(2, 4)
+    m_new = (data[..., 1:] + kernels[..., 1:]).flatten(2, 4)
+    return torch.cat((m_new_w.unsqueeze(-1), m_new), dim=-1)
@@ -0,0 +1,101 @@
+"""
+Mixtures with isotropic covariances (variance * identity): weight, position, variance.
+4 floats per Gaussian in 2d and 5 in 3d, dimensions n_batch, n_layers, n_components, vec as in gmc.mixture.
+Same interface as gmc.mixture_diagonal, which implements the element wise evaluation and convolution for both.
+"""
+import torch
+from torch import Tensor
+
+from . import mixture as gm
+from . import mixture_diagonal as gmd
+
+
+def n_dimensions(mixture: Tensor) -> int:
+    vector_length = mixture.shape[-1]
+    assert vector_length == 4 or vector_length == 5     # weight: 1, position: 2 or 3, variance: 1
+    return vector_length - 2
+
+
+def weights(mixture: Tensor) -> Tensor:
+    return mixture[:, :, :, 0]
+
+
+def positions(mixture: Tensor) -> Tensor:
+    return mixture[:, :, :, 1:(n_dimensions(mixture) + 1)]
+
+
+def variances(mixture: Tensor) -> Tensor:
+    """
+    @return: tensor with dimensions n_batch, n_layers, n_components, 1
+    """
+    return mixture[:, :, :, -1:]
+
+
+def pack_mixture(weights: Tensor, positions: Tensor, variances: Tensor) -> Tensor:
+    return gmd.pack_mixture(weights, positions, variances)
+
+
+def from_full(mixture: Tensor) -> Tensor:
+    """
+    converts a mixture of gmc.mixture (full or packed layout), the variance is the mean of the eigenvalues (trace / n_dims).
+    exact only for isotropic mixtures, otherwise it keeps the integral and the position.
+    """
+    _variances = torch.diagonal(gm.covariances(mixture), dim1=-2, dim2=-1).mean(dim=-1, keepdim=True)
+    return pack_mixture(gm.weights(mixture), gm.positions(mixture), _variances)
+
+
+def from_diagonal(mixture: Tensor) -> Tensor:
+    return pack_mixture(gmd.weights(mixture), gmd.positions(mixture), gmd.variances(mixture).mean(dim=-1, keepdim=True))
+
+
+def to_diagonal(mixture: Tensor) -> Tensor:
+    return pack_mixture(weights(mixture), positions(mixture), variances(mixture).expand(-1, -1, -1, n_dimensions(mixture)))
+
+
+def to_full(mixture: Tensor) -> Tensor:
+    return gmd.to_full(to_diagonal(mixture))
+
+
+def integrate(mixture: Tensor) -> Tensor:
+    return weights(mixture).sum(dim=-1)
+
+
+def evaluate_componentwise(mixture: Tensor, xes: Tensor) -> Tensor:
+    """
+    @return: tensor with dimensions n_batch, n_layers, n_xes, n_components
+    """
+    return gmd._evaluate_componentwise(weights(mixture), positions(mixture), variances(mixture), xes)
+
+
+def evaluate(mixture: Tensor, xes: Tensor) -> Tensor:
+    """
+    @param xes: tensor with dimensions n_batch (may be 1), n_layers (may be 1), n_xes, n_dims
+    @return: tensor with dimensions n_batch, n_layers, n_xes
+    """
+    return gmd._evaluate(weights(mixture), positions(mixture), variances(mixture), xes)
+
+
+def convolve(m1: Tensor, m2: Tensor) -> Tensor:
+    """
+    Component j * n_components(m1) + i of the output is the convolution of m1[i] and m2[j], as in gmc.mixture.convolve.
+    """
+    assert m1.shape[-1] == m2.shape[-1]
+    return gmd._convolve(m1, m2)
+
+
+def convolve_layers(data: Tensor, kernels: Tensor) -> Tensor:
+    """
+    The convolution layer of gmc.cpp.extensions.convolution, as gmc.mixture_diagonal.convolve_layers.
+    """
+    assert data.shape[-1] == kernels.shape[-1]
+    return gmd._convolve_layers(data, kernels)
+
+
+def convert_priors_to_amplitudes(mixture: Tensor) -> Tensor:
+    _variances = variances(mixture)
+    return pack_mixture(weights(mixture) / gmd._norm_factor(_variances, n_dimensions(mixture)), positions(mixture), _variances)
+
+
+def convert_amplitudes_to_priors(mixture: Tensor) -> Tensor:
+    _variances = variances(mixture)
+    return pack_mixture(weights(mixture) * gmd._norm_factor(_variances, n_dimensions(mixture)), positions(mixture), _variances)
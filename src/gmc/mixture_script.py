@@ -0,0 +1,114 @@
+"""
+Pure tensor versions of the gmc.mixture helpers for small mixtures, which torch.jit.script and torch.compile can trace without graph breaks:
+no asserts or value checks, no CovarianceCache, no shape arithmetic on python lists, and closed form 2x2 / 3x3 determinants instead of torch.det,
+so the compiler can fuse everything into a few element wise kernels. Layouts, shapes and results are the same as in gmc.mixture.
+Nothing is validated, use gmc.mixture.is_valid_mixture before if needed.
+
+Usage: torch.jit.script(mixture_script.evaluate_inversed) or torch.compile(mixture_script.evaluate_inversed).
+"""
+import math
+
+import torch
+from torch import Tensor
+
+
+def n_dimensions(mixture: Tensor) -> int:
+    vector_length = mixture.shape[-1]
+    if vector_length == 7 or vector_length == 6:    # full or packed 2d
+        return 2
+    if vector_length == 13 or vector_length == 10:  # full or packed 3d
+        return 3
+    raise ValueError("invalid length of the gaussian vector")
+
+
+def is_packed(mixture: Tensor) -> bool:
+    return mixture.shape[-1] == 6 or mixture.shape[-1] == 10
+
+
+def weights(mixture: Tensor) -> Tensor:
+    return mixture[:, :, :, 0]
+
+
+def positions(mixture: Tensor) -> Tensor:
+    return mixture[:, :, :, 1:(n_dimensions(mixture) + 1)]
+
+
+def covariances(mixture: Tensor) -> Tensor:
+    _n_dims = n_dimensions(mixture)
+    values = mixture[:, :, :, (_n_dims + 1):]
+    if is_packed(mixture):
+        # see gmc.mixture._packed_to_full_index
+        if _n_dims == 2:
+            index = torch.tensor([0, 1, 1, 2], device=mixture.device)
+        else:
+            index = torch.tensor([0, 1, 2, 1, 3, 4, 2, 4, 5], device=mixture.device)
+        values = values.index_select(-1, index)
+    return values.reshape([mixture.shape[0], mixture.shape[1], mixture.shape[2], _n_dims, _n_dims])
+
+
+def pack_mixture(weights: Tensor, positions: Tensor, covariances: Tensor) -> Tensor:
+    return torch.cat((weights.unsqueeze(-1), positions, covariances.flatten(-2)), dim=-1)
+
+
+def det(matrices: Tensor) -> Tensor:
+    """
+    closed form determinant of 2x2 or 3x3 matrices, element wise operations only.
+    """
+    m = matrices
+    if m.shape[-1] == 2:
+        return m[..., 0, 0] * m[..., 1, 1] - m[..., 0, 1] * m[..., 1, 0]
+    return (m[..., 0, 0] * (m[..., 1, 1] * m[..., 2, 2] - m[..., 1, 2] * m[..., 2, 1])
+            - m[..., 0, 1] * (m[..., 1, 0] * m[..., 2, 2] - m[..., 1, 2] * m[..., 2, 0])
+            + m[..., 0, 2] * (m[..., 1, 0] * m[..., 2, 1] - m[..., 1, 1] * m[..., 2, 0]))
+
+
+def evaluate_componentwise_inversed(gaussians: Tensor, xes: Tensor) -> Tensor:
+    """
+    @param xes: tensor with dimensions n_batch (may be 1), n_layers (may be 1), n_xes, n_dims
+    @return: tensor with dimensions n_batch, n_layers, n_xes, n_components
+    """
+    _n_dims = n_dimensions(gaussians)
+    # 1. dim: batches, 2. layers, 3. xes, 4. component, 5.+: vector / matrix components
+    values = xes.unsqueeze(-2) - positions(gaussians).unsqueeze(-3)
+    A = covariances(gaussians)
+    quadratic_form = ((A.unsqueeze(-4) @ values.unsqueeze(-1)).squeeze(-1) * values).sum(dim=-1)
+    norm_factor = torch.sqrt(det(A) / ((2.0 * math.pi) ** _n_dims))
+    return (weights(gaussians) * norm_factor).unsqueeze(-2) * torch.exp(-0.5 * quadratic_form)
+
+
+def evaluate_inversed(mixture: Tensor, xes: Tensor) -> Tensor:
+    """
+    memory is O(n_batch * n_layers * n_xes * n_components), only for small mixtures. gmc.mixture.evaluate_inversed is the scalable version.
+    @return: tensor with dimensions n_batch, n_layers, n_xes
+    """
+    return evaluate_componentwise_inversed(mixture, xes).sum(dim=-1)
+
+
+def convolve(m1: Tensor, m2: Tensor) -> Tensor:
+    """
+    same component order as gmc.mixture.convolve: component j * n_components(m1) + i is the convolution of m1[i] and m2[j].
+    """
+    # adding the vectors adds positions and covariances, in the full and in the packed layout
+    m_new = (m2.unsqueeze(3) + m1.unsqueeze(2)).flatten(2, 3)
+    m_new_w = (weights(m2).unsqueeze(3) * weights(m1).unsqueeze(2)).flatten(2, 3)
+    return torch.cat((m_new_w.unsqueeze(-1), m_new[:, :, :, 1:]), dim=-1)
+
+
+def spatial_scale(m: Tensor, scaling_factors: Tensor) -> Tensor:
+    """Does not scale weights, i.e., the amplitudes will change, but not the integral."""
+    scaling_factors = scaling_factors.unsqueeze(-2)
+    # diag(s) C diag(s), also for a single factor
+    c = covariances(m) * scaling_factors.unsqueeze(-1) * scaling_factors.unsqueeze(-2)
+    return pack_mixture(weights(m), positions(m) * scaling_factors, c)
+
+
+def convert_priors_to_amplitudes(gm: Tensor) -> Tensor:
+    _covariances = covariances(gm)
+    fct = math.sqrt((2 * math.pi) ** n_dimensions(gm))
+    return pack_mixture(weights(gm) / (det(_covariances).sqrt() * fct), positions(gm), _covariances)
+
+
+def convert_amplitudes_to_priors(gm: Tensor) -> Tensor:
+    _covariances = covariances(gm)
+    fct = math.sqrt((2 * math.pi) ** n_dimensions(gm))
+    return pack_mixture(weights(gm) * (det(_covariances).sqrt() * fct), positions(gm), _covariances)
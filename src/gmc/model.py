@@ -1,5 +1,4 @@
 from __future__ import print_function
-import time
 import typing
 
 import torch
@@ -7,11 +6,16 @@ from torch import Tensor
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.utils.data
-from torch.utils.tensorboard import SummaryWriter as TensorboardWriter
 
 import gmc.mixture as gm
+import gmc.fitting
 import gmc.modules
 import gmc.mat_tools as mat_tools
+import gmc.profiling
+
+if typing.TYPE_CHECKING:
+    # tensorboard is slow to import and only needed by callers that log
+    from torch.utils.tensorboard import SummaryWriter as TensorboardWriter
 
 
 class Layer:
@@ -60,6 +64,10 @@ class Config:
         self.relu_config: gmc.modules.ReLUFittingConfig = gmc.modules.ReLUFittingConfig()
         self.convolution_config: gmc.modules.ConvolutionConfig = gmc.modules.ConvolutionConfig()
 
+        # convolution and relu fitting in one kernel, which doesn't store the convolved mixture (ReLUFitting.forward_fused_convolution).
+        # applies to layers without convolution fitting (n_convolution_fittiong_components < 0), requires the fixed_point_only fitting method.
+        self.fused_convolution_relu = False
+
     def produce_gmc_layers_description(self) -> str:
         name = "L"
         for l in self.layers:
@@ -142,16 +150,13 @@ class Net(nn.Module):
         else:
             self.mlp = None
 
-        self.timings = dict()
-        self.last_time = time.time()
+        if config.fused_convolution_relu:
+            assert config.relu_config.fitting_method is gmc.fitting.fixed_point_only
+            assert config.bn_place != Config.BN_PLACE_AFTER_GMC
+        self.fused = [config.fused_convolution_relu and l.n_convolution_fittiong_components < 0 for l in config.layers]
 
-    def reset_timer(self):
-        self.last_time = time.perf_counter()
-
-    def time_lap(self, name: str):
-        current = time.perf_counter()
-        self.timings[name] = current - self.last_time
-        self.last_time = current
+        # per module timings, memory and component counts. switch on with net.profiler.enabled = True, see gmc.profiling
+        self.profiler = gmc.profiling.Profiler(self)
 
     def set_position_learning(self, flag: bool):
         for gmc in self.gmcs:
@@ -161,6 +166,14 @@ class Net(nn.Module):
         for gmc in self.gmcs:
             gmc.learn_covariances = flag
 
+    def apply_bias(self, i: int, x_const: Tensor) -> Tensor:
+        if self.config.bias_type == Config.BIAS_TYPE_NEGATIVE_SOFTPLUS:
+            return x_const - F.softplus(self.biases[i], beta=20)
+        elif self.config.bias_type == Config.BIAS_TYPE_NORMAL:
+            return x_const + self.biases[i]
+        assert self.config.bias_type == Config.BIAS_TYPE_NONE
+        return torch.zeros_like(x_const)
+
     def weight_decay_loss(self) -> Tensor:
         wdl = torch.zeros(1, device=next(self.parameters()).device, dtype=torch.float)
         for gmc in self.gmcs:
@@ -168,7 +181,7 @@ class Net(nn.Module):
         return wdl
 
     # noinspection PyCallingNonCallable
-    def forward(self, in_x: Tensor, tensorboard: TensorboardWriter = None) -> Tensor:
+    def forward(self, in_x: Tensor, tensorboard: "TensorboardWriter" = None) -> Tensor:
         # Andrew Ng says that most of the time batch norm (BN) is applied before activation.
         # That would allow to merge the beta and bias learnable parameters
         # https://www.youtube.com/watch?v=tNIpEZLv_eg
@@ -176,7 +189,8 @@ class Net(nn.Module):
         #
         # in our case: BN just scales and centres. the constant input to BN is ignored, so the constant convolution would be ignored if we place BN before ReLU.
         # but that might perform better anyway, we'll have to test.
-        x, x_const = self.norm0((in_x, None))
+        # inputs with packed covariances (gm.convert_to_packed_covariances, smaller data loader batches) are expanded on the device
+        x, x_const = self.norm0((gm.convert_to_full_covariances(in_x), None))
         n_batch = gm.n_batch(x)
 
         for i in range(len(self.config.layers)):
@@ -184,26 +198,25 @@ class Net(nn.Module):
                 x, x_const = self.dropout((x, x_const))
 
             n_channels_in = gm.n_layers(x)
-            x, x_const = self.gmcs[i](x, x_const)
-            x = gm.pack_mixture(gm.weights(x) / n_channels_in, gm.positions(x), gm.covariances(x))
-            x_const = x_const / n_channels_in
-
-            if self.config.bn_place == Config.BN_PLACE_AFTER_GMC:
-                # might be a bug here with the constant. normalisation doesn't look like it works correctly.
-                # but that might also be due to us removing the constant afterwards.
-                x, x_const = self.norms[i]((x, torch.zeros_like(x_const)))
-
-            if self.config.bias_type == Config.BIAS_TYPE_NEGATIVE_SOFTPLUS:
-                x_const = x_const - F.softplus(self.biases[i], beta=20)
-            elif self.config.bias_type == Config.BIAS_TYPE_NORMAL:
-                x_const = x_const + self.biases[i]
+            if self.fused[i]:
+                # the hooks of the profiler only see forward
+                kernels, x_const = self.profiler.call(f"gmcs.{i}", self.gmcs[i].kernels_and_constant, x, x_const)
+                x_const = self.apply_bias(i, x_const / n_channels_in)
+
+                x, x_const = self.profiler.call(f"relus.{i}", self.relus[i].forward_fused_convolution, x, kernels, 1 / n_channels_in, x_const)
             else:
-                assert self.config.bias_type == Config.BIAS_TYPE_NONE
-                x_const = torch.zeros(n_batch, gm.n_layers(x), device=in_x.device)
+                x, x_const = self.gmcs[i](x, x_const)
+                x = gm.pack_mixture(gm.weights(x) / n_channels_in, gm.positions(x), gm.covariances(x))
+                x_const = x_const / n_channels_in
+
+                if self.config.bn_place == Config.BN_PLACE_AFTER_GMC:
+                    # might be a bug here with the constant. normalisation doesn't look like it works correctly.
+                    # but that might also be due to us removing the constant afterwards.
+                    x, x_const = self.norms[i]((x, torch.zeros_like(x_const)))
+
+                x_const = self.apply_bias(i, x_const)
 
-            self.reset_timer()
-            x, x_const = self.relus[i](x, x_const, tensorboard)
-            self.time_lap(f"relu{i}")
+                x, x_const = self.relus[i](x, x_const, tensorboard)
             # x = self.maxPool1(x)
 
             if self.config.bn_place == Config.BN_PLACE_AFTER_RELU:
@@ -3,21 +3,26 @@ import typing
 
 import torch
 from torch import Tensor
-from torch.utils.tensorboard import SummaryWriter as TensorboardWriter
 
 import gmc.mixture as gm
 import gmc.fitting
-import gmc.render
 import gmc.inout as gmio
 import gmc.mat_tools as mat_tools
-import gmc.cpp.gm_vis.gm_vis as gm_vis
 import gmc.cpp.extensions.convolution.binding as cpp_convolution
 import gmc.cpp.extensions.convolution_fitting.binding as cpp_convolution_fitting
+import gmc.cpp.extensions.convolution_relu.binding as cpp_convolution_relu
+
+if typing.TYPE_CHECKING:
+    # tensorboard and gmc.render (matplotlib) are slow to import, the latter is imported in the debug functions
+    from torch.utils.tensorboard import SummaryWriter as TensorboardWriter
 
 
 class ConvolutionConfig:
-    def __init__(self, learnable_radius = False):
+    def __init__(self, learnable_radius = False, covariance_type: str = gm.COVARIANCE_FULL):
         self.learnable_radius = learnable_radius
+        # gm.COVARIANCE_DIAGONAL or gm.COVARIANCE_ISOTROPIC: kernels, input and output in the layout of gm.covariance_type_module, the convolution is element wise.
+        # the kernels keep the learned covariance factors, the off diagonal entries (or the anisotropy) are dropped. no convolution fitting
+        self.covariance_type = covariance_type
 
 
 class Convolution(torch.nn.modules.Module):
@@ -44,6 +49,8 @@ class Convolution(torch.nn.modules.Module):
         self.learn_covariances = learn_covariances
         self.last_in = None
         self.n_fitting_components = n_fitting_components
+        self._cached_kernels = None
+        self._cached_kernels_key = None
 
         # positive mean produces a rather positive gm. i believe this is a better init
         self.weights = torch.nn.Parameter(torch.randn(self.n_channels_out, n_layers_in, n_kernel_components, 1, dtype=torch.float32))
@@ -89,18 +96,48 @@ class Convolution(torch.nn.modules.Module):
         self.covariance_factors.requires_grad = self.learn_covariances and flag
 
     def kernels(self) -> Tensor:
+        """
+        Without autograd recording (torch.no_grad(), frozen parameters) the kernels are cached until a parameter changes (optimiser step, load_state_dict, .to()),
+        so validation forwards and the debug functions share one materialisation. A recording call builds new kernels each time: cached kernels would share
+        one graph between the forwards, which the first backward frees (forward A, forward B, backward A, backward B).
+        """
+        recording = torch.is_grad_enabled() and any(p.requires_grad for p in self.parameters(recurse=False))
+        key = tuple((p._version, p.data_ptr()) for p in self.parameters(recurse=False))
+        if not recording and self._cached_kernels is not None and self._cached_kernels_key == key:
+            return self._cached_kernels
+
         # a psd matrix can be generated with AA'. we learn A and generate a pd matrix via  AA' + eye * epsilon
         weights = self.weights * self.weight_sd + self.weight_mean
 
         A = self.covariance_factors
         covariances = A @ A.transpose(-1, -2)
-        covariances = covariances + torch.eye(self.n_dims, dtype=torch.float32, device=A.device) * self.covariance_epsilon * max(1.0, torch.max(covariances.detach().abs()).item())
+        # clamp instead of max(1.0, ...item()), which would sync with the device
+        epsilon = self.covariance_epsilon * covariances.detach().abs().max().clamp(min=1.0)
+        covariances = covariances + torch.eye(self.n_dims, dtype=torch.float32, device=A.device) * epsilon
 
         kernel = gm.pack_mixture(weights, self.positions * self.position_range, covariances * self.covariance_range)
 
         assert gm.is_valid_mixture(kernel)
+        if self.config.covariance_type != gm.COVARIANCE_FULL:
+            kernel = gm.covariance_type_module(self.config.covariance_type).from_full(kernel)
+
+        if not recording:
+            self._cached_kernels = kernel
+            self._cached_kernels_key = key
         return kernel
 
+    def full_kernels(self) -> Tensor:
+        """
+        the kernels in the full layout, e.g. for rendering
+        """
+        if self.config.covariance_type != gm.COVARIANCE_FULL:
+            return gm.covariance_type_module(self.config.covariance_type).to_full(self.kernels())
+        return self.kernels()
+
+    def clear_kernel_cache(self) -> None:
+        self._cached_kernels = None
+        self._cached_kernels_key = None
+
     def weight_decay_loss(self) -> Tensor:
         """
         USAGE: use a simple stochastic optimiser! if you use something more elaborate with moments (e.g. Adam), then consider using a separate optimiser as the moments don't play well with weight decay.
@@ -120,49 +157,61 @@ class Convolution(torch.nn.modules.Module):
         return loss
 
     def debug_render(self, position_range: float = None, image_size: int = 80, clamp: typing.Tuple[float, float] = (-0.3, 0.3)):
+        import gmc.render
         if position_range is None:
             position_range = self.position_range * 2
 
         if type(position_range) is torch.Tensor:
             position_range = position_range.item()
 
-        kernels = self.kernels()
+        kernels = self.full_kernels()
         renderings = gmc.render.render(kernels, torch.zeros(1, 1, device=kernels.device),
                                        batches=(0, min(5, gm.n_batch(kernels))), layers=(0, min(5, gm.n_layers(kernels))),
                                        x_low=-position_range*1.25, x_high=position_range*1.25, y_low=-position_range*1.25, y_high=position_range*1.25, width=image_size, height=image_size)
-        renderings = renderings.transpose(0, 1).transpose(1, 2).reshape(renderings.shape[1] * image_size, renderings.shape[0] * image_size)
-        renderings = gmc.render.colour_mapped(renderings.cpu().numpy(), clamp[0], clamp[1])
+        renderings = gmc.render.colour_mapped(gmc.render.montage(renderings).cpu().numpy(), clamp[0], clamp[1])
         return renderings[:, :, :3]
 
-    # def debug_render3d(self, image_size: int = 80, clamp: typing.Tuple[float, float] = (-0.3, 0.3), camera: typing.Optional[typing.Dict] = None) -> Tensor:
-    #     vis = gm_vis.GMVisualizer(False, image_size, image_size)
-    #     if camera is not None:
-    #         vis.set_camera_lookat(**camera)
-    #     else:
-    #         vis.set_camera_auto(True)
-    #     vis.set_density_rendering(True)
-    #     vis.set_density_range_manual(clamp[0], clamp[1])
-
-    #     kernels = self.kernels()
-    #     renderings = gmc.render.render3d(kernels,
-    #                                      batches=(0, min(5, gm.n_batch(kernels))), layers=(0, min(5, gm.n_layers(kernels))),
-    #                                      width=image_size, height=image_size, gm_vis_object=vis)
-    #     vis.finish()
-    #     return renderings.transpose(1, 2).contiguous().view(image_size * renderings.shape[0], image_size * renderings.shape[1], 4)[:, :, :3]
+    def debug_render3d(self, image_size: int = 80, clamp: typing.Tuple[float, float] = (-0.3, 0.3), camera: typing.Optional[typing.Dict] = None) -> Tensor:
+        import gmc.render
+        import gmc.cpp.gm_vis.gm_vis as gm_vis
+        vis = gm_vis.GMVisualizer(False, image_size, image_size)
+        if camera is not None:
+            vis.set_camera_lookat(**camera)
+        else:
+            vis.set_camera_auto(True)
+        vis.set_density_rendering(True)
+        vis.set_density_range_manual(clamp[0], clamp[1])
+
+        kernels = self.full_kernels()
+        renderings = gmc.render.render3d(kernels,
+                                         batches=(0, min(5, gm.n_batch(kernels))), layers=(0, min(5, gm.n_layers(kernels))),
+                                         width=image_size, height=image_size, gm_vis_object=vis)
+        vis.finish()
+        return renderings.transpose(1, 2).contiguous().view(image_size * renderings.shape[0], image_size * renderings.shape[1], 4)[:, :, :3]
 
     def debug_save3d(self, base_name: str):
-        kernel = self.kernels()
+        kernel = self.full_kernels()
 
         gmio.write_gm_to_ply2(kernel, f"{base_name}")
 
     def forward(self, x: Tensor, x_constant: Tensor) -> typing.Tuple[Tensor, Tensor]:
+        if self.config.covariance_type != gm.COVARIANCE_FULL:
+            assert self.n_fitting_components < 0
+            module = gm.covariance_type_module(self.config.covariance_type)
+            # the debugging copy is in the full layout for the rendering and logging code
+            self.last_in = (module.to_full(x.detach()), x_constant.detach())
+            kernels = self.kernels()
+            return module.convolve_layers(x, kernels), self.forward_constant(x_constant, kernels)
+
         assert gm.is_valid_mixture_and_constant(x, x_constant)
         self.last_in = (x.detach(), x_constant.detach())
 
+        kernels = self.kernels()
         if self.n_fitting_components < 0:
-            out_mixtures = cpp_convolution.apply(x, self.kernels())
+            # packed covariances are read directly, the output is in the full layout
+            out_mixtures = cpp_convolution.apply(x, kernels)
         else:
-            kernels = self.kernels()
+            x = gm.convert_to_full_covariances(x)
             out_mixtures = cpp_convolution_fitting.apply(x, kernels, self.n_fitting_components)
 
             # x : [batch, n_in, n_components_in, 7]
@@ -185,16 +234,31 @@ class Convolution(torch.nn.modules.Module):
                 return torch.cat([pi_o, mu_o, sigma_o], dim=-1)
             
             out_mixtures = convolution(x, kernels)
-            
-        n_batch = x_constant.shape[0]
-        n_channels_input = gm.n_layers(x)
-        n_channels_out = self.n_channels_out
-        a = x_constant.view(n_batch, 1, n_channels_input)
-        b = gm.integrate(self.kernels()).view(1, n_channels_out, n_channels_input)
-        out_constants = (a * b).sum(dim=2)
+
+        out_constants = self.forward_constant(x_constant, kernels)
 
         return out_mixtures, out_constants
 
+    def forward_constant(self, x_constant: Tensor, kernels: Tensor) -> Tensor:
+        n_batch = x_constant.shape[0]
+        a = x_constant.view(n_batch, 1, self.n_channels_in)
+        b = gm.integrate(kernels).view(1, self.n_channels_out, self.n_channels_in)
+        return (a * b).sum(dim=2)
+
+    def kernels_and_constant(self, x: Tensor, x_constant: Tensor) -> typing.Tuple[Tensor, Tensor]:
+        """
+        Replaces forward when the convolution is fused with the ReLU fitting (ReLUFitting.forward_fused_convolution): returns the kernels
+        and the convolved constant, the mixture is convolved inside the fused kernel.
+        """
+        assert self.config.covariance_type == gm.COVARIANCE_FULL
+        assert gm.is_valid_mixture_and_constant(x, x_constant)
+        assert self.n_fitting_components < 0
+        assert not gm.is_packed(x)
+        self.last_in = (x.detach(), x_constant.detach())
+
+        kernels = self.kernels()
+        return kernels, self.forward_constant(x_constant, kernels)
+
 
 class ReLUFittingConfig:
     def __init__(self):
@@ -215,24 +279,60 @@ class ReLUFitting(torch.nn.modules.Module):
         self.last_out = None
         self.last_steps = None
 
-    def forward(self, x_m: Tensor, x_constant: Tensor, tensorboard: TensorboardWriter = None) -> typing.Tuple[Tensor, Tensor]:
+    @property
+    def last_in(self) -> typing.Optional[typing.Tuple[Tensor, Tensor]]:
+        # the fused forward has no convolved mixture, it is recomputed when needed for logging / debugging
+        if self._last_in is None and self._last_fused_in is not None:
+            x_m, kernels, weight_scale, x_constant = self._last_fused_in
+            convolved = cpp_convolution.apply(x_m, kernels)
+            self._last_in = (gm.pack_mixture(gm.weights(convolved) * weight_scale, gm.positions(convolved), gm.covariances(convolved)), x_constant)
+        return self._last_in
+
+    @last_in.setter
+    def last_in(self, value: typing.Optional[typing.Tuple[Tensor, Tensor]]):
+        self._last_in = value
+        self._last_fused_in = None
+
+    def forward(self, x_m: Tensor, x_constant: Tensor, tensorboard: "TensorboardWriter" = None) -> typing.Tuple[Tensor, Tensor]:
         y_m, y_constant, steps = self.config.fitting_method(x_m, x_constant, self.n_output_gaussians, self.config.fitting_config, tensorboard, convolution_layer=self.convolution_layer)
 
-        self.last_in = (x_m.detach(), x_constant.detach())
+        last_x_m, last_y_m, last_steps = x_m.detach(), y_m.detach(), [s.detach() for s in steps]
+        covariance_type = self.config.fitting_config.covariance_type
+        if covariance_type != gm.COVARIANCE_FULL:
+            # fitting.Config.covariance_type is only implemented by fixed_point_only. the debugging copies are in the full layout
+            assert self.config.fitting_method is gmc.fitting.fixed_point_only
+            to_full = gm.covariance_type_module(covariance_type).to_full
+            last_x_m, last_y_m, last_steps = to_full(last_x_m), to_full(last_y_m), [to_full(s) for s in last_steps]
+
+        self.last_in = (last_x_m, x_constant.detach())
+        self.last_out = (last_y_m, y_constant.detach())
+        self.last_steps = last_steps
+        return y_m, y_constant
+
+    def forward_fused_convolution(self, x_m: Tensor, kernels: Tensor, weight_scale: float, x_constant: Tensor) -> typing.Tuple[Tensor, Tensor]:
+        """
+        Same as forward on the convolution of x_m with kernels (weights scaled by weight_scale), but in one kernel, which never stores the convolved mixture.
+        x_constant is the constant of the convolved mixture. Only the fixed_point_only fitting method is implemented.
+        """
+        assert self.config.fitting_method is gmc.fitting.fixed_point_only
+        assert self.config.fitting_config.covariance_type == gm.COVARIANCE_FULL
+        assert gm.is_valid_mixture(x_m) and gm.is_valid_mixture(kernels)
+        y_m = cpp_convolution_relu.apply(x_m, kernels, x_constant, weight_scale)
+        y_constant = x_constant.where(x_constant > 0, torch.zeros(1, device=x_constant.device))
+
+        self.last_in = None
+        self._last_fused_in = (x_m.detach(), kernels.detach(), weight_scale, x_constant.detach())
         self.last_out = (y_m.detach(), y_constant.detach())
-        self.last_steps = [s.detach() for s in steps]
+        self.last_steps = []
         return y_m, y_constant
 
     def debug_render(self, position_range: typing.Tuple[float, float, float, float] = None, image_size: int = 80, clamp: typing.Tuple[float, float] = None):
+        import gmc.render
         if position_range is None:
             covariance_adjustment = torch.sqrt(torch.diagonal(gm.covariances(self.last_in[0]), dim1=-2, dim2=-1))
-            position_max = gm.positions(self.last_in[0]) + covariance_adjustment
-            position_max_x = torch.max(position_max[:, :, :, 0]).item()
-            position_max_y = torch.max(position_max[:, :, :, 1]).item()
-            position_min = gm.positions(self.last_in[0]) - covariance_adjustment
-            position_min_x = torch.min(position_min[:, :, :, 0]).item()
-            position_min_y = torch.min(position_min[:, :, :, 1]).item()
-            position_range = [position_min_x, position_min_y, position_max_x, position_max_y]
+            position_max = (gm.positions(self.last_in[0]) + covariance_adjustment).reshape(-1, 2).max(dim=0)[0]
+            position_min = (gm.positions(self.last_in[0]) - covariance_adjustment).reshape(-1, 2).min(dim=0)[0]
+            position_range = torch.cat((position_min, position_max)).tolist()   # x_low, y_low, x_high, y_high in one sync
 
         if clamp is None:
             max_weight = gm.weights(self.last_out[0]).max().item()
@@ -243,9 +343,7 @@ class ReLUFitting(torch.nn.modules.Module):
         last_in = gmc.render.render(self.last_in[0], self.last_in[1], batches=(0, 5), layers=(0, 5),
                                     x_low=position_range[0], y_low=position_range[1], x_high=position_range[2], y_high=position_range[3],
                                     width=image_size, height=image_size).reshape(-1, image_size)
-        target = gmc.render.render_with_relu(self.last_in[0], self.last_in[1], batches=(0, 5), layers=(0, 5),
-                                             x_low=position_range[0], y_low=position_range[1], x_high=position_range[2], y_high=position_range[3],
-                                             width=image_size, height=image_size).reshape(-1, image_size)
+        target = last_in.clamp(min=0)
         steps = [gmc.render.render(s, self.last_in[1], batches=(0, 5), layers=(0, 5),
                                    x_low=position_range[0], y_low=position_range[1], x_high=position_range[2], y_high=position_range[3],
                                    width=image_size, height=image_size).reshape(-1, image_size) for s in self.last_steps]
@@ -257,21 +355,23 @@ class ReLUFitting(torch.nn.modules.Module):
         images = gmc.render.colour_mapped(images.cpu().numpy(), clamp[0], clamp[1])
         return images[:, :, :3]
 
-    # def debug_render3d(self, image_size: int = 80, clamp: typing.Tuple[float, float] = (-0.1, 0.1), camera: typing.Optional[typing.Dict] = None):
-    #     vis = gm_vis.GMVisualizer(False, image_size, image_size)
-    #     if camera is not None:
-    #         vis.set_camera_lookat(**camera)
-    #     else:
-    #         vis.set_camera_auto(True)
-    #     vis.set_density_rendering(True)
-    #     vis.set_density_range_manual(clamp[0], clamp[1])
+    def debug_render3d(self, image_size: int = 80, clamp: typing.Tuple[float, float] = (-0.1, 0.1), camera: typing.Optional[typing.Dict] = None):
+        import gmc.render
+        import gmc.cpp.gm_vis.gm_vis as gm_vis
+        vis = gm_vis.GMVisualizer(False, image_size, image_size)
+        if camera is not None:
+            vis.set_camera_lookat(**camera)
+        else:
+            vis.set_camera_auto(True)
+        vis.set_density_rendering(True)
+        vis.set_density_range_manual(clamp[0], clamp[1])
 
-    #     last_in = gmc.render.render3d(self.last_in[0], batches=(0, 1), layers=(0, 5), gm_vis_object=vis)
-    #     prediction = gmc.render.render3d(self.last_out[0], batches=(0, 1), layers=(0, 5), gm_vis_object=vis)
-    #     vis.finish()
+        last_in = gmc.render.render3d(self.last_in[0], batches=(0, 1), layers=(0, 5), gm_vis_object=vis)
+        prediction = gmc.render.render3d(self.last_out[0], batches=(0, 1), layers=(0, 5), gm_vis_object=vis)
+        vis.finish()
 
-    #     images = torch.cat([last_in.view(image_size * last_in.shape[0] * last_in.shape[1], image_size, 4), prediction.view(image_size * last_in.shape[0] * last_in.shape[1], image_size, 4)], dim=1)
-    #     return images[:, :, :3]
+        images = torch.cat([last_in.view(image_size * last_in.shape[0] * last_in.shape[1], image_size, 4), prediction.view(image_size * last_in.shape[0] * last_in.shape[1], image_size, 4)], dim=1)
+        return images[:, :, :3]
 
     def debug_save3d(self, base_name: str, n_batch_samples: int = 1, n_layers: int = None):
         gmio.write_gm_to_ply2(self.last_in[0][0:n_batch_samples, 0:n_layers], f"{base_name}_in")
@@ -354,13 +454,12 @@ class CovScaleNorm(torch.nn.modules.Module):
 
         scaling_factor = avg_cov_trace / gm.n_dimensions(x_gm)
 
-        assert (scaling_factor > 0).all().item();
+        assert gm.value_check(lambda: (scaling_factor > 0).all())
 
         scaling_factor = (1 / scaling_factor).view(n_batch, gm.n_layers(x_gm), 1)
         scaling_factor = torch.sqrt(scaling_factor)
 
-        assert not torch.any(torch.isnan(scaling_factor))
-        assert not torch.any(torch.isinf(scaling_factor))
+        assert gm.value_check(lambda: torch.isfinite(scaling_factor).all())
 
         y_gm = gm.spatial_scale(x_gm, scaling_factor)
 
@@ -438,8 +537,7 @@ class BatchNorm(torch.nn.modules.Module):
             scaling_factor = scaling_factor * self.learnable_scaling
 
         scaling_factor = scaling_factor.view(-1, n_channels, 1)
-        assert not torch.any(torch.isnan(scaling_factor))
-        assert not torch.any(torch.isinf(scaling_factor))
+        assert gm.value_check(lambda: torch.isfinite(scaling_factor).all())
 
         new_weights = gm.weights(x_gm) * scaling_factor
 
@@ -0,0 +1,209 @@
+import json
+import time
+import typing
+
+import torch
+from torch import Tensor
+
+# Instrumentation of torch modules (e.g. gmc.model.Net, which owns a Profiler): forward and backward wall time, allocated bytes and the number of
+# Gaussian components in and out of every module. Disabled profilers only cost a flag check per hook.
+#
+# Times are taken with a device sync before and after (CUDA only, CPU kernels are synchronous). The backward time of a module runs from the arrival of
+# the gradient of its output to the arrival of the gradient of its input (tensor hooks), i.e., it assumes a chain of modules as in Net.
+# Bytes are the difference in torch.cuda.memory_allocated over the forward (outputs and tensors saved for backward) on CUDA, and the size of the
+# outputs on the CPU, where torch has no allocator statistics.
+
+
+def synchronize(device: torch.device):
+    """
+    waits for the device (no-op for the CPU), use before taking the time of CUDA work.
+    """
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def benchmark(device: torch.device, function: typing.Callable, n_warm_up: int = 2, n_repetitions: int = 10,
+              peak_memory: bool = False) -> typing.Union[float, typing.Tuple[float, typing.Optional[int]]]:
+    """
+    mean wall time of function() in seconds. the warm up calls (extension loading, allocator and cudnn caches) aren't timed.
+    with peak_memory, returns the tuple (time, peak of torch.cuda.max_memory_allocated during the timed calls in bytes).
+    the bytes are None on the CPU, where torch has no allocator statistics.
+    """
+    for i in range(n_warm_up):
+        function()
+    synchronize(device)
+    measure_memory = peak_memory and torch.device(device).type == 'cuda'
+    if measure_memory:
+        torch.cuda.reset_peak_memory_stats(device)
+    start = time.perf_counter()
+    for i in range(n_repetitions):
+        function()
+    synchronize(device)
+    duration = (time.perf_counter() - start) / n_repetitions
+    if not peak_memory:
+        return duration
+    return duration, torch.cuda.max_memory_allocated(device) if measure_memory else None
+
+
+def _tensors(value) -> typing.List[Tensor]:
+    # inputs and outputs of gmc modules are tensors, (nested) tuples of tensors and None
+    if isinstance(value, Tensor):
+        return [value]
+    if isinstance(value, (tuple, list)):
+        return [t for v in value for t in _tensors(v)]
+    return []
+
+
+def _n_components(tensors: typing.List[Tensor]) -> int:
+    # the first mixture (dimensions n_batch, n_layers, n_components, vec), -1 if there is none
+    for t in tensors:
+        if len(t.shape) == 4:
+            return t.shape[2]
+    return -1
+
+
+class Record:
+    def __init__(self, name: str):
+        self.name = name
+        self.n_calls = 0
+        self.forward_time = 0.0
+        self.backward_time = 0.0
+        self.n_bytes = 0
+        self.n_components_in = -1
+        self.n_components_out = -1
+
+
+class Profiler:
+    def __init__(self, model: torch.nn.Module, enabled: bool = False, module_types: typing.Optional[typing.Tuple[type, ...]] = None):
+        """
+        @param model: all sub modules are instrumented, except containers (ModuleList, Sequential etc.) and the model itself
+        @param module_types: if given, only sub modules of these types are instrumented
+        """
+        self.enabled = enabled
+        self.records: typing.Dict[str, Record] = dict()
+        self.trace_events: typing.List[typing.Dict] = list()
+        self._start = time.perf_counter()
+        self._forward_begin: typing.Dict[str, typing.Tuple[float, int]] = dict()
+        self._backward_begin: typing.Dict[str, float] = dict()
+
+        containers = (torch.nn.ModuleList, torch.nn.ModuleDict, torch.nn.Sequential, torch.nn.ParameterList)
+        for name, module in model.named_modules():
+            if module is model or isinstance(module, containers):
+                continue
+            if module_types is not None and not isinstance(module, module_types):
+                continue
+            module.register_forward_pre_hook(self._forward_pre_hook(name))
+            module.register_forward_hook(self._forward_hook(name))
+
+    def reset(self):
+        self.records = dict()
+        self.trace_events = list()
+        self._start = time.perf_counter()
+
+    def _record(self, name: str) -> Record:
+        if name not in self.records:
+            self.records[name] = Record(name)
+        return self.records[name]
+
+    def _now(self, tensors: typing.List[Tensor]) -> float:
+        if len(tensors) > 0:
+            synchronize(tensors[0].device)
+        return time.perf_counter()
+
+    def _trace(self, name: str, thread: str, begin: float, end: float, args: typing.Dict):
+        self.trace_events.append({"name": name, "cat": thread, "ph": "X", "pid": 0, "tid": 0 if thread == "forward" else 1,
+                                  "ts": (begin - self._start) * 1e6, "dur": (end - begin) * 1e6, "args": args})
+
+    def _forward_pre_hook(self, name: str):
+        def hook(module, inputs):
+            self._begin(name, inputs)
+        return hook
+
+    def _forward_hook(self, name: str):
+        def hook(module, inputs, outputs):
+            self._end(name, outputs)
+        return hook
+
+    def call(self, name: str, function: typing.Callable, *args):
+        """
+        instruments a call under the name of a module, for methods other than forward, which the hooks don't see (e.g. ReLUFitting.forward_fused_convolution).
+        """
+        self._begin(name, args)
+        outputs = function(*args)
+        self._end(name, outputs)
+        return outputs
+
+    def _begin(self, name: str, inputs):
+        if not self.enabled:
+            return
+        tensors = _tensors(inputs)
+        allocated = 0
+        if len(tensors) > 0 and tensors[0].is_cuda:
+            allocated = torch.cuda.memory_allocated(tensors[0].device)
+        record = self._record(name)
+        record.n_components_in = _n_components(tensors)
+        self._forward_begin[name] = (self._now(tensors), allocated)
+
+        # the gradient of the input arrives at the end of the backward pass of this module
+        for t in tensors:
+            if t.requires_grad:
+                t.register_hook(self._backward_end_hook(name))
+                break
+
+    def _end(self, name: str, outputs):
+        if not self.enabled or name not in self._forward_begin:
+            return
+        tensors = _tensors(outputs)
+        end = self._now(tensors)
+        begin, allocated = self._forward_begin.pop(name)
+        if len(tensors) > 0 and tensors[0].is_cuda:
+            n_bytes = torch.cuda.memory_allocated(tensors[0].device) - allocated
+        else:
+            n_bytes = sum(t.element_size() * t.nelement() for t in tensors)
+
+        record = self._record(name)
+        record.n_calls += 1
+        record.forward_time += end - begin
+        record.n_bytes += n_bytes
+        record.n_components_out = _n_components(tensors)
+        self._trace(name, "forward", begin, end, {"bytes": n_bytes, "components in": record.n_components_in, "components out": record.n_components_out})
+
+        # the gradient of the output arrives at the beginning of the backward pass of this module
+        for t in tensors:
+            if t.requires_grad:
+                t.register_hook(self._backward_begin_hook(name))
+                break
+
+    def _backward_begin_hook(self, name: str):
+        def hook(grad: Tensor):
+            if self.enabled:
+                self._backward_begin[name] = self._now([grad])
+        return hook
+
+    def _backward_end_hook(self, name: str):
+        def hook(grad: Tensor):
+            if not self.enabled or name not in self._backward_begin:
+                return
+            begin = self._backward_begin.pop(name)
+            end = self._now([grad])
+            self._record(name).backward_time += end - begin
+            self._trace(name, "backward", begin, end, dict())
+        return hook
+
+    def summary(self) -> str:
+        """
+        @return: table with one line per module (in call order), times are the mean per call in milliseconds
+        """
+        lines = [f"{'module':<24} {'calls':>6} {'forward ms':>11} {'backward ms':>12} {'MiB':>9} {'components':>16}"]
+        for r in self.records.values():
+            n_calls = max(r.n_calls, 1)
+            lines.append(f"{r.name:<24} {r.n_calls:>6} {r.forward_time * 1000 / n_calls:>11.3f} {r.backward_time * 1000 / n_calls:>12.3f} "
+                         f"{r.n_bytes / n_calls / 1024 / 1024:>9.2f} {f'{r.n_components_in} -> {r.n_components_out}':>16}")
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path: str):
+        """
+        writes the recorded events in the trace event format (chrome://tracing, perfetto.dev)
+        """
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.trace_events, "displayTimeUnit": "ms"}, file)
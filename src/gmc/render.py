@@ -1,3 +1,4 @@
+import math
 import typing
 import matplotlib as mpl
 import matplotlib.cm
@@ -8,6 +9,7 @@ import torch
 from torch import Tensor
 
 import gmc.mixture as gm
+import gmc.config as config
 import gmc.cpp.gm_vis.gm_vis as gm_vis
 
 from gmc import colourmap
@@ -19,13 +21,54 @@ gamma_correction = 1/2.2
 index_t = typing.Optional[int]
 index_range = typing.Tuple[index_t, index_t]
 
-def colour_mapped(mono, low, high):
+# same resolution as colourmap.cm_linSeg, so the lut gives the same colours as matplotlib.
+colour_lut_size = 2**16
+_colour_lut: typing.Optional[np.ndarray] = None
+_colour_lut_torch: typing.Dict[torch.device, Tensor] = dict()
+
+
+def colour_lut() -> np.ndarray:
+    """
+    RGBA table (float64) with colour_lut_size entries of colourmap.cm_linSeg, and an additional transparent black entry for nans
+    (matplotlib's 'bad' colour).
+    """
+    global _colour_lut
+    if _colour_lut is None:
+        lut = colourmap.cm_linSeg(np.arange(colour_lut_size))
+        _colour_lut = np.concatenate((lut, np.zeros((1, 4))), axis=0)
+    return _colour_lut
+
+
+def colour_mapped(mono: typing.Union[np.ndarray, Tensor], low: float, high: float) -> typing.Union[np.ndarray, Tensor]:
+    """
+    Maps values in [low, high] (clipped) to RGBA colours of colourmap.cm_linSeg by a table lookup.
+    Numpy input gives a numpy array (as matplotlib's ScalarMappable.to_rgba), tensor input a tensor on the same device.
+    """
     if mono.ndim > 2:
         raise Exception("colour_map is only applicable for mono matrices")
 
-    normaliser = matplotlib.colors.Normalize(vmin=low, vmax=high, clip=True)
-    mapper = matplotlib.cm.ScalarMappable(norm=normaliser, cmap=colourmap.cm_linSeg)
-    return mapper.to_rgba(mono)
+    scale = colour_lut_size / (high - low) if high != low else 0.0
+    if isinstance(mono, Tensor):
+        if mono.device not in _colour_lut_torch:
+            _colour_lut_torch[mono.device] = torch.from_numpy(colour_lut()).to(mono.device)
+        indices = ((mono.detach().double() - low) * scale).clamp(0, colour_lut_size - 1).long()
+        indices = indices.where(~torch.isnan(mono), torch.full_like(indices, colour_lut_size))
+        return _colour_lut_torch[mono.device][indices]
+
+    mono = np.asarray(mono, dtype=np.float64)
+    indices = np.clip((mono - low) * scale, 0, colour_lut_size - 1)
+    nans = np.isnan(indices)
+    indices[nans] = colour_lut_size
+    return colour_lut()[indices.astype(np.int64)]
+
+
+def montage(rendering: Tensor) -> Tensor:
+    """
+    Lays out a rendering with dimensions n_batch, n_layers, height, width as one image: layers in rows and batches in columns.
+    @return: tensor with dimensions n_layers * height, n_batch * width
+    """
+    n_batch, n_layers, height, width = rendering.shape
+    return rendering.permute(1, 2, 0, 3).reshape(n_layers * height, n_batch * width)
 
 
 def write_colour_map(width: int, height: int, filename: str):
@@ -44,58 +87,116 @@ def write_colour_map(width: int, height: int, filename: str):
 
 def render(mixture: Tensor, constant: Tensor, batches: index_range = (0, None), layers: index_range = (0, None),
            x_low: float = -22, y_low: float = -22, x_high: float = 22, y_high: float = 22,
-           width: int = 100, height: int = 100):
+           width: int = 100, height: int = 100, tile_size: int = 16, sigma_cutoff: typing.Optional[float] = None) -> Tensor:
+    """
+    Renders 2D mixtures, pixel (0, 0) is at (x_low, y_low). All batches and layers are rendered together.
+
+    The image is split into tiles of tile_size x tile_size pixels. Every tile only evaluates the components whose bounding box at sigma_cutoff
+    standard deviations overlaps it, so the cost scales with the number of overlapping components instead of the number of components.
+    The error is bounded by gm.truncation_error_bound (of the inversed mixture); sigma_cutoff=math.inf renders all components.
+    Tiles are processed in chunks of at most config.eval_slize_size bytes.
+
+    @param sigma_cutoff: defaults to config.eval_sigma_cutoff
+    @return: tensor with dimensions n_batch, n_layers, height, width
+    """
     assert gm.n_dimensions(mixture) == 2
     assert gm.is_valid_mixture_and_constant(mixture, constant)
-    delta_x = (x_high - x_low) / width
-    delta_y = (y_high - y_low) / height
-    xv, yv = torch.meshgrid([torch.arange(x_low, x_high - delta_x / 2, delta_x, dtype=torch.float, device=mixture.device),
-                             torch.arange(y_low, y_high - delta_y / 2, delta_y, dtype=torch.float, device=mixture.device)])
-    m = mixture.detach()[batches[0]:batches[1], layers[0]:layers[1]]
+    if sigma_cutoff is None:
+        sigma_cutoff = config.eval_sigma_cutoff
+    m = gm.convert_to_full_covariances(mixture.detach()[batches[0]:batches[1], layers[0]:layers[1]])
     c = constant.detach()[batches[0]:batches[1], layers[0]:layers[1]]
     n_batch = m.shape[0]
     n_layers = m.shape[1]
-    xes = torch.cat((xv.reshape(-1, 1), yv.reshape(-1, 1)), 1).view(1, 1, -1, 2)
-    rendering = (gm.evaluate(m, xes) + c.unsqueeze(-1))
-    rendering = rendering.view(n_batch, n_layers, width, height).transpose(2, 3)
-    return rendering
+    n_components = m.shape[2]
+    device = m.device
+    delta_x = (x_high - x_low) / width
+    delta_y = (y_high - y_low) / height
+
+    # pixel positions with dimensions tile, pixel in tile, x/y. the tiles at the border may reach outside the image, those pixels are cut away at the end.
+    n_tiles_x = (width + tile_size - 1) // tile_size
+    n_tiles_y = (height + tile_size - 1) // tile_size
+    n_tiles = n_tiles_x * n_tiles_y
+    n_tile_pixels = tile_size * tile_size
+    xs = (x_low + torch.arange(n_tiles_x * tile_size, dtype=torch.float, device=device) * delta_x).view(n_tiles_x, tile_size)
+    ys = (y_low + torch.arange(n_tiles_y * tile_size, dtype=torch.float, device=device) * delta_y).view(n_tiles_y, tile_size)
+    pixels = torch.stack((xs.view(1, n_tiles_x, 1, tile_size).expand(n_tiles_y, n_tiles_x, tile_size, tile_size),
+                          ys.view(n_tiles_y, 1, tile_size, 1).expand(n_tiles_y, n_tiles_x, tile_size, tile_size)), dim=-1).view(n_tiles, n_tile_pixels, 2)
+    tile_low = torch.stack((xs[:, 0].view(1, n_tiles_x).expand(n_tiles_y, n_tiles_x), ys[:, 0].view(n_tiles_y, 1).expand(n_tiles_y, n_tiles_x)), dim=-1).view(n_tiles, 2)
+    tile_high = torch.stack((xs[:, -1].view(1, n_tiles_x).expand(n_tiles_y, n_tiles_x), ys[:, -1].view(n_tiles_y, 1).expand(n_tiles_y, n_tiles_x)), dim=-1).view(n_tiles, 2)
 
+    covariance_cache = gm.CovarianceCache(m)
+    amplitudes = gm.weights(gm.convert_priors_to_amplitudes(m, covariance_cache))
+    positions = gm.positions(m)
+    inversed_covariances = covariance_cache.inverse.reshape(n_batch, n_layers, n_components, 4)
 
-# def render3d(mixture: Tensor, batches: index_range = (0, None), layers: index_range = (0, None),
-#              width: int = 100, height: int = 100, gm_vis_object: gm_vis.GMVisualizer = None) -> Tensor:
-#     assert gm.n_dimensions(mixture) == 3
-#     assert gm.is_valid_mixture(mixture)
+    # overlap of the bounding boxes at sigma_cutoff with the tiles, dimensions batch, layer, tile, component
+    extent = torch.sqrt(torch.diagonal(covariance_cache.covariances, dim1=-2, dim2=-1)) * sigma_cutoff
+    overlap = ((positions - extent).unsqueeze(2) <= tile_high.view(1, 1, n_tiles, 1, 2)) & ((positions + extent).unsqueeze(2) >= tile_low.view(1, 1, n_tiles, 1, 2))
+    overlap = overlap.all(dim=-1) & (amplitudes != 0).unsqueeze(2)
+    n_overlapping = int(overlap.sum(dim=-1).max().item()) if overlap.numel() > 0 else 0
 
-#     end_gm_vis_object = False
-#     if gm_vis_object is None:
-#         gm_vis_object = gm_vis.GMVisualizer(False, width, height)
-#         gm_vis_object.set_camera_auto(True)
-#         gm_vis_object.set_density_rendering(True)
-#         end_gm_vis_object = True
+    rendering = torch.zeros(n_batch, n_layers, n_tiles, n_tile_pixels, dtype=torch.float, device=device)
+    if n_overlapping > 0:
+        # components overlapping a tile come first, the rest is masked out
+        is_overlapping, indices = overlap.to(torch.float).topk(n_overlapping, dim=-1, sorted=False)
+        indices = indices.view(n_batch, n_layers, n_tiles * n_overlapping)
+        tile_amplitudes = (amplitudes.gather(2, indices).view(n_batch, n_layers, n_tiles, n_overlapping) * is_overlapping).unsqueeze(-1)
+        tile_positions = positions.gather(2, indices.unsqueeze(-1).expand(-1, -1, -1, 2)).view(n_batch, n_layers, n_tiles, n_overlapping, 1, 2)
+        tile_inversed = inversed_covariances.gather(2, indices.unsqueeze(-1).expand(-1, -1, -1, 4)).view(n_batch, n_layers, n_tiles, n_overlapping, 1, 4)
 
-#     layer_start = layers[0]
-#     if layer_start is None:
-#         layer_start = 0
-#     layer_end = layers[1]
-#     if layer_end is None:
-#         layer_end = gm.n_layers(mixture)
+        # ~8 floats per component and pixel are alive at the same time
+        tile_bytes = n_batch * n_layers * n_overlapping * n_tile_pixels * 4 * 8
+        chunk_size = max(config.eval_slize_size // tile_bytes, 1)
+        for begin in range(0, n_tiles, chunk_size):
+            end = min(begin + chunk_size, n_tiles)
+            diff = pixels[begin:end].view(1, 1, end - begin, 1, n_tile_pixels, 2) - tile_positions[:, :, begin:end]
+            inversed = tile_inversed[:, :, begin:end]
+            dx = diff[..., 0]
+            dy = diff[..., 1]
+            quadratic_form = dx * dx * inversed[..., 0] + 2 * dx * dy * inversed[..., 1] + dy * dy * inversed[..., 3]
+            rendering[:, :, begin:end] = (tile_amplitudes[:, :, begin:end] * torch.exp(-0.5 * quadratic_form)).sum(dim=3)
 
-#     rendering_list = list()
-#     for lid in range(layer_start, layer_end):
-#         m = mixture[batches[0]:batches[1], lid:(lid+1), :, :]
-#         gm_vis_object.set_gaussian_mixtures(m.detach().cpu())
-#         rendering_list.append(torch.from_numpy(gm_vis_object.render()))
+    rendering = rendering.view(n_batch, n_layers, n_tiles_y, n_tiles_x, tile_size, tile_size).permute(0, 1, 2, 4, 3, 5)
+    rendering = rendering.reshape(n_batch, n_layers, n_tiles_y * tile_size, n_tiles_x * tile_size)[:, :, :height, :width]
+    return rendering + c.view(c.shape[0], c.shape[1], 1, 1)
 
-#     rendering_tensor = torch.cat(rendering_list, dim=1)
-#     n_b = rendering_tensor.shape[0]
-#     height = rendering_tensor.shape[2]
-#     width = rendering_tensor.shape[3]
-#     n_l = len(rendering_list)
 
-#     if end_gm_vis_object:
-#         gm_vis_object.finish()
+def render3d(mixture: Tensor, batches: index_range = (0, None), layers: index_range = (0, None),
+             width: int = 100, height: int = 100, gm_vis_object: gm_vis.GMVisualizer = None) -> Tensor:
+    """
+    Renders 3D mixtures with gm_vis (the OpenGL visualizer, or gmc.render3d.CpuVisualizer if it isn't built).
+    Without gm_vis_object, the density is rendered with an automatic camera.
+    @return: tensor with dimensions n_batch, n_layers * n_renderings, height, width, 4 (renderings of a layer are next to each other)
+    """
+    assert gm.n_dimensions(mixture) == 3
+    assert gm.is_valid_mixture(mixture)
+
+    end_gm_vis_object = False
+    if gm_vis_object is None:
+        gm_vis_object = gm_vis.GMVisualizer(False, width, height)
+        gm_vis_object.set_camera_auto(True)
+        gm_vis_object.set_density_rendering(True)
+        end_gm_vis_object = True
+
+    m = mixture.detach()[batches[0]:batches[1], layers[0]:layers[1]]
+    n_b = m.shape[0]
+    n_l = m.shape[1]
+    if gm_vis_object.is_cpu:
+        # all layers in one pass
+        gm_vis_object.set_gaussian_mixtures(m, isgmm=True)
+        rendering = torch.from_numpy(gm_vis_object.render())
+        rendering_tensor = rendering.view(n_b, n_l * rendering.shape[1], rendering.shape[2], rendering.shape[3], 4)
+    else:
+        rendering_list = list()
+        for lid in range(n_l):
+            gm_vis_object.set_gaussian_mixtures(m[:, lid:(lid + 1)].cpu(), isgmm=True)
+            rendering_list.append(torch.from_numpy(gm_vis_object.render()))
+        rendering_tensor = torch.cat(rendering_list, dim=1)
+
+    if end_gm_vis_object:
+        gm_vis_object.finish()
 
-#     return rendering_tensor
+    return rendering_tensor
 
 
 def render_with_relu(mixture: Tensor, constant: Tensor,
@@ -124,8 +225,7 @@ def imshow(mixture: Tensor, constant: typing.Optional[Tensor] = None,
         if clamp is None:
             r = max(rendering.min().abs().item(), rendering.max().item())
             clamp = (-r, r)
-        rendering = rendering.transpose(0, 1).transpose(1, 2).reshape(rendering.shape[1] * width, rendering.shape[0] * height)
-        colour = colour_mapped(rendering.detach().cpu().numpy(), clamp[0], clamp[1])
+        colour = colour_mapped(montage(rendering).cpu().numpy(), clamp[0], clamp[1])
         plt.figure()
         plt.imshow(colour)
         plt.show(block=False)
@@ -150,8 +250,7 @@ def imshow_with_ReLU(mixture: Tensor, constant: typing.Optional[Tensor] = None,
         if clamp is None:
             r = max(rendering.min().abs().item(), rendering.max().item())
             clamp = (-r, r)
-        rendering = rendering.transpose(0, 1).transpose(1, 2).reshape(rendering.shape[1] * width, rendering.shape[0] * height)
-        colour = colour_mapped(rendering.detach().cpu().numpy(), clamp[0], clamp[1])
+        colour = colour_mapped(montage(rendering).cpu().numpy(), clamp[0], clamp[1])
         plt.figure()
         plt.imshow(colour)
         plt.show(block=False)
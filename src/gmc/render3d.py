@@ -0,0 +1,556 @@
+import math
+import threading
+import typing
+
+import numpy as np
+import torch
+from torch import Tensor
+
+import gmc.config as config
+import gmc.mixture as gm
+import gmc.render
+
+# Headless renderer for 3D mixtures (pure torch, CPU or any other device). It implements the interface of the pygmvis (OpenGL) visualizer, which
+# is used by gmc.cpp.gm_vis.gm_vis.GMVisualizer when pygmvis is not built. Images are float32 RGBA in [0, 1], row 0 is the top.
+#
+# Rays are cast per pixel. The density is integrated analytically along every ray (from the camera to infinity), ellipsoids are the iso surfaces at
+# ellipsoid_sigma standard deviations (mahalanobis distance). As in gmc.render.render, the image is processed in tiles, and every tile only considers the
+# components whose projected bounding sphere overlaps it. All mixtures of the batch and all layers are rendered together, the work is spread
+# over torch's intra-op thread pool.
+
+default_fov = 60.0
+ellipsoid_sigma = 1.0
+
+
+def look_at(position: typing.Sequence[float], lookat: typing.Sequence[float], up: typing.Sequence[float]) -> Tensor:
+    """
+    @return: 4x4 world to camera matrix (OpenGL convention, the camera looks along -z)
+    """
+    position = torch.tensor(position, dtype=torch.float)
+    forward = torch.tensor(lookat, dtype=torch.float) - position
+    forward = forward / forward.norm()
+    right = torch.cross(forward, torch.tensor(up, dtype=torch.float), dim=0)
+    right = right / right.norm()
+    view_matrix = torch.eye(4)
+    view_matrix[0, :3] = right
+    view_matrix[1, :3] = torch.cross(right, forward, dim=0)
+    view_matrix[2, :3] = -forward
+    view_matrix[:3, 3] = -view_matrix[:3, :3] @ position
+    return view_matrix
+
+
+def auto_camera(positions: Tensor, fov: float = default_fov) -> Tensor:
+    """
+    Camera looking at the centre of the bounding box of positions (any shape with x/y/z in the last dimension) from diagonally above, such that the box is visible.
+    @return: 4x4 world to camera matrix
+    """
+    positions = positions.detach().reshape(-1, 3).float().cpu()
+    low = positions.min(dim=0)[0]
+    high = positions.max(dim=0)[0]
+    centre = (low + high) / 2
+    radius = max((high - low).norm().item() / 2, 1e-6)
+    direction = torch.tensor([0.6, 0.5, 1.0])
+    position = centre + direction / direction.norm() * radius / math.sin(math.radians(fov) / 2)
+    return look_at(position.tolist(), centre.tolist(), (0.0, 1.0, 0.0))
+
+
+def _camera_rays(view_matrix: Tensor, width: int, height: int, fov: float, device: torch.device) -> typing.Tuple[Tensor, Tensor]:
+    """
+    @return: camera position (3) and ray directions in world space (height, width, 3, normalised)
+    """
+    view_matrix = view_matrix.to(device=device, dtype=torch.float)
+    rotation = view_matrix[:3, :3]
+    origin = -rotation.transpose(0, 1) @ view_matrix[:3, 3]
+    tan_half_fov = math.tan(math.radians(fov) / 2)
+    xs = ((torch.arange(width, dtype=torch.float, device=device) + 0.5) * 2 / width - 1) * tan_half_fov * width / height
+    ys = (1 - (torch.arange(height, dtype=torch.float, device=device) + 0.5) * 2 / height) * tan_half_fov
+    directions = torch.stack((xs.view(1, width).expand(height, width), ys.view(height, 1).expand(height, width), -torch.ones(height, width, device=device)), dim=-1)
+    directions = directions @ rotation
+    return origin, directions / directions.norm(dim=-1, keepdim=True)
+
+
+def _tiles(view_matrix: Tensor, positions: Tensor, radii: Tensor, width: int, height: int, fov: float, tile_size: int, directions: Tensor, mask: Tensor):
+    """
+    Selects, per tile, the components whose bounding sphere (radii) projects into it.
+    @param positions: n_mixtures, n_components, 3
+    @param mask: n_mixtures, n_components; components to consider
+    @return: component indices (n_mixtures, n_tiles, n_overlapping), their mask (same dims), ray directions per tile (n_tiles, n_tile_pixels, 3), n_tiles_x, n_tiles_y
+    """
+    device = positions.device
+    n_tiles_x = (width + tile_size - 1) // tile_size
+    n_tiles_y = (height + tile_size - 1) // tile_size
+    n_tiles = n_tiles_x * n_tiles_y
+
+    # rays of the pixels outside of the image (in border tiles) repeat the last row / column and are cut away later
+    cols = torch.arange(n_tiles_x * tile_size, device=device).clamp(max=width - 1)
+    rows = torch.arange(n_tiles_y * tile_size, device=device).clamp(max=height - 1)
+    tile_directions = directions[rows.view(n_tiles_y, 1, tile_size, 1), cols.view(1, n_tiles_x, 1, tile_size)].view(n_tiles, tile_size * tile_size, 3)
+
+    # screen space (x / depth, y / depth) bounds of the tiles and the components. the bounds of a sphere follow from the tangents through the camera.
+    tan_half_fov = math.tan(math.radians(fov) / 2)
+    col_slope = ((cols.float() + 0.5) * 2 / width - 1) * tan_half_fov * width / height
+    row_slope = (1 - (rows.float() + 0.5) * 2 / height) * tan_half_fov
+    tile_x = torch.stack((col_slope.view(n_tiles_x, tile_size)[:, 0], col_slope.view(n_tiles_x, tile_size)[:, -1]), dim=-1).view(1, n_tiles_x, 2).expand(n_tiles_y, n_tiles_x, 2).reshape(n_tiles, 2)
+    tile_y = torch.stack((row_slope.view(n_tiles_y, tile_size)[:, -1], row_slope.view(n_tiles_y, tile_size)[:, 0]), dim=-1).view(n_tiles_y, 1, 2).expand(n_tiles_y, n_tiles_x, 2).reshape(n_tiles, 2)
+
+    view_matrix = view_matrix.to(device=device, dtype=torch.float)
+    camera_space = positions @ view_matrix[:3, :3].transpose(0, 1) + view_matrix[:3, 3]
+    depth = -camera_space[..., 2]
+    in_front = depth - radii > 1e-6 * (depth.abs() + radii)
+    mask = mask & (depth + radii > 0)    # not completely behind the camera
+
+    def slope_bounds(coordinate: Tensor):
+        denominator = (depth * depth - radii * radii).clamp(min=1e-12)
+        spread = radii * torch.sqrt((coordinate * coordinate + depth * depth - radii * radii).clamp(min=0))
+        low = torch.where(in_front, (coordinate * depth - spread) / denominator, torch.full_like(depth, -math.inf))
+        high = torch.where(in_front, (coordinate * depth + spread) / denominator, torch.full_like(depth, math.inf))
+        return low.unsqueeze(1), high.unsqueeze(1)
+
+    x_low, x_high = slope_bounds(camera_space[..., 0])
+    y_low, y_high = slope_bounds(camera_space[..., 1])
+    overlap = (x_low <= tile_x[:, 1].view(1, n_tiles, 1)) & (x_high >= tile_x[:, 0].view(1, n_tiles, 1)) & \
+              (y_low <= tile_y[:, 1].view(1, n_tiles, 1)) & (y_high >= tile_y[:, 0].view(1, n_tiles, 1)) & mask.unsqueeze(1)
+    n_overlapping = int(overlap.sum(dim=-1).max().item()) if overlap.numel() > 0 else 0
+    if n_overlapping == 0:
+        return None, None, tile_directions, n_tiles_x, n_tiles_y
+    is_overlapping, indices = overlap.to(torch.float).topk(n_overlapping, dim=-1, sorted=False)
+    return indices, is_overlapping > 0, tile_directions, n_tiles_x, n_tiles_y
+
+
+def _ray_coefficients(mixture: Tensor, covariance_cache: gm.CovarianceCache, origin: Tensor) -> typing.Tuple[Tensor, Tensor, Tensor]:
+    """
+    Along the ray origin + t * direction, the mahalanobis distance squared of a component is a t^2 + 2 b t + c with
+    a = direction^T P direction, b = direction^T q, where P is the inversed covariance matrix and q = P (origin - position).
+    @return: upper triangle of P (n_mixtures, n_components, 6; xx, yy, zz, xy, xz, yz), q (n_mixtures, n_components, 3), c (n_mixtures, n_components)
+    """
+    inversed = covariance_cache.inverse
+    q = (inversed @ (origin - gm.positions(mixture)).unsqueeze(-1)).squeeze(-1)
+    c = (q * (origin - gm.positions(mixture))).sum(dim=-1)
+    upper = torch.stack((inversed[..., 0, 0], inversed[..., 1, 1], inversed[..., 2, 2], inversed[..., 0, 1], inversed[..., 0, 2], inversed[..., 1, 2]), dim=-1)
+    return upper, q, c
+
+
+def _quadratic_terms(directions: Tensor, upper: Tensor, q: Tensor) -> typing.Tuple[Tensor, Tensor]:
+    # directions: ..., 1, n_pixels, 3; upper and q: ..., n_overlapping, 1, 6 / 3
+    dx, dy, dz = directions[..., 0], directions[..., 1], directions[..., 2]
+    a = upper[..., 0] * dx * dx + upper[..., 1] * dy * dy + upper[..., 2] * dz * dz + 2 * (upper[..., 3] * dx * dy + upper[..., 4] * dx * dz + upper[..., 5] * dy * dz)
+    b = q[..., 0] * dx + q[..., 1] * dy + q[..., 2] * dz
+    return a, b
+
+
+def _gather(values: Tensor, indices: Tensor) -> Tensor:
+    # values: n_mixtures, n_components, ...; indices: n_mixtures, n_tiles, n_overlapping -> n_mixtures, n_tiles, n_overlapping, ...
+    trailing = values.shape[2:]
+    flat_indices = indices.reshape(indices.shape[0], -1)
+    flat_indices = flat_indices.view(*flat_indices.shape, *([1] * len(trailing))).expand(*flat_indices.shape, *trailing)
+    return values.gather(1, flat_indices).view(*indices.shape, *trailing)
+
+
+def _chunks(n_tiles: int, n_mixtures: int, n_overlapping: int, n_tile_pixels: int) -> typing.Iterable[typing.Tuple[int, int]]:
+    # ~16 floats per component and pixel are alive at the same time
+    tile_bytes = n_mixtures * n_overlapping * n_tile_pixels * 4 * 16
+    chunk_size = max(config.eval_slize_size // max(tile_bytes, 1), 1)
+    for begin in range(0, n_tiles, chunk_size):
+        yield begin, min(begin + chunk_size, n_tiles)
+
+
+def _untile(values: Tensor, n_tiles_x: int, n_tiles_y: int, tile_size: int, width: int, height: int) -> Tensor:
+    n_mixtures = values.shape[0]
+    values = values.view(n_mixtures, n_tiles_y, n_tiles_x, tile_size, tile_size).permute(0, 1, 3, 2, 4)
+    return values.reshape(n_mixtures, n_tiles_y * tile_size, n_tiles_x * tile_size)[:, :height, :width]
+
+
+def render_density(mixture: Tensor, view_matrix: Tensor, width: int, height: int, fov: float = default_fov,
+                   tile_size: int = 16, sigma_cutoff: typing.Optional[float] = None) -> Tensor:
+    """
+    Integral of the mixture along the ray of every pixel (from the camera to infinity). Components further than sigma_cutoff standard deviations from a tile are skipped.
+
+    @param mixture: 3D mixtures with priors as weights (as everywhere in gmc)
+    @param view_matrix: 4x4 world to camera matrix, e.g. from look_at or auto_camera
+    @param sigma_cutoff: defaults to config.eval_sigma_cutoff
+    @return: tensor with dimensions n_batch, n_layers, height, width
+    """
+    assert gm.n_dimensions(mixture) == 3
+    if sigma_cutoff is None:
+        sigma_cutoff = config.eval_sigma_cutoff
+    n_batch, n_layers = gm.n_batch(mixture), gm.n_layers(mixture)
+    m = gm.convert_to_full_covariances(mixture.detach()).reshape(n_batch * n_layers, 1, gm.n_components(mixture), -1).float()
+    device = m.device
+    origin, directions = _camera_rays(view_matrix, width, height, fov, device)
+
+    covariance_cache = gm.CovarianceCache(m)
+    amplitudes = gm.weights(gm.convert_priors_to_amplitudes(m, covariance_cache))[:, 0]
+    radii = torch.sqrt(covariance_cache.covariances.diagonal(dim1=-2, dim2=-1).sum(dim=-1))[:, 0] * sigma_cutoff
+    indices, mask, tile_directions, n_tiles_x, n_tiles_y = _tiles(view_matrix, gm.positions(m)[:, 0], radii, width, height, fov, tile_size, directions, amplitudes != 0)
+    n_tiles, n_tile_pixels = tile_directions.shape[0], tile_directions.shape[1]
+    rendering = torch.zeros(m.shape[0], n_tiles, n_tile_pixels, device=device)
+    if indices is not None:
+        upper, q, c = _ray_coefficients(m, covariance_cache, origin)
+        tile_amplitudes = _gather(amplitudes, indices) * mask
+        tile_upper = _gather(upper[:, 0], indices)
+        tile_q = _gather(q[:, 0], indices)
+        tile_c = _gather(c[:, 0], indices)
+        for begin, end in _chunks(n_tiles, m.shape[0], indices.shape[-1], n_tile_pixels):
+            a, b = _quadratic_terms(tile_directions[begin:end].view(1, end - begin, 1, n_tile_pixels, 3), tile_upper[:, begin:end].unsqueeze(3), tile_q[:, begin:end].unsqueeze(3))
+            a = a.clamp(min=1e-12)
+            # integral over t in [0, inf) of exp(-0.5 (a t^2 + 2 b t + c)) = sqrt(pi / (2 a)) erfc(b / sqrt(2 a)) exp(-0.5 (c - b^2 / a))
+            minimum = (tile_c[:, begin:end].unsqueeze(3) - b * b / a).clamp(min=0)
+            integral = torch.sqrt(math.pi / (2 * a)) * torch.erfc(b / torch.sqrt(2 * a)) * torch.exp(-0.5 * minimum)
+            rendering[:, begin:end] = (tile_amplitudes[:, begin:end].unsqueeze(3) * integral).sum(dim=2)
+    return _untile(rendering, n_tiles_x, n_tiles_y, tile_size, width, height).view(n_batch, n_layers, height, width)
+
+
+def render_ellipsoids(mixture: Tensor, view_matrix: Tensor, width: int, height: int, fov: float = default_fov,
+                      tile_size: int = 16, sigma: float = ellipsoid_sigma) -> typing.Tuple[Tensor, Tensor, Tensor]:
+    """
+    Ray casts the ellipsoids at sigma standard deviations (mahalanobis distance) of all components (with a depth test).
+
+    @param view_matrix: 4x4 world to camera matrix, e.g. from look_at or auto_camera
+    @return: depth along the ray (inf for the background), index of the visible component (-1 for the background) and
+             the cosine between the surface normal and the ray (for shading), all with dimensions n_batch, n_layers, height, width
+    """
+    assert gm.n_dimensions(mixture) == 3
+    n_batch, n_layers = gm.n_batch(mixture), gm.n_layers(mixture)
+    m = gm.convert_to_full_covariances(mixture.detach()).reshape(n_batch * n_layers, 1, gm.n_components(mixture), -1).float()
+    device = m.device
+    origin, directions = _camera_rays(view_matrix, width, height, fov, device)
+
+    covariance_cache = gm.CovarianceCache(m)
+    radii = torch.sqrt(covariance_cache.covariances.diagonal(dim1=-2, dim2=-1).sum(dim=-1))[:, 0] * sigma
+    indices, mask, tile_directions, n_tiles_x, n_tiles_y = _tiles(view_matrix, gm.positions(m)[:, 0], radii, width, height, fov, tile_size, directions,
+                                                                  torch.ones(m.shape[0], m.shape[2], dtype=torch.bool, device=device))
+    n_tiles, n_tile_pixels = tile_directions.shape[0], tile_directions.shape[1]
+    depth = torch.full((m.shape[0], n_tiles, n_tile_pixels), math.inf, device=device)
+    component = torch.full((m.shape[0], n_tiles, n_tile_pixels), -1, dtype=torch.long, device=device)
+    shading = torch.zeros(m.shape[0], n_tiles, n_tile_pixels, device=device)
+    if indices is not None:
+        upper, q, c = _ray_coefficients(m, covariance_cache, origin)
+        tile_upper = _gather(upper[:, 0], indices)
+        tile_q = _gather(q[:, 0], indices)
+        tile_c = _gather(c[:, 0], indices)
+        for begin, end in _chunks(n_tiles, m.shape[0], indices.shape[-1], n_tile_pixels):
+            chunk_directions = tile_directions[begin:end].view(1, end - begin, 1, n_tile_pixels, 3)
+            chunk_upper = tile_upper[:, begin:end].unsqueeze(3)
+            chunk_q = tile_q[:, begin:end].unsqueeze(3)
+            a, b = _quadratic_terms(chunk_directions, chunk_upper, chunk_q)
+            a = a.clamp(min=1e-12)
+            # nearer intersection of a t^2 + 2 b t + c = sigma^2. the camera must be outside of the ellipsoid (c > sigma^2).
+            discriminant = b * b - a * (tile_c[:, begin:end].unsqueeze(3) - sigma * sigma)
+            t = (-b - torch.sqrt(discriminant.clamp(min=0))) / a
+            hit = (discriminant >= 0) & (t > 0) & (tile_c[:, begin:end].unsqueeze(3) > sigma * sigma) & mask[:, begin:end].unsqueeze(3)
+            t = torch.where(hit, t, torch.full_like(t, math.inf))
+            nearest_t, nearest = t.min(dim=2)
+            depth[:, begin:end] = nearest_t
+
+            # normal at the hit point: P (origin + t direction - position) = q + t P direction
+            def pick(values: Tensor) -> Tensor:
+                return values.expand(-1, -1, -1, n_tile_pixels, -1).gather(2, nearest.view(*nearest.shape[:2], 1, n_tile_pixels, 1).expand(-1, -1, -1, -1, values.shape[-1])).squeeze(2)
+            p_upper = pick(chunk_upper)
+            d = chunk_directions.view(1, end - begin, n_tile_pixels, 3)
+            p_direction = torch.stack((p_upper[..., 0] * d[..., 0] + p_upper[..., 3] * d[..., 1] + p_upper[..., 4] * d[..., 2],
+                                       p_upper[..., 3] * d[..., 0] + p_upper[..., 1] * d[..., 1] + p_upper[..., 5] * d[..., 2],
+                                       p_upper[..., 4] * d[..., 0] + p_upper[..., 5] * d[..., 1] + p_upper[..., 2] * d[..., 2]), dim=-1)
+            visible = torch.isfinite(nearest_t)
+            normal = pick(chunk_q) + torch.where(visible, nearest_t, torch.zeros_like(nearest_t)).unsqueeze(-1) * p_direction
+            cosine = ((normal * d).sum(dim=-1) / normal.norm(dim=-1).clamp(min=1e-12)).abs()
+            shading[:, begin:end] = torch.where(visible, cosine, torch.zeros_like(cosine))
+            component[:, begin:end] = torch.where(visible, indices[:, begin:end].gather(2, nearest), torch.full_like(nearest, -1))
+
+    return tuple(_untile(v, n_tiles_x, n_tiles_y, tile_size, width, height).view(n_batch, n_layers, height, width) for v in (depth, component, shading))
+
+
+def render_points(points: Tensor, view_matrix: Tensor, width: int, height: int, fov: float = default_fov, point_size: int = 1) -> typing.Tuple[Tensor, Tensor]:
+    """
+    Splats points as squares of point_size pixels (with a depth test).
+
+    @param points: n_batch, n_points, 3
+    @return: depth along the ray (inf for the background) and index of the visible point (-1 for the background), both with dimensions n_batch, height, width
+    """
+    n_batch, n_points = points.shape[0], points.shape[1]
+    device = points.device
+    view_matrix = view_matrix.to(device=device, dtype=torch.float)
+    camera_space = points.detach().float() @ view_matrix[:3, :3].transpose(0, 1) + view_matrix[:3, 3]
+    tan_half_fov = math.tan(math.radians(fov) / 2)
+    z = -camera_space[..., 2]
+    col = ((camera_space[..., 0] / z / (tan_half_fov * width / height) + 1) * width / 2).floor().long()
+    row = ((1 - camera_space[..., 1] / z / tan_half_fov) * height / 2).floor().long()
+    distance = camera_space.norm(dim=-1)
+
+    offsets = torch.arange(point_size, device=device) - (point_size - 1) // 2
+    col = (col.view(n_batch, n_points, 1, 1) + offsets.view(1, 1, 1, point_size)).expand(n_batch, n_points, point_size, point_size).reshape(-1)
+    row = (row.view(n_batch, n_points, 1, 1) + offsets.view(1, 1, point_size, 1)).expand(n_batch, n_points, point_size, point_size).reshape(-1)
+    batch = torch.arange(n_batch, device=device).view(n_batch, 1).expand(n_batch, n_points * point_size * point_size).reshape(-1)
+    point = torch.arange(n_points, device=device).view(1, n_points, 1).expand(n_batch, n_points, point_size * point_size).reshape(-1)
+    distance = distance.view(n_batch, n_points, 1).expand(n_batch, n_points, point_size * point_size).reshape(-1)
+    inside = (z.view(n_batch, n_points, 1).expand(n_batch, n_points, point_size * point_size).reshape(-1) > 0) & (col >= 0) & (col < width) & (row >= 0) & (row < height)
+    pixel = (batch * height + row) * width + col
+    pixel, point, distance = pixel[inside], point[inside], distance[inside]
+
+    # nearest point per pixel: sort by distance, then (stable) by pixel, the first entry of every pixel wins
+    order = distance.argsort()
+    pixel, point, distance = pixel[order], point[order], distance[order]
+    pixel, order = pixel.sort(stable=True)
+    point, distance = point[order], distance[order]
+    first = torch.ones_like(pixel, dtype=torch.bool)
+    first[1:] = pixel[1:] != pixel[:-1]
+
+    depth = torch.full((n_batch * height * width,), math.inf, device=device)
+    index = torch.full((n_batch * height * width,), -1, dtype=torch.long, device=device)
+    depth[pixel[first]] = distance[first]
+    index[pixel[first]] = point[first]
+    return depth.view(n_batch, height, width), index.view(n_batch, height, width)
+
+
+class CpuVisualizer:
+    """
+    Drop in for the pygmvis visualizer object (same methods and modes), see gmc.cpp.gm_vis.gm_vis.GMVisualizer for the documentation.
+    Mixtures may have several layers, which are rendered like additional batch entries (index batch * n_layers + layer).
+    The density render modes and acceleration thresholds of the OpenGL renderer have no equivalent, the density is always exact up to sigma_cutoff.
+    """
+    # gmc.cpp.gm_vis.gm_vis enum values
+    COLOR_UNIFORM, COLOR_WEIGHT, COLOR_AMPLITUDE = 1, 2, 3
+    RANGE_MANUAL, RANGE_MINMAX, RANGE_MEDMED = 1, 2, 3
+
+    def __init__(self, asyncmode: bool, width: int, height: int, device: typing.Union[str, torch.device] = 'cpu'):
+        self._asyncmode = asyncmode
+        self._width = width
+        self._height = height
+        self._device = torch.device(device)
+        self._fov = default_fov
+        self._camera_auto = False
+        self._view_matrix = look_at((0.0, 0.0, 10.0), (0.0, 0.0, 0.0), (0.0, 1.0, 0.0))
+        self._white = False
+        self._point_size = 1
+        self._ellipsoids = False
+        self._ellipsoids_pointcloud = False
+        self._ellipsoids_gray = True
+        self._ellipsoids_colormode = self.COLOR_UNIFORM
+        self._ellipsoids_range = (self.RANGE_MINMAX, 0.0, 0.0)
+        self._positions = False
+        self._positions_pointcloud = True
+        self._positions_colormode = self.COLOR_UNIFORM
+        self._positions_range = (self.RANGE_MINMAX, 0.0, 0.0)
+        self._density = False
+        self._density_auto = 0.75
+        self._density_range = (0.0, 1.0)
+        self._density_logarithmic = False
+        self._mixtures: typing.Optional[Tensor] = None
+        self._pointclouds: typing.Optional[Tensor] = None
+        self._callback = None
+        self._thread: typing.Optional[threading.Thread] = None
+        self._stop = False
+
+    def set_image_size(self, width: int, height: int):
+        self._width = width
+        self._height = height
+
+    def set_camera_auto(self, mode: bool):
+        self._camera_auto = mode
+
+    def set_camera_lookat(self, positions: typing.Sequence[float], lookat: typing.Sequence[float], up: typing.Sequence[float]):
+        self._camera_auto = False
+        self._view_matrix = look_at(positions, lookat, up)
+
+    def set_view_matrix(self, viewmat: typing.Sequence[float]):
+        # column major (OpenGL / glm)
+        self._camera_auto = False
+        self._view_matrix = torch.tensor(viewmat, dtype=torch.float).view(4, 4).transpose(0, 1)
+
+    def set_whitemode(self, white: bool):
+        self._white = white
+
+    def set_point_size(self, size: float):
+        self._point_size = max(int(round(size)), 1)
+
+    def set_ellipsoids_pc_rendering(self, ellipsoids: bool, pointcloud: bool, gray: bool = True):
+        self._ellipsoids = ellipsoids
+        self._ellipsoids_pointcloud = pointcloud
+        self._ellipsoids_gray = gray
+
+    def set_ellipsoids_colormode(self, colormode: int):
+        self._ellipsoids_colormode = int(colormode)
+
+    def set_ellipsoids_rangemode(self, rangemode: int, vmin: float, vmax: float):
+        self._ellipsoids_range = (int(rangemode), vmin, vmax)
+
+    def set_positions_rendering(self, positions: bool, pointcloud: bool = True):
+        self._positions = positions
+        self._positions_pointcloud = pointcloud
+
+    def set_positions_colormode(self, colormode: int):
+        self._positions_colormode = int(colormode)
+
+    def set_positions_rangemode(self, rangemode: int, vmin: float, vmax: float):
+        self._positions_range = (int(rangemode), vmin, vmax)
+
+    def set_density_rendering(self, density: bool):
+        self._density = density
+
+    def set_density_rendermode(self, rendermode: int):
+        pass
+
+    def set_density_range_auto(self, autoperc: float = 0.75):
+        self._density_auto = autoperc
+
+    def set_density_range_manual(self, min: float, max: float):
+        self._density_auto = None
+        self._density_range = (min, max)
+
+    def set_density_logarithmic(self, logarithmic: bool):
+        self._density_logarithmic = logarithmic
+
+    def set_density_accthreshold(self, automatic: bool = True, threshold: float = 0.0001):
+        pass
+
+    def set_pointclouds(self, pointclouds: Tensor):
+        self._pointclouds = pointclouds.detach().reshape(pointclouds.shape[0], -1, 3).to(self._device, torch.float)
+
+    def set_pointclouds_from_paths(self, paths: typing.List[str]):
+        pointclouds = list()
+        for path in paths:
+            with open(path) as file:
+                if file.readline().strip() != "OFF":
+                    raise Exception(f"{path} is not a valid OFF file")
+                n_points = int(file.readline().split()[0])
+                pointclouds.append(torch.from_numpy(np.loadtxt(file, dtype=np.float32, max_rows=n_points, usecols=(0, 1, 2)).reshape(n_points, 3)))
+        self.set_pointclouds(torch.stack(pointclouds))
+
+    def set_gaussian_mixtures(self, mixtures: Tensor, isgmm: bool = False):
+        mixtures = gm.convert_to_full_covariances(mixtures.detach()).to(self._device, torch.float)
+        if not isgmm:
+            # amplitudes as weights, gmc uses priors
+            mixtures = gm.convert_amplitudes_to_priors(mixtures)
+        self._mixtures = mixtures
+
+    def set_gaussian_mixtures_from_paths(self, paths: typing.List[str], isgmm: bool = False):
+        import gmc.inout
+        mixtures = [gmc.inout.read_gm_from_ply(path, ismodel=False, device=self._device) for path in paths]
+        self.set_gaussian_mixtures(torch.cat(mixtures, dim=0), isgmm)
+
+    def set_callback(self, callback):
+        self._callback = callback
+
+    def _current_view_matrix(self) -> Tensor:
+        if not self._camera_auto:
+            return self._view_matrix
+        if self._pointclouds is not None:
+            return auto_camera(self._pointclouds, self._fov)
+        return auto_camera(gm.positions(self._mixtures), self._fov)
+
+    def _background(self) -> typing.Tuple[float, float, float]:
+        if self._white:
+            return 1.0, 1.0, 1.0
+        return (0.5, 0.5, 0.5) if self._ellipsoids_gray else (0.0, 0.0, 0.0)
+
+    def _coloured_values(self, values: Tensor, colormode: int, range_settings: typing.Tuple[int, float, float]) -> Tensor:
+        # values: n_mixtures, n_components -> rgb
+        if colormode == self.COLOR_UNIFORM:
+            return torch.full((*values.shape, 3), 0.8, device=values.device)
+        rangemode, low, high = range_settings
+        if rangemode == self.RANGE_MINMAX:
+            low, high = values.min().item(), values.max().item()
+        elif rangemode == self.RANGE_MEDMED:
+            median = values.median().item()
+            low, high = 0.0, 2 * median
+        return gmc.render.colour_mapped(values.reshape(values.shape[0], -1), low, high)[..., :3].float().view(*values.shape, 3)
+
+    def _component_values(self, colormode: int) -> Tensor:
+        if colormode == self.COLOR_AMPLITUDE:
+            return gm.weights(gm.convert_priors_to_amplitudes(self._mixtures))
+        return gm.weights(self._mixtures)
+
+    def _overlay_pointcloud(self, image: Tensor, depth: Tensor, view_matrix: Tensor, n_layers: int) -> Tensor:
+        # image: n_mixtures, height, width, 3; depth: n_mixtures, height, width
+        if self._pointclouds is None:
+            return image
+        point_depth, point_index = render_points(self._pointclouds, view_matrix, self._width, self._height, self._fov, self._point_size)
+        point_depth = point_depth.repeat_interleave(n_layers, dim=0)
+        point_index = point_index.repeat_interleave(n_layers, dim=0)
+        visible = ((point_index >= 0) & (point_depth < depth)).unsqueeze(-1)
+        point_colour = torch.tensor((0.0, 0.0, 0.0) if self._white else (0.95, 0.95, 0.95), device=image.device)
+        return torch.where(visible, point_colour, image)
+
+    def _render_ellipsoids(self, view_matrix: Tensor) -> Tensor:
+        # also renders the point cloud alone (with ellipsoids disabled)
+        n_mixtures, n_layers = gm.n_batch(self._mixtures) * gm.n_layers(self._mixtures), gm.n_layers(self._mixtures)
+        if self._ellipsoids:
+            depth, component, shading = render_ellipsoids(self._mixtures, view_matrix, self._width, self._height, self._fov)
+            depth, component, shading = depth.flatten(0, 1), component.flatten(0, 1), shading.flatten(0, 1)
+        else:
+            depth = torch.full((n_mixtures, self._height, self._width), math.inf, device=self._device)
+            component = torch.full((n_mixtures, self._height, self._width), -1, dtype=torch.long, device=self._device)
+            shading = torch.zeros(n_mixtures, self._height, self._width, device=self._device)
+        colours = self._coloured_values(self._component_values(self._ellipsoids_colormode).flatten(0, 1), self._ellipsoids_colormode, self._ellipsoids_range)
+        colour = colours.gather(1, component.clamp(min=0).view(component.shape[0], -1, 1).expand(-1, -1, 3)).view(*component.shape, 3)
+        colour = colour * (0.3 + 0.7 * shading).unsqueeze(-1)
+        image = torch.where((component >= 0).unsqueeze(-1), colour, torch.tensor(self._background(), device=colour.device))
+        if self._ellipsoids_pointcloud:
+            image = self._overlay_pointcloud(image, depth, view_matrix, n_layers)
+        return image
+
+    def _render_positions(self, view_matrix: Tensor) -> Tensor:
+        n_batch, n_layers, n_components = gm.n_batch(self._mixtures), gm.n_layers(self._mixtures), gm.n_components(self._mixtures)
+        depth, index = render_points(gm.positions(self._mixtures).reshape(n_batch * n_layers, n_components, 3), view_matrix, self._width, self._height, self._fov, max(self._point_size, 3))
+        colours = self._coloured_values(self._component_values(self._positions_colormode).flatten(0, 1), self._positions_colormode, self._positions_range)
+        colour = colours.gather(1, index.clamp(min=0).view(index.shape[0], -1, 1).expand(-1, -1, 3)).view(*index.shape, 3)
+        image = torch.where((index >= 0).unsqueeze(-1), colour, torch.tensor(self._background(), device=colour.device))
+        if self._positions_pointcloud:
+            image = self._overlay_pointcloud(image, depth, view_matrix, n_layers)
+        return image
+
+    def _render_density(self, view_matrix: Tensor) -> Tensor:
+        density = render_density(self._mixtures, view_matrix, self._width, self._height, self._fov).flatten(0, 1)
+        if self._density_auto is not None:
+            # relative to the maximum; a higher autoperc gives a higher intensity
+            r = max(density.abs().max().item(), 1e-12) * 2 ** (4 * (0.75 - self._density_auto))
+            low, high = (-r if (density < 0).any() else 0.0), r
+        else:
+            low, high = self._density_range
+        if self._density_logarithmic:
+            def symmetric_log(x):
+                return math.copysign(math.log10(1 + abs(x)), x) if not isinstance(x, Tensor) else torch.sign(x) * torch.log10(1 + x.abs())
+            density, low, high = symmetric_log(density), symmetric_log(low), symmetric_log(high)
+        return gmc.render.colour_mapped(density.reshape(-1, self._width), low, high)[..., :3].float().view(density.shape[0], self._height, self._width, 3)
+
+    def _render(self) -> np.ndarray:
+        assert self._mixtures is not None
+        view_matrix = self._current_view_matrix()
+        images = list()
+        if self._ellipsoids or self._ellipsoids_pointcloud:
+            images.append(self._render_ellipsoids(view_matrix))
+        if self._positions:
+            images.append(self._render_positions(view_matrix))
+        if self._density:
+            images.append(self._render_density(view_matrix))
+        images = torch.stack(images, dim=1)
+        alpha = torch.ones(*images.shape[:-1], 1, device=images.device)
+        return torch.cat((images, alpha), dim=-1).cpu().numpy()
+
+    def _render_async(self, epoch: int):
+        result = self._render()
+        for gmidx in range(result.shape[0]):
+            for ridx in range(result.shape[1]):
+                if self._stop:
+                    return
+                self._callback(epoch, result[gmidx, ridx], gmidx, ridx)
+
+    def render(self, epoch: int = 0) -> typing.Optional[np.ndarray]:
+        """
+        @return: array with dimensions n_mixtures, n_renderings, height, width, 4 (in order ellipsoids, positions, density), or None in async mode
+        """
+        if not self._asyncmode:
+            return self._render()
+        self.finish()
+        self._stop = False
+        self._thread = threading.Thread(target=self._render_async, args=(epoch,))
+        self._thread.start()
+        return None
+
+    def finish(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def forceStop(self):
+        self._stop = True
+        self.finish()
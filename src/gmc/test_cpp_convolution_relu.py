@@ -0,0 +1,60 @@
+import unittest
+
+import torch.autograd
+
+import gmc.cpp.extensions.convolution.binding as cpp_convolution
+import gmc.cpp.extensions.convolution_relu.binding as cpp_convolution_relu
+import gmc.fitting
+import gmc.mixture as gm
+
+
+class CppConvolutionReLUTest(unittest.TestCase):
+    def _test_against_unfused(self, n_dims: int):
+        n_batches = 3
+        n_in_channels = 4
+        n_out_channels = 5
+        weight_scale = 1 / n_in_channels
+        data = gm.generate_random_mixtures(n_batches, n_in_channels, 6, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+        kernels = gm.generate_random_mixtures(n_out_channels, n_in_channels, 3, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+        constant = torch.rand(n_batches, n_out_channels) - 0.5
+
+        convolved = cpp_convolution.apply(data, kernels)
+        convolved = gm.pack_mixture(gm.weights(convolved) * weight_scale, gm.positions(convolved), gm.covariances(convolved))
+        reference, reference_constant, _ = gmc.fitting.fixed_point_only(convolved, constant, -1)
+
+        fused = cpp_convolution_relu.apply(data, kernels, constant, weight_scale)
+        self.assertEqual(fused.shape, reference.shape)
+        self.assertLess((gm.weights(fused) - gm.weights(reference)).abs().max(), 0.0001)
+        self.assertLess((gm.positions(fused) - gm.positions(reference)).abs().max(), 0.00001)
+        self.assertLess((gm.covariances(fused) - gm.covariances(reference)).abs().max(), 0.00001)
+
+    def _test_grad(self, n_dims: int):
+        data = gm.generate_random_mixtures(2, 3, 4, n_dims=n_dims, pos_radius=1, cov_radius=0.5).to(torch.double)
+        kernels = gm.generate_random_mixtures(2, 3, 2, n_dims=n_dims, pos_radius=1, cov_radius=0.5).to(torch.double)
+        constant = (torch.rand(2, 2) - 0.5).to(torch.double)
+        data.requires_grad = True
+        kernels.requires_grad = True
+        constant.requires_grad = True
+
+        test = torch.autograd.gradcheck(lambda d, k, c: cpp_convolution_relu.apply(d, k, c, 0.5), (data, kernels, constant), eps=1e-6, atol=1e-4)
+        self.assertTrue(test)
+
+    def test_forward_2d(self):
+        torch.manual_seed(0)
+        self._test_against_unfused(2)
+
+    def test_forward_3d(self):
+        torch.manual_seed(0)
+        self._test_against_unfused(3)
+
+    def test_backward_2d(self):
+        torch.manual_seed(0)
+        self._test_grad(2)
+
+    def test_backward_3d(self):
+        torch.manual_seed(0)
+        self._test_grad(3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -132,5 +132,116 @@ class CppEvalTest(unittest.TestCase):
                             self.assertTrue(test)
 
 
+    def test_packed(self):
+        # packed covariances are read by the kernel, the reference expands them in python (autograd sums the gradients of the mirrored entries)
+        for device in ('cpu', 'cuda'):
+            for n_dims in (2, 3):
+                mixture = gm.generate_random_mixtures(3, 4, 20, n_dims, pos_radius=position_radius, cov_radius=covariance_radius).to(torch.float64)
+                mixture = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.covariances(mixture).inverse(), packed_covariances=True).to(device)
+                xes = (torch.rand([1, 4, 100, n_dims], dtype=torch.float64) * position_radius * 2 - position_radius).to(device)
+                mixture.requires_grad = True
+
+                reference = cpp_inversed_eval.apply(gm.convert_to_full_covariances(mixture), xes)
+                reference.sum().backward()
+                reference_grad = mixture.grad.clone()
+
+                mixture.grad = None
+                result = gm.evaluate_inversed(mixture, xes)
+                result.sum().backward()
+                self.assertLess((result - reference).abs().max().item(), 1e-10, msg=f"packed {device} {n_dims}d")
+                self.assertEqual(mixture.grad.shape, mixture.shape)
+                self.assertLess((mixture.grad - reference_grad).abs().max().item(), 1e-10, msg=f"packed grad {device} {n_dims}d")
+
+                self.assertTrue(torch.autograd.gradcheck(cpp_inversed_eval.apply, (mixture[:1, :1, :5].detach().requires_grad_(), xes[:1, :1, :7].detach().requires_grad_()),
+                                                         eps=1e-6, atol=1e-3, nondet_tol=1e-6))
+
+    def test_chunked(self):
+        for device in ('cpu', 'cuda'):
+            for n_dims in (2, 3):
+                mixture = gm.generate_random_mixtures(3, 4, 50, n_dims, pos_radius=position_radius, cov_radius=covariance_radius)
+                mixture = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.covariances(mixture).inverse().transpose(-2, -1)).to(device)
+                xes = (torch.rand([1, 4, 1000, n_dims]) * position_radius * 2 - position_radius).to(device)
+                mixture.requires_grad = True
+                xes.requires_grad = True
+
+                reference = gm.evaluate_inversed(mixture, xes)
+                reference.sum().backward()
+                mixture_reference_grad = mixture.grad.clone()
+                xes_reference_grad = xes.grad.clone()
+
+                # the first budget only splits the xes, which must give the same bits. the second splits the components as well.
+                for memory_budget, bit_identical in ((100000, True), (10000, False)):
+                    mixture.grad = None
+                    xes.grad = None
+                    result = gm.evaluate_inversed_chunked(mixture, xes, memory_budget)
+                    if bit_identical:
+                        self.assertTrue(torch.equal(result, reference), msg=f"chunked {device} {n_dims}d")
+                    else:
+                        self.assertAlmostEqual(((result - reference) ** 2).mean().sqrt().item(), 0, places=test_precision_places, msg=f"RMSE chunked {device} {n_dims}d")
+                    result.sum().backward()
+                    self.assertAlmostEqual(((mixture.grad - mixture_reference_grad) ** 2).mean().sqrt().item(), 0, places=test_precision_places, msg=f"RMSE chunked mixture grad {device} {n_dims}d")
+                    self.assertAlmostEqual(((xes.grad - xes_reference_grad) ** 2).mean().sqrt().item(), 0, places=test_precision_places, msg=f"RMSE chunked xes grad {device} {n_dims}d")
+
+
+    def test_chunked_memory(self):
+        # 4 layers, hence the component blocks are not contiguous. the budget gives 9 component blocks and 13 chunks of xes.
+        mixture = gm.generate_random_mixtures(1, 4, 1000, 3, pos_radius=position_radius, cov_radius=covariance_radius)
+        mixture = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.covariances(mixture).inverse().transpose(-2, -1)).cuda()
+        xes = (torch.rand([1, 4, 5000, 3]) * position_radius * 2 - position_radius).cuda()
+        mixture.requires_grad = True
+        xes.requires_grad = True
+        mixture_bytes = mixture.element_size() * mixture.nelement()
+        xes_bytes = xes.element_size() * xes.nelement()
+        result_bytes = 4 * 5000 * mixture.element_size()
+
+        reference = gm.evaluate_inversed(mixture, xes)
+        reference.sum().backward()
+        mixture_reference_grad = mixture.grad.clone()
+        xes_reference_grad = xes.grad.clone()
+        mixture.grad = None
+        xes.grad = None
+        del reference
+
+        torch.cuda.synchronize()
+        allocated_before = torch.cuda.memory_allocated()
+        result = gm.evaluate_inversed_chunked(mixture, xes, 100000)
+        torch.cuda.synchronize()
+        # saved for backward: one copy of the mixture, copies of the xes chunks and one output per component block and chunk of xes
+        allocated = torch.cuda.memory_allocated() - allocated_before
+        self.assertLess(allocated, 2 * mixture_bytes + 2 * xes_bytes + 11 * result_bytes)
+
+        result.sum().backward()
+        self.assertAlmostEqual(((mixture.grad - mixture_reference_grad) ** 2).mean().sqrt().item(), 0, places=test_precision_places, msg=f"RMSE chunked mixture grad")
+        self.assertAlmostEqual(((xes.grad - xes_reference_grad) ** 2).mean().sqrt().item(), 0, places=test_precision_places, msg=f"RMSE chunked xes grad")
+
+    def test_truncated(self):
+        for device in ('cpu', 'cuda'):
+            for n_dims in (2, 3):
+                mixture = gm.generate_random_mixtures(3, 4, 50, n_dims, pos_radius=position_radius, cov_radius=covariance_radius / 10)
+                mixture = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.covariances(mixture).inverse().transpose(-2, -1)).to(device)
+                xes = (torch.rand([1, 4, 500, n_dims]) * position_radius * 2 - position_radius).to(device)
+
+                reference = gm.evaluate_inversed(mixture, xes)
+                for sigma_cutoff in (1.0, 2.0, 3.0):
+                    result = gm.evaluate_inversed_truncated(mixture, xes, sigma_cutoff)
+                    error = (result - reference).abs().max(dim=-1)[0]
+                    self.assertTrue(torch.all(error <= gm.truncation_error_bound(mixture, sigma_cutoff) * 1.001 + 1e-6), msg=f"truncated {device} {n_dims}d, sigma_cutoff={sigma_cutoff}")
+
+                # with a large cutoff nothing is truncated, hence also the gradient must match
+                mixture.requires_grad = True
+                xes.requires_grad = True
+                reference = gm.evaluate_inversed(mixture, xes)
+                reference.sum().backward()
+                mixture_reference_grad = mixture.grad.clone()
+                xes_reference_grad = xes.grad.clone()
+                mixture.grad = None
+                xes.grad = None
+                result = gm.evaluate_inversed_truncated(mixture, xes, 20.0)
+                result.sum().backward()
+                self.assertAlmostEqual(((result - reference) ** 2).mean().sqrt().item(), 0, places=test_precision_places, msg=f"RMSE truncated {device} {n_dims}d")
+                self.assertAlmostEqual(((mixture.grad - mixture_reference_grad) ** 2).mean().sqrt().item(), 0, places=test_precision_places, msg=f"RMSE truncated mixture grad {device} {n_dims}d")
+                self.assertAlmostEqual(((xes.grad - xes_reference_grad) ** 2).mean().sqrt().item(), 0, places=test_precision_places, msg=f"RMSE truncated xes grad {device} {n_dims}d")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,46 @@
+import os
+import re
+import unittest
+
+from gmc.cpp.extensions import loader
+
+# headers of the CUDA toolkit. CPU-only builds take them from cpu_only/, so every one an extension includes needs a stand-in there.
+cuda_header_pattern = re.compile(r"(cuda.*\.h|math_constants\.h|vector_types\.h|device_.*\.h|thrust/.*|cub/.*)$")
+include_pattern = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]', re.MULTILINE)
+
+
+def included_cuda_headers(source_file: str, visited: set) -> set:
+    # follows the quoted includes that resolve inside the extension sources, returns the CUDA toolkit headers included with <>
+    if source_file in visited:
+        return set()
+    visited.add(source_file)
+    with open(source_file) as file:
+        content = file.read()
+
+    headers = set()
+    for kind, header in include_pattern.findall(content):
+        if kind == "<" and cuda_header_pattern.match(header):
+            headers.add(header)
+            continue
+        for directory in [os.path.dirname(source_file), loader.source_dir, os.path.dirname(loader.source_dir)]:
+            path = os.path.abspath(os.path.join(directory, header))
+            if os.path.isfile(path) and path.startswith(os.path.abspath(loader.source_dir)):
+                headers |= included_cuda_headers(path, visited)
+                break
+    return headers
+
+
+class TestCpuOnlyHeaders(unittest.TestCase):
+    def test_cuda_headers_have_cpu_only_stand_ins(self):
+        for name, (source_files, cuda_only_source_files) in loader.extensions.items():
+            visited = set()
+            headers = set()
+            for source_file in source_files:
+                headers |= included_cuda_headers(os.path.abspath(source_file), visited)
+            for header in headers:
+                self.assertTrue(os.path.isfile(os.path.join(loader.cpu_only_include_path, header)),
+                                f"{name} includes <{header}>, which has no stand-in in cpu_only/")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import math
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+import torch.utils.data
+
+import gmc.inout as gmio
+import gmc.mixture as gm
+
+
+class TestInout(unittest.TestCase):
+    def test_save_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for n_dims in (2, 3):
+                mixture = gm.generate_random_mixtures(n_batch=3, n_layers=2, n_components=17, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+                for packed in (False, True):
+                    # an absolute path replaces config.data_base_path
+                    file_name = os.path.join(directory, f"mixture{n_dims}_{packed}.torch")
+                    gmio.save(mixture, file_name, meta_info="meta", packed=packed)
+                    self.assertEqual(torch.load(file_name)["version"], 7 if packed else 6)
+                    self.assertEqual(torch.load(file_name)["data"].shape[-1], gm.convert_to_packed_covariances(mixture).shape[-1] if packed else mixture.shape[-1])
+
+                    read, meta_info = gmio.load(file_name)
+                    self.assertEqual(meta_info, "meta")
+                    if packed:
+                        # the lower triangle is mirrored from the upper one
+                        self.assertLess((read - mixture).abs().max().item(), 1e-6)
+                    else:
+                        self.assertTrue((read == mixture).all())
+                    read, _ = gmio.load(file_name, packed_covariances=True)
+                    self.assertTrue((read == gm.convert_to_packed_covariances(mixture)).all())
+
+    def test_binary_ply_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for n_dims in (2, 3):
+                mixture = gm.generate_random_mixtures(n_batch=3, n_layers=2, n_components=17, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+                file_name = os.path.join(directory, f"mixture{n_dims}.ply")
+                gmio.write_gm_to_binary_ply(mixture, file_name)
+
+                read = gmio.read_gm_from_binary_ply(file_name)
+                self.assertEqual(read.shape, mixture.shape)
+                self.assertTrue((read == mixture).all())
+                self.assertTrue((gmio.read_gm_from_binary_ply(file_name, packed_covariances=True) == gm.convert_to_packed_covariances(mixture)).all())
+
+    def test_ascii_and_binary_ply_agree(self):
+        mixture = gm.generate_random_mixtures(n_batch=2, n_layers=1, n_components=33, n_dims=3, pos_radius=1, cov_radius=0.5)
+        with tempfile.TemporaryDirectory() as directory:
+            for binary in (False, True):
+                file_name = os.path.join(directory, f"mixture_{binary}.ply")
+                gmio.write_gm_to_ply(gm.weights(mixture), gm.positions(mixture), gm.covariances(mixture), 1, file_name, binary=binary)
+                for ismodel in (False, True):
+                    read = gmio.read_gm_from_ply(file_name, ismodel=ismodel, device='cpu')
+                    reference = mixture[1:2]
+                    if ismodel:
+                        reference = gm.pack_mixture(gm.weights(reference) / gm.weights(reference).sum() / (gm.covariances(reference).det().sqrt() * 15.74960995),
+                                                    gm.positions(reference), gm.covariances(reference))
+                    self.assertLess((read - reference).abs().max().item(), 0.0001)
+
+
+    def test_binary_ply_2d_model(self):
+        mixture = gm.generate_random_mixtures(n_batch=1, n_layers=1, n_components=9, n_dims=2, pos_radius=1, cov_radius=0.5)
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "mixture.ply")
+            gmio.write_gm_to_binary_ply(mixture, file_name)
+            read = gmio.read_gm_from_ply(file_name, ismodel=True, device='cpu')
+            priors = gm.weights(mixture) / gm.weights(mixture).sum()
+            self.assertEqual(read.shape, mixture.shape)
+            self.assertLess((gm.weights(read) - priors / (gm.covariances(mixture).det().sqrt() * 2 * math.pi)).abs().max().item(), 0.0001)
+            self.assertTrue((gm.positions(read) == gm.positions(mixture)).all())
+
+    def test_empty_ply(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for n_dims in (2, 3):
+                mixture = torch.zeros(2, 3, 0, 1 + n_dims + n_dims * n_dims)
+                file_name = os.path.join(directory, f"empty{n_dims}.ply")
+                gmio.write_gm_to_binary_ply(mixture, file_name)
+                self.assertEqual(gmio.read_gm_from_binary_ply(file_name).shape, mixture.shape)
+                self.assertEqual(gmio.read_gm_from_binary_ply(file_name, packed_covariances=True).shape[:3], (2, 3, 0))
+
+            empty = torch.zeros(1, 1, 0, 13)
+            for binary in (False, True):
+                file_name = os.path.join(directory, f"empty_{binary}.ply")
+                gmio.write_gm_to_ply(gm.weights(empty), gm.positions(empty), gm.covariances(empty), 0, file_name, binary=binary)
+                self.assertEqual(gmio.read_gm_from_ply(file_name, device='cpu').shape, (1, 1, 0, 13))
+
+    def test_shards(self):
+        mixtures = [gm.generate_random_mixtures(n_batch=1, n_layers=2, n_components=n, n_dims=2, pos_radius=1, cov_radius=0.5)[0] for n in (5, 8, 3, 8, 7)]
+        with tempfile.TemporaryDirectory() as directory:
+            gmio.write_shards(((m, i * 10) for i, m in enumerate(mixtures)), directory, n_components=8, samples_per_shard=2)
+            data_set = gmio.ShardedMixtureDataSet(directory, begin=1)
+            self.assertEqual(len(data_set), 4)
+            loader = torch.utils.data.DataLoader(data_set, batch_size=2)
+            for batch_id, (batch, labels) in enumerate(loader):
+                self.assertEqual(batch.shape, (2, 2, 8, 6))
+                for i in range(2):
+                    index = 1 + batch_id * 2 + i
+                    self.assertEqual(labels[i].item(), index * 10)
+                    original = mixtures[index].unsqueeze(0)
+                    read = gm.convert_to_full_covariances(batch[i:i+1])
+                    self.assertTrue((read[:, :, :gm.n_components(original)] == original).all())
+                    self.assertTrue((gm.weights(read[:, :, gm.n_components(original):]) == 0).all())
+
+    def test_shard_samples_are_views(self):
+        mixtures = [gm.generate_random_mixtures(n_batch=1, n_layers=1, n_components=4, n_dims=3, pos_radius=1, cov_radius=0.5)[0] for _ in range(3)]
+        with tempfile.TemporaryDirectory() as directory:
+            gmio.write_shards(((m, i) for i, m in enumerate(mixtures)), directory, samples_per_shard=2)
+            data_set = gmio.ShardedMixtureDataSet(directory)
+            for index in range(len(data_set)):
+                mixture, label = data_set[index]
+                self.assertTrue(np.shares_memory(mixture.numpy(), data_set._shards[int(data_set.shard[index])]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+
+import gmc.benchmark_import_time as benchmark_import_time
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_no_extension_or_heavy_module_on_import(self):
+        benchmark_import_time.n_repetitions = 1
+        for module in benchmark_import_time.modules:
+            time, loaded, heavy = benchmark_import_time.measure(module)
+            self.assertEqual(loaded, [], f"importing {module} loaded C++ extensions")
+            self.assertEqual(heavy, [], f"importing {module} imported slow modules")
+
+    def test_lazy_extension_handle(self):
+        from gmc.cpp.extensions import loader
+        import gmc.cpp.extensions.convolution.binding as cpp_convolution
+        self.assertIs(cpp_convolution.cpp_binding, loader.lazy('convolution'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import unittest
+import unittest.mock
+
+from gmc.cpp.extensions import loader
+
+
+class TestLoader(unittest.TestCase):
+    def test_prebuilt_flags_are_portable(self):
+        for cpu_only in [False, True]:
+            configuration = loader.build_configuration('pieces_bindings', cpu_only, portable_flags=True)
+            self.assertNotIn("-march=native", configuration["extra_cflags"])
+            self.assertNotEqual(loader.build_key('pieces_bindings', cpu_only, portable_flags=True),
+                                loader.build_key('pieces_bindings', cpu_only))
+
+    @unittest.skipIf(loader.cpu_only_forced, "GPE_CPU_ONLY=1 only loads CPU only binaries")
+    def test_prebuilt_cuda_binary_is_tried_first(self):
+        # a wheel built with CUDA must load on nodes without CUDA toolkit, i.e. independent of the JIT mode
+        tried = []
+
+        def import_binary(module_name, directory, key):
+            tried.append((module_name, directory, key))
+            return object() if directory == loader.prebuilt_dir else None
+
+        with unittest.mock.patch.object(loader, "_import_binary", import_binary), \
+                unittest.mock.patch.object(loader, "jit_cpu_only", lambda: True):
+            loader.load('pieces_bindings')
+        self.assertEqual(tried, [('pieces_bindings', loader.prebuilt_dir, loader.build_key('pieces_bindings', False, portable_flags=True))])
+
+    def test_sources_key_is_cached(self):
+        loader._sources_key()
+        hits = loader._sources_key.cache_info().hits
+        loader.build_key('pieces_bindings')
+        self.assertEqual(loader._sources_key.cache_info().hits, hits + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
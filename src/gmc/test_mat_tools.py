@@ -28,6 +28,22 @@ class MatToolsTest(unittest.TestCase):
 
         self.assertAlmostEqual((b - target).abs().sum().item(), 0)
 
+    def test_select_top_components(self):
+        mixture = torch.rand(3, 4, 100, 13, requires_grad=True)
+        key = torch.rand(3, 4, 100)
+        selected = mat_tools.select_top_components(mixture, 10, key)
+        _, sorted_indices = torch.sort(key, descending=True)
+        reference = mat_tools.my_index_select(mixture, sorted_indices)[:, :, :10, :]
+        self.assertEqual(selected.shape, (3, 4, 10, 13))
+        self.assertTrue((selected == reference).all())
+
+        selected.sum().backward()
+        self.assertEqual(mixture.grad.sum().item(), 3 * 4 * 10 * 13)
+        selected_mask = torch.zeros_like(key).scatter(-1, sorted_indices[:, :, :10], 1)
+        self.assertTrue((mixture.grad == selected_mask.unsqueeze(-1)).all())
+
+        self.assertEqual(mat_tools.select_top_components(mixture, 1000, key).shape, (3, 4, 100, 13))
+
     def test_flatten_index(self):
         indices = torch.arange(3 * 5 * 7 * 11).view(3, 5, 7, 11)
         for i in range(3):
@@ -8,7 +8,9 @@ import torch
 from torch import Tensor
 import gmc.cpp.extensions.convolution.binding as cpp_convolution
 
+import gmc.config as config
 import gmc.mixture as gm
+import gmc.mat_tools as mat_tools
 
 
 def _triangle_mat_data(dims: int) -> (np.array, np.array, Tensor):
@@ -135,6 +137,25 @@ class TestGM(unittest.TestCase):
             # plt.imshow((reference_solution - our_solution)); plt.colorbar(); plt.show();
             self.assertLess(max_l2_err, 0.0000001)
 
+    def test_convolution_broadcast(self):
+        for n_dims in (2, 3):
+            gm1 = gm.generate_random_mixtures(3, 2, 5, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+            gm2 = gm.generate_random_mixtures(1, 2, 4, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+            gm1_repeated, gm2_repeated = gm._polynomial_mul_repeat(gm1, gm2)
+            reference = torch.cat(((gm.weights(gm1_repeated) * gm.weights(gm2_repeated)).unsqueeze(-1), (gm1_repeated + gm2_repeated)[:, :, :, 1:]), dim=-1)
+            result = gm.convolve(gm1, gm2)
+            self.assertEqual(result.shape, reference.shape)
+            self.assertLess((result - reference).abs().max().item(), 0.000001)
+
+            packed = gm.convolve(gm.convert_to_packed_covariances(gm1), gm.convert_to_packed_covariances(gm2))
+            self.assertLess((gm.convert_to_full_covariances(packed) - reference).abs().max().item(), 0.000001)
+
+            # the budget keeps the products with the largest amplitudes
+            largest = gm.convolve(gm1, gm2, n_components_out=7)
+            amplitudes = gm.weights(gm.convert_priors_to_amplitudes(reference)).abs()
+            self.assertLess((largest - mat_tools.select_top_components(reference, 7, amplitudes)).abs().max().item(), 0.000001)
+            self.assertEqual(gm.convolve(gm1, gm2, n_components_out=100).shape, reference.shape)
+
     def test_convolution_grad(self):
         a = gm.generate_random_mixtures(3, 5, 7, n_dims=2, pos_radius=1, cov_radius=0.5).to(torch.double)
         b = gm.generate_random_mixtures(2, 5, 4, n_dims=2, pos_radius=1, cov_radius=0.5).to(torch.double)
@@ -200,5 +221,67 @@ class TestGM(unittest.TestCase):
             self.assertTrue((m1 - m2).abs().max().item() < 0.00001)  # round trip
 
 
+    def test_packed_covariances(self):
+        for n_dims, packed_length in ((2, 6), (3, 10)):
+            mixture = gm.generate_random_mixtures(n_batch=3, n_layers=2, n_components=5, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+            packed = gm.convert_to_packed_covariances(mixture)
+            self.assertEqual(packed.shape[-1], packed_length)
+            self.assertTrue(gm.is_packed(packed))
+            self.assertFalse(gm.is_packed(mixture))
+            self.assertEqual(gm.n_dimensions(packed), n_dims)
+            self.assertTrue(gm.is_valid_mixture(packed))
+
+            self.assertTrue((gm.weights(packed) == gm.weights(mixture)).all())
+            self.assertTrue((gm.positions(packed) == gm.positions(mixture)).all())
+            self.assertTrue((gm.covariances(packed) == gm.covariances(mixture)).all())
+            self.assertTrue((gm.convert_to_full_covariances(packed) == mixture).all())
+            self.assertTrue((gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.covariances(mixture), packed_covariances=True) == packed).all())
+
+            xes = torch.rand(1, 1, 100, n_dims) * 2 - 1
+            self.assertLess((gm.evaluate(packed, xes) - gm.evaluate(mixture, xes)).abs().max().item(), 0.000001)
+
+    def test_covariance_cache(self):
+        for n_dims in (2, 3):
+            mixture = gm.generate_random_mixtures(n_batch=2, n_layers=3, n_components=4, n_dims=n_dims, pos_radius=1, cov_radius=0.5).to(torch.double)
+            covariances = gm.covariances(mixture)
+            cache = gm.CovarianceCache(mixture)
+            self.assertLess((cache.inverse - covariances.inverse()).abs().max().item(), 0.000001)
+            self.assertIs(cache.inverse, cache.inverse)
+            self.assertLess((cache.cholesky @ cache.cholesky.transpose(-1, -2) - covariances).abs().max().item(), 0.000001)
+            self.assertLess((cache.det - covariances.det()).abs().max().item(), 0.000001)
+
+            # autograd through the cached inverse
+            xes = torch.rand(1, 1, 20, n_dims, dtype=torch.double) * 2 - 1
+            a = mixture.clone().requires_grad_(True)
+            b = mixture.clone().requires_grad_(True)
+            cache = gm.CovarianceCache(a)
+            (gm.evaluate(a, xes, cache) + gm.evaluate_componentwise(a, xes, cache).sum(-1)).sum().backward()
+            (gm.evaluate(b, xes) + gm.evaluate_componentwise(b, xes).sum(-1)).sum().backward()
+            self.assertLess((a.grad - b.grad).abs().max().item(), 0.000001)
+
+    def test_validation_levels(self):
+        valid = gm.generate_random_mixtures(n_batch=2, n_layers=3, n_components=4, n_dims=2, pos_radius=1, cov_radius=0.5)
+        nan = valid.clone()
+        nan[0, 0, 0, 0] = float('nan')
+        wrong_shape = valid[0]
+
+        level = config.validation_level
+        try:
+            config.validation_level = config.VALIDATION_FULL
+            self.assertTrue(gm.is_valid_mixture(valid))
+            self.assertRaises(AssertionError, gm.is_valid_mixture, nan)
+            self.assertRaises(AssertionError, gm.is_valid_mixture, wrong_shape)
+
+            config.validation_level = config.VALIDATION_CHEAP
+            self.assertTrue(gm.is_valid_mixture(nan))
+            self.assertRaises(AssertionError, gm.is_valid_mixture, wrong_shape)
+            self.assertRaises(AssertionError, gm.is_valid_mixture_and_constant, valid, torch.zeros(2, 5))
+
+            config.validation_level = config.VALIDATION_OFF
+            self.assertTrue(gm.is_valid_mixture(wrong_shape))
+            self.assertTrue(gm.is_valid_mixture_and_constant(valid, torch.zeros(2, 5)))
+        finally:
+            config.validation_level = level
+
 if __name__ == '__main__':
     unittest.main()
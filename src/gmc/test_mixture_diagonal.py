@@ -0,0 +1,106 @@
+import unittest
+
+import torch
+
+import gmc.fitting
+import gmc.mixture as gm
+import gmc.mixture_diagonal as gmd
+import gmc.mixture_isotropic as gmi
+
+
+def _random_diagonal(n_batch: int, n_layers: int, n_components: int, n_dims: int) -> torch.Tensor:
+    weights = torch.rand(n_batch, n_layers, n_components) * 2 - 1
+    positions = torch.rand(n_batch, n_layers, n_components, n_dims) * 2 - 1
+    variances = torch.rand(n_batch, n_layers, n_components, n_dims) * 0.5 + 0.05
+    return gmd.pack_mixture(weights, positions, variances)
+
+
+class MixtureDiagonalTest(unittest.TestCase):
+    def _assert_close(self, a: torch.Tensor, b: torch.Tensor):
+        self.assertEqual(a.shape, b.shape)
+        self.assertLess((a - b).abs().max().item(), 1e-5 * max(b.abs().max().item(), 1))
+
+    def _test_against_full(self, module, mixture: torch.Tensor, kernel: torch.Tensor):
+        n_dims = module.n_dimensions(mixture)
+        full = module.to_full(mixture)
+        full_kernel = module.to_full(kernel)
+        xes = torch.rand(1, gm.n_layers(mixture), 500, n_dims) * 4 - 2
+
+        self._assert_close(module.evaluate(mixture, xes), gm.evaluate(full, xes))
+        self._assert_close(module.evaluate_componentwise(mixture, xes), gm.evaluate_componentwise(full, xes))
+        self._assert_close(module.integrate(mixture), gm.integrate(full))
+        self._assert_close(module.to_full(module.convolve(mixture, kernel)), gm.convolve(full, full_kernel))
+        self._assert_close(module.to_full(module.convert_priors_to_amplitudes(mixture)), gm.convert_priors_to_amplitudes(full))
+        self._assert_close(module.convert_amplitudes_to_priors(module.convert_priors_to_amplitudes(mixture)), mixture)
+        self._assert_close(module.from_full(full), mixture)
+
+    def test_diagonal(self):
+        torch.manual_seed(0)
+        for n_dims in (2, 3):
+            self._test_against_full(gmd, _random_diagonal(3, 4, 10, n_dims), _random_diagonal(1, 4, 5, n_dims))
+
+    def test_isotropic(self):
+        torch.manual_seed(0)
+        for n_dims in (2, 3):
+            mixture = gmi.from_diagonal(_random_diagonal(3, 4, 10, n_dims))
+            kernel = gmi.from_diagonal(_random_diagonal(1, 4, 5, n_dims))
+            self.assertEqual(mixture.shape[-1], n_dims + 2)
+            self._test_against_full(gmi, mixture, kernel)
+            self._assert_close(gmi.from_diagonal(gmi.to_diagonal(mixture)), mixture)
+
+    def test_chunked_evaluation(self):
+        torch.manual_seed(0)
+        mixture = _random_diagonal(2, 3, 50, 3)
+        xes = torch.rand(2, 3, 1000, 3) * 4 - 2
+        reference = gmd.evaluate_componentwise(mixture, xes).sum(dim=-1)
+        eval_slize_size = gmd.config.eval_slize_size
+        gmd.config.eval_slize_size = 2 * 3 * 50 * 3 * 4 * 64    # 64 xes per chunk
+        try:
+            self._assert_close(gmd.evaluate(mixture, xes), reference)
+        finally:
+            gmd.config.eval_slize_size = eval_slize_size
+
+    def test_dispatch(self):
+        torch.manual_seed(0)
+        for covariance_type, module in ((gm.COVARIANCE_DIAGONAL, gmd), (gm.COVARIANCE_ISOTROPIC, gmi)):
+            mixture = _random_diagonal(2, 3, 10, 3)
+            kernel = _random_diagonal(1, 3, 4, 3)
+            if module is gmi:
+                mixture, kernel = gmi.from_diagonal(mixture), gmi.from_diagonal(kernel)
+            xes = torch.rand(1, 3, 100, 3) * 4 - 2
+            self._assert_close(gm.evaluate(mixture, xes, covariance_type=covariance_type), module.evaluate(mixture, xes))
+            self._assert_close(gm.convolve(mixture, kernel, covariance_type=covariance_type), module.convolve(mixture, kernel))
+
+    def test_convolve_layers(self):
+        torch.manual_seed(0)
+        for module in (gmd, gmi):
+            data = _random_diagonal(2, 3, 6, 3)
+            kernels = _random_diagonal(4, 3, 5, 3)
+            if module is gmi:
+                data, kernels = gmi.from_diagonal(data), gmi.from_diagonal(kernels)
+            result = module.convolve_layers(data, kernels)
+            self.assertEqual(result.shape, (2, 4, 3 * 6 * 5, data.shape[-1]))
+
+            # output layer o is the sum of the convolutions of every input layer with kernel layer o
+            xes = torch.rand(1, 1, 200, 3) * 4 - 2
+            for o in range(4):
+                reference = sum(module.evaluate(module.convolve(data[:, i:i + 1], kernels[o:o + 1, i:i + 1]), xes) for i in range(3))
+                self._assert_close(module.evaluate(result[:, o:o + 1], xes), reference)
+
+    def test_fixed_point_only(self):
+        torch.manual_seed(0)
+        for covariance_type, module in ((gm.COVARIANCE_DIAGONAL, gmd), (gm.COVARIANCE_ISOTROPIC, gmi)):
+            mixture = _random_diagonal(2, 3, 20, 3)
+            if module is gmi:
+                mixture = gmi.from_diagonal(mixture)
+            constant = torch.rand(2, 3) - 0.5
+            config = gmc.fitting.Config()
+            config.covariance_type = covariance_type
+            fitting, fitting_constant, _ = gmc.fitting.fixed_point_only(mixture, constant, -1, config)
+            reference, reference_constant, _ = gmc.fitting.fixed_point_only(module.to_full(mixture), constant, -1)
+            self._assert_close(module.to_full(fitting), reference)
+            self._assert_close(fitting_constant, reference_constant)
+
+
+if __name__ == '__main__':
+    unittest.main()
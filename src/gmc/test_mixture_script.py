@@ -0,0 +1,60 @@
+import unittest
+
+import torch
+
+import gmc.mixture as gm
+import gmc.mixture_script as gms
+
+
+class MixtureScriptTest(unittest.TestCase):
+    def _mixtures(self, n_dims: int):
+        torch.manual_seed(0)
+        mixture = gm.generate_random_mixtures(3, 4, 20, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+        inversed = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.CovarianceCache(mixture).inverse)
+        kernel = gm.generate_random_mixtures(1, 4, 5, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+        xes = torch.rand(1, 4, 100, n_dims) * 4 - 2
+        return mixture, inversed, kernel, xes
+
+    def _assert_close(self, a: torch.Tensor, b: torch.Tensor):
+        self.assertEqual(a.shape, b.shape)
+        self.assertLess((a - b).abs().max().item(), 1e-5 * max(b.abs().max().item(), 1))
+
+    def _test_against_mixture(self, n_dims: int, ns):
+        mixture, inversed, kernel, xes = self._mixtures(n_dims)
+        scaling = torch.rand(3, 4, n_dims) + 0.5
+        self._assert_close(ns.evaluate_componentwise_inversed(inversed, xes), gm.evaluate_componentwise_inversed(inversed, xes))
+        self._assert_close(ns.evaluate_inversed(inversed, xes), gm.evaluate_inversed(inversed, xes))
+        self._assert_close(ns.convolve(mixture, kernel), gm.convolve(mixture, kernel))
+        self._assert_close(ns.convolve(gm.convert_to_packed_covariances(mixture), gm.convert_to_packed_covariances(kernel)), gm.convert_to_packed_covariances(gm.convolve(mixture, kernel)))
+        self._assert_close(ns.spatial_scale(mixture, scaling), gm.spatial_scale(mixture, scaling))
+        self._assert_close(ns.spatial_scale(mixture, scaling[:, :, :1]), gm.spatial_scale(mixture, scaling[:, :, :1]))
+        self._assert_close(ns.convert_priors_to_amplitudes(mixture), gm.convert_priors_to_amplitudes(mixture))
+        self._assert_close(ns.convert_amplitudes_to_priors(mixture), gm.convert_amplitudes_to_priors(mixture))
+        self._assert_close(ns.covariances(gm.convert_to_packed_covariances(mixture)), gm.covariances(mixture))
+        self._assert_close(ns.det(gm.covariances(mixture)), gm.covariances(mixture).det())
+
+    def test_eager(self):
+        self._test_against_mixture(2, gms)
+        self._test_against_mixture(3, gms)
+
+    def test_script(self):
+        class Scripted:
+            pass
+        scripted = Scripted()
+        for name in ("det", "evaluate_componentwise_inversed", "evaluate_inversed", "convolve", "spatial_scale",
+                     "convert_priors_to_amplitudes", "convert_amplitudes_to_priors", "covariances"):
+            setattr(scripted, name, torch.jit.script(getattr(gms, name)))
+        self._test_against_mixture(2, scripted)
+        self._test_against_mixture(3, scripted)
+
+    def test_gradient(self):
+        mixture, inversed, kernel, xes = self._mixtures(2)
+        a = inversed.clone().requires_grad_()
+        b = inversed.clone().requires_grad_()
+        gms.evaluate_inversed(a, xes).sum().backward()
+        gm.evaluate_inversed(b, xes).sum().backward()
+        self._assert_close(a.grad, b.grad)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@ import numpy as np
 import scipy.signal
 
 import gmc.mixture as gm
+import gmc.mixture_diagonal as gmd
+import gmc.mixture_isotropic as gmi
 import gmc.modules as gmc
 import gmc.mat_tools as mat_tools
 import gmc.cpp.extensions.convolution.binding as cpp_convolution
@@ -106,6 +108,82 @@ class TestGM(unittest.TestCase):
             # render.imshow(conv_fit_result)
             self.assertTrue((torch.sort(reference, dim=2)[0] - torch.sort(conv_fit_result, dim=2)[0]).abs().max().item() < 0.0001)
 
+    def test_convolution_packed(self):
+        for n_dims in (2, 3):
+            data = gm.generate_random_mixtures(2, 3, 5, n_dims=n_dims, pos_radius=1, cov_radius=0.25).to(torch.float64)
+            kernels = gm.generate_random_mixtures(4, 3, 2, n_dims=n_dims, pos_radius=1, cov_radius=0.25).to(torch.float64)
+            packed_data = gm.convert_to_packed_covariances(data).requires_grad_()
+            kernels.requires_grad = True
+
+            # the reference expands in python, autograd sums the gradients of the mirrored covariance entries
+            reference = cpp_convolution.apply(gm.convert_to_full_covariances(packed_data), kernels)
+            reference.sum().backward()
+            reference_grads = (packed_data.grad.clone(), kernels.grad.clone())
+
+            packed_data.grad = None
+            kernels.grad = None
+            result = cpp_convolution.apply(packed_data, kernels)
+            self.assertFalse(gm.is_packed(result))
+            self.assertLess((result - reference).abs().max().item(), 1e-12)
+            result.sum().backward()
+            self.assertLess((packed_data.grad - reference_grads[0]).abs().max().item(), 1e-12)
+            self.assertLess((kernels.grad - reference_grads[1]).abs().max().item(), 1e-12)
+
+    def test_convolution_diagonal(self):
+        for covariance_type, module in ((gm.COVARIANCE_DIAGONAL, gmd), (gm.COVARIANCE_ISOTROPIC, gmi)):
+            conv_layer = gmc.Convolution(gmc.ConvolutionConfig(covariance_type=covariance_type), n_layers_in=3, n_layers_out=4, n_dims=3, position_range=1, covariance_range=0.25, weight_sd=1)
+            data = module.from_full(gm.generate_random_mixtures(2, 3, 5, n_dims=3, pos_radius=1, cov_radius=0.25))
+            x_constant = torch.rand(2, 3)
+
+            result, result_constant = conv_layer(data, x_constant)
+            reference = cpp_convolution.apply(module.to_full(data), conv_layer.full_kernels())
+            xes = torch.rand(1, 1, 500, 3) * 4 - 2
+            reference_values = gm.evaluate(reference, xes)
+            self.assertLess((gm.evaluate(module.to_full(result), xes) - reference_values).abs().max().item(), 1e-5 * max(reference_values.abs().max().item(), 1))
+            self.assertLess((result_constant - conv_layer.forward_constant(x_constant, conv_layer.full_kernels())).abs().max().item(), 1e-6)
+
+            result.sum().backward()
+            self.assertIsNotNone(conv_layer.covariance_factors.grad)
+
+    def test_convolution_kernel_cache(self):
+        conv_layer = gmc.Convolution(gmc.ConvolutionConfig(), n_layers_in=2, n_layers_out=3, n_dims=2, position_range=1, covariance_range=0.25, weight_sd=1)
+        optimiser = torch.optim.SGD(conv_layer.parameters(), lr=0.1)
+
+        with torch.no_grad():
+            kernels = conv_layer.kernels()
+            self.assertIs(conv_layer.kernels(), kernels)
+            self.assertFalse(kernels.requires_grad)
+        # a recording call must not return the cached kernels without graph, nor share its own graph
+        recorded = conv_layer.kernels()
+        self.assertTrue(recorded.requires_grad)
+        self.assertIsNot(conv_layer.kernels(), recorded)
+
+        # the optimiser step changes the parameters in place
+        recorded.sum().backward()
+        optimiser.step()
+        with torch.no_grad():
+            after_step = conv_layer.kernels()
+            self.assertIsNot(after_step, kernels)
+            self.assertGreater((after_step - kernels).abs().max().item(), 0)
+
+        # frozen parameters record nothing, the kernels are cached with grad enabled as well
+        conv_layer.set_requires_grad(False)
+        self.assertIs(conv_layer.kernels(), conv_layer.kernels())
+        conv_layer.set_requires_grad(True)
+        self.assertTrue(conv_layer.kernels().requires_grad)
+
+    def test_convolution_interleaved_backward(self):
+        # forward A, forward B, backward A, backward B: each forward needs its own kernel graph
+        conv_layer = gmc.Convolution(gmc.ConvolutionConfig(), n_layers_in=2, n_layers_out=3, n_dims=2, position_range=1, covariance_range=0.25, weight_sd=1)
+        x_a = gm.generate_random_mixtures(2, 2, 4, n_dims=2, pos_radius=1, cov_radius=0.25)
+        x_b = gm.generate_random_mixtures(2, 2, 4, n_dims=2, pos_radius=1, cov_radius=0.25)
+        y_a, _ = conv_layer(x_a, torch.zeros(2, 2))
+        y_b, _ = conv_layer(x_b, torch.zeros(2, 2))
+        gm.weights(y_a).sum().backward()
+        grad_a = conv_layer.weights.grad.clone()
+        gm.weights(y_b).sum().backward()
+        self.assertGreater((conv_layer.weights.grad - grad_a).abs().max().item(), 0)
+
     def test_convolution_with_const(self):
         n_batches = 3
         n_layers_in = 4
@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import unittest
+
+import torch
+
+import gmc.mixture as gm
+import gmc.profiling
+
+
+class Duplicate(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.scale = torch.nn.Parameter(torch.ones(1))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.cat((x, x), dim=2) * self.scale
+
+
+class Chain(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.layers = torch.nn.ModuleList([Duplicate(), Duplicate()])
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        for layer in self.layers:
+            x = layer(x)
+        return x
+
+
+class ProfilingTest(unittest.TestCase):
+    def test_records(self):
+        model = Chain()
+        profiler = gmc.profiling.Profiler(model)
+        mixture = gm.generate_random_mixtures(2, 3, 5, n_dims=2)
+
+        model(mixture).sum().backward()
+        self.assertEqual(len(profiler.records), 0)
+
+        profiler.enabled = True
+        for i in range(2):
+            model(mixture).sum().backward()
+        self.assertEqual(list(profiler.records.keys()), ["layers.0", "layers.1"])
+        first, second = profiler.records["layers.0"], profiler.records["layers.1"]
+        self.assertEqual(first.n_calls, 2)
+        self.assertEqual((first.n_components_in, first.n_components_out), (5, 10))
+        self.assertEqual((second.n_components_in, second.n_components_out), (10, 20))
+        self.assertEqual(second.n_bytes, 2 * 2 * 3 * 20 * 7 * 4)
+        self.assertGreater(first.forward_time, 0)
+        # layers.0 has no input gradient (the mixture is not learnable)
+        self.assertGreater(second.backward_time, 0)
+        self.assertIn("layers.1", profiler.summary())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.json")
+            profiler.export_chrome_trace(path)
+            with open(path) as file:
+                events = json.load(file)["traceEvents"]
+        self.assertEqual(len([e for e in events if e["cat"] == "forward"]), 4)
+        self.assertEqual(len([e for e in events if e["cat"] == "backward"]), 2)
+
+        profiler.reset()
+        self.assertEqual(len(profiler.records), 0)
+
+    def test_call(self):
+        model = Chain()
+        profiler = gmc.profiling.Profiler(model, enabled=True)
+        mixture = gm.generate_random_mixtures(1, 1, 4, n_dims=3)
+        profiler.call("duplicate", model.layers[0].forward, mixture)
+        self.assertEqual(profiler.records["duplicate"].n_components_out, 8)
+        self.assertNotIn("layers.0", profiler.records)
+
+    def test_benchmark_peak_memory(self):
+        calls = []
+        duration = gmc.profiling.benchmark('cpu', lambda: calls.append(1), n_warm_up=1, n_repetitions=3)
+        self.assertEqual(len(calls), 4)
+        self.assertGreaterEqual(duration, 0)
+        duration, peak = gmc.profiling.benchmark('cpu', lambda: calls.append(1), n_warm_up=0, n_repetitions=1, peak_memory=True)
+        self.assertIsNone(peak)
+
+    @unittest.skipUnless(torch.cuda.is_available(), "needs CUDA")
+    def test_benchmark_peak_memory_cuda(self):
+        duration, peak = gmc.profiling.benchmark('cuda', lambda: torch.empty(1024 ** 2, device='cuda'), peak_memory=True)
+        self.assertGreaterEqual(peak, 4 * 1024 ** 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+import torch
+
+import gmc.cpp.extensions.convolution.binding as cpp_convolution
+import gmc.cpp.extensions.convolution_fitting.binding as cpp_convolution_fitting
+import gmc.mixture as gm
+
+
+class ReducedPrecisionTest(unittest.TestCase):
+    def _test_evaluate(self, dtype: torch.dtype, n_dims: int, tolerance: float):
+        mixture = gm.generate_random_mixtures(2, 3, 50, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+        xes = torch.rand(1, 3, 1000, n_dims) * 4 - 2
+        reference = gm.evaluate(mixture, xes)
+
+        # rounding the stored mixture is the only source of error, the accumulation is in float32
+        inversed = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.CovarianceCache(mixture).inverse).to(dtype)
+        reduced_result = gm.evaluate_inversed(inversed, xes)
+        self.assertEqual(reduced_result.dtype, torch.float32)
+        self.assertEqual(reduced_result.shape, reference.shape)
+        self.assertLess(((reference - reduced_result).abs().max() / reference.abs().max()).item(), tolerance)
+
+        # not splitting the components, the chunked evaluation is bit identical, also in the dtype
+        chunked_result = gm.evaluate_inversed_chunked(inversed, xes, 100000)
+        self.assertEqual(chunked_result.dtype, torch.float32)
+        self.assertTrue(torch.equal(chunked_result, reduced_result))
+
+        inversed.requires_grad = True
+        gm.evaluate_inversed(inversed, xes).sum().backward()
+        self.assertEqual(inversed.grad.dtype, dtype)
+        self.assertTrue(torch.isfinite(inversed.grad.float()).all())
+
+    def _test_convolution(self, dtype: torch.dtype, n_dims: int, tolerance: float):
+        data = gm.generate_random_mixtures(2, 3, 8, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+        kernels = gm.generate_random_mixtures(4, 3, 5, n_dims=n_dims, pos_radius=1, cov_radius=0.5)
+        xes = torch.rand(1, 1, 1000, n_dims) * 4 - 2
+
+        for fun in (lambda d, k: cpp_convolution.apply(d, k), lambda d, k: cpp_convolution_fitting.apply(d, k, 3 * 8 * 5)):
+            reference = gm.evaluate(fun(data, kernels), xes)
+            reduced = fun(data.to(dtype), kernels.to(dtype))
+            self.assertEqual(reduced.dtype, dtype)
+            result = gm.evaluate(reduced.float(), xes)
+            self.assertLess(((reference - result).abs().max() / reference.abs().max()).item(), tolerance)
+
+    def test_evaluate_half(self):
+        torch.manual_seed(0)
+        self._test_evaluate(torch.float16, 2, 0.01)
+        self._test_evaluate(torch.float16, 3, 0.01)
+
+    def test_evaluate_bfloat16(self):
+        torch.manual_seed(0)
+        self._test_evaluate(torch.bfloat16, 2, 0.05)
+        self._test_evaluate(torch.bfloat16, 3, 0.05)
+
+    def test_convolution_half(self):
+        torch.manual_seed(0)
+        self._test_convolution(torch.float16, 2, 0.02)
+        self._test_convolution(torch.float16, 3, 0.02)
+
+    def test_convolution_bfloat16(self):
+        torch.manual_seed(0)
+        self._test_convolution(torch.bfloat16, 2, 0.1)
+        self._test_convolution(torch.bfloat16, 3, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import math
+import unittest
+
+import matplotlib.cm
+import matplotlib.colors
+import numpy as np
+import torch
+
+import gmc.mixture as gm
+import gmc.render as render
+from gmc import colourmap
+
+
+def reference_render(mixture, constant, x_low, y_low, x_high, y_high, width, height):
+    # full evaluation of every component at every pixel (the former implementation)
+    xs = x_low + torch.arange(width, dtype=torch.float) * (x_high - x_low) / width
+    ys = y_low + torch.arange(height, dtype=torch.float) * (y_high - y_low) / height
+    yv, xv = torch.meshgrid([ys, xs])
+    xes = torch.stack((xv.reshape(-1), yv.reshape(-1)), dim=-1).view(1, 1, -1, 2)
+    rendering = gm.evaluate(mixture, xes) + constant.unsqueeze(-1)
+    return rendering.view(gm.n_batch(mixture), gm.n_layers(mixture), height, width)
+
+
+class TestRender(unittest.TestCase):
+    def test_tiled_against_full_evaluation(self):
+        mixture = gm.generate_random_mixtures(n_batch=3, n_layers=2, n_components=40, n_dims=2, pos_radius=10, cov_radius=0.5)
+        constant = torch.rand(3, 2) - 0.5
+        # the image size is not a multiple of the tile size
+        args = dict(x_low=-12, y_low=-11, x_high=12, y_high=13, width=53, height=37)
+        reference = reference_render(mixture, constant, **args)
+
+        exact = render.render(mixture, constant, sigma_cutoff=math.inf, tile_size=8, **args)
+        self.assertEqual(exact.shape, reference.shape)
+        self.assertLess((exact - reference).abs().max().item(), 0.00001)
+
+        truncated = render.render(mixture, constant, **args)
+        inversed = gm.pack_mixture(gm.weights(mixture), gm.positions(mixture), gm.covariances(mixture).inverse())
+        bound = gm.truncation_error_bound(inversed).view(3, 2, 1, 1)
+        self.assertTrue(((truncated - reference).abs() <= bound + 0.00001).all())
+
+        packed = render.render(gm.convert_to_packed_covariances(mixture), constant, batches=(1, 3), layers=(1, 2), **args)
+        self.assertLess((packed - truncated[1:3, 1:2]).abs().max().item(), 0.00001)
+
+    def test_montage(self):
+        rendering = torch.arange(2 * 3 * 4 * 5, dtype=torch.float).view(2, 3, 4, 5)
+        montage = render.montage(rendering)
+        self.assertEqual(montage.shape, (3 * 4, 2 * 5))
+        self.assertTrue((montage[4:8, 5:10] == rendering[1, 1]).all())
+
+    def test_colour_mapped(self):
+        values = np.linspace(-1.5, 1.5, 1000).reshape(20, 50)
+        values[3, 7] = np.nan
+        mapper = matplotlib.cm.ScalarMappable(norm=matplotlib.colors.Normalize(vmin=-1, vmax=1, clip=True), cmap=colourmap.cm_linSeg)
+        reference = mapper.to_rgba(values)
+
+        colour = render.colour_mapped(values, -1, 1)
+        self.assertEqual(colour.shape, (20, 50, 4))
+        self.assertLess(np.abs(colour - reference).max(), 0.0001)
+
+        colour_torch = render.colour_mapped(torch.from_numpy(values).float(), -1, 1)
+        self.assertLess(np.abs(colour_torch.numpy() - reference).max(), 0.001)
+
+
+if __name__ == '__main__':
+    unittest.main()
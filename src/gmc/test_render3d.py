@@ -0,0 +1,63 @@
+import math
+import unittest
+
+import torch
+
+import gmc.mixture as gm
+import gmc.render3d as render3d
+
+
+class TestRender3d(unittest.TestCase):
+    def test_density_against_ray_marching(self):
+        torch.manual_seed(0)
+        mixture = gm.generate_random_mixtures(n_batch=2, n_layers=2, n_components=10, n_dims=3, pos_radius=1, cov_radius=0.3)
+        view_matrix = render3d.look_at((4.0, 3.0, 6.0), (0.0, 0.0, 0.0), (0.0, 1.0, 0.0))
+        width, height = 24, 20
+        density = render3d.render_density(mixture, view_matrix, width, height, tile_size=8, sigma_cutoff=math.inf)
+        self.assertEqual(density.shape, (2, 2, height, width))
+
+        # march from the camera through the mixture (well beyond it)
+        origin, directions = render3d._camera_rays(view_matrix, width, height, render3d.default_fov, torch.device('cpu'))
+        n_steps = 2000
+        step = 16 / n_steps
+        ts = (torch.arange(n_steps, dtype=torch.float) + 0.5) * step
+        xes = (origin.view(1, 1, 3) + directions.view(-1, 1, 3) * ts.view(1, -1, 1)).view(1, 1, -1, 3)
+        reference = (gm.evaluate(mixture, xes).view(2, 2, height, width, n_steps).sum(dim=-1) * step)
+        self.assertLess(((density - reference).abs() / reference.abs().max()).max().item(), 0.001)
+
+        truncated = render3d.render_density(mixture, view_matrix, width, height, tile_size=8)
+        self.assertLess(((truncated - reference).abs() / reference.abs().max()).max().item(), 0.02)
+
+    def test_ellipsoids_and_points(self):
+        sigma = 0.5
+        mixture = gm.pack_mixture(torch.ones(1, 1, 1), torch.zeros(1, 1, 1, 3), torch.eye(3).view(1, 1, 1, 3, 3) * sigma ** 2)
+        view_matrix = render3d.look_at((0.0, 0.0, 5.0), (0.0, 0.0, 0.0), (0.0, 1.0, 0.0))
+        depth, component, shading = render3d.render_ellipsoids(mixture, view_matrix, 33, 33, sigma=1)
+        self.assertAlmostEqual(depth[0, 0, 16, 16].item(), 5 - sigma, places=4)
+        self.assertEqual(component[0, 0, 16, 16].item(), 0)
+        self.assertAlmostEqual(shading[0, 0, 16, 16].item(), 1, places=4)
+        self.assertEqual(component[0, 0, 0, 0].item(), -1)
+        self.assertTrue(math.isinf(depth[0, 0, 0, 0].item()))
+
+        point_depth, point_index = render3d.render_points(torch.tensor([[[0.0, 0.0, 0.0], [0.0, 0.0, 1.0]]]), view_matrix, 33, 33)
+        self.assertEqual(point_index[0, 16, 16].item(), 1)
+        self.assertAlmostEqual(point_depth[0, 16, 16].item(), 4, places=4)
+        self.assertEqual((point_index >= 0).sum().item(), 1)
+
+    def test_visualizer(self):
+        mixture = gm.generate_random_mixtures(n_batch=2, n_layers=3, n_components=8, n_dims=3, pos_radius=1, cov_radius=0.3)
+        vis = render3d.CpuVisualizer(False, 40, 30)
+        vis.set_camera_auto(True)
+        vis.set_ellipsoids_pc_rendering(True, True)
+        vis.set_ellipsoids_colormode(render3d.CpuVisualizer.COLOR_WEIGHT)
+        vis.set_density_rendering(True)
+        vis.set_pointclouds(torch.rand(2, 100, 3))
+        vis.set_gaussian_mixtures(mixture, isgmm=True)
+        rendering = vis.render()
+        vis.finish()
+        self.assertEqual(rendering.shape, (6, 2, 30, 40, 4))
+        self.assertTrue(((rendering >= 0) & (rendering <= 1)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# builds all extensions ahead of time, which takes a while. run with GMC_TEST_WHEEL=1
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipUnless(os.environ.get("GMC_TEST_WHEEL", "0") not in ("", "0"), "set GMC_TEST_WHEEL=1 to build and install the wheel")
+class TestWheel(unittest.TestCase):
+    def test_installed_wheel_loads_prebuilt_extensions(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            wheel_dir = os.path.join(temp_dir, "wheel")
+            site_dir = os.path.join(temp_dir, "site")
+            subprocess.run([sys.executable, "-m", "pip", "wheel", "--no-deps", "--no-build-isolation", "-w", wheel_dir, src_dir], check=True)
+            wheels = [os.path.join(wheel_dir, f) for f in os.listdir(wheel_dir) if f.endswith(".whl")]
+            self.assertEqual(len(wheels), 1)
+            subprocess.run([sys.executable, "-m", "pip", "install", "--no-deps", "--target", site_dir, wheels[0]], check=True)
+
+            # the wheel contains no C++ sources, so the extension can only come from the prebuilt directory
+            script = "\n".join([
+                "import gmc.fitting",
+                "from gmc.cpp.extensions import loader",
+                "assert not loader.sources_available('pieces_bindings')",
+                "module = loader.load('pieces_bindings')",
+                "assert module.__file__.startswith(loader.prebuilt_dir), module.__file__",
+            ])
+            environment = dict(os.environ, PYTHONPATH=site_dir, GMC_EXTENSIONS_CACHE=os.path.join(temp_dir, "cache"))
+            result = subprocess.run([sys.executable, "-c", script], cwd=temp_dir, env=environment, capture_output=True, text=True)
+            self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
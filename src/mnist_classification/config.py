@@ -29,6 +29,8 @@ class Config:
         self.test_set_end = 10000
         self.input_fitting_components = 32
         self.input_fitting_iterations = 100
+        # read the fitted inputs from memory mapped shards (gmc.inout.ShardedMixtureDataSet), they are converted from the per sample files on first use
+        self.input_shards = False
         self.batch_size = 100
         self.n_epochs = 80
         self.kernel_learning_rate = 0.001
@@ -43,12 +43,23 @@ class GmMnistDataSet(torch.utils.data.Dataset):
         return self.end - self.begin
 
     def __getitem__(self, index):
-        mixture, meta = gmc.inout.load(f"{self.prefix}{index + self.begin}")
+        # packed covariances are smaller in the data loader, gmc.model.Net expands them on the device
+        mixture, meta = gmc.inout.load(f"{self.prefix}{index + self.begin}", packed_covariances=True)
         if len(meta.shape) == 1:
             return mixture[0], meta[0]
         return mixture[0], meta
 
 
+def sharded_data_set(config: Config, dataset_name: str, begin: int, end: int) -> gmc.inout.ShardedMixtureDataSet:
+    directory = config.data_base_path / config.produce_input_description() / f"{dataset_name}_shards"
+    if not (directory / "index.pt").exists():
+        # all samples of (fashion) mnist, the range is selected when reading
+        n_samples = 60000 if dataset_name == "train" else 10000
+        per_file = GmMnistDataSet(f'{config.produce_input_description()}/{dataset_name}_', begin=0, end=n_samples)
+        gmc.inout.write_shards((per_file[i] for i in range(len(per_file))), str(directory), n_components=config.input_fitting_components)
+    return gmc.inout.ShardedMixtureDataSet(str(directory), begin=begin, end=end)
+
+
 def render_debug_images_to_tensorboard(model, epoch, tensor_board_writer):
     for i, gmc in enumerate(model.gmcs):
         tensor_board_writer.add_image(f"mnist conv {i}", gmc.debug_render(clamp=[-2.2, 2.2]), epoch, dataformats='HWC')
@@ -196,10 +207,14 @@ def experiment(device: str = 'cuda', desc_string: str = "", config: typing.Optio
     torch.manual_seed(random_seed)
     # input_fitting.fit(config)
 
-    train_loader = torch.utils.data.DataLoader(GmMnistDataSet(f'{config.produce_input_description()}/train_', begin=config.training_set_start, end=config.training_set_end), batch_size=config.batch_size,
-                                               num_workers=config.num_dataloader_workers, shuffle=True)
-    test_loader = torch.utils.data.DataLoader(GmMnistDataSet(f'{config.produce_input_description()}/test_', begin=config.test_set_start, end=config.test_set_end), batch_size=config.batch_size,
-                                              num_workers=config.num_dataloader_workers)
+    if config.input_shards:
+        train_set = sharded_data_set(config, "train", begin=config.training_set_start, end=config.training_set_end)
+        test_set = sharded_data_set(config, "test", begin=config.test_set_start, end=config.test_set_end)
+    else:
+        train_set = GmMnistDataSet(f'{config.produce_input_description()}/train_', begin=config.training_set_start, end=config.training_set_end)
+        test_set = GmMnistDataSet(f'{config.produce_input_description()}/test_', begin=config.test_set_start, end=config.test_set_end)
+    train_loader = torch.utils.data.DataLoader(train_set, batch_size=config.batch_size, num_workers=config.num_dataloader_workers, shuffle=True)
+    test_loader = torch.utils.data.DataLoader(test_set, batch_size=config.batch_size, num_workers=config.num_dataloader_workers)
 
     model = gmc.model.Net(learn_positions=config.learn_positions_after == 0,
                           learn_covariances=config.learn_covariances_after == 0,
@@ -32,6 +32,8 @@ class Config:
         self.n_classes = n_classes
 
         self.n_input_gaussians = -1
+        # read the inputs from memory mapped shards (gmc.inout.ShardedMixtureDataSet), they are converted from the per sample files on first use
+        self.input_shards = False
         self.batch_size = 21
         self.n_epochs = 62
         self.kernel_learning_rate = 0.001
@@ -43,10 +45,17 @@ class Config:
         self.save_model = False
         self.log_interval = self.batch_size * 10
         self.log_tensorboard_renderings = True
+        # per layer forward / backward time, memory and component counts (gmc.profiling): tensorboard, a summary table and a chrome trace per log interval
+        self.profile = False
         self.fitting_test_data_store_at_epoch = 10000
         self.fitting_test_data_store_n_batches = 10
         self.fitting_test_data_store_path = f"{self.data_base_path}/modelnet/fitting_input"
 
+    def produce_input_description(self):
+        if self.n_input_gaussians == -1:
+            return "all_components"
+        return f"padded{self.n_input_gaussians}"
+
     def produce_description(self):
         return f"lr{int(self.kernel_learning_rate * 1000)}_wDec{int(self.weight_decay_rate * 100)}_{self.model.produce_description()}"
 
@@ -13,6 +13,7 @@ import torch.utils.data
 import torch.utils.tensorboard
 import typing
 
+import gmc.inout
 import gmc.mixture as gm
 import gmc.model
 import gmc.fitting
@@ -78,6 +79,18 @@ class ModelNetDataSet(torch.utils.data.Dataset):
         return mixture[0], torch.tensor(self.sample_labels[index])
 
 
+def sharded_data_set(config: Config, sample_names_file: pathlib.Path) -> gmc.inout.ShardedMixtureDataSet:
+    directory = config.modelnet_data_path / config.produce_input_description() / f"{sample_names_file.stem}_shards"
+    if not (directory / "index.pt").exists():
+        per_file = ModelNetDataSet(config, config.modelnet_data_path, config.modelnet_category_list_file, sample_names_file)
+        n_components = config.n_input_gaussians
+        if n_components == -1:
+            # the samples have different sizes, the block size must fit the largest
+            n_components = max(per_file[i][0].shape[-2] for i in range(len(per_file)))
+        gmc.inout.write_shards((per_file[i] for i in range(len(per_file))), str(directory), n_components=n_components)
+    return gmc.inout.ShardedMixtureDataSet(str(directory))
+
+
 def render_debug_images_to_tensorboard(model, epoch, tensor_board_writer, config: Config):
     kernel_path = f"{config.data_base_path}/debug_out/{training_ablation_name}/{training_dsicription_string}/kernels"
     activation_path = f"{config.data_base_path}/debug_out/{training_ablation_name}/{training_dsicription_string}/activations"
@@ -163,8 +176,17 @@ def train(model: gmc.model.Net, device: str, train_loader: torch.utils.data.Data
                 tensor_board_writer.add_scalar(f"06.2 convolution layer {i} convolution position range", pos_range, step)
                 tensor_board_writer.add_scalar(f"06.2 convolution layer {i} convolution covariance range", cov_range, step)
 
-            # for name, timing in model.timings.items():
-            #     tensor_board_writer.add_scalar(f"06. {name} time", timing, step)
+            if model.profiler.enabled:
+                for name, record in model.profiler.records.items():
+                    n_calls = max(record.n_calls, 1)
+                    tensor_board_writer.add_scalar(f"06.3 {name} forward time", record.forward_time / n_calls, step)
+                    tensor_board_writer.add_scalar(f"06.4 {name} backward time", record.backward_time / n_calls, step)
+                    tensor_board_writer.add_scalar(f"06.5 {name} n components out", record.n_components_out, step)
+                print(model.profiler.summary())
+                trace_path = f"{config.data_base_path}/debug_out/{training_ablation_name}/{training_dsicription_string}/traces"
+                os.makedirs(trace_path, exist_ok=True)
+                model.profiler.export_chrome_trace(f"{trace_path}/step{step}.json")
+                model.profiler.reset()
 
             print(f'Training kernels: {epoch}/{step} [{batch_idx}/{len(train_loader)} '
                   f'({100. * batch_idx / len(train_loader):.0f}%)]\tClassification loss: {loss.item():.6f} (accuracy: {100 * correct / len(data)}), '
@@ -226,15 +248,20 @@ def experiment(device: str = 'cuda', desc_string: str = "", config: Config = Non
     # Training settings
     torch.manual_seed(random_seed)
 
-    train_loader = torch.utils.data.DataLoader(ModelNetDataSet(config, config.modelnet_data_path, config.modelnet_category_list_file, config.modelnet_training_sample_names_file),
-                                               batch_size=config.batch_size, num_workers=config.num_dataloader_workers, shuffle=True, drop_last=True)
-    test_loader  = torch.utils.data.DataLoader(ModelNetDataSet(config, config.modelnet_data_path, config.modelnet_category_list_file, config.modelnet_test_sample_names_file),
-                                               batch_size=config.batch_size, num_workers=config.num_dataloader_workers)
+    if config.input_shards:
+        train_set = sharded_data_set(config, config.modelnet_training_sample_names_file)
+        test_set = sharded_data_set(config, config.modelnet_test_sample_names_file)
+    else:
+        train_set = ModelNetDataSet(config, config.modelnet_data_path, config.modelnet_category_list_file, config.modelnet_training_sample_names_file)
+        test_set = ModelNetDataSet(config, config.modelnet_data_path, config.modelnet_category_list_file, config.modelnet_test_sample_names_file)
+    train_loader = torch.utils.data.DataLoader(train_set, batch_size=config.batch_size, num_workers=config.num_dataloader_workers, shuffle=True, drop_last=True)
+    test_loader  = torch.utils.data.DataLoader(test_set, batch_size=config.batch_size, num_workers=config.num_dataloader_workers)
 
     model = gmc.model.Net(learn_positions=config.learn_positions_after == 0,
                           learn_covariances=config.learn_covariances_after == 0,
                           config=config.model)
     model = model.to(device)
+    model.profiler.enabled = config.profile
 
     kernel_optimiser = optim.Adam(model.parameters(), lr=config.kernel_learning_rate)
     weight_decay_optimiser = optim.SGD(model.parameters(), lr=(config.weight_decay_rate * config.kernel_learning_rate))
@@ -113,9 +113,5 @@ class MaxPooling(torch.nn.modules.Module):
         self.n_output_gaussians = n_output_gaussians
 
     def forward(self, x: Tensor) -> Tensor:
-        sorted_indices = torch.argsort(gm.weights(x.detach()), dim=2, descending=True)
-        sorted_mixture = mat_tools.my_index_select(x, sorted_indices)
-
-        n_output_gaussians = min(self.n_output_gaussians, gm.n_components(x))
-        return sorted_mixture[:, :, :n_output_gaussians, :]
+        return mat_tools.select_top_components(x, self.n_output_gaussians, gm.weights(x.detach()))
 
@@ -0,0 +1,27 @@
+import torch
+
+from gmc.profiling import benchmark
+import pcfitting.config as general_config
+from pcfitting.generators.em_tools import EMTools
+
+# E-step of the em fitting, dense torch implementation vs. the fused kernel (general_config.fused_expectation).
+# 100k points and 512 gaussians, one point cloud. the dense version runs with its default sub batching (everything at once) if it fits into memory.
+n_points = 100000
+n_gaussians = 512
+
+
+eps = (torch.eye(3, 3, device=general_config.device) * 1e-7).view(1, 1, 1, 3, 3)
+gm_data = EMTools.TrainingData(1, n_gaussians, torch.float32, eps)
+running = torch.ones(1, dtype=torch.bool)
+gm_data.set_positions(torch.rand(1, 1, n_gaussians, 3, device=general_config.device), running)
+gm_data.set_covariances(torch.eye(3, 3, device=general_config.device).view(1, 1, 1, 3, 3).repeat(1, 1, n_gaussians, 1, 1) * 0.01, running)
+gm_data.set_priors(torch.full([1, 1, n_gaussians], 1 / n_gaussians, device=general_config.device), running)
+points = torch.rand(1, 1, n_points, 1, 3, device=general_config.device)
+
+for fused in [False, True]:
+    general_config.fused_expectation = fused
+    try:
+        t = benchmark(general_config.device, lambda: EMTools.expectation(points, gm_data, n_gaussians, running), n_repetitions=5)
+        print(f"{general_config.device}, {'fused' if fused else 'dense'}: {t * 1000:.1f}ms")
+    except RuntimeError as e:   # out of memory
+        print(f"{general_config.device}, {'fused' if fused else 'dense'}: {e}")
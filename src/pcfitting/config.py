@@ -1,4 +1,17 @@
+import os
 import pathlib
+import typing
+
+import torch
+
 data_base_path = pathlib.Path("/home/madam/Documents/work/tuw/gmc_net/data")
 verbosity = 1
-device = 'cuda'
+# device of the point clouds, mixtures and fitting state of all generators, initializers, scalers and dataset iterators.
+# "cpu" runs on torch's intra-op thread pool with n_threads threads. can be set with the environment variables PCFITTING_DEVICE and PCFITTING_N_THREADS.
+device = os.environ.get("PCFITTING_DEVICE", 'cuda' if torch.cuda.is_available() else 'cpu')
+# applied with torch.set_num_threads by programs.execute_fitting2, None keeps torch's default (the number of physical cores)
+n_threads: typing.Optional[int] = int(os.environ["PCFITTING_N_THREADS"]) if "PCFITTING_N_THREADS" in os.environ else None
+# EMTools.expectation uses the fused kernel of gmc.cpp.extensions.em_expectation, one pass over the gaussians per point without n_points x n_gaussians
+# temporaries. False selects the dense torch implementation with sub batching, which is also used if the extension can't be loaded.
+# can be set with the environment variable PCFITTING_FUSED_EXPECTATION.
+fused_expectation = os.environ.get("PCFITTING_FUSED_EXPECTATION", "1") not in ("", "0")
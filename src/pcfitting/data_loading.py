@@ -1,21 +1,23 @@
-from typing import List
+from typing import List, Iterator
 
+import numpy
 import torch
 import os
 import gmc.mixture as gm
 import gmc.inout as gmio
+import pcfitting.config as general_config
 
 
 def load_pc_from_off(path: str) -> torch.Tensor:
     # Loads a pointcloud from an off-file at the given path
-    # Returns it as a 3d cpu-tensor with shape [1,n,3]
+    # Returns it as a 3d tensor with shape [1,n,3] on the configured device (general_config.device)
     file = open(path, "r")
     if 'OFF' != file.readline().strip():
         raise Exception("Not a valid OFF header!")
     n_points = int(file.readline().strip().split(" ")[0])
     points = [[[float(s) for s in file.readline().strip().split(" ") if s != ''] for pt in range(n_points)]]
     file.close()
-    return torch.tensor(points, dtype=torch.float32, device='cuda')
+    return torch.tensor(points, dtype=torch.float32, device=general_config.device)
 
 
 def write_pc_to_off(path: str, pc: torch.Tensor):
@@ -44,8 +46,31 @@ def sample(pcbatch: torch.Tensor, n_sample_points: int) -> torch.Tensor:
     return sample_points
 
 
+def load_pc_chunks_from_npy(path: str, chunk_size: int, shuffle: bool = True) -> Iterator[torch.Tensor]:
+    # Reads a pointcloud from a .npy-file at the given path in chunks, without loading it into memory as a whole
+    # (the file is memory-mapped). The file contains a [n,3] or [m,n,3] array.
+    # If shuffle is true, every chunk consists of chunk_size random points (sorted, so that the reads are
+    # sequential), and chunks are generated endlessly. Otherwise the file is read once from front to back.
+    # Yields 3d tensors with shape [m,chunk_size,3] (m=1 for [n,3]-files, the last chunk might be smaller)
+    # on the configured device (general_config.device)
+    data = numpy.load(path, mmap_mode='r')
+    if len(data.shape) == 2:
+        data = data.reshape(1, data.shape[0], data.shape[1])
+    point_count = data.shape[1]
+    if shuffle:
+        rng = numpy.random.default_rng()
+        while True:
+            sample_point_idz = numpy.sort(rng.choice(point_count, min(chunk_size, point_count), replace=False))
+            yield torch.from_numpy(numpy.ascontiguousarray(data[:, sample_point_idz, :], dtype=numpy.float32))\
+                .to(general_config.device)
+    else:
+        for start in range(0, point_count, chunk_size):
+            yield torch.from_numpy(numpy.ascontiguousarray(data[:, start:(start + chunk_size), :], dtype=numpy.float32))\
+                .to(general_config.device)
+
+
 def read_gm_from_ply(filename: str, ismodel: bool) -> torch.Tensor:
-    return gmio.read_gm_from_ply(filename, ismodel, 'cuda')
+    return gmio.read_gm_from_ply(filename, ismodel, general_config.device)
 
 
 def write_gm_to_ply(weights: torch.Tensor, positions: torch.Tensor,
@@ -74,7 +99,7 @@ def save_gms(gmbatch: torch.Tensor, gmmbatch: torch.Tensor, basepath: str, names
 
 def add_noise(pcbatch: torch.Tensor, n_noisepoints: int):
     batch_size = pcbatch.shape[0]
-    samples = torch.rand(batch_size, n_noisepoints, 3, dtype=pcbatch.dtype, device='cuda')
+    samples = torch.rand(batch_size, n_noisepoints, 3, dtype=pcbatch.dtype, device=pcbatch.device)
     for b in range(batch_size):
         pmin = pcbatch[b].min(dim=0)[0]
         pmax = pcbatch[b].max(dim=0)[0]
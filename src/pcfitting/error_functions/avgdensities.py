@@ -86,7 +86,7 @@ class AvgDensities(EvalFunction):
             gminvcovariances = mat_tools.inverse(gmcovariances).contiguous()
             gmamplitudes = weights / (gmcovariances.det().sqrt() * 15.74960995)
         mixture_with_inversed_cov = gm.pack_mixture(gmamplitudes, gmpositions, gminvcovariances)
-        output = torch.zeros(batch_size, point_count, dtype=points.dtype, device='cuda')
+        output = torch.zeros(batch_size, point_count, dtype=points.dtype, device=points.device)
         subbatches = math.ceil((batch_size * point_count) / 65535)
         subbatch_pointcount = math.ceil(point_count / subbatches)
         for p in range(subbatches):
@@ -44,7 +44,7 @@ class IntUniformity(EvalFunction):
             p2 = mesh.vertices[mesh.faces[i,2]]
             n = mesh.face_normals[i]
             x3d = lambda u, v: p0 + u*(p1-p0) + v*(p2-p0)
-            x3dt = lambda u, v: torch.tensor(x3d(u, v)).to(dtype=dt).cuda().view(1, 1, 1, 3)
+            x3dt = lambda u, v: torch.tensor(x3d(u, v)).to(dtype=dt, device=mixture_with_inversed_cov.device).view(1, 1, 1, 3)
             sub = np.linalg.norm(p1-p0)*np.linalg.norm(p2-p0)
             integrant = lambda u, v: gm.evaluate_inversed_with_amplitude_mixture(mixture_with_inversed_cov, x3dt(u, v)).item()
             mean = sub * dblquad(integrant, 0, 1, lambda x: 0, lambda x: 1-x)[0] / mesh.area_faces[i]
@@ -57,7 +57,7 @@ class IntUniformity(EvalFunction):
             p1 = mesh.vertices[mesh.faces[i, 1]]
             p2 = mesh.vertices[mesh.faces[i, 2]]
             x3d = lambda u, v: p0 + u*(p1-p0) + v*(p2-p0)
-            x3dt = lambda u, v: torch.tensor(x3d(u, v)).to(dtype=dt).cuda().view(1, 1, 1, 3)
+            x3dt = lambda u, v: torch.tensor(x3d(u, v)).to(dtype=dt, device=mixture_with_inversed_cov.device).view(1, 1, 1, 3)
             sub = np.linalg.norm(p1-p0)*np.linalg.norm(p2-p0)
             integrant = lambda u, v: (gm.evaluate_inversed_with_amplitude_mixture(mixture_with_inversed_cov, x3dt(u, v)).item() - mean) ** 2
             stabw = sub * dblquad(integrant, 0, 1, lambda x: 0, lambda x: 1-x)[0] / mesh.area_faces[i]
@@ -36,10 +36,10 @@ class LcSmoothness(EvalFunction):
         if modelpath is not None:
             file = modelpath + ".nngraph-e" + str(point_count) + "-n" + str(self._nn) + ".torch"
             if os.path.exists(file):
-                nngraph = torch.load(file).cuda()
+                nngraph = torch.load(file).to(pcbatch.device)
             else:
                 print("Calculating nngraph")
-                nngraph = pyeval.nn_graph(pcbatch.view(-1, 3), self._nn).cuda()
+                nngraph = pyeval.nn_graph(pcbatch.view(-1, 3), self._nn).to(pcbatch.device)
                 torch.save(nngraph, file)
                 print("Saved nngraph")
 
@@ -17,7 +17,7 @@ class RcdLoss(EvalFunction):
     def __init__(self, np, ng):
         # avoidinf to True adds epps to the gaussian values to avoid taking the logarithm of 0 which would
         # lead to infinite loss
-        g = gm.pack_mixture(torch.tensor([1]).view(1,1,-1), torch.tensor([0,0,0]).view(1,1,-1,3), torch.eye(3).view(1,1,-1,3, 3)).cuda()
+        g = gm.pack_mixture(torch.tensor([1]).view(1,1,-1), torch.tensor([0,0,0]).view(1,1,-1,3), torch.eye(3).view(1,1,-1,3, 3)).to(general_config.device)
         self._pointsperG = int(np / ng)
         self._template = GMSampler.sampleGMM_ext(g, self._pointsperG).view(1, 1, self._pointsperG, 3).expand(1, ng, self._pointsperG, 3)
 
@@ -36,7 +36,7 @@ class RcdLoss(EvalFunction):
 
         # data_loading.write_pc_to_off(r"C:\Users\SimonFraiss\Desktop\rcd.off", pointsmoved.view(batch_size, -1, 3))
 
-        loss = torch.zeros(1, batch_size).cuda()
+        loss = torch.zeros(1, batch_size, device=pcbatch.device)
         for i in range(batch_size):
             loss[0, i], _ = p3dl.chamfer_distance(pcbatch[i].view(1,-1,3), pointsmoved[i].view(1,-1, 3))
         return loss.sqrt()
@@ -58,7 +58,7 @@ class ReconstructionStatsFiltered(EvalFunction):
         query_point = o3d.core.Tensor(sampled.view(-1, 3).cpu().numpy(), dtype=o3d.core.Dtype.Float32)
         scene = o3d.t.geometry.RaycastingScene()
         scene.add_triangles(meshO)
-        distances = torch.from_numpy(scene.compute_distance(query_point).numpy()).cuda()
+        distances = torch.from_numpy(scene.compute_distance(query_point).numpy()).to(sampled.device)
         closest = sampled[0, distances.lt(thresh), :]
         #print(closest.shape[0])
 
@@ -41,7 +41,7 @@ class ReconstructionStatsProjected(EvalFunction):
         scene = o3d.t.geometry.RaycastingScene()
         scene.add_triangles(meshO)
         ans = scene.compute_closest_points(query_point)
-        projected = torch.from_numpy(ans['points'].numpy()).cuda()
+        projected = torch.from_numpy(ans['points'].numpy()).to(sampled.device)
 
         return self._recstat.calculate_score_on_reconstructed(pcbatch, projected, modelpath)
 
@@ -41,13 +41,13 @@ class Smoothness(EvalFunction):
         if modelpath is not None:
             file = modelpath + ".nngraph-e" + str(point_count) + "-n" + str(self._nn) + (("_s" + str(self._subsamples)) if self._subsamples > 0 else "") + ".torch"
             if os.path.exists(file):
-                nngraph = torch.load(file).cuda()
+                nngraph = torch.load(file).to(pcbatch.device)
             else:
                 print("Calculating nngraph")
                 if self._subsamples > 0:
-                    nngraph = pyeval.nn_graph_sub(pcbatch.view(-1, 3), self._subsamples, self._nn).cuda()
+                    nngraph = pyeval.nn_graph_sub(pcbatch.view(-1, 3), self._subsamples, self._nn).to(pcbatch.device)
                 else:
-                    nngraph = pyeval.nn_graph(pcbatch.view(-1, 3), self._nn).cuda()
+                    nngraph = pyeval.nn_graph(pcbatch.view(-1, 3), self._nn).to(pcbatch.device)
                 torch.save(nngraph, file)
                 print("Saved nngraph")
 
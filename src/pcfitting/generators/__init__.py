@@ -4,4 +4,5 @@ from .gradient_descent_rec_generator import GradientDescentRecGenerator
 from .eckart_generator_hp import EckartGeneratorHP
 from .eckart_generator_sp import EckartGeneratorSP
 from .preiner_generator import PreinerGenerator
-from .scikit_em_generator import ScikitEMGenerator
\ No newline at end of file
+from .scikit_em_generator import ScikitEMGenerator
+from .online_em_generator import OnlineEMGenerator
\ No newline at end of file
@@ -3,7 +3,9 @@ from pcfitting import TerminationCriterion, MaxIterationTerminationCriterion
 from pcfitting.error_functions import LikelihoodLoss
 from .level_scaler import LevelScaler
 import torch
+import warnings
 import gmc.mixture as gm
+import pcfitting.config as general_config
 from gmc import mat_tools
 import math
 from .em_tools import EMTools
@@ -49,8 +51,9 @@ class EckartGeneratorHP(GMMGenerator):
         #           'bb': Initialize GMMs on corners of tight bounding box of points (different side lengths)
         #           'eigen': Use Eigen vector decomposition to determine initial positions
         #   m_step_gaussian_subbatchsize: int
-        #       How many Gaussian Sub-Mixtures should be processed in the M-Step at once (see _maximization)
-        #       -1 means all Gaussians (default)
+        #       Deprecated, will be removed. The M-Step works on the sparse responsibilities of all Gaussians at once
+        #       (see _maximization), this is only passed on to the GMMInitializer of the per Sub-GM initialization
+        #       methods. -1 (default) means all Gaussians there.
         #   m_step_points_subbatchsize: int
         #       How many points should be processed in the M-Step at once (see _maximization)
         #       -1 means all Points (default)
@@ -66,6 +69,9 @@ class EckartGeneratorHP(GMMGenerator):
         self._n_levels = n_levels
         self._initialization_method = initialization_method
         self._termination_criterion = termination_criterion
+        if m_step_gaussians_subbatchsize != -1:
+            warnings.warn("EckartGeneratorHP: m_step_gaussians_subbatchsize is deprecated, the M-Step doesn't split the "
+                          "Gaussians. It only affects the GMMInitializer.", DeprecationWarning)
         self._m_step_gaussians_subbatchsize = m_step_gaussians_subbatchsize
         self._m_step_points_subbatchsize = m_step_points_subbatchsize
         self._dtype = dtype
@@ -107,7 +113,7 @@ class EckartGeneratorHP(GMMGenerator):
         batch_size = pcbatch.shape[0]
         assert (batch_size == 1), "EckartGenerator currently does not support batchsizes > 1"
         point_count = pcbatch.shape[1]
-        pcbatch = pcbatch.to(self._dtype).cuda()
+        pcbatch = pcbatch.to(dtype=self._dtype, device=general_config.device)
 
         epsilon = self._epsvar
         if self._eps_is_relative:
@@ -115,29 +121,29 @@ class EckartGeneratorHP(GMMGenerator):
             epsilon *= extends.max(dim=0)[0].item() ** 2
             epsilon = max(epsilon, 1e-9)
 
-        eps = (torch.eye(3, 3, dtype=self._dtype, device='cuda') * epsilon).view(1, 1, 1, 3, 3)
+        eps = (torch.eye(3, 3, dtype=self._dtype, device=general_config.device) * epsilon).view(1, 1, 1, 3, 3)
         self._gmminitializer = GMMInitializer(self._m_step_gaussians_subbatchsize, self._m_step_points_subbatchsize,
                                               self._dtype, epsilon)
 
         # parent_per_point (1,n) identifies which gaussian in the previous layer this point is assigned to
-        parent_per_point = torch.zeros(1, point_count, dtype=torch.long, device='cuda')
+        parent_per_point = torch.zeros(1, point_count, dtype=torch.long, device=general_config.device)
         # the 0th layer, only has one (fictional) Gaussian, whose index is assumed to be 0
         parent_per_point[:, :] = 0
 
         llh_loss_calc = LikelihoodLoss(True)
         mixture = None
 
-        finished_gaussians = torch.tensor([], dtype=torch.long, device='cuda')
+        finished_gaussians = torch.tensor([], dtype=torch.long, device=general_config.device)
         # finished_subgmms: Gaussians that will not be expanded anymore, from each level
         finished_subgmms = []
         # weights of the parents of each point. initialized with one (fictional 0th layer has only one Gaussian)
-        parentweights = torch.ones(1, 1, self._n_gaussians_per_node, dtype=self._dtype, device='cuda')
+        parentweights = torch.ones(1, 1, self._n_gaussians_per_node, dtype=self._dtype, device=general_config.device)
 
         absiteration = 0  # Iteration index overall
         for level in range(self._n_levels):
             print("Level: ", level)
             parentcount_for_level = self._n_gaussians_per_node ** level  # How many parents the current level has
-            relevant_parents = torch.arange(0, parentcount_for_level, device='cuda')  # (parentcount)
+            relevant_parents = torch.arange(0, parentcount_for_level, device=general_config.device)  # (parentcount)
 
             # Scaler, to scale down the sub-pointclouds, and up the resulting sub-gms
             scaler = LevelScaler(active=self._use_scaling, interval=self._scaling_interval)
@@ -167,7 +173,7 @@ class EckartGeneratorHP(GMMGenerator):
                 points = points_scaled.unsqueeze(1).unsqueeze(3)  # (1, 1, np, 1, 3)
 
                 # E-Step
-                responsibilities = self._expectation(points, gm_data, parent_per_point)
+                responsibilities, responsibility_indices = self._expectation(points, gm_data, parent_per_point)
                 # Calculate Mixture and Loss
                 mixture = gm_data.pack_scaled_up_mixture(scaler)
                 mixture = self._construct_full_gm(mixture, finished_subgmms)
@@ -179,14 +185,14 @@ class EckartGeneratorHP(GMMGenerator):
 
                 if not self._termination_criterion.may_continue(iteration - 1, loss.view(-1)).item():
                     # update parent_per_point for next level from responsibilities
-                    new_parent_indices = responsibilities.argmax(dim=3)
+                    new_parent_indices = responsibility_indices.gather(3, responsibilities.argmax(dim=3, keepdim=True))
                     parent_per_point = new_parent_indices.view(1, -1)
                     break
 
                 # M-Step
-                self._maximization(points, responsibilities, gm_data, eps)
+                self._maximization(points, responsibilities, responsibility_indices, gm_data, eps)
 
-            all_new_parents = torch.tensor(range(len(gm_data)), device='cuda').view(-1, 1, 1)
+            all_new_parents = torch.tensor(range(len(gm_data)), device=general_config.device).view(-1, 1, 1)
             finished_gaussians = ((parent_per_point.eq(all_new_parents)).sum(2) == 0).nonzero(as_tuple=False)[:, 0]
             mixture = gm_data.pack_scaled_up_mixture(scaler)
             if level + 1 != self._n_levels:
@@ -209,9 +215,9 @@ class EckartGeneratorHP(GMMGenerator):
         gmcount = relevant_parents.shape[0]
         gausscount = gmcount * self._n_gaussians_per_node
         gmdata = self.GMLevelTrainingData(self._dtype)
-        gmdata.positions = torch.zeros(1, 1, gausscount, 3, dtype=self._dtype, device='cuda')
-        gmdata.covariances = torch.zeros(1, 1, gausscount, 3, 3, dtype=self._dtype, device='cuda')
-        gmdata.priors = torch.zeros(1, 1, gausscount, dtype=self._dtype, device='cuda')
+        gmdata.positions = torch.zeros(1, 1, gausscount, 3, dtype=self._dtype, device=general_config.device)
+        gmdata.covariances = torch.zeros(1, 1, gausscount, 3, 3, dtype=self._dtype, device=general_config.device)
+        gmdata.priors = torch.zeros(1, 1, gausscount, dtype=self._dtype, device=general_config.device)
         for i in relevant_parents:
             gidx_start = i * self._n_gaussians_per_node
             gidx_end = gidx_start + self._n_gaussians_per_node
@@ -224,7 +230,7 @@ class EckartGeneratorHP(GMMGenerator):
                 gmdata.priors[0, 0, gidx_start:gidx_end] = 0.0
                 gmdata.positions[0, 0, gidx_start:gidx_start + pcount] = relpoints
                 gmdata.covariances[0, 0, gidx_start:gidx_start + pcount] = 0.1 * torch.eye(3, dtype=self._dtype,
-                                                                                           device='cuda')
+                                                                                           device=general_config.device)
                 gmdata.priors[0, 0, gidx_start:gidx_start + pcount] = 1 / pcount.to(self._dtype)
             else:
                 subgm = self._gmminitializer.initialize_by_method_name(self._initialization_method,
@@ -248,7 +254,7 @@ class EckartGeneratorHP(GMMGenerator):
         # This returns the bounding boxes for each parent (K,2,3) (0=min,1=extend)
         # The bounding box is a arbitrary box rather than a regular cube.
         n_parents = relevant_parents.shape[0]
-        result = torch.zeros(n_parents, 2, 3, dtype=pcbatch.dtype, device='cuda')
+        result = torch.zeros(n_parents, 2, 3, dtype=pcbatch.dtype, device=general_config.device)
         for i in relevant_parents:
             rel_point_mask: torch.Tensor = torch.eq(parent_per_point, i)
             rel_points = pcbatch[rel_point_mask]
@@ -285,7 +291,7 @@ class EckartGeneratorHP(GMMGenerator):
             [1, 0, 0],
             [0, 1, 0],
             [1, 0, 1]
-        ], dtype=self._dtype, device='cuda')
+        ], dtype=self._dtype, device=general_config.device)
         if self._n_gaussians_per_node <= 8:
             gmdata.positions = position_templates[0:self._n_gaussians_per_node].unsqueeze(0).unsqueeze(0)\
                 .repeat(1, 1, gmcount, 1)
@@ -295,12 +301,12 @@ class EckartGeneratorHP(GMMGenerator):
             gmdata.positions = gmdata.positions[:, :, 0:self._n_gaussians_per_node, :].repeat(1, 1, gmcount, 1)
         gmdata.positions[0, 0, :, :] *= bbs_rep[:, 1, :]
         gmdata.positions[0, 0, :, :] += bbs_rep[:, 0, :]
-        gmdata.covariances = 0.1 * torch.eye(3, dtype=self._dtype, device='cuda').unsqueeze(0).unsqueeze(0).\
+        gmdata.covariances = 0.1 * torch.eye(3, dtype=self._dtype, device=general_config.device).unsqueeze(0).unsqueeze(0).\
             unsqueeze(0).repeat(1, 1, self._n_gaussians_per_node * gmcount, 1, 1)
         gmdata.covariances[0, 0, :, :, :] *= bbs_rep[:, 1, :].unsqueeze(2) ** 2
         gmdata.inverse_covariances = mat_tools.inverse(gmdata.covariances).contiguous()
         EMTools.replace_invalid_matrices(gmdata.covariances, gmdata.inverse_covariances, eps, mat_tools.inverse(eps))
-        gmdata.priors = torch.zeros(1, 1, self._n_gaussians_per_node * gmcount, dtype=self._dtype, device='cuda')
+        gmdata.priors = torch.zeros(1, 1, self._n_gaussians_per_node * gmcount, dtype=self._dtype, device=general_config.device)
         gmdata.priors[:, :, :] = 1 / self._n_gaussians_per_node
         gmdata.priors[:, :, finished_gaussians] = 0
 
@@ -314,9 +320,9 @@ class EckartGeneratorHP(GMMGenerator):
         gmcount = relevant_parents.shape[0]
         gausscount = gmcount * self._n_gaussians_per_node
         gmdata = self.GMLevelTrainingData(self._dtype)
-        gmdata.positions = torch.zeros(1, 1, gausscount, 3, dtype=self._dtype, device='cuda')
-        gmdata.covariances = torch.zeros(1, 1, gausscount, 3, 3, dtype=self._dtype, device='cuda')
-        gmdata.priors = torch.zeros(1, 1, gausscount, dtype=self._dtype, device='cuda')
+        gmdata.positions = torch.zeros(1, 1, gausscount, 3, dtype=self._dtype, device=general_config.device)
+        gmdata.covariances = torch.zeros(1, 1, gausscount, 3, 3, dtype=self._dtype, device=general_config.device)
+        gmdata.priors = torch.zeros(1, 1, gausscount, dtype=self._dtype, device=general_config.device)
 
         position_templates3d = torch.tensor([
             [-1, -1, -1],
@@ -327,7 +333,7 @@ class EckartGeneratorHP(GMMGenerator):
             [1, 1, -1],
             [-1, 1, 1],
             [1, -1, -1]
-        ], dtype=self._dtype, device='cuda')
+        ], dtype=self._dtype, device=general_config.device)
         position_templates2d = torch.tensor([
             [-1, -1, 0],
             [1, 1, 0],
@@ -337,7 +343,7 @@ class EckartGeneratorHP(GMMGenerator):
             [-1, 0, 0],
             [0, 1, 0],
             [0, -1, 0]
-        ], dtype=self._dtype, device='cuda')
+        ], dtype=self._dtype, device=general_config.device)
 
         epsval = eps[0,0,0,0,0]
 
@@ -353,7 +359,7 @@ class EckartGeneratorHP(GMMGenerator):
                 gmdata.priors[0, 0, gidx_start:gidx_end] = 0.0
                 gmdata.positions[0, 0, gidx_start:gidx_start + pcount] = relpoints
                 gmdata.covariances[0, 0, gidx_start:gidx_start + pcount] = 0.1 * torch.eye(3, dtype=self._dtype,
-                                                                                           device='cuda')
+                                                                                           device=general_config.device)
                 gmdata.priors[0, 0, gidx_start:gidx_start + pcount] = 1 / pcount.to(self._dtype)
             else:
                 meanpos = relpoints.mean(dim=0, keepdim=True)
@@ -389,7 +395,8 @@ class EckartGeneratorHP(GMMGenerator):
 
         return gmdata
 
-    def _expectation(self, points: torch.Tensor, gm_data, parent_per_point: torch.Tensor) -> torch.Tensor:
+    def _expectation(self, points: torch.Tensor, gm_data, parent_per_point: torch.Tensor) -> \
+            (torch.Tensor, torch.Tensor):
         # This performs the Expectation step of the EM Algorithm. This calculates the responsibilities.
         # So the probabilities, how likely each point belongs to each gaussian.
         # The calculations are performed numerically stable in Log-Space!
@@ -401,10 +408,11 @@ class EckartGeneratorHP(GMMGenerator):
         #   parent_per_point: torch.Tensor of shape (n)
         #       The parent index for each point
         # Returns:
-        #   responsibilities: torch.Tensor of shape (1, 1, n, p*g) where g is self._n_gaussians_per_node (results in
-        #       the number of all gaussians on this level)
-        #       responsibilities for point-gaussian-combinations where the point does not belong to a
-        #       gaussian's parent will be 0. Also note, that there might be Sub-GMs without points assigned to them.
+        #   responsibilities: torch.Tensor of shape (1, 1, n, g) where g is self._n_gaussians_per_node
+        #       Sparse responsibilities: only those of the g children of each point's parent, all others are 0.
+        #       Also note, that there might be Sub-GMs without points assigned to them.
+        #   responsibility_indices: torch.Tensor of shape (1, 1, n, g), dtype long
+        #       Index of the Gaussian (on this level, i.e. out of p*g) of each responsibility
         #
         #   Note that this does not support executing only parts of the responsibilities at once for memory optimization
         #   (as in the M-Step). It would be possible to implement this though, similar as in the E-Step of EMGenerator
@@ -416,12 +424,12 @@ class EckartGeneratorHP(GMMGenerator):
         all_gauss_count = gm_data.positions.shape[2]
 
         # mask_indizes is a list of indizes of a) points with their corresponding b) gauss (child) indizes
-        mask_indizes = torch.zeros(n_sample_points, 2, dtype=torch.long, device='cuda')
-        mask_indizes[:, 0] = torch.arange(0, n_sample_points, dtype=torch.long, device='cuda')
+        mask_indizes = torch.zeros(n_sample_points, 2, dtype=torch.long, device=general_config.device)
+        mask_indizes[:, 0] = torch.arange(0, n_sample_points, dtype=torch.long, device=general_config.device)
         mask_indizes[:, 1] = parent_per_point.view(-1)
         mask_indizes = mask_indizes.repeat(1, 1, self._n_gaussians_per_node)
         mask_indizes[:, :, 1::2] *= self._n_gaussians_per_node
-        mask_indizes[:, :, 1::2] += torch.arange(0, self._n_gaussians_per_node, dtype=torch.long, device='cuda')
+        mask_indizes[:, :, 1::2] += torch.arange(0, self._n_gaussians_per_node, dtype=torch.long, device=general_config.device)
         mask_indizes = mask_indizes.view(n_sample_points * self._n_gaussians_per_node, 2)
 
         # Every point belongs to exactly self._n_gaussians_per_node gaussians, therefore we can work with (npxng)
@@ -454,22 +462,24 @@ class EckartGeneratorHP(GMMGenerator):
 
         # Local responsibilities: Responsibilities of points to their corresponding gaussians only
         responsibilities_local = torch.exp(likelihood_log - llh_sum)  # (1, 1, np, ngLocal)
-        # Global responsibilities: Responsibilities of points to all gaussians
-        responsibilities_global = torch.zeros(1, 1, n_sample_points, all_gauss_count, dtype=self._dtype, device='cuda')
-        responsibilities_global[:, :, mask_indizes[:, 0], mask_indizes[:, 1]] = responsibilities_local.view(1, 1, -1)
+        # The dense (np x p*g) responsibilities would be 0 except for these, the M-Step consumes them sparsely
+        responsibility_indices = mask_indizes[:, 1].reshape(1, 1, n_sample_points, self._n_gaussians_per_node)
 
-        return responsibilities_global
+        return responsibilities_local, responsibility_indices
 
-    def _maximization(self, points: torch.Tensor, responsibilities: torch.Tensor, gm_data, eps: torch.Tensor):
+    def _maximization(self, points: torch.Tensor, responsibilities: torch.Tensor, responsibility_indices: torch.Tensor,
+                      gm_data, eps: torch.Tensor):
         # This performs the Maximization step of the EM Algorithm.
         # Updates the GM-Model given the responsibilities which resulted from the E-Step.
-        # Per default, all points and Gaussians are processed at once.
-        # However, by setting m_step_gaussians_subbatchsize and m_step_points_subbatchsize in the constructor,
+        # The sufficient statistics are accumulated from the sparse responsibilities (EMTools.sparse_statistics),
+        # relative to the current positions, so time and memory scale with n_points x g.
+        # Per default, all points are processed at once.
+        # However, by setting m_step_points_subbatchsize in the constructor,
         # this can be split into several processings to save memory.
         # Parameters:
         #   points: torch.Tensor of shape (1, 1, n_points, 1, 3)
         #       View of the point cloud
-        #   responsibilities: torch.Tensor of shape (1, 1, n_points, n_gaussians)
+        #   responsibilities, responsibility_indices: torch.Tensor of shape (1, 1, n_points, g)
         #       This is the result of the E-step.
         #   gm_data: TrainingData
         #       The current GM-object (will be changed)
@@ -477,74 +487,53 @@ class EckartGeneratorHP(GMMGenerator):
         #       Epsilon-Matrix to add to the covariances
 
         n_sample_points = points.shape[2]
-        all_gauss_count = responsibilities.shape[3]
-        gauss_subbatch_size = self._n_gaussians_per_node * self._m_step_gaussians_subbatchsize
-        if gauss_subbatch_size < 1:
-            gauss_subbatch_size = all_gauss_count
+        all_gauss_count = len(gm_data)
         point_subbatch_size = self._m_step_points_subbatchsize
         if point_subbatch_size < 1:
             point_subbatch_size = n_sample_points
 
-        # Iterate over Gauss-Subbatches
-        for j_start in range(0, all_gauss_count, gauss_subbatch_size):
-            j_end = j_start + gauss_subbatch_size
-            actual_gauss_subbatch_size = min(all_gauss_count, j_end) - j_start
-            # Initialize T-Variables for these Gaussians, will be filled in the upcoming loop
-            # Positions/Covariances/Priors are calculated from these (see Eckart-Paper)
-            t_0 = torch.zeros(1, 1, actual_gauss_subbatch_size, dtype=self._dtype, device='cuda')
-            t_1 = torch.zeros(1, 1, actual_gauss_subbatch_size, 3, dtype=self._dtype, device='cuda')
-
-            # Iterate over Point-Subbatches
-            for i_start in range(0, n_sample_points, point_subbatch_size):
-                i_end = i_start + point_subbatch_size
-                relevant_responsibilities = responsibilities[:, :, i_start:i_end, j_start:j_end]
-                actual_gauss_subbatch_size = relevant_responsibilities.shape[3]
-                actual_point_subbatch_size = relevant_responsibilities.shape[2]
-
-                relevant_points = points[:, :, i_start:i_end]\
-                    .expand(1, 1, actual_point_subbatch_size, actual_gauss_subbatch_size, 3)
-
-                t_0 += relevant_responsibilities.sum(dim=2)  # shape: (1, 1, J)
-                t_1 += (relevant_points * relevant_responsibilities.unsqueeze(4))\
-                    .sum(dim=2)  # shape: (1, 1, J, 3)
-                del relevant_points
-
-            # formulas taken from eckart paper. cov formula replaced by original em formula for better stability.
-            gm_data.positions[:, :, j_start:j_end] = t_1 / t_0.unsqueeze(3)  # (1, 1, J, 3)
-            # This calculation is fine because we process all parents children at once
-            relevant_point_count = t_0.view(1, -1, self._n_gaussians_per_node).sum(dim=2) \
-                .repeat(1, self._n_gaussians_per_node, 1).transpose(-1, -2).reshape(1, -1)
-            gm_data.priors[:, :, j_start:j_end] = t_0 / relevant_point_count
-            del t_1
-
-            t_2 = torch.zeros(1, 1, actual_gauss_subbatch_size, 3, 3, dtype=self._dtype, device='cuda')
-
-            for i_start in range(0, n_sample_points, point_subbatch_size):
-                i_end = i_start + point_subbatch_size
-                relevant_responsibilities = responsibilities[:, :, i_start:i_end, j_start:j_end]
-                actual_gauss_subbatch_size = relevant_responsibilities.shape[3]
-                actual_point_subbatch_size = relevant_responsibilities.shape[2]
-                relevant_points = points[:, :, i_start:i_end] \
-                    .expand(1, 1, actual_point_subbatch_size, actual_gauss_subbatch_size, 3)
-                relevant_relative_points = relevant_points \
-                    - gm_data.positions[:, :, j_start:j_end].unsqueeze(2).\
-                    expand(1, 1, actual_point_subbatch_size, actual_gauss_subbatch_size, 3)
-                matrices_from_points = relevant_relative_points.unsqueeze(5) * relevant_relative_points.\
-                    unsqueeze(5).transpose(-1, -2)
-                t_2 += (matrices_from_points * relevant_responsibilities.unsqueeze(4).unsqueeze(5)).sum(dim=2)
-                del matrices_from_points, relevant_points, relevant_relative_points
-
-            gm_data.set_covariances_where_valid(j_start, j_end,
-                                                t_2 / t_0.unsqueeze(3).unsqueeze(4) + eps.expand_as(t_2))
-            del t_0, t_2
+        points = points.reshape(n_sample_points, 3)
+        offsets = gm_data.positions.reshape(all_gauss_count, 3)
+        # Initialize T-Variables, will be filled in the upcoming loop
+        # Positions/Covariances/Priors are calculated from these (see Eckart-Paper)
+        t_0 = torch.zeros(all_gauss_count, dtype=self._dtype, device=general_config.device)
+        t_1 = torch.zeros(all_gauss_count, 3, dtype=self._dtype, device=general_config.device)
+        t_2 = torch.zeros(all_gauss_count, 3, 3, dtype=self._dtype, device=general_config.device)
+
+        # Iterate over Point-Subbatches
+        for i_start in range(0, n_sample_points, point_subbatch_size):
+            i_end = min(n_sample_points, i_start + point_subbatch_size)
+            point_indices = torch.arange(i_start, i_end, device=general_config.device).view(-1, 1)\
+                .expand(i_end - i_start, self._n_gaussians_per_node)
+            statistics = EMTools.sparse_statistics(points, point_indices.reshape(-1),
+                                                   responsibility_indices[0, 0, i_start:i_end].reshape(-1),
+                                                   responsibilities[0, 0, i_start:i_end].reshape(-1), all_gauss_count,
+                                                   offsets)
+            t_0 += statistics[0]
+            t_1 += statistics[1]
+            t_2 += statistics[2]
+            del statistics
+
+        # formulas taken from eckart paper. cov formula replaced by original em formula for better stability.
+        t_0 = t_0.view(1, 1, all_gauss_count)
+        means = t_1.view(1, 1, all_gauss_count, 3) / t_0.unsqueeze(3)  # relative to the old positions
+        gm_data.positions = gm_data.positions + means  # (1, 1, g, 3)
+        # This calculation is fine because we process all parents children at once
+        relevant_point_count = t_0.view(1, -1, self._n_gaussians_per_node).sum(dim=2) \
+            .repeat(1, self._n_gaussians_per_node, 1).transpose(-1, -2).reshape(1, -1)
+        gm_data.priors = t_0 / relevant_point_count
+        covariances = t_2.view(1, 1, all_gauss_count, 3, 3) / t_0.unsqueeze(3).unsqueeze(4) \
+            - means.unsqueeze(4) * means.unsqueeze(3)
+        gm_data.set_covariances_where_valid(0, all_gauss_count, covariances + eps.expand_as(covariances))
+        del t_0, t_1, t_2, means, covariances
 
         # Handling of invalid Gaussians! If all responsibilities of a Gaussian are zero, the previous code will
         # set the prior of it to zero and the covariances and positions to NaN
         # To avoid NaNs, we will then replace those invalid values with 0 (pos) and eps (cov).
         nans = torch.isnan(gm_data.priors) | (gm_data.priors == 0)
-        gm_data.positions[nans] = torch.tensor([0.0, 0.0, 0.0], dtype=self._dtype, device='cuda')
-        gm_data.covariances[nans] = torch.eye(3, dtype=self._dtype, device='cuda')
-        gm_data.inverse_covariances[nans] = torch.eye(3, dtype=self._dtype, device='cuda')
+        gm_data.positions[nans] = torch.tensor([0.0, 0.0, 0.0], dtype=self._dtype, device=general_config.device)
+        gm_data.covariances[nans] = torch.eye(3, dtype=self._dtype, device=general_config.device)
+        gm_data.inverse_covariances[nans] = torch.eye(3, dtype=self._dtype, device=general_config.device)
         gm_data.priors[nans] = 0
 
     @staticmethod
@@ -16,6 +16,8 @@ class EckartGeneratorSP(GMMGenerator):
     # This algorithms first creates a GMM of j Gaussians, then replaces each Gaussian
     # with j new Gaussians, and fits those Sub-GMM to the points, weighted by their
     # previous responsibility to that Gaussian.
+    # The responsibilities stay dense (n_points x n_parents x n_gaussians_per_node), there is no top-k mode as in
+    # EMGenerator (responsibilities_top_k) or sparse M-Step as in EckartGeneratorHP.
 
     def __init__(self,
                  n_gaussians_per_node: int,
@@ -2,6 +2,7 @@ from pcfitting import GMMGenerator, GMLogger, data_loading
 from pcfitting import TerminationCriterion, MaxIterationTerminationCriterion
 import torch
 import gmc.mixture as gm
+import pcfitting.config as general_config
 from .gmm_initializer import GMMInitializer
 from .em_tools import EMTools
 
@@ -17,6 +18,9 @@ class EMGenerator(GMMGenerator):
                  em_step_gaussians_subbatchsize: int = -1,
                  em_step_points_subbatchsize: int = -1,
                  use_noise_cluster: bool = False,
+                 responsibilities_top_k: int = -1,
+                 responsibilities_threshold: float = 0.0,
+                 responsibilities_sigma_cutoff: float = 5.0,
                  dtype: torch.dtype = torch.float32,
                  eps: float = 1e-7,
                  eps_is_relative: bool = True,
@@ -48,6 +52,18 @@ class EMGenerator(GMMGenerator):
         #       -1 means all Points (default)
         #   use_noise_cluster: bool
         #       If true, a noise cluster is used, meaning a weighted uniform distribution over the boudning box
+        #   responsibilities_top_k: int
+        #       If positive, only the top-k responsibilities of each point are kept (sparse E- and M-Step, see
+        #       EMTools.expectation_sparse). This scales with n_points x k instead of n_points x n_gaussians.
+        #       -1 means dense responsibilities (default). Can't be combined with the noise cluster.
+        #       Of the Eckart generators, only EckartGeneratorHP has sparse responsibilities (one point-child pair
+        #       per point), EckartGeneratorSP keeps the dense ones.
+        #   responsibilities_threshold: float
+        #       In the sparse mode, responsibilities below this threshold are dropped as well. Default: 0
+        #   responsibilities_sigma_cutoff: float
+        #       In the sparse mode, the candidates of each point are the Gaussians whose bounding box at this many
+        #       standard deviations contains the point (see EMTools.expectation_sparse). None searches all Gaussians.
+        #       Default: 5
         #   dtype: torch.dtype
         #       In which data type (precision) the operations should be performed. Default: torch.float32
         #   eps: float
@@ -65,6 +81,11 @@ class EMGenerator(GMMGenerator):
         self._em_step_gaussians_subbatchsize = em_step_gaussians_subbatchsize
         self._em_step_points_subbatchsize = em_step_points_subbatchsize
         self._use_noise_cluster = use_noise_cluster
+        self._responsibilities_top_k = responsibilities_top_k
+        self._responsibilities_threshold = responsibilities_threshold
+        self._responsibilities_sigma_cutoff = responsibilities_sigma_cutoff
+        if responsibilities_top_k > 0 and use_noise_cluster:
+            raise ValueError("sparse responsibilities (responsibilities_top_k) don't support the noise cluster")
         self._logger = None
         self._epsvar = eps
         if eps < 1e-9:
@@ -101,7 +122,7 @@ class EMGenerator(GMMGenerator):
         n_sample_points = min(point_count, self._n_sample_points)
         if n_sample_points == -1:
             n_sample_points = point_count
-        pcbatch = pcbatch.to(self._dtype).cuda()  # dimension: (bs, np, 3)
+        pcbatch = pcbatch.to(dtype=self._dtype, device=general_config.device)  # dimension: (bs, np, 3)
 
         assert (point_count > self._n_gaussians)
 
@@ -110,7 +131,7 @@ class EMGenerator(GMMGenerator):
             extends = pcbatch.max(dim=1)[0] - pcbatch.min(dim=1)[0]
             initnoisevalues = 1 / torch.prod(extends, dim=1)
 
-        epsilons = torch.ones(batch_size, dtype=self._dtype, device='cuda') * self._epsvar
+        epsilons = torch.ones(batch_size, dtype=self._dtype, device=general_config.device) * self._epsvar
         if self._eps_is_relative:
             extends = pcbatch.max(dim=1)[0] - pcbatch.min(dim=1)[0]
             epsilons *= extends.max(dim=1)[0] ** 2
@@ -118,7 +139,7 @@ class EMGenerator(GMMGenerator):
 
         # eps is a small multiple of the identity matrix which is added to the cov-matrizes
         # in order to avoid singularities
-        eps = (torch.eye(3, 3, dtype=self._dtype, device='cuda')).view(1, 1, 1, 3, 3) \
+        eps = (torch.eye(3, 3, dtype=self._dtype, device=general_config.device)).view(1, 1, 1, 3, 3) \
             .expand(batch_size, 1, 1, 3, 3) * epsilons.view(-1, 1, 1, 1, 1)
 
         # running defines which batches are still being trained
@@ -148,7 +169,7 @@ class EMGenerator(GMMGenerator):
         iteration = 0
 
         # last losses. saved so we have losses for gms that are already finished
-        last_losses = torch.ones(batch_size, dtype=self._dtype, device='cuda')
+        last_losses = torch.ones(batch_size, dtype=self._dtype, device=general_config.device)
         while True:
             iteration += 1
 
@@ -161,9 +182,16 @@ class EMGenerator(GMMGenerator):
                 .expand(batch_size, 1, n_sample_points, 1, 3)
 
             # Expectation: Calculates responsibilities and current losses
-            responsibilities, losses = EMTools.expectation(points_rep, gm_data, self._n_gaussians, running,
-                                                           self._em_step_gaussians_subbatchsize,
-                                                           self._em_step_points_subbatchsize, last_losses)
+            if self._responsibilities_top_k > 0:
+                responsibilities, responsibility_indices, losses = \
+                    EMTools.expectation_sparse(points_rep, gm_data, self._n_gaussians, running,
+                                               self._responsibilities_top_k, self._responsibilities_threshold,
+                                               self._em_step_points_subbatchsize, last_losses,
+                                               self._responsibilities_sigma_cutoff)
+            else:
+                responsibilities, losses = EMTools.expectation(points_rep, gm_data, self._n_gaussians, running,
+                                                               self._em_step_gaussians_subbatchsize,
+                                                               self._em_step_points_subbatchsize, last_losses)
             last_losses = losses
 
             # Log Loss (before changing the values in the maximization step,
@@ -181,9 +209,13 @@ class EMGenerator(GMMGenerator):
                 break
 
             # Maximization -> update GM-data
-            points_rep = points_rep.expand(batch_size, 1, n_sample_points, self._n_gaussians, 3)
-            EMTools.maximization(points_rep, responsibilities, gm_data, running, eps,
-                                 self._em_step_gaussians_subbatchsize, self._em_step_points_subbatchsize)
+            if self._responsibilities_top_k > 0:
+                EMTools.maximization_sparse(points_rep, responsibilities, responsibility_indices, gm_data, running, eps,
+                                            self._em_step_points_subbatchsize)
+            else:
+                points_rep = points_rep.expand(batch_size, 1, n_sample_points, self._n_gaussians, 3)
+                EMTools.maximization(points_rep, responsibilities, gm_data, running, eps,
+                                     self._em_step_gaussians_subbatchsize, self._em_step_points_subbatchsize)
 
         # Create final mixtures
         final_gm = gm_data.pack_mixture()
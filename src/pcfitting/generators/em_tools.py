@@ -1,6 +1,7 @@
 import gmc.mixture as gm
 import torch
 from gmc import mat_tools
+import gmc.cpp.extensions.em_expectation.binding as cpp_em_expectation
 
 import pcfitting.config as general_config
 
@@ -20,6 +21,9 @@ class EMTools:
         # Per default, all points and Gaussians are processed at once.
         # However, by setting em_gaussians_subbatchsize and em_points_subbatchsize,
         # this can be split into several processings to save memory.
+        # If general_config.fused_expectation is set, the fused kernel is used instead, which streams over the Gaussians
+        # and needs no temporaries, the subbatch sizes are ignored then. If the kernel can't be loaded (e.g. no compiler),
+        # the dense implementation is used.
         # Parameters:
         #   points: torch.Tensor of shape (batch_size, 1, n_points, 1, 3)
         #       This is a expansion of the (sampled) point cloud
@@ -48,6 +52,9 @@ class EMTools:
 
         has_noise = gm_data.has_noise_cluster()
 
+        if general_config.fused_expectation and cpp_em_expectation.available():
+            return EMTools.expectation_fused(points, gm_data, running, has_noise, losses)
+
         # This uses the fact that
         # log(a * exp(-0.5 * M(x))) = log(a) + log(exp(-0.5 * M(x))) = log(a) - 0.5 * M(x)
 
@@ -92,7 +99,7 @@ class EMTools:
             for i_start in range(0, n_sample_points, point_subbatch_size):
                 i_end = i_start + point_subbatch_size
                 actual_point_subbatch_size = min(n_sample_points, i_end) - i_start
-                likelihood_log[:, :, i_start:i_end, -1] = gm_data.get_noise_loglikelihood()\
+                likelihood_log[:, :, i_start:i_end, -1] = gm_data.get_noise_loglikelihood()[running]\
                     .unsqueeze(1).unsqueeze(2).expand(running_batch_size, 1, actual_point_subbatch_size)
 
         # Logarithmized Likelihood for each point given the GM. shape: (bs, 1, np, 1)
@@ -109,17 +116,50 @@ class EMTools:
         # Calculating responsibilities and returning them and the mean loglikelihoods
         return responsibilities, losses
 
+    @staticmethod
+    def expectation_fused(points: torch.Tensor, gm_data, running: torch.Tensor, has_noise: bool,
+                          losses: torch.Tensor = None) -> (torch.Tensor, torch.Tensor):
+        # Same as expectation, but the log-likelihoods, their log-sum-exp per point and the responsibilities
+        # are computed by one kernel in a single pass over the Gaussians (gmc.cpp.extensions.em_expectation).
+        # Parameters and return values are the same as in expectation.
+        batch_size = points.shape[0]
+        running_batch_size = running.sum()
+        n_sample_points = points.shape[2]
+        dtype = points.dtype
+
+        noise_loglikelihood = gm_data.get_noise_loglikelihood()[running] if has_noise else None
+        # running_responsibilities shape: (rbs, np, ng (+1)), llh shape: (rbs, np)
+        running_responsibilities, llh = \
+            cpp_em_expectation.expectation(points[running, 0, :, 0, :], gm_data.get_positions()[running, 0],
+                                           gm_data.get_inversed_covariances()[running, 0],
+                                           gm_data.get_logarithmized_amplitudes()[running, 0], noise_loglikelihood)
+
+        if losses is None:
+            losses = torch.zeros(batch_size, dtype=dtype, device=general_config.device)
+        losses[running] = -llh.mean(dim=1).view(running_batch_size)
+        responsibilities = torch.zeros(batch_size, 1, n_sample_points, running_responsibilities.shape[2], dtype=dtype,
+                                       device=general_config.device)
+        responsibilities[running] = running_responsibilities.unsqueeze(1)
+        return responsibilities, losses
+
     @staticmethod
     def maximization(points_rep: torch.Tensor, responsibilities: torch.Tensor, gm_data, running: torch.Tensor,
                      eps: torch.Tensor, em_gaussians_subbatchsize: int = -1, em_points_subbatchsize: int = -1):
         # This performs the Maximization step of the EM Algorithm.
         # Updates the GM-Model given the responsibilities which resulted from the E-Step.
+        # The sufficient statistics T0 = sum r, T1 = sum r*x and T2 = sum r*x*x^T (see Eckart-Paper) are accumulated
+        # in one pass over the points as matrix products R^T X and R^T (X (x) X). The covariances are T2/T0 - mu*mu^T.
+        # The points are centered on their mean beforehand. That doesn't help small Gaussians far from the mean, for
+        # which the difference cancels in float32, so the statistics are accumulated in float64 (the matrix product
+        # can't take the points relative to each Gaussian as maximization_sparse does without n_points x n_gaussians
+        # temporaries). This doubles the memory of the responsibilities of one subbatch for float32 inputs.
         # Per default, all points and Gaussians are processed at once.
         # However, by setting em_gaussians_subbatchsize and em_points_subbatchsize,
         # this can be split into several processings to save memory.
         # Parameters:
         #   points_rep: torch.Tensor of shape (batch_size, 1, n_points, n_gaussians, 3)
         #       This is a expansion of the (sampled) point cloud, repeated n_gaussian times along dimension 4
+        #       (only the first repetition is read, it may be an expanded view)
         #   responsibilities: torch.Tensor of shape (batch_size, 1, n_points, n_gaussians)
         #       This is the result of the E-step.
         #   gm_data: EMTools.TrainingData
@@ -138,7 +178,55 @@ class EMTools:
         n_sample_points = points_rep.shape[2]
         n_gaussians = points_rep.shape[3]
         dtype = points_rep.dtype
-        n_running = running.sum()
+
+        new_positions = gm_data.get_positions()[running].clone()
+        new_covariances = gm_data.get_covariances()[running].clone()
+        new_priors = gm_data.get_priors()[running].clone()
+        new_noise_weight = gm_data.get_noise_weight()[running]
+
+        t_0, means, covariances = EMTools.dense_statistics(points_rep[:, 0, :, 0, :], responsibilities, running,
+                                                           n_gaussians, em_gaussians_subbatchsize,
+                                                           em_points_subbatchsize)
+        new_priors[:, 0] = (t_0 / n_sample_points).to(dtype)
+        new_positions[:, 0] = means.to(dtype)
+        new_covariances[:, 0] = covariances.to(dtype) + eps[running, 0]
+        del t_0, means, covariances
+
+        if gm_data.has_noise_cluster():
+            new_noise_weight = responsibilities[running, 0, :, -1].sum(dim=1) / n_sample_points
+
+        # Handling of invalid Gaussians! If all responsibilities of a Gaussian are zero, the previous code will
+        # set the prior of it to zero and the covariances and positions to NaN
+        # To avoid NaNs, we will then replace those invalid values with 0 (pos) and eps (cov).
+        # if (new_priors == 0).sum() > 0:
+            # print("detected ", (new_priors == 0).sum().item(), "0-priors!")
+        new_positions[new_priors == 0] = torch.tensor([0.0, 0.0, 0.0], dtype=dtype, device=general_config.device)
+        new_covariances[new_priors == 0] = torch.eye(3, dtype=dtype, device=general_config.device)
+
+        # Update GMData
+        gm_data.set_positions(new_positions, running)
+        gm_data.set_covariances(new_covariances, running)
+        gm_data.set_priors(new_priors, running)
+        gm_data.set_noise_weight(new_noise_weight, running)
+
+    @staticmethod
+    def dense_statistics(points: torch.Tensor, responsibilities: torch.Tensor, running: torch.Tensor,
+                         n_gaussians: int, em_gaussians_subbatchsize: int = -1, em_points_subbatchsize: int = -1) -> \
+            (torch.Tensor, torch.Tensor, torch.Tensor):
+        # Sufficient statistics of the M-Step from dense responsibilities (see maximization), accumulated as matrix
+        # products R^T X and R^T (X (x) X) of the points centered on their mean, in float64.
+        # Parameters:
+        #   points: torch.Tensor of shape (batch_size, n_points, 3)
+        #   responsibilities: torch.Tensor of shape (batch_size, 1, n_points, n_gaussians (+1))
+        #       Only the first n_gaussians columns are used (i.e., not the noise cluster)
+        #   running: torch.Tensor of shape (batch_size), dtype=bool
+        #   n_gaussians, em_gaussians_subbatchsize, em_points_subbatchsize: see maximization
+        # Returns (float64, only for the running GMs):
+        #   t_0: torch.Tensor of shape (rbs, n_gaussians): sum r
+        #   means: torch.Tensor of shape (rbs, n_gaussians, 3): T1 / T0
+        #   covariances: torch.Tensor of shape (rbs, n_gaussians, 3, 3): T2 / T0 - mu*mu^T
+        #   means and covariances are NaN where t_0 is zero
+        n_sample_points = points.shape[1]
         gauss_subbatch_size = em_gaussians_subbatchsize
         if gauss_subbatch_size < 1:
             gauss_subbatch_size = n_gaussians
@@ -146,61 +234,321 @@ class EMTools:
         if point_subbatch_size < 1:
             point_subbatch_size = n_sample_points
 
-        new_positions = gm_data.get_positions()[running].clone()
-        new_covariances = gm_data.get_covariances()[running].clone()
-        new_priors = gm_data.get_priors()[running].clone()
-        new_noise_weight = gm_data.get_noise_weight()[running]
+        # Centered points, in the accumulation precision. shape: (bs, np, 3)
+        points = points[running].to(torch.float64)
+        n_running = points.shape[0]
+        center = points.mean(dim=1, keepdim=True)
+        points = points - center
 
+        t_0 = torch.zeros(n_running, n_gaussians, dtype=torch.float64, device=general_config.device)
+        means = torch.zeros(n_running, n_gaussians, 3, dtype=torch.float64, device=general_config.device)
+        covariances = torch.zeros(n_running, n_gaussians, 3, 3, dtype=torch.float64, device=general_config.device)
         # Iterate over Gauss-Subbatches
         for j_start in range(0, n_gaussians, gauss_subbatch_size):
-            j_end = j_start + gauss_subbatch_size
-            actual_gauss_subbatch_size = min(n_gaussians, j_end) - j_start
+            j_end = min(n_gaussians, j_start + gauss_subbatch_size)
             # Initialize T-Variables for these Gaussians, will be filled in the upcoming loop
             # Positions/Covariances/Priors are calculated from these (see Eckart-Paper)
-            t_0 = torch.zeros(n_running, 1, actual_gauss_subbatch_size, dtype=dtype, device=general_config.device)
-            t_1 = torch.zeros(n_running, 1, actual_gauss_subbatch_size, 3, dtype=dtype, device=general_config.device)
+            t_1 = torch.zeros(n_running, j_end - j_start, 3, dtype=torch.float64, device=general_config.device)
+            t_2 = torch.zeros(n_running, j_end - j_start, 9, dtype=torch.float64, device=general_config.device)
 
             # Iterate over Point-Subbatches
             for i_start in range(0, n_sample_points, point_subbatch_size):
                 i_end = i_start + point_subbatch_size
-                relevant_responsibilities = responsibilities[running, :, i_start:i_end, j_start:j_end]
-                # actual_point_subbatch_size = relevant_responsibilities.shape[2]
-                relevant_points = points_rep[running, :, i_start:i_end, j_start:j_end, :]
-                # Fill T-Variables      # t_2 shape: (1, 1, J, 3, 3)
-                t_0 += relevant_responsibilities.sum(dim=2)  # shape: (1, 1, J)
-                t_1 += (relevant_points * relevant_responsibilities.unsqueeze(4)) \
-                    .sum(dim=2)  # shape: (1, 1, J, 3)
-                del relevant_points
+                # R^T. shape: (bs, J, np)
+                relevant_responsibilities_t = responsibilities[running, 0, i_start:i_end, j_start:j_end]\
+                    .transpose(-1, -2).to(torch.float64)
+                relevant_points = points[:, i_start:i_end]
+                # Outer products of the points, flattened. shape: (bs, np, 9)
+                relevant_outer_products = (relevant_points.unsqueeze(3) * relevant_points.unsqueeze(2)).flatten(2, 3)
+                t_0[:, j_start:j_end] += relevant_responsibilities_t.sum(dim=2)
+                t_1 += relevant_responsibilities_t @ relevant_points
+                t_2 += relevant_responsibilities_t @ relevant_outer_products
+                del relevant_outer_products
+
+            relative_means = t_1 / t_0[:, j_start:j_end].unsqueeze(2)  # (bs, J, 3), relative to center
+            means[:, j_start:j_end] = relative_means + center
+            covariances[:, j_start:j_end] = t_2.view(n_running, -1, 3, 3) / t_0[:, j_start:j_end, None, None] \
+                - relative_means.unsqueeze(3) * relative_means.unsqueeze(2)
+            del t_1, t_2, relative_means
+
+        return t_0, means, covariances
 
-            new_priors[:, :, j_start:j_end] = t_0 / n_sample_points
-            new_positions[:, :, j_start:j_end] = t_1 / t_0.unsqueeze(3)  # (bs, 1, ng, 3)
+    @staticmethod
+    def expectation_sparse(points: torch.Tensor, gm_data, n_gaussians: int, running: torch.Tensor, top_k: int,
+                           threshold: float = 0.0, em_points_subbatchsize: int = -1, losses: torch.Tensor = None,
+                           sigma_cutoff: float = 5.0, max_candidate_pairs: int = 2 ** 22) -> \
+            (torch.Tensor, torch.Tensor, torch.Tensor):
+        # Sparse version of expectation. Only the top_k responsibilities of each point are kept, and of those only the
+        # ones of at least threshold (the largest one is always kept). They are renormalized to sum up to one
+        # (truncated EM).
+        # The candidates of each point are found with a uniform grid over the bounding boxes of the Gaussians at
+        # sigma_cutoff standard deviations (see candidate_grid), so time and memory scale with n_points x the number of
+        # candidates per grid cell instead of n_points x n_gaussians. Gaussians whose box doesn't contain a point are
+        # below exp(-sigma_cutoff^2 / 2) of their amplitude there and are left out of its loss as well. Points outside
+        # of all boxes are evaluated against all Gaussians. With sigma_cutoff None, all Gaussians are candidates of
+        # every point and the losses are exact. The noise cluster is not supported.
+        # The position and inversed covariance of every (point, candidate)-pair are gathered. Early in the fit, broad
+        # Gaussians make the number of candidates approach n_gaussians, which would take more memory than the dense
+        # expectation, so the point subbatches are shrunk until they hold at most max_candidate_pairs pairs.
+        # Parameters:
+        #   points, gm_data, n_gaussians, running, em_points_subbatchsize, losses: see expectation
+        #   top_k: int
+        #       Maximum number of responsibilities per point
+        #   threshold: float
+        #       Responsibilities smaller than this are dropped (before renormalization)
+        #   sigma_cutoff: float
+        #       Size of the bounding boxes of the Gaussians in standard deviations, None for an exhaustive search
+        #   max_candidate_pairs: int
+        #       Upper bound of running batch size x points per subbatch x largest candidate count (grid search only)
+        # Returns:
+        #   values: torch.Tensor of shape (batch_size, 1, n_points, k), k = min(top_k, n_gaussians)
+        #       Responsibilities, zero for finished GMs and dropped entries
+        #   indices: torch.Tensor of shape (batch_size, 1, n_points, k), dtype long
+        #       Gaussian index of each value
+        #   losses: torch.Tensor of shape (batch_size): Negative Log-Likelihood for each GM
+        assert not gm_data.has_noise_cluster()
 
-            del t_1
-            t_2 = torch.zeros(n_running, 1, actual_gauss_subbatch_size, 3, 3, dtype=dtype, device=general_config.device)
+        batch_size = points.shape[0]
+        n_sample_points = points.shape[2]
+        dtype = points.dtype
+        k = min(top_k, n_gaussians)
+        point_subbatch_size = em_points_subbatchsize
+        if point_subbatch_size < 1:
+            point_subbatch_size = n_sample_points
 
-            for i_start in range(0, n_sample_points, point_subbatch_size):
-                i_end = i_start + point_subbatch_size
-                relevant_responsibilities = responsibilities[running, :, i_start:i_end, j_start:j_end]
-                actual_point_subbatch_size = relevant_responsibilities.shape[2]
-                relevant_relative_points = points_rep[running, :, i_start:i_end, j_start:j_end, :] \
-                    - new_positions[:, :, j_start:j_end].unsqueeze(2)\
-                    .expand(n_running, 1, actual_point_subbatch_size, actual_gauss_subbatch_size, 3)
-                matrices_from_points = relevant_relative_points.unsqueeze(5) * relevant_relative_points.unsqueeze(5)\
-                    .transpose(-1, -2)
-                t_2 += (matrices_from_points * relevant_responsibilities.unsqueeze(4).unsqueeze(5)).sum(dim=2)
-                del matrices_from_points, relevant_relative_points
-
-            new_covariances[:, :, j_start:j_end] = t_2 / t_0.unsqueeze(3).unsqueeze(4) + eps[running]
-            del t_0, t_2
+        running_points = points[:, 0, :, 0, :][running]  # (rbs, np, 3)
+        gmpos = gm_data.get_positions()[running, 0]  # (rbs, ng, 3)
+        gmicov = gm_data.get_inversed_covariances()[running, 0]  # (rbs, ng, 3, 3)
+        gmloga = gm_data.get_logarithmized_amplitudes()[running, 0]  # (rbs, ng)
+        n_running = gmpos.shape[0]
+        grid = None
+        if sigma_cutoff is not None:
+            grid = EMTools.candidate_grid(running_points, gmpos, gm_data.get_covariances()[running, 0], sigma_cutoff)
+            max_candidates = max(int(EMTools.grid_candidate_counts(grid, running_points).max()), 1)
+            point_subbatch_size = min(point_subbatch_size, max(1, max_candidate_pairs // (n_running * max_candidates)))
+
+        values = torch.zeros(batch_size, 1, n_sample_points, k, dtype=dtype, device=general_config.device)
+        indices = torch.zeros(batch_size, 1, n_sample_points, k, dtype=torch.long, device=general_config.device)
+        llh_total = torch.zeros(n_running, dtype=dtype, device=general_config.device)
+        for i_start in range(0, n_sample_points, point_subbatch_size):
+            i_end = i_start + point_subbatch_size
+            subbatch_points = running_points[:, i_start:i_end]
+            if grid is None:
+                # Tensor of {PC-point minus GM-position}-vectors. shape: (rbs, np, ng, 3)
+                grelpos = subbatch_points.unsqueeze(2) - gmpos.unsqueeze(1)
+                # The logarithmized likelihoods of each point for each gaussian. shape: (rbs, np, ng)
+                likelihood_log = gmloga.unsqueeze(1) - 0.5 * torch.einsum('bpgi,bgij,bpgj->bpg', grelpos, gmicov, grelpos)
+                candidates = None
+            else:
+                # candidates: Gaussian indices, shape: (rbs, np, nc), nc is the largest candidate count in this subbatch
+                candidates, valid = EMTools.grid_candidates(grid, subbatch_points)
+                flat_candidates = (candidates + torch.arange(n_running, device=general_config.device)
+                                   .view(-1, 1, 1) * n_gaussians).view(-1)
+                grelpos = subbatch_points.unsqueeze(2) - gmpos.reshape(-1, 3)[flat_candidates].view(candidates.shape + (3,))
+                likelihood_log = gmloga.reshape(-1)[flat_candidates].view(candidates.shape) - 0.5 * torch.einsum(
+                    'bpci,bpcij,bpcj->bpc', grelpos, gmicov.reshape(-1, 3, 3)[flat_candidates]
+                    .view(candidates.shape + (3, 3)), grelpos)
+                likelihood_log[~valid] = -float('inf')
+                if likelihood_log.shape[2] < k:
+                    padding = torch.full(likelihood_log.shape[:2] + (k - likelihood_log.shape[2],), -float('inf'),
+                                         dtype=dtype, device=general_config.device)
+                    likelihood_log = torch.cat((likelihood_log, padding), dim=2)
+                    candidates = torch.cat((candidates, torch.zeros_like(padding, dtype=torch.long)), dim=2)
+                del valid, flat_candidates
+            del grelpos
+            llh_sum = torch.logsumexp(likelihood_log, dim=2, keepdim=True)
+            top_likelihood_log, top_indices = torch.topk(likelihood_log, k, dim=2)
+            del likelihood_log
+            if candidates is not None:
+                top_indices = candidates.gather(2, top_indices)
+                # Points outside of all bounding boxes, evaluated against all Gaussians
+                outside = torch.isinf(llh_sum[:, :, 0]).nonzero(as_tuple=True)
+                if outside[0].shape[0] > 0:
+                    grelpos = subbatch_points[outside].unsqueeze(1) - gmpos[outside[0]]
+                    outside_likelihood_log = gmloga[outside[0]] - 0.5 * torch.einsum(
+                        'pgi,pgij,pgj->pg', grelpos, gmicov[outside[0]], grelpos)
+                    llh_sum[outside] = torch.logsumexp(outside_likelihood_log, dim=1, keepdim=True)
+                    top_likelihood_log[outside], top_indices[outside] = torch.topk(outside_likelihood_log, k, dim=1)
+                    del grelpos, outside_likelihood_log
+            llh_total += llh_sum.sum(dim=(1, 2))
+            top_responsibilities = torch.exp(top_likelihood_log - llh_sum)
+            if threshold > 0:
+                dropped = top_responsibilities < threshold
+                dropped[:, :, 0] = False
+                top_responsibilities[dropped] = 0
+            values[running, 0, i_start:i_end] = top_responsibilities / top_responsibilities.sum(dim=2, keepdim=True)
+            indices[running, 0, i_start:i_end] = top_indices
 
-        if gm_data.has_noise_cluster():
-            new_noise_weight[running] = responsibilities[running, 0, :, -1].sum(dim=1) / n_sample_points
+        if losses is None:
+            losses = torch.zeros(batch_size, dtype=dtype, device=general_config.device)
+        losses[running] = -llh_total / n_sample_points
+        return values, indices, losses
 
-        # Handling of invalid Gaussians! If all responsibilities of a Gaussian are zero, the previous code will
-        # set the prior of it to zero and the covariances and positions to NaN
-        # To avoid NaNs, we will then replace those invalid values with 0 (pos) and eps (cov).
-        # if (new_priors == 0).sum() > 0:
-            # print("detected ", (new_priors == 0).sum().item(), "0-priors!")
+    @staticmethod
+    def candidate_grid(points: torch.Tensor, positions: torch.Tensor, covariances: torch.Tensor,
+                       sigma_cutoff: float) -> tuple:
+        # Spatial index for the candidate search of expectation_sparse: a uniform grid with about n_gaussians cells
+        # over the bounding box of each point cloud. Every Gaussian is entered into all cells that its axis aligned
+        # bounding box at sigma_cutoff standard deviations (half extents sigma_cutoff * sqrt(diag(C))) overlaps.
+        # The (cell, Gaussian)-entries are sorted by cell, so the candidates of a cell are a contiguous range.
+        # Parameters:
+        #   points: torch.Tensor of shape (bs, n_points, 3)
+        #   positions: torch.Tensor of shape (bs, n_gaussians, 3)
+        #   covariances: torch.Tensor of shape (bs, n_gaussians, 3, 3)
+        #   sigma_cutoff: float
+        # Returns:
+        #   Tuple of the grid origins (bs, 1, 3), cell sizes (bs, 1, 3), number of cells per axis,
+        #   start and count of the entries of each cell (bs * n_cells^3) and the sorted Gaussian indices (n_entries)
+        batch_size = positions.shape[0]
+        n_gaussians = positions.shape[1]
+        n_cells = max(1, round(n_gaussians ** (1 / 3)))
+        origins = points.min(dim=1, keepdim=True)[0]
+        extents = points.max(dim=1, keepdim=True)[0] - origins
+        cell_sizes = torch.where(extents > 0, extents / n_cells, torch.ones_like(extents))
+        half_extents = sigma_cutoff * covariances.diagonal(dim1=-2, dim2=-1).clamp(min=0).sqrt()
+        lower = ((positions - half_extents - origins) / cell_sizes).floor().clamp(0, n_cells - 1).long()
+        upper = ((positions + half_extents - origins) / cell_sizes).floor().clamp(0, n_cells - 1).long()
+
+        # One entry per covered cell of each Gaussian
+        spans = (upper - lower + 1).reshape(-1, 3)  # (bs * ng, 3)
+        entry_counts = spans.prod(dim=1)
+        entry_gaussians = torch.arange(batch_size * n_gaussians, device=positions.device)\
+            .repeat_interleave(entry_counts)
+        local = torch.arange(entry_gaussians.shape[0], device=positions.device) - \
+            (entry_counts.cumsum(0) - entry_counts).repeat_interleave(entry_counts)
+        entry_spans = spans[entry_gaussians]
+        entry_cells = lower.reshape(-1, 3)[entry_gaussians]
+        entry_cells[:, 0] += local % entry_spans[:, 0]
+        entry_cells[:, 1] += (local // entry_spans[:, 0]) % entry_spans[:, 1]
+        entry_cells[:, 2] += local // (entry_spans[:, 0] * entry_spans[:, 1])
+        cell_ids = (entry_gaussians // n_gaussians) * n_cells ** 3 + \
+            (entry_cells[:, 2] * n_cells + entry_cells[:, 1]) * n_cells + entry_cells[:, 0]
+
+        order = torch.argsort(cell_ids)
+        sorted_gaussians = entry_gaussians[order] % n_gaussians
+        cell_counts = torch.bincount(cell_ids, minlength=batch_size * n_cells ** 3)
+        cell_starts = cell_counts.cumsum(0) - cell_counts
+        return origins, cell_sizes, n_cells, cell_starts, cell_counts, sorted_gaussians
+
+    @staticmethod
+    def grid_candidates(grid: tuple, points: torch.Tensor) -> (torch.Tensor, torch.Tensor):
+        # Candidate Gaussians of each point, i.e., the entries of its cell in the grid of candidate_grid.
+        # Parameters:
+        #   grid: tuple
+        #       Result of candidate_grid
+        #   points: torch.Tensor of shape (bs, n_points, 3)
+        # Returns:
+        #   candidates: torch.Tensor of shape (bs, n_points, nc), dtype long, nc is the largest number of candidates
+        #       Gaussian indices, padded with valid indices
+        #   valid: torch.Tensor of shape (bs, n_points, nc), dtype bool
+        #       False for the padding
+        origins, cell_sizes, n_cells, cell_starts, cell_counts, sorted_gaussians = grid
+        cell_ids = EMTools.grid_cell_ids(grid, points)
+        counts = cell_counts[cell_ids]
+        slots = torch.arange(max(int(counts.max()), 1), device=points.device)
+        valid = slots < counts.unsqueeze(2)
+        entries = (cell_starts[cell_ids].unsqueeze(2) + slots).clamp(max=max(sorted_gaussians.shape[0] - 1, 0))
+        return sorted_gaussians[entries], valid
+
+    @staticmethod
+    def grid_cell_ids(grid: tuple, points: torch.Tensor) -> torch.Tensor:
+        # Index of the cell of each point in the grid of candidate_grid, shape (bs, n_points), dtype long
+        origins, cell_sizes, n_cells = grid[:3]
+        batch_size = points.shape[0]
+        cells = ((points - origins) / cell_sizes).floor().clamp(0, n_cells - 1).long()
+        return torch.arange(batch_size, device=points.device).view(-1, 1) * n_cells ** 3 + \
+            (cells[:, :, 2] * n_cells + cells[:, :, 1]) * n_cells + cells[:, :, 0]
+
+    @staticmethod
+    def grid_candidate_counts(grid: tuple, points: torch.Tensor) -> torch.Tensor:
+        # Number of candidates of each point (see grid_candidates), shape (bs, n_points), dtype long
+        return grid[4][EMTools.grid_cell_ids(grid, points)]
+
+    @staticmethod
+    def sparse_statistics(points: torch.Tensor, point_indices: torch.Tensor, gaussian_indices: torch.Tensor,
+                          values: torch.Tensor, n_gaussians: int, offsets: torch.Tensor = None) -> \
+            (torch.Tensor, torch.Tensor, torch.Tensor):
+        # Sufficient statistics of the M-Step (see Eckart-Paper) from sparse responsibilities, which are given as a
+        # list of (point, gaussian, responsibility)-entries. Time and memory are linear in the number of entries.
+        # The points are taken relative to an offset per Gaussian, e.g. its current position. With offsets close to
+        # the new positions mu, the covariances T2/T0 - mu*mu^T don't suffer from cancellation.
+        # Parameters:
+        #   points: torch.Tensor of shape (n_points, 3)
+        #   point_indices, gaussian_indices: torch.Tensor of shape (n_entries), dtype long
+        #   values: torch.Tensor of shape (n_entries)
+        #       The responsibility of entry i is values[i] for the point point_indices[i]
+        #       and the Gaussian gaussian_indices[i]
+        #   n_gaussians: int
+        #   offsets: torch.Tensor of shape (n_gaussians, 3) or None (zero)
+        # Returns (x relative to the offset of the Gaussian):
+        #   t_0: torch.Tensor of shape (n_gaussians): sum r
+        #   t_1: torch.Tensor of shape (n_gaussians, 3): sum r*x
+        #   t_2: torch.Tensor of shape (n_gaussians, 3, 3): sum r*x*x^T
+        entry_points = points[point_indices]
+        if offsets is not None:
+            entry_points = entry_points - offsets[gaussian_indices]
+        weighted_points = entry_points * values.unsqueeze(1)
+        t_0 = torch.zeros(n_gaussians, dtype=points.dtype, device=points.device).index_add_(0, gaussian_indices, values)
+        t_1 = torch.zeros(n_gaussians, 3, dtype=points.dtype, device=points.device)\
+            .index_add_(0, gaussian_indices, weighted_points)
+        t_2 = torch.zeros(n_gaussians, 9, dtype=points.dtype, device=points.device)\
+            .index_add_(0, gaussian_indices, (weighted_points.unsqueeze(2) * entry_points.unsqueeze(1)).flatten(1, 2))
+        return t_0, t_1, t_2.view(n_gaussians, 3, 3)
+
+    @staticmethod
+    def maximization_sparse(points_rep: torch.Tensor, values: torch.Tensor, indices: torch.Tensor, gm_data,
+                            running: torch.Tensor, eps: torch.Tensor, em_points_subbatchsize: int = -1):
+        # Sparse version of maximization, consumes the result of expectation_sparse directly.
+        # Time and memory scale with n_points x k instead of n_points x n_gaussians.
+        # Parameters:
+        #   points_rep: torch.Tensor of shape (batch_size, 1, n_points, 1, 3)
+        #       This is a expansion of the (sampled) point cloud
+        #   values, indices: torch.Tensor of shape (batch_size, 1, n_points, k)
+        #       Result of expectation_sparse
+        #   gm_data, running, eps, em_points_subbatchsize: see maximization
+        n_sample_points = points_rep.shape[2]
+        n_gaussians = gm_data.get_positions().shape[2]
+        dtype = points_rep.dtype
+        n_running = int(running.sum())
+        k = values.shape[3]
+        point_subbatch_size = em_points_subbatchsize
+        if point_subbatch_size < 1:
+            point_subbatch_size = n_sample_points
+
+        # Points of all running GMs, flattened. shape: (rbs * np, 3)
+        points = points_rep[:, 0, :, 0, :][running].reshape(-1, 3)
+        # The statistics are taken relative to the current positions. shape: (rbs * ng, 3)
+        offsets = gm_data.get_positions()[running, 0].reshape(-1, 3)
+        running_values = values[running, 0]
+        # Gaussian indices into the flattened (rbs * ng) Gaussians of all running GMs
+        running_indices = indices[running, 0] + \
+            torch.arange(n_running, device=general_config.device).view(-1, 1, 1) * n_gaussians
+        batch_point_offsets = torch.arange(n_running, device=general_config.device).view(-1, 1, 1) * n_sample_points
+
+        t_0 = torch.zeros(n_running * n_gaussians, dtype=dtype, device=general_config.device)
+        t_1 = torch.zeros(n_running * n_gaussians, 3, dtype=dtype, device=general_config.device)
+        t_2 = torch.zeros(n_running * n_gaussians, 3, 3, dtype=dtype, device=general_config.device)
+        for i_start in range(0, n_sample_points, point_subbatch_size):
+            i_end = min(n_sample_points, i_start + point_subbatch_size)
+            point_indices = (torch.arange(i_start, i_end, device=general_config.device).view(1, -1, 1)
+                             + batch_point_offsets).expand(n_running, i_end - i_start, k)
+            statistics = EMTools.sparse_statistics(points, point_indices.reshape(-1),
+                                                   running_indices[:, i_start:i_end].reshape(-1),
+                                                   running_values[:, i_start:i_end].reshape(-1), n_running * n_gaussians,
+                                                   offsets)
+            t_0 += statistics[0]
+            t_1 += statistics[1]
+            t_2 += statistics[2]
+            del statistics
+
+        t_0 = t_0.view(n_running, 1, n_gaussians)
+        means = t_1.view(n_running, 1, n_gaussians, 3) / t_0.unsqueeze(3)  # relative to offsets
+        new_priors = t_0 / n_sample_points
+        new_positions = means + offsets.view(n_running, 1, n_gaussians, 3)
+        new_covariances = t_2.view(n_running, 1, n_gaussians, 3, 3) / t_0.unsqueeze(3).unsqueeze(4) \
+            - means.unsqueeze(4) * means.unsqueeze(3) + eps[running]
+
+        # Gaussians without responsibilities, see maximization
         new_positions[new_priors == 0] = torch.tensor([0.0, 0.0, 0.0], dtype=dtype, device=general_config.device)
         new_covariances[new_priors == 0] = torch.eye(3, dtype=dtype, device=general_config.device)
 
@@ -208,7 +556,6 @@ class EMTools:
         gm_data.set_positions(new_positions, running)
         gm_data.set_covariances(new_covariances, running)
         gm_data.set_priors(new_priors, running)
-        gm_data.set_noise_weight(new_noise_weight, running)
 
     @staticmethod
     def find_valid_matrices(covariances: torch.Tensor, invcovs: torch.Tensor, strong: bool = False) -> torch.Tensor:
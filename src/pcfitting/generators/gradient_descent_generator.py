@@ -7,14 +7,13 @@ from .gmm_initializer import GMMInitializer
 import torch
 import torch.optim
 import gmc.mixture as gm
+import pcfitting.config as general_config
 
 
 class GradientDescentGenerator(GMMGenerator):
     # GMM Generator following a Gradient Descent approach
     # Minimizes the Likelihood
 
-    _device = torch.device('cuda')
-
     def __init__(self,
                  n_gaussians: int,
                  n_sample_points: int,
@@ -82,7 +81,7 @@ class GradientDescentGenerator(GMMGenerator):
 
         batch_size = pcbatch.shape[0]
         point_count = pcbatch.shape[1]
-        pcbatch = pcbatch.to(self._device)
+        pcbatch = pcbatch.to(general_config.device)
 
         # Initialize mixture (Important: Assumes intervall [0,1])
         if gmbatch is None:
@@ -108,7 +107,7 @@ class GradientDescentGenerator(GMMGenerator):
         iteration = 0
 
         if self._logger:
-            self._logger.log(iteration, losses, gm_data.pack_mixture(), torch.ones(batch_size, dtype=torch.bool, device='cuda'))
+            self._logger.log(iteration, losses, gm_data.pack_mixture(), torch.ones(batch_size, dtype=torch.bool, device=general_config.device))
 
         # Check termination criteria
         current_losses = losses.clone().detach()
@@ -156,7 +155,7 @@ class GradientDescentGenerator(GMMGenerator):
             gmbatch = gm.generate_random_mixtures(n_batch=batch_size, n_layers=1, n_components=self._n_gaussians,
                                                   n_dims=3, pos_radius=0.5,
                                                   cov_radius=0.01 / (self._n_gaussians ** (1 / 3)),
-                                                  weight_min=0, weight_max=1, device=self._device)
+                                                  weight_min=0, weight_max=1, device=general_config.device)
             indizes = torch.randperm(point_count)[0:self._n_gaussians]
             positions = pcbatch[:, indizes, :].view(batch_size, 1, self._n_gaussians, 3)
             return gm.pack_mixture(gm.weights(gmbatch), positions, gm.covariances(gmbatch))
@@ -165,7 +164,7 @@ class GradientDescentGenerator(GMMGenerator):
             gmbatch = gm.generate_random_mixtures(n_batch=batch_size, n_layers=1, n_components=self._n_gaussians,
                                                   n_dims=3, pos_radius=0.5,
                                                   cov_radius=0.01 / (self._n_gaussians ** (1 / 3)),
-                                                  weight_min=0, weight_max=1, device=self._device)
+                                                  weight_min=0, weight_max=1, device=general_config.device)
             sampled = furthest_point_sampling.apply(pcbatch.float(), self._n_gaussians).to(torch.long).reshape(-1)
             batch_indizes = torch.arange(0, batch_size).repeat(self._n_gaussians, 1).transpose(-1, -2).reshape(-1)
             gmpositions = pcbatch[batch_indizes, sampled, :].view(batch_size, 1, self._n_gaussians, 3)
@@ -214,7 +213,7 @@ class GradientDescentGenerator(GMMGenerator):
             batch_size = covariances.shape[0]
             n_gaussians = covariances.shape[2]
             cov_factor_mat = torch.cholesky(covariances)
-            cov_factor_vec = torch.zeros((batch_size, 1, n_gaussians, 6)).to(GradientDescentGenerator._device)
+            cov_factor_vec = torch.zeros((batch_size, 1, n_gaussians, 6)).to(general_config.device)
             cov_factor_vec[:, :, :, 0] = torch.max(cov_factor_mat[:, :, :, 0, 0] - self._epsilon, 0)[0]
             cov_factor_vec[:, :, :, 1] = torch.max(cov_factor_mat[:, :, :, 1, 1] - self._epsilon, 0)[0]
             cov_factor_vec[:, :, :, 2] = torch.max(cov_factor_mat[:, :, :, 2, 2] - self._epsilon, 0)[0]
@@ -237,7 +236,7 @@ class GradientDescentGenerator(GMMGenerator):
             # and determinants
             cov_shape = self.tr_cov_data.shape
             cov_factor_mat_rec = torch.zeros((cov_shape[0], cov_shape[1], cov_shape[2], 3, 3)).to(
-                GradientDescentGenerator._device)
+                general_config.device)
             cov_factor_mat_rec[:, :, :, 0, 0] = torch.abs(self.tr_cov_data[:, :, :, 0]) + self._epsilon
             cov_factor_mat_rec[:, :, :, 1, 1] = torch.abs(self.tr_cov_data[:, :, :, 1]) + self._epsilon
             cov_factor_mat_rec[:, :, :, 2, 2] = torch.abs(self.tr_cov_data[:, :, :, 2]) + self._epsilon
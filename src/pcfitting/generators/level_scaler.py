@@ -31,8 +31,8 @@ class LevelScaler:
         self._parent_per_point = parent_per_point
 
         if self._active:
-            self._scaleP = torch.zeros(parent_count, dtype=pcbatch.dtype, device='cuda')  # shape: (parent_count)
-            self._offsetP = torch.zeros(parent_count, 3, dtype=pcbatch.dtype, device='cuda')  # (parent_count, 3)
+            self._scaleP = torch.zeros(parent_count, dtype=pcbatch.dtype, device=pcbatch.device)  # shape: (parent_count)
+            self._offsetP = torch.zeros(parent_count, 3, dtype=pcbatch.dtype, device=pcbatch.device)  # (parent_count, 3)
             for i in range(parent_count):
                 rel_point_mask: torch.Tensor = torch.eq(parent_per_point, i)
                 pcount = rel_point_mask.sum()
@@ -52,8 +52,8 @@ class LevelScaler:
                     self._offsetP[i] = torch.tensor([0.0, 0.0, 0.0])
             self._scaleP = self._scaleP.view(parent_count, 1)
         else:
-            self._scaleP = torch.ones(parent_count, 1, dtype=pcbatch.dtype, device='cuda')
-            self._offsetP = torch.zeros(parent_count, 3, dtype=pcbatch.dtype, device='cuda')
+            self._scaleP = torch.ones(parent_count, 1, dtype=pcbatch.dtype, device=pcbatch.device)
+            self._offsetP = torch.zeros(parent_count, 3, dtype=pcbatch.dtype, device=pcbatch.device)
 
     def scale_pc(self, pcbatch: torch.Tensor) -> torch.Tensor:
         # Scales down the given point cloud (1,n,3) according to the scales extracted in set_pointcloud_batch
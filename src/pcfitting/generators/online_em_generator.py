@@ -0,0 +1,290 @@
+from typing import Iterable
+from pcfitting import GMMGenerator, GMLogger, data_loading
+from pcfitting import TerminationCriterion, MaxIterationTerminationCriterion
+import torch
+import gmc.mixture as gm
+import pcfitting.config as general_config
+from .gmm_initializer import GMMInitializer
+from .em_tools import EMTools
+
+
+class OnlineEMGenerator(GMMGenerator):
+    # GMM Generator using stepwise online EM (Cappe and Moulines, "Online EM Algorithm for Latent Data Models", 2009).
+    # Every iteration processes one chunk of points only. The normalized sufficient statistics of the chunk are blended
+    # into the running ones with a decaying step size gamma_t = (t + step_size_offset)^(-step_size_exponent), and the
+    # GM is derived from the running statistics. So the point cloud never has to be in memory as a whole, the points
+    # can be streamed from an iterator of chunks (e.g. data_loading.load_pc_chunks_from_npy).
+    # The statistics are kept as (prior, mean, covariance) per Gaussian and blended like in a parallel variance
+    # computation, which is equivalent to blending T0, T1, T2 but doesn't suffer from cancellation for
+    # large coordinates.
+
+    def __init__(self,
+                 n_gaussians: int,
+                 chunk_size: int = 100000,
+                 termination_criterion: TerminationCriterion = MaxIterationTerminationCriterion(100),
+                 initialization_method: str = 'randnormpos',
+                 step_size_exponent: float = 0.6,
+                 step_size_offset: float = 0.0,
+                 em_step_gaussians_subbatchsize: int = -1,
+                 em_step_points_subbatchsize: int = -1,
+                 dtype: torch.dtype = torch.float32,
+                 eps: float = 1e-7,
+                 eps_is_relative: bool = True,
+                 verbosity: int = 2):
+        # Constructor. Creates a new OnlineEMGenerator.
+        # Parameters:
+        #   n_gaussians: int
+        #       Number of components this Generator should create.
+        #       This should always be set correctly, also when this is used for refining.
+        #   chunk_size: int
+        #       Number of points per iteration. Only used by generate, generate_from_chunks takes the chunks as they are
+        #   termination_criteration: TerminationCriterion
+        #       Defining when to terminate. Default: After 100 Iterations (= chunks).
+        #       The losses given to the termination criterion are the losses of the current chunk, so they are noisy.
+        #       The generation also stops when the chunks run out.
+        #   initialization_method: string
+        #       Defines which initialization to use, it is performed on the first chunk.
+        #       All options from GMMInitializer are available (see EMGenerator)
+        #   step_size_exponent: float
+        #       Decay of the step size, has to be in (0.5, 1] for convergence. 1 averages all chunks equally,
+        #       smaller values forget the early chunks (and the initialization) faster. Default: 0.6
+        #   step_size_offset: float
+        #       Offset of the iteration count in the step size. With 0 (default), the first chunk replaces the
+        #       initialization completely, larger values keep more of the initialization and damp the early steps.
+        #   em_step_gaussian_subbatchsize: int
+        #       How many Gaussian Sub-Mixtures should be processed in the E- and M-Step at once
+        #       -1 means all Gaussians (default)
+        #   em_step_points_subbatchsize: int
+        #       How many points should be processed in the E- and M-Step at once
+        #       -1 means all Points of the chunk (default)
+        #   dtype: torch.dtype
+        #       In which data type (precision) the operations should be performed. Default: torch.float32
+        #   eps: float
+        #       Small value to be added to the covariances' diagonals for numerical stability
+        #   eps_is_relative: bool
+        #       If false, eps is added as is to the covariances. If true (default), this eps is relative
+        #       to the longest side of the bounding box of the first chunk.
+        #       eps_abs = eps_rel * (maxextend^2)
+        #
+        if not 0.5 < step_size_exponent <= 1:
+            raise ValueError("step_size_exponent has to be in (0.5, 1]")
+        self._verbosity = verbosity
+        self._n_gaussians = n_gaussians
+        self._chunk_size = chunk_size
+        self._initialization_method = initialization_method
+        self._termination_criterion = termination_criterion
+        self._step_size_exponent = step_size_exponent
+        self._step_size_offset = step_size_offset
+        self._em_step_gaussians_subbatchsize = em_step_gaussians_subbatchsize
+        self._em_step_points_subbatchsize = em_step_points_subbatchsize
+        self._logger = None
+        self._epsvar = eps
+        if eps < 1e-9:
+            print("Warning! Very small eps! Might cause numerical issues!")
+        self._eps_is_relative = eps_is_relative
+        self._dtype = dtype
+
+    def set_logging(self, logger: GMLogger = None):
+        # Sets logging options
+        # Paramters:
+        #   logger: GMLogger
+        #       GMLogger object to call every iteration
+        #
+        self._logger = logger
+
+    def generate(self, pcbatch: torch.Tensor, gmbatch: torch.Tensor = None) -> (torch.Tensor, torch.Tensor):
+        # Gets a point cloud batch of size [m,n,3]
+        # where m is the batch size and n the point count.
+        # Every iteration samples a chunk of chunk_size points from it.
+        # If the given logger uses a scaler, the point cloud has to be be given downscaled!
+        # It might be given an initial gaussian mixture of
+        # size [m,1,g,10] where m is the batch size and g
+        # the number of Gaussians.
+        # It returns two gaussian mixtures of sizes
+        # [m,1,g,10], the first being a mixture with amplitudes as weights
+        # the second a mixture where the weights describe the priors.
+        def chunks():
+            while True:
+                yield data_loading.sample(pcbatch, self._chunk_size)
+
+        return self.generate_from_chunks(chunks(), gmbatch)
+
+    def generate_from_chunks(self, chunks: Iterable[torch.Tensor], gmbatch: torch.Tensor = None) \
+            -> (torch.Tensor, torch.Tensor):
+        # Like generate, but the points are given as an iterable of chunks of size [m,c,3], where c might differ
+        # between the chunks (e.g. data_loading.load_pc_chunks_from_npy). The chunks should be random samples
+        # of the point clouds, spatially ordered chunks (e.g. of a scan) bias the GM towards the last ones.
+
+        # Initializations
+        self._termination_criterion.reset()
+
+        chunk_iterator = iter(chunks)
+        pcbatch = next(chunk_iterator).to(dtype=self._dtype, device=general_config.device)  # dimension: (bs, nc, 3)
+        batch_size = pcbatch.shape[0]
+
+        assert (pcbatch.shape[1] > self._n_gaussians)
+
+        epsilons = torch.ones(batch_size, dtype=self._dtype, device=general_config.device) * self._epsvar
+        if self._eps_is_relative:
+            extends = pcbatch.max(dim=1)[0] - pcbatch.min(dim=1)[0]
+            epsilons *= extends.max(dim=1)[0] ** 2
+            epsilons[epsilons < 1e-9] = 1e-9
+
+        # eps is a small multiple of the identity matrix which is added to the cov-matrizes
+        # in order to avoid singularities
+        eps = (torch.eye(3, 3, dtype=self._dtype, device=general_config.device)).view(1, 1, 1, 3, 3) \
+            .expand(batch_size, 1, 1, 3, 3) * epsilons.view(-1, 1, 1, 1, 1)
+
+        # running defines which batches are still being trained
+        running = torch.ones(batch_size, dtype=torch.bool)
+
+        # Initialize mixture data on the first chunk
+        if gmbatch is None:
+            initializer = GMMInitializer(self._em_step_gaussians_subbatchsize, self._em_step_points_subbatchsize,
+                                         self._dtype, epsilons)
+            gmbatch_init = initializer.initialize_by_method_name(self._initialization_method, pcbatch,
+                                                                 self._n_gaussians, -1, None, None)
+        else:
+            gmbatch_init = gmbatch
+        gm_data = EMTools.TrainingData(batch_size, self._n_gaussians, self._dtype, eps)
+        gm_data.set_positions(gm.positions(gmbatch_init), running)
+        gm_data.set_covariances(gm.covariances(gmbatch_init), running)
+        if gmbatch is None:
+            gm_data.set_priors(gm.weights(gmbatch_init), running)
+        else:
+            gm_data.set_amplitudes(gm.weights(gmbatch_init), running)
+
+        del epsilons
+
+        # Running statistics: priors (~T0), means (~T1/T0) and covariances without eps (~T2/T0 - mean*mean^T)
+        stat_priors = gm_data.get_priors().clone()
+        stat_positions = gm_data.get_positions().clone()
+        stat_covariances = gm_data.get_covariances().clone()
+
+        iteration = 0
+
+        # last losses. saved so we have losses for gms that are already finished
+        last_losses = torch.ones(batch_size, dtype=self._dtype, device=general_config.device)
+        while True:
+            iteration += 1
+
+            if iteration > 1:
+                pcbatch = next(chunk_iterator, None)
+                if pcbatch is None:
+                    break
+                pcbatch = pcbatch.to(dtype=self._dtype, device=general_config.device)
+            n_chunk_points = pcbatch.shape[1]
+            points_rep = pcbatch.unsqueeze(1).unsqueeze(3).expand(batch_size, 1, n_chunk_points, 1, 3)
+
+            # Expectation: Calculates responsibilities and current losses (of this chunk)
+            responsibilities, losses = EMTools.expectation(points_rep, gm_data, self._n_gaussians, running,
+                                                           self._em_step_gaussians_subbatchsize,
+                                                           self._em_step_points_subbatchsize, last_losses)
+            last_losses = losses
+
+            # Log Loss (before changing the values in the maximization step,
+            # so basically we use the logg of the previous iteration)
+            loss = losses.sum()
+
+            assert not torch.isnan(loss).any()
+            if self._logger:
+                self._logger.log(iteration - 1, losses, gm_data.pack_mixture(), running)
+
+            # If in the previous iteration we already reached the termination criteration, stop now
+            # and do not perform the maximization step
+            running = self._termination_criterion.may_continue(iteration - 1, losses)
+            if not running.any():
+                break
+
+            # Maximization -> blend the statistics of this chunk into the running statistics, update GM-data
+            step_size = (iteration + self._step_size_offset) ** (-self._step_size_exponent)
+            chunk_priors, chunk_positions, chunk_covariances = \
+                self._chunk_statistics(pcbatch, responsibilities, running, stat_positions[running])
+            OnlineEMGenerator.blend_statistics(stat_priors, stat_positions, stat_covariances,
+                                               chunk_priors, chunk_positions, chunk_covariances, step_size, running)
+
+            new_positions = stat_positions[running].clone()
+            new_covariances = stat_covariances[running] + eps[running]
+            new_priors = stat_priors[running]
+            # Gaussians without any responsibilities so far are invalid, as in EMTools.maximization
+            new_positions[new_priors == 0] = torch.tensor([0.0, 0.0, 0.0], dtype=self._dtype,
+                                                          device=general_config.device)
+            new_covariances[new_priors == 0] = torch.eye(3, dtype=self._dtype, device=general_config.device)
+            gm_data.set_positions(new_positions, running)
+            gm_data.set_covariances(new_covariances, running)
+            gm_data.set_priors(new_priors, running)
+
+        # Create final mixtures
+        final_gm = gm_data.pack_mixture()
+        final_gmm = gm_data.pack_mixture_model()
+
+        self.final_nr_iterations = iteration - 1
+
+        # Gaussian-Weights might be set to zero. This prints for how many Gs this is the case
+        n_invalid_gaussians = torch.sum(gm_data.get_priors() == 0).item()
+        if self._verbosity >= 2:
+            print("OnlineEM: # of invalid Gaussians: ", n_invalid_gaussians)
+        elif self._verbosity >= 1 and n_invalid_gaussians > 0:
+            print(f"OnlineEM: {n_invalid_gaussians} invalid Gaussians")
+
+        return final_gm, final_gmm
+
+    def _chunk_statistics(self, points: torch.Tensor, responsibilities: torch.Tensor, running: torch.Tensor,
+                          offsets: torch.Tensor) -> (torch.Tensor, torch.Tensor, torch.Tensor):
+        # Normalized sufficient statistics of one chunk, the M-Step of EMTools.maximization without the update.
+        # They are accumulated by EMTools.dense_statistics (in float64, so large coordinates don't cancel).
+        # Parameters:
+        #   points: torch.Tensor of shape (batch_size, n_points, 3)
+        #   responsibilities: torch.Tensor of shape (batch_size, 1, n_points, n_gaussians)
+        #   running: torch.Tensor of shape (batch_size), dtype=bool
+        #   offsets: torch.Tensor of shape (rbs, 1, n_gaussians, 3)
+        #       The current positions of the running GMs, used for Gaussians without responsibilities
+        # Returns:
+        #   priors: torch.Tensor of shape (rbs, 1, n_gaussians): T0 / n_points
+        #   positions: torch.Tensor of shape (rbs, 1, n_gaussians, 3): T1 / T0 (the offsets, where T0 is zero)
+        #   covariances: torch.Tensor of shape (rbs, 1, n_gaussians, 3, 3): T2 / T0 - mu*mu^T (zero, where T0 is zero)
+        n_points = points.shape[1]
+        n_gaussians = offsets.shape[2]
+        t_0, means, covariances = EMTools.dense_statistics(points, responsibilities, running, n_gaussians,
+                                                           self._em_step_gaussians_subbatchsize,
+                                                           self._em_step_points_subbatchsize)
+        t_0, means, covariances = t_0.to(self._dtype), means.to(self._dtype), covariances.to(self._dtype)
+        invalid = t_0 == 0
+        means[invalid] = offsets[:, 0][invalid]
+        covariances[invalid] = 0
+        return (t_0 / n_points).unsqueeze(1), means.unsqueeze(1), covariances.unsqueeze(1)
+
+    @staticmethod
+    def blend_statistics(priors: torch.Tensor, positions: torch.Tensor, covariances: torch.Tensor,
+                         chunk_priors: torch.Tensor, chunk_positions: torch.Tensor, chunk_covariances: torch.Tensor,
+                         step_size: float, running: torch.Tensor):
+        # Stepwise update s = (1 - step_size) * s + step_size * s_chunk of the normalized sufficient statistics
+        # T0/n, T1/n, T2/n, expressed in priors, positions and covariances (the running statistics are changed).
+        # Both sets of moments are taken about the new position, so nothing is subtracted from a large T2.
+        # Parameters:
+        #   priors, positions, covariances: torch.Tensor of shape (batch_size, 1, n_gaussians(, 3(, 3)))
+        #       Running statistics, updated in place for the running batch entries
+        #   chunk_priors, chunk_positions, chunk_covariances: torch.Tensor of shape (rbs, 1, n_gaussians(, 3(, 3)))
+        #       Statistics of the current chunk (see _chunk_statistics)
+        #   step_size: float
+        #       Weight of the chunk, in (0, 1]
+        #   running: torch.Tensor of shape (batch_size), dtype=bool
+        old_weights = (1 - step_size) * priors[running]
+        new_weights = step_size * chunk_priors
+        new_priors = old_weights + new_weights
+        # Where both are zero, the Gaussian stays invalid
+        safe_priors = torch.where(new_priors > 0, new_priors, torch.ones_like(new_priors))
+        old_factors = (old_weights / safe_priors).unsqueeze(3)
+        new_factors = (new_weights / safe_priors).unsqueeze(3)
+
+        old_positions = positions[running]
+        new_positions = old_factors * old_positions + new_factors * chunk_positions
+        old_deltas = old_positions - new_positions
+        new_deltas = chunk_positions - new_positions
+        new_covariances = \
+            old_factors.unsqueeze(4) * (covariances[running] + old_deltas.unsqueeze(4) * old_deltas.unsqueeze(3)) + \
+            new_factors.unsqueeze(4) * (chunk_covariances + new_deltas.unsqueeze(4) * new_deltas.unsqueeze(3))
+
+        priors[running] = new_priors
+        positions[running] = new_positions
+        covariances[running] = new_covariances
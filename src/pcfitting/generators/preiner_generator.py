@@ -9,6 +9,7 @@ from .em_tools import EMTools
 from .level_scaler import LevelScaler
 import torch
 import gmc.mixture as gm
+import pcfitting.config as general_config
 from gmc import mat_tools
 import math
 import pcfitting.cpp.gmslib.src.pytorch_bindings.compute_mixture as gms
@@ -103,7 +104,7 @@ class PreinerGenerator(GMMGenerator):
         assert (batch_size == 1), "PreinerGenerator currently does not support batchsizes > 1"
         point_count = pcbatch.shape[1]
 
-        gmm = gms.compute_mixture(pcbatch[0], self._params).view(1, 1, -1, 13).cuda()
+        gmm = gms.compute_mixture(pcbatch[0], self._params).view(1, 1, -1, 13).to(general_config.device)
         gma = gm.convert_priors_to_amplitudes(gmm)
 
         if self._logger:
@@ -2,6 +2,7 @@ import os
 import torch
 from queue import SimpleQueue
 from pcfitting import data_loading
+import pcfitting.config as general_config
 import trimesh
 import trimesh.sample
 import math
@@ -77,7 +78,7 @@ class PCDatasetIterator(DatasetIterator):
         # and n is the point count
         # also returns a list of names of the point clouds
         current_batch_size = min(self._batch_size, self._file_queue.qsize())
-        batch = torch.zeros(current_batch_size, self._point_count, 3, device=torch.device("cuda"))
+        batch = torch.zeros(current_batch_size, self._point_count, 3, device=general_config.device)
         names = [None] * current_batch_size
         for i in range(self._batch_size):
             if not self._file_queue.empty():
@@ -11,6 +11,7 @@ import gmc.inout as gmio
 from pcfitting import GMMGenerator, Scaler, PCDatasetIterator, GMLogger, EvalFunction, data_loading
 from pcfitting.generators.em_tools import EMTools
 import pcfitting.pc_dataset_iterator
+import pcfitting.config as general_config
 
 
 def execute_fitting2(training_name: Optional[str], dataset: pcfitting.pc_dataset_iterator.DatasetIterator,
@@ -23,6 +24,8 @@ def execute_fitting2(training_name: Optional[str], dataset: pcfitting.pc_dataset
     # ---- GMM FITTING ----
     if formats is None:
         formats = [".gma.ply"]
+    if general_config.n_threads is not None:
+        torch.set_num_threads(general_config.n_threads)
 
     # Create Dataset Iterator and Scaler
     scaler = Scaler(active=scaling_active, interval=scaling_interval)
@@ -112,9 +115,9 @@ def execute_fitting_on_single_pcbatch(training_name: str, pcbatch: torch.Tensor,
 
     # scaler = None
     scaler = Scaler(active=scaling_active, interval=scaling_interval)
-    scaler.set_pointcloud_batch(pcbatch.cuda())
+    scaler.set_pointcloud_batch(pcbatch.to(general_config.device))
 
-    scaled_pc = scaler.scale_pc(pcbatch.cuda())
+    scaled_pc = scaler.scale_pc(pcbatch.to(general_config.device))
     # scaled_pc = pcbatch
 
     for j in range(len(generators)):
@@ -193,7 +196,7 @@ def execute_evaluation(training_name: str, model_path: Optional[str], pc1_path:
             if not os.path.exists(gm_path):
                 print(name + " / " + gid + ": No GM found")
             else:
-                gm = gmio.read_gm_from_ply(gm_path, ismodel).cuda()
+                gm = gmio.read_gm_from_ply(gm_path, ismodel).to(general_config.device)
                 gm = scaler.scale_gm(gm)
                 # Enlarge EVs
                 if smallest_ev is not None:
@@ -250,7 +253,7 @@ def execute_evaluation_singlepc_severalgm(pc1_path: str, pc2_path: Optional[str]
 
                 # Get GM Path
                 ismodel = gm_path.endswith(".gmm.ply")
-                gm = gmio.read_gm_from_ply(gm_path, ismodel).cuda()
+                gm = gmio.read_gm_from_ply(gm_path, ismodel).to(general_config.device)
                 gm = scaler.scale_gm(gm)
                 # Evaluate using each error function
                 print(gm_path)
@@ -278,7 +281,7 @@ def quick_evaluation(pc_path: str, gm_path: str, mesh_path: str, is_model: bool,
                      scaling_active: bool = False,
                      scaling_interval: Tuple[float, float] = (-50.0, 50.0)):
     # Load pc
-    pc = data_loading.load_pc_from_off(pc_path).cuda()
+    pc = data_loading.load_pc_from_off(pc_path)
 
     # Scale to double size
     # minext = (torch.max(pc[0], dim=0)[0] - torch.min(pc[0], dim=0)[0]).min()
@@ -291,7 +294,7 @@ def quick_evaluation(pc_path: str, gm_path: str, mesh_path: str, is_model: bool,
     pc_scaled = scaler.scale_pc(pc)
 
     # Load gm
-    gm = gmio.read_gm_from_ply(gm_path, is_model).cuda()
+    gm = gmio.read_gm_from_ply(gm_path, is_model).to(general_config.device)
     if is_model:
         gm = mixture.convert_priors_to_amplitudes(gm)
     covariances = mixture.covariances(gm)
@@ -309,8 +312,8 @@ def quick_refine(training_name: str, pc_path: str, gm_in_path: str, gm_in_ismode
                  log_rendering_tb: int = 0, log_gm: int = 0, scaling_active: bool = False,
                  scaling_interval: Tuple[float, float] = (-50.0, 50.0)):
     # Load data
-    pc = data_loading.load_pc_from_off(pc_path).cuda()
-    gm = gmio.read_gm_from_ply(gm_in_path, gm_in_ismodel).cuda()
+    pc = data_loading.load_pc_from_off(pc_path)
+    gm = gmio.read_gm_from_ply(gm_in_path, gm_in_ismodel).to(general_config.device)
 
     # Scale down
     scaler = Scaler(active=scaling_active, interval=scaling_interval)
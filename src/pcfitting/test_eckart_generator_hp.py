@@ -0,0 +1,73 @@
+import unittest
+import torch
+from pcfitting.generators.eckart_generator_hp import EckartGeneratorHP
+from gmc import mat_tools
+import pcfitting.config as general_config
+
+
+class EckartGeneratorHPTest(unittest.TestCase):
+
+    def _level_data(self, n_parents: int, n_children: int) -> EckartGeneratorHP.GMLevelTrainingData:
+        n_gaussians = n_parents * n_children
+        gm_data = EckartGeneratorHP.GMLevelTrainingData(torch.float64)
+        factors = torch.rand(1, 1, n_gaussians, 3, 3, dtype=torch.float64, device=general_config.device) - 0.5
+        gm_data.positions = torch.rand(1, 1, n_gaussians, 3, dtype=torch.float64, device=general_config.device) + 100
+        gm_data.covariances = factors @ factors.transpose(-1, -2) * 0.1 + \
+            torch.eye(3, 3, dtype=torch.float64, device=general_config.device) * 0.01
+        gm_data.inverse_covariances = mat_tools.inverse(gm_data.covariances).contiguous()
+        gm_data.priors = torch.full([1, 1, n_gaussians], 1 / n_children, dtype=torch.float64, device=general_config.device)
+        gm_data.parents = torch.arange(n_parents, device=general_config.device).repeat_interleave(n_children).view(1, 1, -1)
+        gm_data.parentweights = torch.full([1, 1, n_gaussians], 1 / n_parents, dtype=torch.float64,
+                                           device=general_config.device)
+        return gm_data
+
+    def test_sparse_steps_match_dense_steps(self):
+        # the E- and M-Step on the local (sparse) responsibilities give the same result as the previous dense
+        # implementation, which worked on n_points x n_gaussians responsibilities that are 0 outside of each point's parent
+        n_parents = 3
+        n_children = 4
+        n_gaussians = n_parents * n_children
+        n_points = 500
+        torch.manual_seed(0)
+        generator = EckartGeneratorHP(n_children, 2, m_step_points_subbatchsize=128, dtype=torch.float64)
+        gm_data = self._level_data(n_parents, n_children)
+        old_positions = gm_data.positions.clone()
+        points = torch.rand(1, 1, n_points, 1, 3, dtype=torch.float64, device=general_config.device) + 100
+        parent_per_point = torch.randint(0, n_parents, [1, n_points], device=general_config.device)
+        eps = (torch.eye(3, 3, dtype=torch.float64, device=general_config.device) * 1e-7).view(1, 1, 1, 3, 3)
+
+        responsibilities, responsibility_indices = generator._expectation(points, gm_data, parent_per_point)
+
+        # dense E-Step: all Gaussians, restricted to the children of the parent of each point
+        x = points[0, 0, :, 0]
+        relative = x.unsqueeze(1) - gm_data.positions[0, 0].unsqueeze(0)
+        likelihood_log = torch.log(gm_data.calculate_amplitudes()[0, 0]).unsqueeze(0) - \
+            0.5 * torch.einsum('pgi,gij,pgj->pg', relative, gm_data.inverse_covariances[0, 0], relative)
+        children = gm_data.parents.view(1, -1).eq(parent_per_point.view(-1, 1))
+        likelihood_log[~children] = -float('inf')
+        dense = torch.exp(likelihood_log - torch.logsumexp(likelihood_log, dim=1, keepdim=True))
+        sparse = torch.zeros(n_points, n_gaussians, dtype=torch.float64, device=general_config.device)\
+            .scatter_(1, responsibility_indices[0, 0], responsibilities[0, 0])
+        self.assertLess((sparse - dense).abs().max().item(), 1e-10)
+
+        generator._maximization(points, responsibilities, responsibility_indices, gm_data, eps)
+
+        # dense M-Step
+        t_0 = dense.sum(dim=0)
+        positions = (dense.unsqueeze(2) * x.unsqueeze(1)).sum(dim=0) / t_0.unsqueeze(1)
+        relative = x.unsqueeze(1) - positions.unsqueeze(0)
+        covariances = torch.einsum('pg,pgi,pgj->gij', dense, relative, relative) / t_0.view(-1, 1, 1) + eps[0, 0]
+        priors = t_0 / t_0.view(n_parents, n_children).sum(dim=1).repeat_interleave(n_children)
+
+        self.assertFalse(gm_data.positions.eq(old_positions).all())
+        self.assertLess((gm_data.positions[0, 0] - positions).abs().max().item(), 1e-10)
+        self.assertLess((gm_data.covariances[0, 0] - covariances).abs().max().item(), 1e-10)
+        self.assertLess((gm_data.priors[0, 0] - priors).abs().max().item(), 1e-10)
+
+    def test_deprecated_gaussians_subbatchsize(self):
+        with self.assertWarns(DeprecationWarning):
+            EckartGeneratorHP(4, 2, m_step_gaussians_subbatchsize=16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,271 @@
+import unittest
+import torch
+from gmc.cpp.extensions import loader
+import gmc.cpp.extensions.em_expectation.binding as cpp_em_expectation
+from pcfitting.generators.em_tools import EMTools
+import pcfitting.config as general_config
+
+
+class EMToolsTest(unittest.TestCase):
+
+    def _training_data(self, batch_size: int, n_gaussians: int, noise: bool) -> EMTools.TrainingData:
+        eps = (torch.eye(3, 3, dtype=torch.float64, device=general_config.device) * 1e-7).view(1, 1, 1, 3, 3)\
+            .expand(batch_size, 1, 1, 3, 3)
+        gm_data = EMTools.TrainingData(batch_size, n_gaussians, torch.float64, eps)
+        running = torch.ones(batch_size, dtype=torch.bool)
+        factors = torch.rand(batch_size, 1, n_gaussians, 3, 3, dtype=torch.float64, device=general_config.device) - 0.5
+        covariances = factors @ factors.transpose(-1, -2) * 0.1 + \
+            torch.eye(3, 3, dtype=torch.float64, device=general_config.device) * 0.01
+        priors = torch.rand(batch_size, 1, n_gaussians, dtype=torch.float64, device=general_config.device)
+        gm_data.set_positions(torch.rand(batch_size, 1, n_gaussians, 3, dtype=torch.float64, device=general_config.device),
+                              running)
+        gm_data.set_covariances(covariances, running)
+        gm_data.set_priors(priors / priors.sum(dim=2, keepdim=True) * (0.9 if noise else 1.0), running)
+        if noise:
+            gm_data.set_noise(torch.full([batch_size], 0.1, dtype=torch.float64, device=general_config.device),
+                              torch.full([batch_size], 0.5, dtype=torch.float64, device=general_config.device))
+        return gm_data
+
+    def _test_fused_against_dense(self, noise: bool):
+        batch_size = 3
+        n_gaussians = 17
+        n_points = 300
+        gm_data = self._training_data(batch_size, n_gaussians, noise)
+        points = torch.rand(batch_size, 1, n_points, 1, 3, dtype=torch.float64, device=general_config.device)
+        # the second point cloud is finished, its responsibilities must be zero and its loss must be kept
+        running = torch.tensor([True, False, True])
+        last_losses = torch.full([batch_size], 7.0, dtype=torch.float64, device=general_config.device)
+
+        fused = general_config.fused_expectation
+        try:
+            general_config.fused_expectation = False
+            responsibilities, losses = EMTools.expectation(points, gm_data, n_gaussians, running, 5, 64,
+                                                           last_losses.clone())
+            general_config.fused_expectation = True
+            fused_responsibilities, fused_losses = EMTools.expectation(points, gm_data, n_gaussians, running, 5, 64,
+                                                                       last_losses.clone())
+        finally:
+            general_config.fused_expectation = fused
+
+        self.assertEqual(fused_responsibilities.shape, (batch_size, 1, n_points, n_gaussians + noise))
+        self.assertLess((fused_responsibilities - responsibilities).abs().max().item(), 1e-10)
+        self.assertLess((fused_losses - losses).abs().max().item(), 1e-10)
+        self.assertEqual(fused_responsibilities[1].abs().max().item(), 0)
+        self.assertEqual(fused_losses[1].item(), 7.0)
+        self.assertLess((fused_responsibilities[running].sum(dim=3) - 1).abs().max().item(), 1e-10)
+
+    def test_fused_expectation(self):
+        self._test_fused_against_dense(noise=False)
+
+    def test_fused_expectation_with_noise(self):
+        self._test_fused_against_dense(noise=True)
+
+    def test_fused_expectation_degenerate_covariance(self):
+        # a flat Gaussian whose smallest eigenvalue was rounded below zero has a negative determinant and a nan log amplitude.
+        # set_covariances would reject it, so it is written directly. the fused kernel must not skip the nan, but poison the point cloud as logsumexp does
+        batch_size = 3
+        n_gaussians = 17
+        gm_data = self._training_data(batch_size, n_gaussians, False)
+        running = torch.ones(batch_size, dtype=torch.bool)
+        gm_data._covariances[0, 0, 5] = torch.diag(torch.tensor([0.01, 0.01, -1e-15], dtype=torch.float64, device=general_config.device))
+        gm_data.set_priors(gm_data.get_priors()[running], running)
+        self.assertTrue(gm_data.get_logarithmized_amplitudes()[0, 0, 5].isnan().item())
+        points = torch.rand(batch_size, 1, 200, 1, 3, dtype=torch.float64, device=general_config.device)
+
+        fused = general_config.fused_expectation
+        try:
+            general_config.fused_expectation = False
+            responsibilities, losses = EMTools.expectation(points, gm_data, n_gaussians, running)
+            general_config.fused_expectation = True
+            fused_responsibilities, fused_losses = EMTools.expectation(points, gm_data, n_gaussians, running)
+        finally:
+            general_config.fused_expectation = fused
+
+        self.assertTrue(losses[0].isnan().item())
+        self.assertTrue(fused_losses[0].isnan().item())
+        self.assertTrue(fused_responsibilities[0].isnan().all().item())
+        self.assertTrue(fused_responsibilities.isnan().eq(responsibilities.isnan()).all().item())
+        self.assertLess((fused_responsibilities[1:] - responsibilities[1:]).abs().max().item(), 1e-10)
+        self.assertLess((fused_losses[1:] - losses[1:]).abs().max().item(), 1e-10)
+
+    def test_fused_expectation_fallback(self):
+        # an extension that failed to load selects the dense implementation instead of raising
+        batch_size = 2
+        n_gaussians = 9
+        gm_data = self._training_data(batch_size, n_gaussians, False)
+        points = torch.rand(batch_size, 1, 100, 1, 3, dtype=torch.float64, device=general_config.device)
+        running = torch.ones(batch_size, dtype=torch.bool)
+
+        fused = general_config.fused_expectation
+        binding = cpp_em_expectation.cpp_binding
+        try:
+            general_config.fused_expectation = False
+            responsibilities, losses = EMTools.expectation(points, gm_data, n_gaussians, running)
+            general_config.fused_expectation = True
+            cpp_em_expectation.cpp_binding = loader.LazyExtension('em_expectation')
+            cpp_em_expectation.cpp_binding.error = RuntimeError("no compiler")
+            fallback_responsibilities, fallback_losses = EMTools.expectation(points, gm_data, n_gaussians, running)
+        finally:
+            general_config.fused_expectation = fused
+            cpp_em_expectation.cpp_binding = binding
+
+        self.assertEqual((fallback_responsibilities - responsibilities).abs().max().item(), 0)
+        self.assertEqual((fallback_losses - losses).abs().max().item(), 0)
+
+    def test_maximization(self):
+        batch_size = 3
+        n_gaussians = 17
+        n_points = 300
+        gm_data = self._training_data(batch_size, n_gaussians, noise=False)
+        old_positions = gm_data.get_positions().clone()
+        # far from the origin, the covariances are computed from the centered points
+        points = torch.rand(batch_size, 1, n_points, 1, 3, dtype=torch.float64, device=general_config.device) + 100
+        responsibilities = torch.rand(batch_size, 1, n_points, n_gaussians, dtype=torch.float64,
+                                      device=general_config.device)
+        responsibilities /= responsibilities.sum(dim=3, keepdim=True)
+        running = torch.tensor([True, False, True])
+        eps = (torch.eye(3, 3, dtype=torch.float64, device=general_config.device) * 1e-7).view(1, 1, 1, 3, 3)\
+            .expand(batch_size, 1, 1, 3, 3)
+
+        EMTools.maximization(points.expand(batch_size, 1, n_points, n_gaussians, 3), responsibilities, gm_data, running,
+                             eps, 5, 64)
+
+        r = responsibilities[:, 0]
+        x = points[:, 0, :, 0]
+        t_0 = r.sum(dim=1)
+        positions = torch.einsum('bpg,bpd->bgd', r, x) / t_0.unsqueeze(2)
+        relative = x.unsqueeze(2) - positions.unsqueeze(1)
+        covariances = torch.einsum('bpg,bpgd,bpge->bgde', r, relative, relative) / t_0.unsqueeze(2).unsqueeze(3) + eps[:, 0]
+
+        self.assertLess((gm_data.get_priors()[running, 0] - t_0[running] / n_points).abs().max().item(), 1e-10)
+        self.assertLess((gm_data.get_positions()[running, 0] - positions[running]).abs().max().item(), 1e-10)
+        self.assertLess((gm_data.get_covariances()[running, 0] - covariances[running]).abs().max().item(), 1e-10)
+        self.assertTrue(gm_data.get_positions()[1].eq(old_positions[1]).all())
+
+    def test_maximization_float32_far_cluster(self):
+        # a thin cluster far from the mean of the point cloud: T2/T0 - mu*mu^T cancels if accumulated in float32
+        n_points = 2000
+        torch.manual_seed(0)
+        thin = torch.randn(n_points // 2, 3, dtype=torch.float64, device=general_config.device) * 0.01 + 1000
+        broad = torch.randn(n_points // 2, 3, dtype=torch.float64, device=general_config.device)
+        points = torch.cat((thin, broad)).view(1, 1, n_points, 1, 3)
+        responsibilities = torch.zeros(1, 1, n_points, 2, dtype=torch.float64, device=general_config.device)
+        responsibilities[0, 0, :n_points // 2, 0] = 1
+        responsibilities[0, 0, n_points // 2:, 1] = 1
+        running = torch.ones(1, dtype=torch.bool)
+        eps = torch.zeros(1, 1, 1, 3, 3, dtype=torch.float32, device=general_config.device)
+        gm_data = EMTools.TrainingData(1, 2, torch.float32, eps)
+        gm_data.set_positions(torch.zeros(1, 1, 2, 3, device=general_config.device), running)
+        gm_data.set_covariances(torch.eye(3, 3, device=general_config.device).expand(1, 1, 2, 3, 3), running)
+        gm_data.set_priors(torch.full([1, 1, 2], 0.5, device=general_config.device), running)
+
+        EMTools.maximization(points.float().expand(1, 1, n_points, 2, 3), responsibilities.float(), gm_data, running, eps)
+
+        # reference from the float32 points, computed in float64
+        thin = points.float().double()[0, 0, :n_points // 2, 0]
+        relative = thin - thin.mean(dim=0)
+        covariance = relative.t() @ relative / (n_points // 2)
+        self.assertEqual(gm_data.get_covariances().dtype, torch.float32)
+        self.assertLess((gm_data.get_covariances()[0, 0, 0].double() - covariance).abs().max().item(),
+                        1e-3 * covariance.diagonal().min().item())
+
+    def test_sparse_expectation(self):
+        batch_size = 3
+        n_gaussians = 17
+        n_points = 300
+        gm_data = self._training_data(batch_size, n_gaussians, noise=False)
+        points = torch.rand(batch_size, 1, n_points, 1, 3, dtype=torch.float64, device=general_config.device)
+        running = torch.tensor([True, False, True])
+        responsibilities, losses = EMTools.expectation(points, gm_data, n_gaussians, running)
+
+        # with all Gaussians kept, the sparse responsibilities are the dense ones
+        values, indices, sparse_losses = EMTools.expectation_sparse(points, gm_data, n_gaussians, running, n_gaussians,
+                                                                    em_points_subbatchsize=64, sigma_cutoff=None)
+        dense = torch.zeros_like(responsibilities).scatter_(3, indices, values)
+        self.assertLess((dense - responsibilities).abs().max().item(), 1e-10)
+        self.assertLess((sparse_losses - losses).abs().max().item(), 1e-10)
+
+        # truncated: renormalized top 3 in descending order, the losses are still exact
+        values, indices, sparse_losses = EMTools.expectation_sparse(points, gm_data, n_gaussians, running, 3,
+                                                                    sigma_cutoff=None)
+        self.assertEqual(values.shape, (batch_size, 1, n_points, 3))
+        self.assertLess((values[running].sum(dim=3) - 1).abs().max().item(), 1e-10)
+        self.assertTrue(values[running][..., :-1].ge(values[running][..., 1:]).all())
+        self.assertTrue(indices[running].eq(responsibilities[running].topk(3, dim=3)[1]).all())
+        self.assertEqual(values[1].abs().max().item(), 0)
+        self.assertLess((sparse_losses - losses).abs().max().item(), 1e-10)
+
+    def test_sparse_expectation_candidate_grid(self):
+        # 64 small, well separated clusters on a regular grid, one Gaussian each: the candidate search visits only a few Gaussians per
+        # point and gives the same top 3 as the exhaustive search
+        batch_size = 2
+        n_gaussians = 64
+        n_points = 1000
+        centers = torch.stack(torch.meshgrid(*[torch.arange(4, dtype=torch.float64) * 2] * 3), dim=-1).view(1, 1, -1, 3)\
+            .to(general_config.device).expand(batch_size, 1, n_gaussians, 3)
+        running = torch.ones(batch_size, dtype=torch.bool)
+        eps = (torch.eye(3, 3, dtype=torch.float64, device=general_config.device) * 1e-7).view(1, 1, 1, 3, 3)\
+            .expand(batch_size, 1, 1, 3, 3)
+        gm_data = EMTools.TrainingData(batch_size, n_gaussians, torch.float64, eps)
+        gm_data.set_positions(centers, running)
+        gm_data.set_covariances(torch.eye(3, 3, dtype=torch.float64, device=general_config.device)
+                                .expand(batch_size, 1, n_gaussians, 3, 3) * 0.01, running)
+        gm_data.set_priors(torch.full([batch_size, 1, n_gaussians], 1 / n_gaussians, dtype=torch.float64,
+                                      device=general_config.device), running)
+        assignment = torch.randint(0, n_gaussians, [batch_size, n_points], device=general_config.device)
+        points = centers[:, 0].gather(1, assignment.unsqueeze(2).expand(batch_size, n_points, 3)) + \
+            torch.randn(batch_size, n_points, 3, dtype=torch.float64, device=general_config.device) * 0.1
+        # one point far outside of all bounding boxes, in a grid cell without candidates
+        points[0, 0] = torch.tensor([10.0, 10.0, 10.0])
+        points = points.view(batch_size, 1, n_points, 1, 3)
+
+        grid = EMTools.candidate_grid(points[:, 0, :, 0], gm_data.get_positions()[:, 0], gm_data.get_covariances()[:, 0],
+                                      5.0)
+        candidates, valid = EMTools.grid_candidates(grid, points[:, 0, :, 0])
+        self.assertLess(candidates.shape[2], n_gaussians / 4)
+
+        values, indices, losses = EMTools.expectation_sparse(points, gm_data, n_gaussians, running, 3,
+                                                             em_points_subbatchsize=300, sigma_cutoff=None)
+        grid_values, grid_indices, grid_losses = EMTools.expectation_sparse(points, gm_data, n_gaussians, running, 3,
+                                                                            em_points_subbatchsize=300)
+        self.assertTrue(grid_indices[..., 0].eq(indices[..., 0]).all())
+        self.assertLess((grid_values - values).abs().max().item(), 1e-6)
+        self.assertLess((grid_losses - losses).abs().max().item(), 1e-6)
+        self.assertTrue(EMTools.grid_candidate_counts(grid, points[:, 0, :, 0]).eq(valid.sum(dim=2)).all())
+
+        # a budget below one subbatch of 300 points shrinks the subbatches, the result doesn't change
+        budget_values, budget_indices, budget_losses = EMTools.expectation_sparse(
+            points, gm_data, n_gaussians, running, 3, em_points_subbatchsize=300,
+            max_candidate_pairs=batch_size * 50 * candidates.shape[2])
+        self.assertTrue(budget_indices.eq(grid_indices).all())
+        self.assertLess((budget_values - grid_values).abs().max().item(), 1e-10)
+        self.assertLess((budget_losses - grid_losses).abs().max().item(), 1e-10)
+
+    def test_sparse_maximization(self):
+        batch_size = 3
+        n_gaussians = 17
+        n_points = 300
+        points = torch.rand(batch_size, 1, n_points, 1, 3, dtype=torch.float64, device=general_config.device) + 100
+        running = torch.tensor([True, False, True])
+        eps = (torch.eye(3, 3, dtype=torch.float64, device=general_config.device) * 1e-7).view(1, 1, 1, 3, 3)\
+            .expand(batch_size, 1, 1, 3, 3)
+        torch.manual_seed(0)
+        gm_data = self._training_data(batch_size, n_gaussians, noise=False)
+        torch.manual_seed(0)
+        sparse_gm_data = self._training_data(batch_size, n_gaussians, noise=False)
+
+        values, indices, _ = EMTools.expectation_sparse(points, gm_data, n_gaussians, running, n_gaussians,
+                                                        sigma_cutoff=None)
+        responsibilities = torch.zeros(batch_size, 1, n_points, n_gaussians, dtype=torch.float64,
+                                       device=general_config.device).scatter_(3, indices, values)
+        EMTools.maximization(points.expand(batch_size, 1, n_points, n_gaussians, 3), responsibilities, gm_data,
+                             running, eps)
+        EMTools.maximization_sparse(points, values, indices, sparse_gm_data, running, eps, 64)
+
+        self.assertLess((sparse_gm_data.get_priors() - gm_data.get_priors()).abs().max().item(), 1e-10)
+        self.assertLess((sparse_gm_data.get_positions() - gm_data.get_positions()).abs().max().item(), 1e-10)
+        self.assertLess((sparse_gm_data.get_covariances() - gm_data.get_covariances()).abs().max().item(), 1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
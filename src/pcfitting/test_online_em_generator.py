@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+import numpy
+import torch
+import gmc.mixture as gm
+from pcfitting import MaxIterationTerminationCriterion, data_loading
+from pcfitting.generators.online_em_generator import OnlineEMGenerator
+import pcfitting.config as general_config
+
+
+class OnlineEMGeneratorTest(unittest.TestCase):
+
+    def test_blend_statistics(self):
+        # blending the statistics of two equally sized chunks with step size 0.5 gives the statistics of both chunks
+        batch_size = 2
+        n_gaussians = 7
+        n_points = 200
+        generator = OnlineEMGenerator(n_gaussians, dtype=torch.float64)
+        running = torch.ones(batch_size, dtype=torch.bool)
+        points = torch.rand(batch_size, 2 * n_points, 3, dtype=torch.float64, device=general_config.device) * 10 + 1000
+        responsibilities = torch.rand(batch_size, 1, 2 * n_points, n_gaussians, dtype=torch.float64,
+                                      device=general_config.device)
+        responsibilities /= responsibilities.sum(dim=3, keepdim=True)
+        offsets = points[:, 0:n_gaussians].unsqueeze(1)
+
+        priors, positions, covariances = generator._chunk_statistics(points[:, :n_points],
+                                                                     responsibilities[:, :, :n_points], running,
+                                                                     offsets)
+        chunk_priors, chunk_positions, chunk_covariances = \
+            generator._chunk_statistics(points[:, n_points:], responsibilities[:, :, n_points:], running, offsets)
+        OnlineEMGenerator.blend_statistics(priors, positions, covariances,
+                                           chunk_priors, chunk_positions, chunk_covariances, 0.5, running)
+        all_priors, all_positions, all_covariances = generator._chunk_statistics(points, responsibilities,
+                                                                                    running, offsets)
+
+        self.assertLess((priors - all_priors).abs().max().item(), 1e-12)
+        self.assertLess((positions - all_positions).abs().max().item(), 1e-9)
+        self.assertLess((covariances - all_covariances).abs().max().item(), 1e-9)
+
+    def test_generate_from_npy_chunks(self):
+        # streams a point cloud of four clusters far from the origin from a .npy file
+        n_gaussians = 4
+        centers = numpy.array([[0, 0, 0], [4, 0, 0], [0, 4, 0], [0, 0, 4]], dtype=numpy.float32) + 1000
+        points = numpy.random.default_rng(0).normal(scale=0.2, size=(4, 2500, 3)).astype(numpy.float32)
+        points = (points + centers.reshape(4, 1, 3)).reshape(-1, 3)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "clusters.npy")
+            numpy.save(path, points)
+            generator = OnlineEMGenerator(n_gaussians, termination_criterion=MaxIterationTerminationCriterion(30))
+            gmbatch, gmmbatch = generator.generate_from_chunks(data_loading.load_pc_chunks_from_npy(path, 1000))
+
+        self.assertEqual(generator.final_nr_iterations, 30)
+        self.assertEqual(tuple(gmmbatch.shape), (1, 1, n_gaussians, 13))
+        self.assertTrue(torch.isfinite(gmmbatch).all())
+        self.assertAlmostEqual(gm.weights(gmmbatch).sum().item(), 1, places=4)
+        positions = gm.positions(gmmbatch).view(-1, 3).cpu().numpy()
+        self.assertTrue(((positions > 999) & (positions < 1005)).all())
+        self.assertTrue((gm.covariances(gmmbatch).det() > 0).all())
+
+    def test_invalid_step_size_exponent(self):
+        with self.assertRaises(ValueError):
+            OnlineEMGenerator(8, step_size_exponent=0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ import torch
 from gmc import mixture
 from pcfitting import Scaler, ScalingMethod
 from pcfitting.generators.level_scaler import LevelScaler
+import pcfitting.config as general_config
 
 
 class ScalerTest(unittest.TestCase):
@@ -20,24 +21,24 @@ class ScalerTest(unittest.TestCase):
             [1.0, 0.5, 0.3],
             [0.8, 1.0, 0.7],
             [0.2, 0.0, 0.0]
-        ]], device='cuda')
+        ]], device=general_config.device)
         gmpositions = torch.tensor([[
             [1.0, 2.0, 3.0],
             [11.0, 22.0, 33.0]
         ], [
             [0.0, 0.0, 0.0],
             [0.5, 0.5, 0.5]
-        ]], device='cuda').view(2, 1, 2, 3)
+        ]], device=general_config.device).view(2, 1, 2, 3)
         gmcovariances = torch.tensor([[
             [[0.4, 0.3, 0.2], [0.3, 0.6, 0.1], [0.2, 0.1, 0.9]],
             [[1.2, 0.3, 0.2], [0.3, 2.2, 0.1], [0.2, 0.1, 3.3]]
         ], [
             [[0.4, 0.3, 0.2], [0.3, 0.6, 0.1], [0.2, 0.1, 0.9]],
             [[1.2, 0.3, 0.2], [0.3, 2.2, 0.1], [0.2, 0.1, 3.3]]
-        ]], device='cuda').view(2, 1, 2, 3, 3)
+        ]], device=general_config.device).view(2, 1, 2, 3, 3)
         assert(gmcovariances.det().gt(0).all())
         assert(gmcovariances[:, :, 0:2, 0:2].gt(0).all())
-        gmpriors = torch.tensor([[[0.4, 0.6]], [[0.5, 0.5]]], device='cuda')
+        gmpriors = torch.tensor([[[0.4, 0.6]], [[0.5, 0.5]]], device=general_config.device)
         gmamplitudes = gmpriors / (gmcovariances.det().sqrt() * 15.74960995)
         self._gm = mixture.pack_mixture(gmamplitudes, gmpositions, gmcovariances)
         self._gmm = mixture.pack_mixture(gmpriors, gmpositions, gmcovariances)
@@ -79,7 +80,7 @@ class ScalerTest(unittest.TestCase):
             [1.0, 0.5, 0.3],
             [0.8, 1.0, 0.7],
             [0.2, 0.0, 0.0]
-        ]], device='cuda')
+        ]], device=general_config.device)
         self.assertTrue(torch.allclose(scaledpc, scaledpc_should))
         self.assertTrue(torch.allclose(unscaledpc, self._points))
         # Test GM
@@ -91,14 +92,14 @@ class ScalerTest(unittest.TestCase):
         ], [
             [0.0, 0.0, 0.0],
             [0.5, 0.5, 0.5]
-        ]], device='cuda').view(2, 1, 2, 3)
+        ]], device=general_config.device).view(2, 1, 2, 3)
         gmref_cov = torch.tensor([[
             [[0.004, 0.003, 0.002], [0.003, 0.006, 0.001], [0.002, 0.001, 0.009]],
             [[0.012, 0.003, 0.002], [0.003, 0.022, 0.001], [0.002, 0.001, 0.033]]
         ], [
             [[0.4, 0.3, 0.2], [0.3, 0.6, 0.1], [0.2, 0.1, 0.9]],
             [[1.2, 0.3, 0.2], [0.3, 2.2, 0.1], [0.2, 0.1, 3.3]]
-        ]], device='cuda').view(2, 1, 2, 3, 3)
+        ]], device=general_config.device).view(2, 1, 2, 3, 3)
         gmref_amp = mixture.weights(self._gmm) / (gmref_cov.det().sqrt() * 15.74960995)
         gmref = mixture.pack_mixture(gmref_amp, gmref_pos, gmref_cov)
         self.assertTrue(torch.allclose(gmref, scaledgm))
@@ -128,7 +129,7 @@ class ScalerTest(unittest.TestCase):
             [10.0, 0.0, -4.0],
             [6.0, 10.0, 4.0],
             [-6.0, -10.0, -10.0]
-        ]], device='cuda')
+        ]], device=general_config.device)
         self.assertTrue(torch.allclose(scaledpc, scaledpc_should))
         self.assertTrue(torch.allclose(unscaledpc, self._points))
         # Test GM
@@ -140,14 +141,14 @@ class ScalerTest(unittest.TestCase):
         ], [
             [-10.0, -10.0, -10.0],
             [0.0, 0.0, 0.0]
-        ]], device='cuda').view(2, 1, 2, 3)
+        ]], device=general_config.device).view(2, 1, 2, 3)
         gmref_cov = torch.tensor([[
             [[0.4, 0.3, 0.2], [0.3, 0.6, 0.1], [0.2, 0.1, 0.9]],
             [[1.2, 0.3, 0.2], [0.3, 2.2, 0.1], [0.2, 0.1, 3.3]]
         ], [
             [[160.0, 120.0, 80.0], [120.0, 240.0, 40.0], [80.0, 40.0, 360.0]],
             [[480.0, 120.0, 80.0], [120.0, 880.0, 40.0], [80.0, 40.0, 1320.0]]
-        ]], device='cuda').view(2, 1, 2, 3, 3)
+        ]], device=general_config.device).view(2, 1, 2, 3, 3)
         gmref_cov[0] /= (1.5 ** 2)
         gmref_amp = mixture.weights(self._gmm) / (gmref_cov.det().sqrt() * 15.74960995)
         gmref = mixture.pack_mixture(gmref_amp, gmref_pos, gmref_cov)
@@ -168,7 +169,7 @@ class ScalerTest(unittest.TestCase):
             [1.9, 2.9, 3.0],
             [0.9, 2.4, 2.5],
             [9.9, 9.8, 9.7]
-        ]]).cuda()
+        ]]).to(general_config.device)
         parent_per_point = torch.tensor([[0, 0, 0, 1, 1, 2]])
         scaler = LevelScaler(active=False)
         scaler.set_pointcloud(pcbatch, parent_per_point, 3)
@@ -185,9 +186,9 @@ class ScalerTest(unittest.TestCase):
             [0.0, 0.0, 0.0],
             [1.0, 0.0, 0.0],
             [1.0, 1.0, 1.0],
-        ]]]).cuda()
-        gmcovariances = torch.eye(3, 3).view(1, 1, 1, 3, 3).expand(1, 1, 9, 3, 3).cuda()
-        gmweights = torch.zeros(1, 1, 9).cuda()
+        ]]]).to(general_config.device)
+        gmcovariances = torch.eye(3, 3).view(1, 1, 1, 3, 3).expand(1, 1, 9, 3, 3).to(general_config.device)
+        gmweights = torch.zeros(1, 1, 9).to(general_config.device)
         gmweights[:, :, :] = 1 / 3.0
 
         gmwn, gmpn, gmcn = scaler.unscale_gmm_wpc(gmweights, gmpositions, gmcovariances)
@@ -203,7 +204,7 @@ class ScalerTest(unittest.TestCase):
             [1.9, 2.9, 3.0],
             [0.9, 2.4, 2.5],
             [9.9, 9.8, 9.7]
-        ]]).cuda()
+        ]]).to(general_config.device)
         parent_per_point = torch.tensor([[0, 0, 0, 1, 1, 2]])
         scaler = LevelScaler(active=True, interval=(0.0, 1.0))
         scaler.set_pointcloud(pcbatch, parent_per_point, 4)
@@ -215,7 +216,7 @@ class ScalerTest(unittest.TestCase):
             [1, 0.5, 0.5],
             [0, 0, 0],
             [0.0, 0.0, 0.0]
-        ]], device='cuda')
+        ]], device=general_config.device)
         self.assertTrue(torch.allclose(scaled_pc, scaled_pc_should))
 
         gmpositions = torch.tensor([[[
@@ -235,9 +236,9 @@ class ScalerTest(unittest.TestCase):
             [1.0, 0.0, 0.0],
             [1.0, 1.0, 1.0],
             [1.0, 1.0, 1.0],
-        ]]]).cuda()
-        gmcovariances = torch.eye(3, 3).view(1, 1, 1, 3, 3).expand(1, 1, 16, 3, 3).cuda()
-        gmweights = torch.zeros(1, 1, 16).cuda()
+        ]]]).to(general_config.device)
+        gmcovariances = torch.eye(3, 3).view(1, 1, 1, 3, 3).expand(1, 1, 16, 3, 3).to(general_config.device)
+        gmweights = torch.zeros(1, 1, 16).to(general_config.device)
         gmweights[:, :, :] = 1 / 4.0
 
         gmwn, gmpn, gmcn = scaler.unscale_gmm_wpc(gmweights, gmpositions, gmcovariances)
@@ -258,7 +259,7 @@ class ScalerTest(unittest.TestCase):
             [1.0, 0.0, 0.0],
             [1.0, 1.0, 1.0],
             [1.0, 1.0, 1.0]
-        ]]], device='cuda')
+        ]]], device=general_config.device)
         gmcn_should = gmcovariances.clone()
         gmcn_should[0, 0, 0:4] *= (2.6**2)
         self.assertTrue(torch.allclose(gmpn, gmpn_should))
@@ -273,7 +274,7 @@ class ScalerTest(unittest.TestCase):
             [1.9, 2.9, 3.0],
             [0.9, 2.4, 2.5],
             [9.9, 9.8, 9.7]
-        ]]).cuda()
+        ]]).to(general_config.device)
         parent_per_point = torch.tensor([[0, 0, 0, 1, 1, 2]])
         scaler = LevelScaler(active=True, interval=(-2.0, 0.0))
         scaler.set_pointcloud(pcbatch, parent_per_point, 3)
@@ -285,7 +286,7 @@ class ScalerTest(unittest.TestCase):
             [1, 0.5, 0.5],
             [0, 0, 0],
             [0.0, 0.0, 0.0]
-        ]], device='cuda') * 2 - 2
+        ]], device=general_config.device) * 2 - 2
         self.assertTrue(torch.allclose(scaled_pc, scaled_pc_should))
 
         gmpositions = torch.tensor([[[
@@ -298,9 +299,9 @@ class ScalerTest(unittest.TestCase):
             [0.0, 0.0, 0.0],
             [1.0, 0.0, 0.0],
             [1.0, 1.0, 1.0],
-        ]]]).cuda() * 2 - 2
-        gmcovariances = torch.eye(3, 3).view(1, 1, 1, 3, 3).expand(1, 1, 9, 3, 3).cuda()
-        gmweights = torch.zeros(1, 1, 9).cuda()
+        ]]]).to(general_config.device) * 2 - 2
+        gmcovariances = torch.eye(3, 3).view(1, 1, 1, 3, 3).expand(1, 1, 9, 3, 3).to(general_config.device)
+        gmweights = torch.zeros(1, 1, 9).to(general_config.device)
         gmweights[:, :, :] = 1 / 3.0
 
         gmwn, gmpn, gmcn = scaler.unscale_gmm_wpc(gmweights, gmpositions, gmcovariances)
@@ -314,7 +315,7 @@ class ScalerTest(unittest.TestCase):
             [9.9, 9.8, 9.7],
             [11.9, 9.8, 9.7],
             [11.9, 11.8, 11.7]
-        ]]], device='cuda')
+        ]]], device=general_config.device)
         gmcn_should = gmcovariances.clone()
         gmcn_should[0, 0, 0:3] *= (1.3 ** 2)
         gmcn_should[0, 0, 3:6] *= (0.5 ** 2)
@@ -0,0 +1,54 @@
+"""
+Ahead of time build of the gmc C++ / CUDA extensions.
+
+    python setup.py build_ext --inplace     # prebuilt extensions in gmc/cpp/extensions/prebuilt
+    pip wheel --no-deps .                   # wheel with the prebuilt extensions
+
+gmc.cpp.extensions.loader imports the prebuilt binaries if their build key matches the current sources and flags,
+and falls back to JIT compilation into its cache otherwise. The wheel contains no C++ sources, there the key written at build time
+is trusted as long as torch and the flags are the same (see loader.key_matches). Set GPE_CPU_ONLY=1 for builds without CUDA.
+The binaries are built without -march=native, so that they run on other CPUs than the build machine.
+"""
+import os
+
+from setuptools import setup, find_packages
+from torch.utils.cpp_extension import BuildExtension, CppExtension, CUDAExtension
+
+from gmc.cpp.extensions import loader
+
+
+class BuildExtensionWithKeys(BuildExtension):
+    """writes the build key next to every extension, so that the loader can verify that the binary is up to date."""
+    def build_extensions(self):
+        super().build_extensions()
+        for extension in self.extensions:
+            module_name = extension.name.split(".")[-1]
+            key_file = os.path.join(os.path.dirname(self.get_ext_fullpath(extension.name)), module_name + ".key")
+            with open(key_file, "w") as file:
+                file.write(loader.build_key(extension.gmc_name, cpu_only, portable_flags=True))
+
+
+# unlike JIT builds, no GPU is needed for building the CUDA code paths
+cpu_only = loader.cpu_only_forced or not loader.cuda_toolkit_available
+
+
+def extension_modules():
+    modules = []
+    for name in loader.extensions.keys():
+        configuration = loader.build_configuration(name, cpu_only, portable_flags=True)
+        extension_type = CppExtension if cpu_only else CUDAExtension
+        module = extension_type(f"gmc.cpp.extensions.prebuilt.{configuration['name']}",
+                                configuration["sources"],
+                                include_dirs=configuration["extra_include_paths"],
+                                extra_compile_args={"cxx": configuration["extra_cflags"], "nvcc": configuration["extra_cuda_cflags"]},
+                                extra_link_args=configuration["extra_ldflags"])
+        module.gmc_name = name
+        modules.append(module)
+    return modules
+
+
+setup(name="gmc",
+      version="0.1",
+      packages=find_packages(include=["gmc", "gmc.*"]),
+      ext_modules=extension_modules(),
+      cmdclass={"build_ext": BuildExtensionWithKeys})